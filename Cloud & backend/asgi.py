@@ -0,0 +1,385 @@
+"""
+Asyncio entry point for /assess and /chat, alongside the Flask app in main.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+
+Requests and responses match the Flask routes. Each request is a task on one
+event loop instead of a worker thread, so a process holds hundreds of
+requests waiting on the ML backend or Gemini at no thread cost. The ML
+backend is called through AsyncMLBackendClient (aiohttp), and Gemini through
+the SDK's async methods behind the same LLM gateway. In legacy mode the ML
+backend's report is generated as a background job while the career_details
+call runs here, instead of one after the other. At the request's deadline
+the response is sent with the cluster's fallback in place of whatever is not
+ready; those calls carry on as tasks and upgrade the stored result. When the
+client disconnects, the request's in-flight calls are cancelled. Prompts, parsing, chat sessions
+and the gateway come from main.py. The streaming endpoints are only served by
+the Flask app. Finished assessments are queued in main.py's assessment store
+and read back from it, off the event loop, by GET /assessment/<id>.
+"""
+import asyncio
+import contextlib
+import json
+import time
+
+import aiohttp
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import main
+from career_common.llm_gateway import INTERACTIVE, GatewayBusy
+from career_common.metrics import FALLBACKS, ASGIMetrics, correlation_headers, span
+from ml_client import CircuitOpenError, async_client_from_env
+
+ml_client = async_client_from_env(main.ML_BACKEND_URL)
+llm_gateway = main.llm_gateway
+chat_sessions = main.chat_sessions
+assessment_store = main.assessment_store
+
+ML_BACKEND_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError)
+# Logged for requests whose client went away; nobody receives the response
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def until_disconnected(request, work):
+    """
+    Await the coroutine `work`, cancelling it if the client disconnects first.
+    The request body must already have been read.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_disconnected(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            # Let the cancelled calls record their outcome before answering
+            await asyncio.gather(task, return_exceptions=True)
+    if task.cancelled():
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    return task.result()
+
+
+async def _disconnected(request):
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+def error_response(message, status=500):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def busy_response(error):
+    """503 with Retry-After for a Gemini call the LLM gateway did not admit."""
+    print(f"Gemini call not admitted: {error}")
+    return JSONResponse({"error": main.BUSY_MESSAGE}, status_code=503,
+                        headers={"Retry-After": str(error.retry_after)})
+
+
+async def assess(request):
+    user_assessment_data = await read_json(request)
+    if not user_assessment_data:
+        return error_response("Invalid JSON input", 400)
+    assess_mode = request.query_params.get('mode', main.ASSESS_MODE)
+    if assess_mode not in main.ASSESS_MODES:
+        return error_response(f"mode must be one of {', '.join(main.ASSESS_MODES)}", 400)
+    deadline, error = main.request_deadline(request.query_params)
+    if error:
+        return error_response(error, 400)
+    user_id = main.assessment_user_id(request.headers, user_assessment_data)
+    return await until_disconnected(request, _assess(user_assessment_data, assess_mode, user_id, deadline))
+
+
+async def _assess(user_assessment_data, assess_mode, user_id, deadline):
+    combined = assess_mode == "combined"
+    try:
+        # In legacy mode the ML backend queues its report and returns the cluster at once
+        with span("ml_backend"):
+            ml_response = await ml_client.post(main.ml_backend_path(combined, deadline, background_report=True),
+                                               json=user_assessment_data, deadline=deadline.remaining(),
+                                               headers=correlation_headers())
+            ml_results = await ml_response.json()
+        # ml_backend_path asks for the cluster's fallback, but an older ML backend may not send one
+        fallback = ml_results.pop('fallback', None)
+        return await _assess_before_deadline(user_assessment_data, assess_mode, user_id, deadline,
+                                             ml_results, fallback)
+
+    except json.JSONDecodeError as err:
+        print(f"Failed to parse careerDetails JSON: {err}")
+        return error_response("Failed to parse career details JSON from model output")
+    except ML_BACKEND_ERRORS as e:
+        print(f"Error communicating with ML backend: {e}")
+        return error_response(f"Failed to connect to ML backend: {e}")
+    except GatewayBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"An error occurred during assessment: {e}")
+        return error_response("An internal error occurred during assessment.")
+
+
+async def _assess_before_deadline(user_assessment_data, assess_mode, user_id, deadline, ml_results, fallback):
+    """
+    The /assess response from whatever is ready at the deadline, with the ML
+    backend's `fallback` standing in for the rest. Calls still running carry
+    on, and their result replaces the stored assessment when it arrives.
+    Without a fallback it waits for every call and raises a failed
+    career_details call's error, as main.assess does.
+    """
+    combined = assess_mode == "combined"
+    # The backend's report and the career_details call only share the cluster
+    career_task = asyncio.ensure_future(fetch_career_details(user_assessment_data, ml_results, combined))
+    guidance_task = None if combined else asyncio.ensure_future(fetch_guidance(ml_results))
+    tasks = [task for task in (career_task, guidance_task) if task is not None]
+    try:
+        with span("llm_wait"):
+            await asyncio.wait(tasks, timeout=deadline.remaining() if fallback is not None else None)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    career_details = None
+    if fallback is None:
+        career_details = career_task.result()
+    elif not career_task.done():
+        FALLBACKS.inc(operation="assess", reason="deadline")
+    elif career_task.exception() is not None:
+        error = career_task.exception()
+        if isinstance(error, GatewayBusy):
+            print(f"Gemini call not admitted: {error}")
+            FALLBACKS.inc(operation="assess", reason="busy")
+        else:
+            unparsable = isinstance(error, json.JSONDecodeError)
+            print(f"{'Failed to parse careerDetails JSON' if unparsable else 'Career details not generated'}: {error}")
+            FALLBACKS.inc(operation="assess", reason="unparsable" if unparsable else "error")
+    else:
+        career_details = career_task.result()
+    if guidance_task is not None:
+        guidance = None
+        if guidance_task.done():
+            if guidance_task.exception() is None:
+                guidance = guidance_task.result()
+            else:
+                print(f"Guidance report not generated: {guidance_task.exception()}")
+        if guidance is None and fallback is None:
+            ml_results['guidance'] = main.MISSING_REPORT_MESSAGE
+        elif guidance is None:
+            ml_results['guidance'] = fallback['guidance']
+            ml_results['guidance_status'] = "fallback"
+        else:
+            ml_results['guidance'] = guidance
+    career_details = main.apply_career_details(ml_results, career_details, fallback, combined)
+
+    pending = [task for task in tasks if not task.done()]
+    if pending and main.assessment_store is not None:
+        ml_results['upgrade_pending'] = True
+    stored = main.store_assessment(user_id, ml_results, career_details, assess_mode)
+    if ml_results.get('upgrade_pending') and stored:
+        upgrade = asyncio.ensure_future(upgrade_later(stored["assessment_id"], user_id, assess_mode, ml_results,
+                                                      career_details, career_task, guidance_task))
+        upgrades.add(upgrade)
+        upgrade.add_done_callback(upgrades.discard)
+    else:
+        for task in pending:
+            task.cancel()
+    return JSONResponse({
+        "ml_results": ml_results,
+        "career_details": career_details,
+        "assess_mode": assess_mode,
+        **stored
+    })
+
+
+# Upgrades in flight; the event loop only keeps weak references to tasks
+upgrades = set()
+
+
+async def upgrade_later(assessment_id, user_id, assess_mode, ml_results, career_details, career_task, guidance_task):
+    """Stores the generated result in place of the fallback assessment once its calls finish."""
+    pending = [task for task in (career_task, guidance_task) if task is not None and not task.done()]
+    await asyncio.wait(pending)
+    generated = report = None
+    parts = []
+    if career_task in pending:
+        parts.append("career_details")
+        if career_task.exception() is None:
+            generated = career_task.result()
+        else:
+            print(f"Career details for assessment {assessment_id} not generated: {career_task.exception()}")
+    if guidance_task in pending:
+        parts.append("guidance")
+        if guidance_task.exception() is None:
+            report = guidance_task.result()
+        else:
+            print(f"Guidance report for assessment {assessment_id} not generated: {guidance_task.exception()}")
+    main.store_upgrade(assessment_id, user_id, assess_mode, ml_results, career_details, generated, report, parts)
+
+
+async def fetch_career_details(user_assessment_data, ml_results, combined):
+    """The parsed career_details JSON (with the report under "report" in combined mode)."""
+    recommendation_prompt = main.build_recommendation_prompt(
+        user_assessment_data, ml_results.get('cluster_name', 'N/A'), ml_results if combined else None)
+    model = main.GenerativeModel("gemini-2.5-flash")
+    # Identical assessments in flight share one generation
+    response = await llm_gateway.acall("career_details", model.generate_content_async,
+                                       recommendation_prompt, priority=INTERACTIVE, coalesce=True)
+    with span("parse_career_details"):
+        return main.parse_career_details(response.text)
+
+
+async def fetch_guidance(ml_results):
+    """
+    Long-polls the ML backend's guidance job named in `ml_results` (removing
+    the job fields) and returns the report, or None if there is none or the
+    backend lost it (as main.wait_for_guidance).
+    """
+    status = ml_results.pop('guidance_status', None)
+    job_id = ml_results.pop('guidance_job_id', None)
+    ml_results.pop('guidance_url', None)
+    if status == "done":
+        return ml_results.get('guidance')
+    if status != "pending":
+        return None
+    if job_id is None:
+        print("Guidance pending without a job ID")
+        return None
+
+    give_up_at = time.monotonic() + ml_client.read_timeout
+    try:
+        with span("ml_guidance"):
+            while True:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                response = await ml_client.get(f"/guidance/{job_id}",
+                                               params={"wait": f"{min(main.GUIDANCE_POLL_WAIT, remaining):.1f}"},
+                                               headers=correlation_headers())
+                if response.status == 200:
+                    return (await response.json()).get('guidance')
+            print(f"Guidance job {job_id} still pending after {ml_client.read_timeout:g}s")
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
+            print(f"Guidance job {job_id} not found by the ML backend")
+        else:
+            print(f"Guidance job {job_id} failed: {e}")
+    except ML_BACKEND_ERRORS as e:
+        print(f"Guidance job {job_id} failed: {e}")
+    return None
+
+
+async def chat(request):
+    data = await read_json(request)
+    session, error, status = main.find_chat_session(data)
+    if error:
+        return error_response(error, status)
+    return await until_disconnected(request, _chat(data, session))
+
+
+async def _chat(data, session):
+    user_query = data['user_query']
+    try:
+        if session.async_lock is None:
+            session.async_lock = asyncio.Lock()
+        # One turn at a time per session, so the history stays consistent
+        async with session.async_lock:
+            model = main.GenerativeModel("gemini-2.5-flash")
+            chat_session = model.start_chat(history=session.gemini_history())
+            gemini_chat_response = await llm_gateway.acall(
+                "chat", chat_session.send_message_async, user_query, priority=INTERACTIVE,
+                tokens=llm_gateway.estimate_tokens(user_query) + session.history_tokens())
+            assistant_message = gemini_chat_response.text
+            if not assistant_message:
+                raise Exception("No response generated from Gemini API")
+            chat_sessions.record_turn(session, user_query, assistant_message)
+
+        return JSONResponse(main.chat_reply(data, session, user_query, assistant_message))
+
+    except GatewayBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        print(f"An error occurred during chat: {e}")
+        return error_response("An internal error occurred during chat.")
+
+
+async def get_assessment(request):
+    """A stored /assess result by its assessment_id, if it belongs to the X-User-ID caller."""
+    if assessment_store is None:
+        return error_response("Assessment store is disabled", 404)
+    assessment_id = request.path_params['assessment_id']
+    try:
+        document = await run_in_threadpool(assessment_store.get_document, assessment_id,
+                                           request.headers.get(main.USER_ID_HEADER))
+    except Exception:
+        return error_response("Assessment store is unavailable", 503)
+    if document is None:
+        return error_response(f"Unknown assessment {assessment_id}", 404)
+    body, upgrade_pending = document
+    return Response(body + "\n", media_type='application/json',
+                    headers=main.stored_result_headers(upgrade_pending))
+
+
+async def list_assessments(request):
+    """The X-User-ID caller's newest stored results, newest first (?limit=, default 20)."""
+    if assessment_store is None:
+        return error_response("Assessment store is disabled", 404)
+    user_id = request.headers.get(main.USER_ID_HEADER)
+    if not user_id:
+        return error_response(main.USER_ID_REQUIRED_MESSAGE, 401)
+    limit, error = main.assessment_list_limit(request.query_params)
+    if error:
+        return error_response(error, 400)
+    return JSONResponse({"assessments": await run_in_threadpool(assessment_store.list_for_user, user_id, limit)})
+
+
+async def assessment_store_stats(request):
+    """Write, drop and lookup counters of this process's assessment store."""
+    if assessment_store is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **assessment_store.stats()})
+
+
+async def ml_backend_stats(request):
+    """Latency, retry and circuit breaker stats of the async ML backend client."""
+    return JSONResponse(ml_client.stats())
+
+
+async def llm_stats(request):
+    """Limits, budget use and queue counters of this process's LLM gateway."""
+    return JSONResponse(llm_gateway.stats())
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await ml_client.close()
+
+
+routes = [
+    Route('/assess', assess, methods=['POST']),
+    Route('/chat', chat, methods=['POST']),
+    Route('/assessment/{assessment_id}', get_assessment, methods=['GET']),
+    Route('/assessments', list_assessments, methods=['GET']),
+    Route('/assessment_store/stats', assessment_store_stats, methods=['GET']),
+    Route('/ml_backend/stats', ml_backend_stats, methods=['GET']),
+    Route('/llm/stats', llm_stats, methods=['GET']),
+]
+
+# Correlation IDs, stage timings and GET /metrics, as instrument_app does for Flask
+app = ASGIMetrics(
+    Starlette(routes=routes, lifespan=lifespan,
+              middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"],
+                                     allow_headers=["*"])]),
+    endpoints=[route.path for route in routes],
+)
@@ -0,0 +1,332 @@
+"""
+Stored /assess results, so a student revisiting their results reads them by
+ID instead of re-running the prediction and both Gemini calls.
+
+`AssessmentStore.save` assigns an assessment ID and queues the result. A
+background writer thread writes queued results to the backend in batches, so
+saving adds no I/O to the request. Results still in the queue are served from
+memory, so a lookup right after the assessment finds them. Backends store
+`ml_results` and `career_details` as JSON text, so a lookup concatenates
+strings and does not parse them again.
+
+A result filed under a user is only read back for that user. Replacing a
+result (a fallback upgraded to the generated one) keeps its `created_at`.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Results written per backend transaction
+WRITE_BATCH_SIZE = 100
+# Seconds close() waits for the writer to drain the queue
+CLOSE_TIMEOUT = 5
+# Columns of a stored row, in order
+COLUMNS = ("assessment_id, user_id, created_at, assess_mode, cluster_name, ml_results, career_details,"
+           " upgrade_pending")
+
+
+def _timestamp(created_at):
+    return datetime.fromtimestamp(created_at, timezone.utc).isoformat(timespec='seconds')
+
+
+def document_json(row):
+    """The GET /assessment/<id> body for a stored row, built without parsing its JSON columns."""
+    assessment_id, user_id, created_at, assess_mode, _, ml_results_json, career_details_json, _ = row
+    return (f'{{"assessment_id": {json.dumps(assessment_id)}, "user_id": {json.dumps(user_id)}, '
+            f'"created_at": "{_timestamp(created_at)}", "assess_mode": {json.dumps(assess_mode)}, '
+            f'"ml_results": {ml_results_json}, "career_details": {career_details_json}}}')
+
+
+def summary(row):
+    """The GET /assessments entry for a stored row."""
+    assessment_id, _, created_at, assess_mode, cluster_name, _, _, _ = row
+    return {"assessment_id": assessment_id, "created_at": _timestamp(created_at),
+            "assess_mode": assess_mode, "cluster_name": cluster_name}
+
+
+class MemoryAssessmentBackend:
+    """Per-process store for development, keeping the `max_entries` newest results."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put_many(self, rows):
+        with self._lock:
+            for row in rows:
+                if row[2] is None:
+                    row = _created_at(row, self._rows.get(row[0]))
+                self._rows[row[0]] = row
+            while len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+    def get(self, assessment_id):
+        with self._lock:
+            return self._rows.get(assessment_id)
+
+    def list_for_user(self, user_id, limit):
+        with self._lock:
+            rows = [row for row in self._rows.values() if row[1] == user_id]
+        return sorted(rows, key=lambda row: row[2], reverse=True)[:limit]
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class SQLiteAssessmentBackend:
+    """
+    Results in one SQLite file shared by every worker process on the host,
+    indexed by user and by creation time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS assessments ("
+                " assessment_id TEXT PRIMARY KEY,"
+                " user_id TEXT,"
+                " created_at REAL NOT NULL,"
+                " assess_mode TEXT NOT NULL,"
+                " cluster_name TEXT,"
+                " ml_results TEXT NOT NULL,"
+                " career_details TEXT NOT NULL,"
+                " upgrade_pending INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {column[1] for column in conn.execute("PRAGMA table_info(assessments)")}
+            if 'upgrade_pending' not in columns:
+                # A file written before the column was added
+                conn.execute("ALTER TABLE assessments ADD COLUMN upgrade_pending INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS assessments_user_created"
+                         " ON assessments (user_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS assessments_created ON assessments (created_at)")
+
+    def _connect(self):
+        # One connection per thread and per process, since a preloaded app forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put_many(self, rows):
+        now = time.time()
+        with self._connect() as conn:
+            # A row without created_at keeps the one of the row it replaces
+            conn.executemany(
+                "INSERT OR REPLACE INTO assessments (assessment_id, user_id, created_at, assess_mode, cluster_name,"
+                " ml_results, career_details, upgrade_pending) VALUES (?, ?, COALESCE(?, (SELECT created_at"
+                " FROM assessments WHERE assessment_id = ?), ?), ?, ?, ?, ?, ?)",
+                [row[:3] + (row[0], now) + row[3:] for row in rows])
+
+    def get(self, assessment_id):
+        return self._connect().execute(f"SELECT {COLUMNS} FROM assessments WHERE assessment_id = ?",
+                                       (assessment_id,)).fetchone()
+
+    def list_for_user(self, user_id, limit):
+        return self._connect().execute(
+            f"SELECT {COLUMNS} FROM assessments WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, limit)).fetchall()
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM assessments").fetchone()[0]
+
+
+class AssessmentStore:
+    """
+    Front end over a backend: IDs, the write-behind queue and counters.
+    At most `max_pending` results wait for the writer; beyond that a result
+    is not stored and save() returns None.
+    """
+
+    def __init__(self, backend, max_pending=1000):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.saved = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_writer(self):
+        # The writer thread, queue and pending results belong to one process;
+        # a forked worker starts its own on first use
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._pending = {}
+            self._writer = threading.Thread(target=self._write_loop, name="assessment-store-writer",
+                                            daemon=True)
+            self._writer.start()
+            self._pid = os.getpid()
+
+    def save(self, ml_results, career_details, assess_mode, user_id=None, assessment_id=None):
+        """
+        Queue an assessment result and return its new ID, or None when the
+        queue is full. Pass `assessment_id` to replace an earlier result, such
+        as a fallback whose generated result has arrived; it keeps the
+        earlier result's created_at. The result must not be modified
+        afterwards.
+        """
+        self._ensure_writer()
+        created_at = None if assessment_id else time.time()
+        assessment_id = assessment_id or uuid.uuid4().hex
+        with self._lock:
+            previous = self._pending.get(assessment_id)
+            if created_at is None and previous is not None:
+                created_at = previous[2]
+            # None: the backend keeps the stored row's created_at
+            entry = (assessment_id, user_id, created_at, assess_mode, ml_results, career_details)
+            # Under the lock, so the writer cannot finish the entry before it is pending
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+                entry = None
+            else:
+                self._pending[assessment_id] = entry
+        if entry is None:
+            print("Assessment store queue full; result not stored")
+            return None
+        return assessment_id
+
+    def _write_loop(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._write(batch)
+                    return
+                batch.append(entry)
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.backend.put_many([_row(entry) for entry in batch])
+            failed = 0
+        except Exception as e:
+            print(f"Assessment store write failed: {e}")
+            failed = len(batch)
+        with self._lock:
+            for entry in batch:
+                # A newer result queued under the same ID stays pending
+                if self._pending.get(entry[0]) is entry:
+                    del self._pending[entry[0]]
+            self.saved += len(batch) - failed
+            self.errors += failed
+
+    def get_document(self, assessment_id, user_id=None):
+        """
+        (JSON document, upgrade_pending) of a stored result, or None if it is
+        unknown or filed under a user other than `user_id`. A result saved
+        without a user is read by anyone who has its ID.
+        """
+        with self._lock:
+            self.lookups += 1
+            entry = self._pending.get(assessment_id) if self._pid == os.getpid() else None
+        row = _row(entry) if entry is not None else None
+        if row is None or row[2] is None:
+            try:
+                stored = self.backend.get(assessment_id)
+            except Exception as e:
+                print(f"Assessment store lookup failed: {e}")
+                with self._lock:
+                    self.errors += 1
+                raise
+            # A queued replacement takes the created_at of the result it replaces
+            row = stored if row is None else _created_at(row, stored)
+        if row is None or row[1] not in (None, user_id):
+            return None
+        return document_json(row), bool(row[7])
+
+    def list_for_user(self, user_id, limit=20):
+        """Summaries of the user's newest results, newest first."""
+        rows = {row[0]: row for row in self.backend.list_for_user(user_id, limit)}
+        with self._lock:
+            pending = [_row(entry) for entry in self._pending.values()
+                       if entry[1] == user_id] if self._pid == os.getpid() else []
+        for row in pending:
+            if row[2] is None:
+                # A replacement of a result older than the listed ones stays out
+                if row[0] in rows:
+                    rows[row[0]] = _created_at(row, rows[row[0]])
+            else:
+                rows[row[0]] = row
+        rows = sorted(rows.values(), key=lambda row: row[2], reverse=True)[:limit]
+        return [summary(row) for row in rows]
+
+    def close(self):
+        """Write the queued results and stop the writer."""
+        if self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(None, timeout=CLOSE_TIMEOUT)
+        except queue.Full:
+            return
+        self._writer.join(CLOSE_TIMEOUT)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "backend": type(self.backend).__name__,
+                "saved": self.saved,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "lookups": self.lookups,
+                "pending": len(self._pending) if self._pid == os.getpid() else 0,
+            }
+        try:
+            stats["entries"] = len(self.backend)
+        except Exception:
+            stats["entries"] = None
+        return stats
+
+
+def _row(entry):
+    assessment_id, user_id, created_at, assess_mode, ml_results, career_details = entry
+    return (assessment_id, user_id, created_at, assess_mode, ml_results.get('cluster_name'),
+            json.dumps(ml_results), json.dumps(career_details), int(bool(ml_results.get('upgrade_pending'))))
+
+
+def _created_at(row, previous):
+    """`row` with the created_at of the row it replaces, or now when there is none."""
+    return row[:2] + (previous[2] if previous is not None else time.time(),) + row[3:]
+
+
+def assessment_store_from_env():
+    """
+    Build the assessment store selected by ASSESSMENT_STORE (sqlite, memory
+    or off). Returns None when storing is disabled.
+    """
+    kind = os.getenv("ASSESSMENT_STORE", "sqlite").lower()
+    max_pending = int(os.getenv("ASSESSMENT_STORE_MAX_PENDING", "1000"))
+
+    if kind in ("off", "none", "0", "false"):
+        return None
+    if kind == "sqlite":
+        backend = SQLiteAssessmentBackend(os.getenv("ASSESSMENT_STORE_PATH", "assessments.sqlite3"))
+    else:
+        backend = MemoryAssessmentBackend(int(os.getenv("ASSESSMENT_STORE_MAX_ENTRIES", "10000")))
+    return AssessmentStore(backend, max_pending=max_pending)
@@ -0,0 +1,175 @@
+"""Shared helpers for the orchestrator benchmark scripts."""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+ML_BACKEND_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "ml_backend")
+
+STUB_ML_RESULT = {
+    "cluster_label": 1,
+    "cluster_name": "N/A",
+    "cluster_description": "N/A",
+    "suggested_careers": [{"career_name": "Data Scientist"}, {"career_name": "Web Developer"}],
+    "guidance": "## Stub guidance\n",
+}
+# What ?fallback=true adds, standing in for the cluster's metadata report
+STUB_FALLBACK = {
+    "guidance": "## Your Career Guidance Summary\n",
+    "career_details": {"primaryCareer": "Data Scientist", "alternativePaths": [], "keySkills": []},
+}
+
+
+# Answer choices of the web app's questionnaire, keyed by question number
+QUESTION_CHOICES = {
+    "2": ["10th", "12th", "Below 10"],
+    "3": ["Arts", "Commerce", "Science"],
+    "6": ["High", "Low", "Lower-Middle", "Middle", "Upper-Middle"],
+    "7": ["Arts", "Commerce", "Engineering", "Law", "Medicine", "Science", "Technology"],
+    "14": ["Arts", "Commerce", "Engineering", "Law", "Medicine", "Science", "Technology"],
+    "16": ["Hybrid", "On-site", "Remote"],
+    "17": ["Yes", "No"],
+    "21": ["Yes", "No"],
+}
+
+
+def random_questionnaire(rng):
+    """A questionnaire payload as the web app posts it to /assess."""
+    answers = {str(question): rng.randint(0, 10) for question in range(8, 14)}
+    answers.update({question: rng.choice(choices) for question, choices in QUESTION_CHOICES.items()})
+    answers.update({
+        "1": rng.randint(13, 19),
+        "4": rng.sample(["Hearing", "Learning", "Physical", "Visual"], rng.randint(0, 1)),
+        "5": rng.sample(["Creative Hobbies", "Technical Hobbies", "Sports"], rng.randint(0, 3)),
+        "15": rng.randrange(10000, 200000, 5000),
+        "18": rng.randint(30, 100),
+        "19": rng.randint(30, 100),
+        "20": rng.randint(30, 100),
+        "22": rng.randint(0, 100),
+    })
+    return answers
+
+
+class _StubMLHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        query = parse_qs(urlparse(self.path).query)
+        result = dict(STUB_ML_RESULT)
+        delay = self.server.delay
+        deadline = float(query.get("deadline", ["0"])[0])
+        if query.get("guidance") == ["false"]:
+            result.update(guidance=None, guidance_status="skipped")
+        elif query.get("async") == ["true"]:
+            result.update(guidance=None, guidance_status="pending", **self._queue_job())
+        elif deadline and self.server.guidance_delay > deadline:
+            # The report misses its deadline: the fallback now, the report as a job
+            delay += deadline
+            result.update(guidance=STUB_FALLBACK["guidance"], guidance_status="fallback",
+                          **self._queue_job(deadline))
+        else:
+            delay += self.server.guidance_delay
+        if query.get("fallback") == ["true"]:
+            result["fallback"] = STUB_FALLBACK
+        if delay:
+            time.sleep(delay)
+        self._reply(200, result)
+
+    def _queue_job(self, started=0.0):
+        # The report is "generated" guidance_delay seconds after the job is queued
+        with self.server.lock:
+            job_id = str(len(self.server.jobs))
+            self.server.jobs[job_id] = time.monotonic() + self.server.guidance_delay - started
+        return {"guidance_job_id": job_id, "guidance_url": f"/guidance/{job_id}"}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        ready_at = self.server.jobs.get(url.path.rsplit("/", 1)[-1])
+        if not url.path.startswith("/guidance/") or ready_at is None:
+            self._reply(404, {"error": "Unknown or expired guidance job"})
+            return
+        wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+        remaining = ready_at - time.monotonic()
+        if remaining > wait:
+            time.sleep(wait)
+            self._reply(202, {"status": "pending"})
+            return
+        time.sleep(max(0.0, remaining))
+        self._reply(200, {"status": "done", "guidance": STUB_ML_RESULT["guidance"]})
+
+    def _reply(self, status, result):
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.requests += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubMLServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 drops connections under high concurrency
+
+
+def start_stub_ml_backend(delay=0.0, port=0, guidance_delay=0.0):
+    """
+    Serve canned /predict_from_questionnaire responses on localhost in a
+    background thread. Returns the server; its `connections` and `requests`
+    attributes count accepted TCP connections and answered requests.
+    `guidance_delay` is how long the report takes on top of `delay`: inline,
+    or as an ?async=true job polled on GET /guidance/<job_id>?wait=. Past a
+    ?deadline= the inline report becomes a fallback plus a job, and
+    ?fallback=true adds STUB_FALLBACK, as the ML backend does.
+    """
+    server = _StubMLServer(("127.0.0.1", port), _StubMLHandler)
+    server.delay = delay
+    server.guidance_delay = guidance_delay
+    server.jobs = {}
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples, elapsed):
+    """Throughput and tail latencies in milliseconds."""
+    return {
+        "count": len(samples),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(samples, 50) * 1e3,
+        "p95_ms": percentile(samples, 95) * 1e3,
+        "p99_ms": percentile(samples, 99) * 1e3,
+    }
+
+
+def print_row(label, stats, extra=""):
+    print(f"{label:<28} {stats['throughput_rps']:>9.1f} req/s  p50={stats['p50_ms']:>8.2f}ms  "
+          f"p95={stats['p95_ms']:>8.2f}ms  p99={stats['p99_ms']:>8.2f}ms  {extra}")
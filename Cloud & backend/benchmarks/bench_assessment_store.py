@@ -0,0 +1,191 @@
+"""
+Cost of storing /assess results, and of reading them back by ID.
+
+    python benchmarks/bench_assessment_store.py [--results 5000] [--requests 300]
+                                                [--llm-latency-ms 200] [--ml-delay-ms 5]
+                                                [--output bench_assessment_store.json] [--baseline previous.json]
+
+First the store on its own, with a SQLite file in a temporary directory: the
+time save() adds to a request (queueing for the writer thread) next to a
+synchronous insert of the same row, and how fast the writer drains the
+queue. Then through main:app with the Flask test client, against the stub
+ML backend and the local Gemini stub: POST /assess with the store off and
+on, and GET /assessment/<id> for the stored results.
+
+Exits non-zero if a result cannot be read back right after save(), a stored
+result differs from the /assess response, saving makes /assess slower by
+more than --tolerance, or a run regresses against --baseline.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from random import Random
+
+from _common import SERVICE_DIR, percentile, print_row, random_questionnaire, start_stub_ml_backend, summarize
+from assessment_store import AssessmentStore, SQLiteAssessmentBackend, _row
+from career_common import bench_results as results
+
+
+def sample_result(rng):
+    """ml_results and career_details the size of a real combined-mode assessment."""
+    ml_results = {
+        "cluster_label": rng.randrange(16), "cluster_name": "Analytical Problem Solvers",
+        "cluster_description": "Students drawn to structured, quantitative work. " * 4,
+        "suggested_careers": [{"career_name": f"Career {i}"} for i in range(5)],
+        "guidance": "## Career Guidance Report\n\n" + "A paragraph of personalised guidance. " * 80,
+        "model_version": "7d5d9585be457ff3",
+    }
+    career_details = {
+        "primaryCareer": "Data Scientist",
+        "description": "Builds models from data. " * 10,
+        "salaryRange": "INR 8-25 LPA",
+        "skills": [f"Skill {i}" for i in range(8)],
+        "educationPath": ["BSc Statistics", "MSc Data Science"],
+        "alternativeCareers": [{"title": f"Alternative {i}", "fit": "High"} for i in range(4)],
+    }
+    return ml_results, career_details
+
+
+def micro_stats(samples):
+    return {"count": len(samples), "p50_us": percentile(samples, 50) * 1e6,
+            "p95_us": percentile(samples, 95) * 1e6, "p99_us": percentile(samples, 99) * 1e6}
+
+
+def print_micro(label, stats):
+    print(f"{label:<28} p50={stats['p50_us']:>8.1f}us  p95={stats['p95_us']:>8.1f}us  "
+          f"p99={stats['p99_us']:>8.1f}us")
+
+
+def bench_store(directory, count, rng, failures):
+    rows = [sample_result(rng) for _ in range(count)]
+
+    backend = SQLiteAssessmentBackend(os.path.join(directory, 'sync.sqlite3'))
+    inserts = []
+    for i, (ml_results, career_details) in enumerate(rows):
+        start = time.perf_counter()
+        backend.put_many([_row((f"sync-{i}", "user", time.time(), "combined", ml_results, career_details))])
+        inserts.append(time.perf_counter() - start)
+
+    store = AssessmentStore(SQLiteAssessmentBackend(os.path.join(directory, 'store.sqlite3')),
+                            max_pending=count)
+    saves, ids, unreadable = [], [], 0
+    started = time.perf_counter()
+    for i, (ml_results, career_details) in enumerate(rows):
+        start = time.perf_counter()
+        assessment_id = store.save(ml_results, career_details, "combined", f"user-{i % 50}")
+        saves.append(time.perf_counter() - start)
+        ids.append((assessment_id, f"user-{i % 50}"))
+        if assessment_id is None or store.get_document(assessment_id, f"user-{i % 50}") is None:
+            unreadable += 1
+    store.close()
+    drained = time.perf_counter() - started
+
+    mismatched = 0
+    for (assessment_id, user_id), (ml_results, career_details) in zip(ids, rows):
+        document = json.loads((store.get_document(assessment_id, user_id) or ('null',))[0])
+        if not document or document['ml_results'] != ml_results or document['career_details'] != career_details:
+            mismatched += 1
+    if unreadable:
+        failures.append(f"{unreadable} result(s) not readable right after save()")
+    if mismatched:
+        failures.append(f"{mismatched} stored result(s) differ from what was saved")
+
+    lookups = []
+    for assessment_id, user_id in ids:
+        start = time.perf_counter()
+        store.get_document(assessment_id, user_id)
+        lookups.append(time.perf_counter() - start)
+
+    stats = {"insert": micro_stats(inserts), "save": micro_stats(saves), "get_json": micro_stats(lookups)}
+    print_micro("synchronous SQLite insert", stats["insert"])
+    print_micro("save() (write-behind)", stats["save"])
+    print_micro("get_document() from SQLite", stats["get_json"])
+    print(f"writer stored {store.saved} results in {drained:.2f}s "
+          f"({store.saved / drained:.0f}/s, {store.errors} errors, {store.dropped} dropped)")
+    return stats
+
+
+def timed(calls, fn):
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        begin = time.perf_counter()
+        fn(call)
+        latencies.append(time.perf_counter() - begin)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def bench_http(directory, args, rng, failures):
+    ml_backend = start_stub_ml_backend(delay=args.ml_delay_ms / 1000.0)
+    os.environ.update(ML_BACKEND_URL=ml_backend.url, LLM_STUB='1', LLM_STUB_LATENCY_MS=str(args.llm_latency_ms),
+                      LLM_STUB_FAILURE_RATE='0', ASSESSMENT_STORE='sqlite',
+                      ASSESSMENT_STORE_PATH=os.path.join(directory, 'http.sqlite3'))
+    import main
+    client = main.app.test_client()
+    store = main.assessment_store
+    # Distinct prompts, so no /assess is coalesced with another
+    payloads = [dict(random_questionnaire(rng), fieldOfInterest=f"Field {i}") for i in range(2 * args.requests)]
+    responses = {}
+
+    def assess(payload):
+        response = client.post('/assess', json=payload, headers={'X-User-ID': 'bench'})
+        body = response.get_json()
+        if body.get('assessment_id'):
+            responses[body['assessment_id']] = body
+
+    stats = {}
+    try:
+        client.post('/assess', json=payloads[0])
+        main.assessment_store = None
+        stats["assess_store_off"] = timed(payloads[:args.requests], assess)
+        main.assessment_store = store
+        stats["assess_store_on"] = timed(payloads[args.requests:], assess)
+        stats["get_assessment"] = timed(list(responses), lambda i: client.get(
+            f'/assessment/{i}', headers={'X-User-ID': 'bench'}).get_json())
+    finally:
+        ml_backend.shutdown()
+        store.close()
+
+    mismatched = sum(1 for assessment_id, body in responses.items()
+                     if json.loads(store.get_document(assessment_id, 'bench')[0])['career_details'] != body['career_details'])
+    if len(responses) != args.requests or mismatched:
+        failures.append(f"/assess: {len(responses)} of {args.requests} results stored, {mismatched} differ")
+
+    for name, label in (("assess_store_off", "POST /assess, store off"), ("assess_store_on", "POST /assess, store on"),
+                        ("get_assessment", "GET /assessment/<id>")):
+        print_row(label, stats[name])
+    slowdown = stats["assess_store_on"]["p50_ms"] / stats["assess_store_off"]["p50_ms"] - 1
+    print(f"store adds {slowdown:+.1%} to the /assess p50; a lookup costs "
+          f"{stats['get_assessment']['p50_ms'] / stats['assess_store_on']['p50_ms']:.2%} of an assessment")
+    if slowdown > args.tolerance:
+        failures.append(f"storing results makes /assess {slowdown:.1%} slower")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--results', type=int, default=5000, help="results saved in the store-only run")
+    parser.add_argument('--requests', type=int, default=300, help="POST /assess requests per run")
+    parser.add_argument('--llm-latency-ms', type=float, default=200)
+    parser.add_argument('--ml-delay-ms', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=1234)
+    results.add_arguments(parser, "bench_assessment_store.json")
+    args = parser.parse_args()
+
+    failures, suite_results = [], {}
+    with tempfile.TemporaryDirectory() as directory:
+        suite_results.update(bench_store(directory, args.results, Random(args.seed), failures))
+        suite_results.update(bench_http(directory, args, Random(args.seed), failures))
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    regressed = results.finish(args, "assessment_store", params, suite_results, SERVICE_DIR)
+    return 1 if failures or regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Concurrency benchmark of the two entry points, Flask (main:app under gunicorn
+gthread) and asyncio (asgi:app under uvicorn), against local stubs.
+
+    python benchmarks/bench_async.py [--servers flask,asgi] [--scenarios assess,assess_legacy,chat]
+                                     [--requests 600] [--concurrency 200] [--llm-latency-ms 1000]
+                                     [--ml-delay-ms 20] [--guidance-delay-ms 1000]
+                                     [--output bench_async.json] [--baseline previous.json]
+
+Both servers run one worker process with LLM_STUB=1 and call the stub ML
+backend from _common, which answers after --ml-delay-ms and takes a further
+--guidance-delay-ms for the legacy-mode report. The LLM gateway's concurrency
+cap is raised so that the worker, not the gateway, limits throughput, and
+every /assess payload carries its own fieldOfInterest so that no two prompts
+are coalesced into one generation. Each
+scenario keeps --concurrency requests in flight from an asyncio load
+generator on aiohttp, so the gthread server is held to its thread count
+while the asyncio server holds every request open at once.
+
+Then --cancel-requests clients give up halfway through their Gemini call.
+On the asyncio server each of them must cancel its Gemini call, which is
+checked through llm_requests_total{outcome="cancelled"}. Exits non-zero on
+errors, a failed cancellation check, or a regression against --baseline.
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+from random import Random
+
+import aiohttp
+
+from _common import SERVICE_DIR, print_row, random_questionnaire, start_stub_ml_backend, summarize
+from load_suite import CHAT_QUERIES, _fallback, free_port, start_service, stop_service, stub_env
+from career_common import bench_results as results
+
+SERVERS = ("flask", "asgi")
+SCENARIOS = ("assess", "assess_legacy", "chat")
+CANCELLED = re.compile(r'^llm_requests_total\{operation="([^"]+)",outcome="cancelled"\} (\d+)', re.M)
+
+
+def start_orchestrator(server, args, port, ml_url):
+    env = dict(stub_env(args), ML_BACKEND_URL=ml_url, ML_BACKEND_POOL_SIZE=str(args.threads),
+               ML_BACKEND_ASYNC_POOL_SIZE=str(args.concurrency),
+               LLM_MAX_CONCURRENCY="100000", LLM_MAX_QUEUE="100000")
+    if server == "flask":
+        command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", "1",
+                   "--threads", str(args.threads), "--worker-class", "gthread", "--timeout", "120",
+                   "main:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning", "--no-access-log", "--backlog", "4096"]
+    return start_service(command, SERVICE_DIR, env, port)
+
+
+def assessment(rng, i):
+    """A questionnaire whose career_details prompt differs from every other one."""
+    return dict(random_questionnaire(rng), fieldOfInterest=f"Field {i}")
+
+
+def build_calls(scenario, rng, count, sessions):
+    """(path, payload) pairs of one scenario."""
+    if scenario == "assess":
+        return [("/assess", assessment(rng, i)) for i in range(count)]
+    if scenario == "assess_legacy":
+        return [("/assess?mode=legacy", assessment(rng, i)) for i in range(count)]
+    return [("/chat", {"session_id": sessions[i % len(sessions)], "user_query": rng.choice(CHAT_QUERIES)})
+            for i in range(count)]
+
+
+async def open_chat_sessions(client, url, rng, count):
+    async def first_turn(_):
+        async with client.post(f"{url}/chat", json={
+            "user_query": rng.choice(CHAT_QUERIES),
+            "assessment_data": {"career_details": {"primaryCareer": "Data Scientist"},
+                                "career_cluster": "Analytical", "responses": {"academicStream": "Science"}},
+        }) as response:
+            response.raise_for_status()
+            return (await response.json())["session_id"]
+
+    return await asyncio.gather(*[first_turn(i) for i in range(count)])
+
+
+async def run_calls(client, url, calls, concurrency):
+    """Send `calls` with `concurrency` in flight; returns (latencies, errors, elapsed)."""
+    pending = iter(calls)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        for path, payload in pending:
+            start = time.perf_counter()
+            try:
+                async with client.post(f"{url}{path}", json=payload) as response:
+                    ok = response.status == 200 and not _fallback(await response.json())
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors, time.perf_counter() - start
+
+
+async def cancelled_calls(client, url):
+    async with client.get(f"{url}/metrics") as response:
+        text = await response.text()
+    return sum(int(count) for _, count in CANCELLED.findall(text))
+
+
+async def check_cancellation(client, url, rng, count, give_up_after):
+    """
+    Send `count` requests and drop their connections after `give_up_after`
+    seconds; returns how many Gemini calls were cancelled.
+    """
+    before = await cancelled_calls(client, url)
+
+    async def abandon(i):
+        try:
+            async with client.post(f"{url}/assess", json=assessment(rng, i),
+                                   timeout=aiohttp.ClientTimeout(total=give_up_after)) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+    await asyncio.gather(*[abandon(i) for i in range(count)])
+    await asyncio.sleep(0.5)
+    return await cancelled_calls(client, url) - before
+
+
+async def bench_server(server, args, scenarios, ml_url):
+    port = free_port()
+    orchestrator = start_orchestrator(server, args, port, ml_url)
+    rows = {}
+    url = f"http://127.0.0.1:{port}"
+
+    def client():
+        # gunicorn closes connections idle for 2s, so never reuse one idle for longer
+        connector = aiohttp.TCPConnector(limit=args.concurrency + args.cancel_requests, keepalive_timeout=1.0)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120))
+
+    try:
+        for scenario in scenarios:
+            rng = Random(f"{args.seed}:{scenario}")
+            async with client() as session:
+                sessions = (await open_chat_sessions(session, url, rng, args.concurrency)
+                            if scenario == "chat" else None)
+                calls = build_calls(scenario, rng, args.warmup + args.requests, sessions)
+                await run_calls(session, url, calls[:args.warmup], args.concurrency)
+                latencies, errors, elapsed = await run_calls(session, url, calls[args.warmup:], args.concurrency)
+            stats = summarize(latencies, elapsed)
+            stats["errors"] = errors
+            stats["error_rate"] = errors / len(latencies) if latencies else 0.0
+            print_row(f"{server} {scenario}", stats, f"errors={errors}")
+            rows[f"{server}/{scenario}"] = stats
+        if args.cancel_requests:
+            give_up_after = (args.ml_delay_ms + args.llm_latency_ms / 2) / 1000.0
+            async with client() as session:
+                cancelled = await check_cancellation(session, url, Random(f"{args.seed}:cancel"),
+                                                     args.cancel_requests, give_up_after)
+            print(f"{server}: {args.cancel_requests} abandoned requests -> {cancelled} Gemini call(s) cancelled")
+            rows[f"{server}/cancelled"] = cancelled
+    finally:
+        stop_service(orchestrator)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--servers", default=",".join(SERVERS))
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=600, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32, help="gthread threads of the Flask worker")
+    parser.add_argument("--llm-latency-ms", type=float, default=1000)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--ml-delay-ms", type=float, default=20)
+    parser.add_argument("--guidance-delay-ms", type=float, default=1000)
+    parser.add_argument("--cancel-requests", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1234)
+    results.add_arguments(parser, "bench_async.json")
+    args = parser.parse_args()
+
+    servers = [name.strip() for name in args.servers.split(",") if name.strip()]
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = sorted(set(servers) - set(SERVERS)) + sorted(set(scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown server(s) or scenario(s): {', '.join(unknown)}")
+
+    ml_backend = start_stub_ml_backend(delay=args.ml_delay_ms / 1000.0,
+                                       guidance_delay=args.guidance_delay_ms / 1000.0)
+    print(f"{args.requests} requests per scenario, {args.concurrency} in flight, stub LLM "
+          f"{args.llm_latency_ms:.0f}ms, ML backend {args.ml_delay_ms:.0f}ms "
+          f"(+{args.guidance_delay_ms:.0f}ms report), Flask worker with {args.threads} threads")
+
+    suite_results, failed = {}, False
+    try:
+        for server in servers:
+            rows = asyncio.run(bench_server(server, args, scenarios, ml_backend.url))
+            cancelled = rows.pop(f"{server}/cancelled", None)
+            suite_results.update(rows)
+            failed |= any(stats["errors"] for stats in rows.values())
+            if server == "asgi" and cancelled is not None and cancelled < args.cancel_requests:
+                print(f"FAIL only {cancelled} of {args.cancel_requests} abandoned requests were cancelled")
+                failed = True
+    finally:
+        ml_backend.shutdown()
+
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    regressed = results.finish(args, "async_serving", params, suite_results, SERVICE_DIR)
+    return 1 if failed or regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+/assess latency with a deadline shorter than the Gemini calls behind it.
+
+    python benchmarks/bench_deadline.py [--requests 100] [--concurrency 4] [--deadline-ms 300]
+                                        [--llm-latency-ms 1000] [--ml-delay-ms 5] [--slack-ms 100]
+                                        [--output bench_deadline.json] [--baseline previous.json]
+
+Through main:app with the Flask test client, against the stub ML backend and
+the local Gemini stub, in combined and legacy mode: POST /assess without a
+deadline, then with ?deadline=, where every response should carry the
+cluster's fallback and an assessment ID. Until the Gemini calls finish,
+GET /assessment/<id> should serve the fallback uncached; afterwards, the
+generated result in its place.
+
+Exits non-zero if an /assess p99 exceeds the deadline by more than
+--slack-ms, a deadline-bound response is not a stored fallback, a stored
+result is served as immutable before its upgrade or is not upgraded, or a
+run regresses against --baseline.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+
+from _common import SERVICE_DIR, print_row, random_questionnaire, start_stub_ml_backend, summarize
+from career_common import bench_results as results
+
+MODES = ("combined", "legacy")
+
+
+def run(client, mode, deadline, payloads, concurrency):
+    """POSTs every payload to /assess; returns the latency stats and the response bodies."""
+    path = f"/assess?mode={mode}&deadline={deadline:g}"
+
+    def assess(payload):
+        start = time.perf_counter()
+        response = client.post(path, json=payload, headers={'X-User-ID': 'bench'})
+        return time.perf_counter() - start, response.status_code, response.get_json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        calls = list(pool.map(assess, payloads))
+    stats = summarize([latency for latency, _, _ in calls], time.perf_counter() - start)
+    stats["error_rate"] = sum(1 for _, status, _ in calls if status != 200) / len(calls)
+    return stats, [body for _, status, body in calls if status == 200]
+
+
+def wait_for_upgrades(client, bodies, timeout):
+    """The stored results of `bodies` still holding a fallback after up to `timeout` seconds."""
+    ids = [body['assessment_id'] for body in bodies if body.get('assessment_id')]
+    give_up_at = time.monotonic() + timeout
+    while True:
+        stale = [i for i in ids if 'fallback' in client.get(f'/assessment/{i}').get_json()['ml_results']]
+        if not stale or time.monotonic() > give_up_at:
+            return stale
+        time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help="POST /assess requests per run")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--deadline-ms', type=float, default=300)
+    parser.add_argument('--llm-latency-ms', type=float, default=1000)
+    parser.add_argument('--ml-delay-ms', type=float, default=5)
+    parser.add_argument('--slack-ms', type=float, default=100, help="allowed p99 beyond the deadline")
+    parser.add_argument('--seed', type=int, default=1234)
+    results.add_arguments(parser, "bench_deadline.json")
+    args = parser.parse_args()
+
+    # The legacy report takes as long as a Gemini call too
+    ml_backend = start_stub_ml_backend(delay=args.ml_delay_ms / 1000.0, guidance_delay=args.llm_latency_ms / 1000.0)
+    os.environ.update(ML_BACKEND_URL=ml_backend.url, LLM_STUB='1', LLM_STUB_LATENCY_MS=str(args.llm_latency_ms),
+                      LLM_STUB_FAILURE_RATE='0', ASSESSMENT_STORE='memory')
+    import main as orchestrator
+    client = orchestrator.app.test_client()
+    rng = Random(args.seed)
+    deadline = args.deadline_ms / 1000.0
+    failures, suite_results = [], {}
+
+    try:
+        for mode in MODES:
+            # Distinct prompts, so no /assess is coalesced with another
+            payloads = [dict(random_questionnaire(rng), fieldOfInterest=f"{mode} {i}")
+                        for i in range(2 * args.requests)]
+            stats, _ = run(client, mode, 0, payloads[:args.requests], args.concurrency)
+            suite_results[f"{mode}_no_deadline"] = stats
+            print_row(f"{mode}, no deadline", stats)
+
+            stats, bodies = run(client, mode, deadline, payloads[args.requests:], args.concurrency)
+            suite_results[f"{mode}_deadline"] = stats
+            print_row(f"{mode}, deadline {args.deadline_ms:g}ms", stats)
+            if stats["p99_ms"] > args.deadline_ms + args.slack_ms:
+                failures.append(f"{mode}: p99 {stats['p99_ms']:.1f}ms with a {args.deadline_ms:g}ms deadline")
+            served = sum(1 for body in bodies if body['ml_results'].get('fallback') and body.get('assessment_id'))
+            if served != args.requests:
+                failures.append(f"{mode}: {served} of {args.requests} responses are stored fallbacks")
+            elif 'no-cache' not in client.get(f"/assessment/{bodies[-1]['assessment_id']}").headers['Cache-Control']:
+                failures.append(f"{mode}: a result awaiting its upgrade is served as immutable")
+
+            stale = wait_for_upgrades(client, bodies, timeout=10 * args.llm_latency_ms / 1000.0)
+            print(f"{mode}: {len(bodies) - len(stale)} of {len(bodies)} stored results upgraded")
+            if stale:
+                failures.append(f"{mode}: {len(stale)} stored result(s) still hold the fallback")
+    finally:
+        ml_backend.shutdown()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    regressed = results.finish(args, "deadline", params, suite_results, SERVICE_DIR)
+    return 1 if failures or regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Load test of the orchestrator-to-ML-backend hop against a local stub backend.
+
+    python benchmarks/bench_ml_client.py [--requests 2000] [--concurrency 16] [--delay-ms 2]
+
+Compares a fresh requests.post per call (the old behaviour) with the shared
+pooled MLBackendClient, reporting throughput, latency and TCP connections.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from _common import print_row, start_stub_ml_backend, summarize
+from ml_client import MLBackendClient
+
+PAYLOAD = {str(i): i for i in range(1, 23)}
+
+
+def run(call, total, concurrency):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--delay-ms', type=float, default=2.0, help="stub backend latency")
+    args = parser.parse_args()
+
+    server = start_stub_ml_backend(delay=args.delay_ms / 1000.0)
+    url = f"{server.url}/predict_from_questionnaire"
+
+    def plain():
+        response = requests.post(url, json=PAYLOAD)
+        response.raise_for_status()
+        response.json()
+
+    before = server.connections
+    stats = run(plain, args.requests, args.concurrency)
+    print_row("requests.post per call", stats, f"connections={server.connections - before}")
+
+    client = MLBackendClient(server.url, pool_size=args.concurrency)
+    before = server.connections
+    stats = run(lambda: client.post("/predict_from_questionnaire", json=PAYLOAD).json(),
+                args.requests, args.concurrency)
+    print_row("pooled MLBackendClient", stats, f"connections={server.connections - before}")
+
+    client_stats = client.stats()
+    print(f"client: reuse ratio={client_stats['connection_reuse_ratio']:.3f}  "
+          f"retries={client_stats['retries']}  circuit={client_stats['circuit_state']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
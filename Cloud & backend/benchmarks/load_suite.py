@@ -0,0 +1,237 @@
+"""
+End-to-end load suite for both services against the local Gemini stub, with
+JSON results and a baseline comparison.
+
+    python benchmarks/load_suite.py [--scenarios predict_from_questionnaire,assess,chat]
+                                    [--requests 200] [--concurrency 32]
+                                    [--llm-latency-ms 500] [--llm-failure-rate 0.0]
+                                    [--output load_suite.json] [--baseline previous.json]
+
+Starts ml_backend under gunicorn with its production profile and this
+service under gunicorn with gthread workers, both with LLM_STUB=1 and the
+given stub latency and failure rate (LLM_STUB_SEED makes injected failures
+repeatable), then drives each scenario with a fixed number of requests at a
+fixed concurrency. Payloads come from a fixed seed. The ML backend's guidance
+cache is off, so every request waits on a generation.
+
+Reports throughput, p50/p95/p99 and errors per scenario: non-200 responses,
+plus 200s that carry the fallback report instead of a generated one. With
+--baseline it exits non-zero if a scenario regressed by more than the
+tolerance.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+
+import requests
+
+from _common import ML_BACKEND_DIR, SERVICE_DIR, print_row, random_questionnaire, summarize
+from career_common import bench_results as results
+
+SCENARIOS = ("predict_from_questionnaire", "assess", "chat")
+# Both services answer with this when the Gemini call behind a report failed
+FALLBACK_REPORT = "Sorry, there was an error generating your career guidance report."
+CHAT_QUERIES = [
+    "What should I study next year?",
+    "Which skills matter most for this career?",
+    "How do I find an internship?",
+    "What are good alternatives if I change my mind?",
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def stub_env(args):
+    return dict(os.environ, LLM_STUB="1", LLM_STUB_LATENCY_MS=str(args.llm_latency_ms),
+                LLM_STUB_FAILURE_RATE=str(args.llm_failure_rate), LLM_STUB_SEED=str(args.seed))
+
+
+def start_service(command, cwd, env, port):
+    """Start a gunicorn service and wait until its /metrics answers."""
+    server = subprocess.Popen(command, cwd=cwd, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1).raise_for_status()
+            return server
+        except requests.RequestException:
+            if server.poll() is not None:
+                raise RuntimeError(f"{' '.join(command)} exited during startup")
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"{' '.join(command)} did not become ready within 60s")
+
+
+def stop_service(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def start_ml_backend(args, port):
+    env = dict(stub_env(args), SERVING_PROFILE="production", GUNICORN_WORKERS=str(args.ml_workers),
+               GUNICORN_THREADS=str(args.ml_threads), GUNICORN_BIND=f"127.0.0.1:{port}",
+               GUIDANCE_CACHE="off")
+    return start_service([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                         ML_BACKEND_DIR, env, port)
+
+
+def start_orchestrator(args, port, ml_port):
+    env = dict(stub_env(args), ML_BACKEND_URL=f"http://127.0.0.1:{ml_port}",
+               ML_BACKEND_POOL_SIZE=str(args.threads))
+    command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+               "--workers", str(args.workers), "--threads", str(args.threads),
+               "--worker-class", "gthread", "--timeout", "120", "main:app"]
+    return start_service(command, SERVICE_DIR, env, port)
+
+
+class LoadClient:
+    """Keep-alive sessions, one per load generator thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def post(self, url, payload):
+        """Returns (latency in seconds, whether the response was a success)."""
+        session = self.session()
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=payload, timeout=120)
+            ok = response.status_code == 200 and not _fallback(response.json())
+        except (requests.RequestException, ValueError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+
+def _fallback(body):
+    """True if a 200 response carries a fallback report or career_details instead of generated ones."""
+    ml_results = body.get("ml_results") or {}
+    if "fallback" in ml_results or "fallback" in (body.get("guidance_status"), ml_results.get("guidance_status")):
+        return True
+    guidance = body.get("guidance") or ml_results.get("guidance") or ""
+    return isinstance(guidance, str) and guidance.startswith(FALLBACK_REPORT)
+
+
+def build_calls(scenario, urls, rng, count, sessions):
+    """The request payloads of one scenario, as (url, payload) pairs."""
+    if scenario == "predict_from_questionnaire":
+        return [(f"{urls['ml_backend']}/predict_from_questionnaire", random_questionnaire(rng))
+                for _ in range(count)]
+    if scenario == "assess":
+        return [(f"{urls['orchestrator']}/assess", random_questionnaire(rng)) for _ in range(count)]
+    return [(f"{urls['orchestrator']}/chat",
+             {"session_id": sessions[i % len(sessions)], "user_query": rng.choice(CHAT_QUERIES)})
+            for i in range(count)]
+
+
+def open_chat_sessions(urls, client, rng, count, attempts=20):
+    """
+    Start `count` chat sessions (one first turn each) and return their IDs.
+    First turns that hit an injected failure are retried.
+    """
+    ids = []
+    while len(ids) < count:
+        response = client.session().post(f"{urls['orchestrator']}/chat", timeout=120, json={
+            "user_query": rng.choice(CHAT_QUERIES),
+            "assessment_data": {
+                "career_details": {"primaryCareer": "Data Scientist", "keySkills": ["Statistics", "Python"]},
+                "career_cluster": "Analytical",
+                "responses": {"academicStream": "Science", "fieldOfInterest": "Technology"},
+            },
+        })
+        if response.status_code == 200:
+            ids.append(response.json()["session_id"])
+            continue
+        attempts -= 1
+        if attempts <= 0:
+            response.raise_for_status()
+    return ids
+
+
+def run_scenario(calls, client, concurrency, warmup):
+    for url, payload in calls[:warmup]:
+        client.post(url, payload)
+    calls = calls[warmup:]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(lambda call: client.post(*call), calls))
+    elapsed = time.perf_counter() - start
+
+    stats = summarize([latency for latency, _ in outcomes], elapsed)
+    stats["errors"] = sum(1 for _, ok in outcomes if not ok)
+    stats["error_rate"] = stats["errors"] / len(outcomes) if outcomes else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1, help="orchestrator gunicorn workers")
+    parser.add_argument("--threads", type=int, default=32, help="orchestrator threads per worker")
+    parser.add_argument("--ml-workers", type=int, default=2)
+    parser.add_argument("--ml-threads", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1234)
+    results.add_arguments(parser, "load_suite.json")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = sorted(set(scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenario(s) {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+
+    ml_port, port = free_port(), free_port()
+    urls = {"ml_backend": f"http://127.0.0.1:{ml_port}", "orchestrator": f"http://127.0.0.1:{port}"}
+    print(f"{args.requests} requests per scenario, {args.concurrency} concurrent, "
+          f"stub latency {args.llm_latency_ms:.0f}ms, failure rate {args.llm_failure_rate:.2f}")
+
+    suite_results = {}
+    ml_backend = start_ml_backend(args, ml_port)
+    try:
+        orchestrator = start_orchestrator(args, port, ml_port)
+        try:
+            client = LoadClient()
+            for scenario in scenarios:
+                # Each scenario gets its own seeded stream, so selecting a subset does not change payloads
+                rng = Random(f"{args.seed}:{scenario}")
+                sessions = (open_chat_sessions(urls, client, rng, args.concurrency)
+                            if scenario == "chat" else None)
+                calls = build_calls(scenario, urls, rng, args.warmup + args.requests, sessions)
+                stats = run_scenario(calls, client, args.concurrency, args.warmup)
+                print_row(scenario, stats, f"errors={stats['errors']}")
+                suite_results[scenario] = stats
+        finally:
+            stop_service(orchestrator)
+    finally:
+        stop_service(ml_backend)
+
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    return 1 if results.finish(args, "end_to_end", params, suite_results, SERVICE_DIR) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
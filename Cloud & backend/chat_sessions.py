@@ -0,0 +1,135 @@
+"""
+Server-side chat sessions for /chat.
+
+A session holds the system prompt built once from the assessment, plus a
+rolling history kept under a token budget. Turns that fall out of the budget
+are folded into a short summary of what the student asked earlier. Idle
+sessions expire after a TTL.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from career_common.tokens import estimate_tokens
+
+SUMMARY_QUESTION_CHARS = 160
+
+
+class ChatSession:
+    def __init__(self, session_id, system_prompt, assessment_data):
+        self.session_id = session_id
+        self.system_prompt = system_prompt
+        self.assessment_data = assessment_data
+        self.turns = []  # [{"role": "user" | "assistant", "content": str}]
+        self.earlier_questions = []
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.async_lock = None  # asyncio.Lock, created on first use by asgi.py
+
+    def summary(self):
+        if not self.earlier_questions:
+            return ""
+        return "Earlier in this conversation the student asked about: " + "; ".join(self.earlier_questions)
+
+    def history_tokens(self):
+        """Estimated tokens of the system prompt, summary and kept turns sent with each turn."""
+        return (estimate_tokens(self.system_prompt) + estimate_tokens(self.summary())
+                + sum(estimate_tokens(turn["content"]) for turn in self.turns))
+
+    def gemini_history(self):
+        """History for model.start_chat(): system prompt (+ summary), then the kept turns."""
+        context = self.system_prompt
+        summary = self.summary()
+        if summary:
+            context = f"{context}\n\n{summary}"
+        history = [{"role": "user", "parts": [{"text": context}]}]
+        for turn in self.turns:
+            role = "model" if turn["role"] == "assistant" else "user"
+            history.append({"role": role, "parts": [{"text": turn["content"]}]})
+        return history
+
+
+class ChatSessionStore:
+    """In-process session store with TTL expiry, an LRU size cap and token-budgeted history."""
+
+    def __init__(self, ttl_seconds=1800, history_token_budget=2000, summary_token_budget=300,
+                 max_sessions=10000):
+        self.ttl_seconds = ttl_seconds
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, system_prompt, assessment_data, chat_history=None):
+        """Start a session, optionally seeded with a client-side chat_history."""
+        session = ChatSession(uuid.uuid4().hex, system_prompt, assessment_data)
+        for msg in chat_history or []:
+            role = "assistant" if msg.get("role") in ("assistant", "model") else "user"
+            session.turns.append({"role": role, "content": msg.get("content", "")})
+        self._trim(session)
+
+        with self._lock:
+            self._evict_expired()
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id):
+        """Return the live session and mark it used, or None if unknown or expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.monotonic() - session.last_used > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def record_turn(self, session, user_query, assistant_message):
+        """Append a question/answer pair and trim the history back under budget."""
+        session.turns.append({"role": "user", "content": user_query})
+        session.turns.append({"role": "assistant", "content": assistant_message})
+        session.last_used = time.monotonic()
+        self._trim(session)
+
+    def _trim(self, session):
+        # Keep at least the latest exchange even if it alone exceeds the budget
+        while len(session.turns) > 2 and \
+                sum(estimate_tokens(turn["content"]) for turn in session.turns) > self.history_token_budget:
+            dropped = session.turns.pop(0)
+            if dropped["role"] == "user":
+                # Drop the answer with its question so the history keeps alternating
+                if session.turns and session.turns[0]["role"] == "assistant":
+                    session.turns.pop(0)
+                question = " ".join(dropped["content"].split())
+                if len(question) > SUMMARY_QUESTION_CHARS:
+                    question = question[:SUMMARY_QUESTION_CHARS - 3] + "..."
+                session.earlier_questions.append(question)
+        while session.earlier_questions and estimate_tokens(session.summary()) > self.summary_token_budget:
+            session.earlier_questions.pop(0)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [session_id for session_id, session in self._sessions.items()
+                   if now - session.last_used > self.ttl_seconds]
+        for session_id in expired:
+            del self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def store_from_env():
+    """Build the session store from the CHAT_* environment variables."""
+    return ChatSessionStore(
+        ttl_seconds=int(os.getenv("CHAT_SESSION_TTL", "1800")),
+        history_token_budget=int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000")),
+        summary_token_budget=int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "300")),
+        max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "10000")),
+    )
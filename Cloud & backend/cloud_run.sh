@@ -22,7 +22,8 @@ gcloud auth configure-docker
 echo "Building Docker image..."
 # The image name format is gcr.io/PROJECT_ID/SERVICE_NAME
 DOCKER_IMAGE="gcr.io/${PROJECT_ID}/${SERVICE_NAME}"
-docker build -t "${DOCKER_IMAGE}" .
+# The image installs the shared package from the repository root, so build from there
+docker build -t "${DOCKER_IMAGE}" -f "$(dirname "$0")/Dockerfile" "$(dirname "$0")/.."
 
 echo "Pushing Docker image to Google Container Registry..."
 docker push "${DOCKER_IMAGE}"
@@ -0,0 +1,58 @@
+"""
+Per-request latency budget for /assess, and the threads that let a request
+stop waiting for Gemini when its budget runs out.
+
+A Deadline starts when the request arrives and tells each stage how long it
+may still wait. When the career_details call has not answered in time,
+/assess answers with the fallback report and career_details the ML backend
+rendered from the cluster's metadata, and the call carries on: once it
+finishes, the stored assessment is replaced by the generated result. The
+Flask app runs such calls on a BackgroundCalls pool, since a worker thread
+cannot return while it is still inside the call; the asyncio entry point
+uses tasks instead.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Deadline:
+    """The time left of a request's budget of `seconds`; no limit when it is 0."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds > 0 else None
+
+    def __bool__(self):
+        return self.expires_at is not None
+
+    def remaining(self):
+        """Seconds left, never negative, or None without a limit."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+class BackgroundCalls:
+    """
+    Thread pool for calls a request may stop waiting for. `max_workers`
+    should cover every call the LLM gateway runs or queues, so a call never
+    waits for a thread here on top of its gateway slot. `name` prefixes the
+    pool's thread names.
+    """
+
+    def __init__(self, max_workers, name="assess-background"):
+        self.max_workers = max_workers
+        self.name = name
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a pool thread and return its Future."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # Created lazily so a preloaded app does not fork live threads
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=self.name)
+        return self._executor.submit(fn, *args, **kwargs)
@@ -1,20 +1,74 @@
 import os
+import atexit
+import math
+import time
 import requests
 import json
-from flask import Flask, request, jsonify
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from assessment_store import assessment_store_from_env
+from chat_sessions import store_from_env
+from deadlines import BackgroundCalls, Deadline
+from career_common.llm_gateway import INTERACTIVE, GatewayBusy, gateway_from_env
+from career_common.metrics import FALLBACK_UPGRADES, FALLBACKS, correlation_headers, instrument_app, span
+from ml_client import client_from_env
+
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
+instrument_app(app) # Correlation IDs, stage timings and GET /metrics
 load_dotenv()
 
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
+# Set LLM_STUB=1 to answer with the local stub instead of the Gemini API
+if os.getenv("LLM_STUB", "").lower() in ("1", "true", "yes"):
+    from career_common.llm_stub import StubGenerativeModel as GenerativeModel
+else:
+    GenerativeModel = genai.GenerativeModel
+
 ML_BACKEND_URL = os.getenv("ML_BACKEND_URL", "http://localhost:8081") # Replace with your Vertex AI endpoint
 
+# Shared keep-alive client with deadlines, retries and a circuit breaker
+ml_client = client_from_env(ML_BACKEND_URL)
+
+# Concurrency, per-minute budgets, coalescing and the priority queue for every
+# Gemini call of this process; configured by the LLM_* environment variables
+llm_gateway = gateway_from_env()
+
+# "combined" writes the guidance report and career_details in one Gemini call;
+# "legacy" lets the ML backend generate its own report as well (two calls)
+ASSESS_MODES = ("combined", "legacy")
+ASSESS_MODE = os.getenv("ASSESS_MODE", "combined")
+
+# Seconds /assess may take before it answers with the cluster's fallback report
+# and career_details (0 = no limit); ?deadline= overrides it per request
+ASSESS_DEADLINE = float(os.getenv("ASSESS_DEADLINE", "30"))
+# Gemini calls a request stopped waiting for finish here: one thread for every
+# call the gateway can run or queue
+background_calls = BackgroundCalls(llm_gateway.max_concurrency + llm_gateway.max_queue)
+# Fallback results waiting for their upgrade are stored from here, off the
+# request threads and without taking background_calls threads from Gemini calls
+upgrade_calls = BackgroundCalls(int(os.getenv("ASSESS_UPGRADE_WORKERS", "16")), name="assess-upgrade")
+# Seconds per long-poll of the ML backend's /guidance/<job_id>; it caps the wait too
+GUIDANCE_POLL_WAIT = 25.0
+
+# Server-side chat sessions so clients only send the new message each turn
+chat_sessions = store_from_env()
+
+# Stored /assess results for GET /assessment/<id>; configured by ASSESSMENT_STORE
+assessment_store = assessment_store_from_env()
+if assessment_store is not None:
+    atexit.register(assessment_store.close)
+# Optional caller-supplied user the stored results are indexed by (or "user_id" in the body)
+USER_ID_HEADER = "X-User-ID"
+
+MISSING_REPORT_MESSAGE = "Sorry, there was an error generating your career guidance report. Please try again later."
+
 @app.route('/assess', methods=['POST'])
 def assess():
     try:
@@ -22,77 +76,89 @@ def assess():
         if not user_assessment_data:
             return jsonify({"error": "Invalid JSON input"}), 400
 
-        # 1. Call ML Backend (Vertex AI Endpoint)
-        ml_response = requests.post(f"{ML_BACKEND_URL}/predict_from_questionnaire", json=user_assessment_data)
-        ml_response.raise_for_status() # Raise an exception for HTTP errors
-        ml_results = ml_response.json()
+        # ?mode= overrides ASSESS_MODE per request, e.g. to compare the two
+        assess_mode = request.args.get('mode', ASSESS_MODE)
+        if assess_mode not in ASSESS_MODES:
+            return jsonify({"error": f"mode must be one of {', '.join(ASSESS_MODES)}"}), 400
+        deadline, error = request_deadline(request.args)
+        if error:
+            return jsonify({"error": error}), 400
+        combined = assess_mode == "combined"
+
+        # 1. Call ML Backend (Vertex AI Endpoint); in combined mode it skips its own report.
+        # It also sends the cluster's fallback report and career_details
+        with span("ml_backend"):
+            ml_response = ml_client.post(ml_backend_path(combined, deadline), json=user_assessment_data,
+                                         deadline=deadline.remaining(),
+                                         headers=correlation_headers()) # Raises for HTTP errors
+            ml_results = ml_response.json()
+        fallback = ml_results.pop('fallback', None)
+        guidance_job_id = take_guidance_job(ml_results)
 
         cluster_name = ml_results.get('cluster_name', 'N/A')
-        cluster_description = ml_results.get('cluster_description', 'N/A')
-        suggested_careers = ml_results.get('suggested_careers', [])
 
         # 2. Prepare prompt for Gemini API to get structured career details
-        recommendation_prompt = f"""
-        You are a career counselor AI. Based on the assessment data and the determined career cluster "{cluster_name}", provide a detailed career recommendation.
-
-        Assessment Summary:
-        - Career Cluster: {cluster_name}
-        - Primary Strengths: {user_assessment_data.get('verbalAptitude', 0) > 7 and "Verbal, " or ""}{user_assessment_data.get('quantitativeAptitude', 0) > 7 and "Quantitative, " or ""}{user_assessment_data.get('creativity', 0) > 7 and "Creative" or ""}
-        - Academic Stream: {user_assessment_data.get('academicStream', 'N/A')}
-        - Field of Interest: {user_assessment_data.get('fieldOfInterest', 'N/A')}
-        - Work Preferences: {user_assessment_data.get('workArrangement', 'N/A')}, {user_assessment_data.get('internationalWork', 'No') == "Yes" and "Open to international opportunities" or "Prefers domestic opportunities"}
-
-        Provide a detailed career recommendation in the following JSON format:
-        {{
-          "primaryCareer": "Specific job title",
-          "description": "2-3 sentence description of the career",
-          "salaryRange": "$XX,000 - $XX,000 (or INR equivalent)",
-          "growthOutlook": "Growth outlook with percentage",
-          "educationRequired": "Required education level and field",
-          "alternativePaths": [
-            {{"title": "Alternative Career 1", "description": "Brief description"}},
-            {{"title": "Alternative Career 2", "description": "Brief description"}}
-          ],
-          "keySkills": ["Skill 1", "Skill 2", "Skill 3", "Skill 4", "Skill 5"],
-          "nextSteps": ["Step 1", "Step 2", "Step 3", "Step 4"],
-          "whyRecommended": "Detailed explanation of why this career suits the student based on their assessment"
-        }}
-
-        Respond ONLY with valid JSON. Make it personalized, realistic, and aligned with Indian career paths and salary expectations.
-        """
-
-        # 3. Call Gemini API for structured career details
-        model = genai.GenerativeModel("gemini-2.5-flash") # Or other appropriate Gemini model
-        gemini_recommendation_response = model.generate_content(recommendation_prompt)
-        
-        career_details_raw = gemini_recommendation_response.text
-        
-        # Extract JSON from code blocks if needed
-        try:
-            if "```json" in career_details_raw:
-                career_details_raw = career_details_raw.split("```json")[1].split("```")[0].strip()
-            elif "```" in career_details_raw:
-                career_details_raw = career_details_raw.split("```")[1].split("```")[0].strip()
-        except Exception:
-            pass # ignore, use raw text
-
-        parsed_career_details = {}
+        recommendation_prompt = build_recommendation_prompt(user_assessment_data, cluster_name,
+                                                            ml_results if combined else None)
+
+        # 3. Call Gemini API for structured career details, waiting at most until the deadline
+        model = GenerativeModel("gemini-2.5-flash") # Or other appropriate Gemini model
+        career_future = None
         try:
-            parsed_career_details = json.loads(career_details_raw)
-        except json.JSONDecodeError as err:
-            print(f"Failed to parse careerDetails JSON: {err}")
-            return jsonify({"error": "Failed to parse career details JSON from model output"}), 500
+            if deadline and fallback is not None:
+                # On another thread, so this one can answer while the call carries on
+                career_future = background_calls.submit(generate_career_details, model, recommendation_prompt)
+                with span("llm_wait"):
+                    parsed_career_details = career_future.result(timeout=deadline.remaining())
+                career_future = None
+            else:
+                parsed_career_details = generate_career_details(model, recommendation_prompt)
+        except FutureTimeout:
+            FALLBACKS.inc(operation="assess", reason="deadline")
+            parsed_career_details = None
+        except GatewayBusy as e:
+            if fallback is None:
+                raise
+            career_future = None
+            print(f"Gemini call not admitted: {e}")
+            FALLBACKS.inc(operation="assess", reason="busy")
+            parsed_career_details = None
+        except Exception as e:
+            if fallback is None:
+                raise
+            career_future = None
+            unparsable = isinstance(e, json.JSONDecodeError)
+            print(f"{'Failed to parse careerDetails JSON' if unparsable else 'Career details not generated'}: {e}")
+            FALLBACKS.inc(operation="assess", reason="unparsable" if unparsable else "error")
+            parsed_career_details = None
 
+        parsed_career_details = apply_career_details(ml_results, parsed_career_details, fallback, combined)
+        user_id = assessment_user_id(request.headers, user_assessment_data)
+        # The generated result replaces the stored fallback once it arrives
+        upgrading = assessment_store is not None and (career_future is not None or guidance_job_id is not None)
+        if upgrading:
+            ml_results['upgrade_pending'] = True
+        stored = store_assessment(user_id, ml_results, parsed_career_details, assess_mode)
+        if upgrading and stored:
+            upgrade_later(stored["assessment_id"], user_id, assess_mode, ml_results, parsed_career_details,
+                          career_future, guidance_job_id, correlation_headers())
 
         # 4. Send combined response to webapp
         return jsonify({
-            "ml_results": ml_results, # Contains cluster_label, cluster_name, cluster_description, suggested_careers, guidance (from ML backend's Gemini call)
-            "career_details": parsed_career_details # Structured career details from Cloud & Backend's Gemini call
+            "ml_results": ml_results, # Contains cluster_label, cluster_name, cluster_description, suggested_careers, guidance
+            "career_details": parsed_career_details, # Structured career details from Cloud & Backend's Gemini call
+            "assess_mode": assess_mode,
+            **stored
         })
 
     except requests.exceptions.RequestException as e:
         print(f"Error communicating with ML backend: {e}")
         return jsonify({"error": f"Failed to connect to ML backend: {e}"}), 500
+    except json.JSONDecodeError as err:
+        print(f"Failed to parse careerDetails JSON: {err}")
+        return jsonify({"error": "Failed to parse career details JSON from model output"}), 500
+    except GatewayBusy as e:
+        return busy_response(e)
     except Exception as e:
         print(f"An error occurred during assessment: {e}")
         return jsonify({"error": "An internal error occurred during assessment."}), 500
@@ -101,87 +167,570 @@ def assess():
 def chat():
     try:
         data = request.get_json()
-        if not data or 'user_query' not in data or 'assessment_data' not in data:
-            return jsonify({"error": "Invalid JSON input or missing user_query/assessment_data"}), 400
+        session, error = resolve_chat_session(data)
+        if error:
+            return error
 
         user_query = data['user_query']
-        chat_history = data.get('chat_history', []) # List of {"role": "user/model", "content": "message"}
-        assessment_data = data['assessment_data'] # Expected to contain career_details and responses
-
-        # Extract relevant assessment details for the system prompt
-        career_details = assessment_data.get('career_details', {})
-        assessment_responses = assessment_data.get('responses', {})
-
-        # Construct system prompt similar to career-chat/index.ts
-        system_prompt = f"""
-        You are a helpful career guidance AI assistant. You're chatting with a student about their career assessment results.
-
-        Career Recommendation:
-        - Primary Career: {career_details.get('primaryCareer', 'N/A')}
-        - Career Cluster: {assessment_data.get('career_cluster', 'N/A')}
-        - Description: {career_details.get('description', 'N/A')}
-        - Salary Range: {career_details.get('salaryRange', 'N/A')}
-        - Growth Outlook: {career_details.get('growthOutlook', 'N/A')}
-        - Education Required: {career_details.get('educationRequired', 'N/A')}
-
-        Key Skills Needed:
-        {', '.join(career_details.get('keySkills', [])) or "N/A"}
-
-        Student Assessment Summary:
-        - Academic Stream: {assessment_responses.get('academicStream', 'N/A')}
-        - Field of Interest: {assessment_responses.get('fieldOfInterest', 'N/A')}
-        - Verbal Aptitude: {assessment_responses.get('verbalAptitude', 'N/A')}/10
-        - Quantitative Aptitude: {assessment_responses.get('quantitativeAptitude', 'N/A')}/10
-        - Creativity: {assessment_responses.get('creativity', 'N/A')}/10
-
-        Guidelines:
-        - Provide personalized career guidance based on their assessment
-        - Answer questions about the recommended career path
-        - Suggest specific skills to develop, courses to take, and actionable steps
-        - Be realistic and concise (2-4 paragraphs max)
-        - Reference alternative careers if asked
-        - Help with education planning, skill development, and career roadmap
-        """
-
-        # Build conversation history for Gemini
-        # Gemini expects roles "user" and "model"
-        conversation_for_gemini = []
-        for msg in chat_history:
-            role = "model" if msg.get("role") == "assistant" else "user"
-            conversation_for_gemini.append({"role": role, "parts": [{"text": msg.get("content", "")}]})
-        
-        # Add the current user message
-        conversation_for_gemini.append({"role": "user", "parts": [{"text": user_query}]})
-
-        # Call Gemini API for chat response
-        model = genai.GenerativeModel("gemini-2.5-flash") # Or other appropriate Gemini model
-        
-        # Start a chat session with the system prompt
-        chat_session = model.start_chat(history=[{"role": "user", "parts": [{"text": system_prompt}]}])
-        
-        # Send the conversation history and current user query
-        gemini_chat_response = chat_session.send_message(user_query)
-
-
-        assistant_message = gemini_chat_response.text
-        if not assistant_message:
-            raise Exception("No response generated from Gemini API")
-
-        # Update chat history to be returned to the webapp
-        updated_chat_history = chat_history + [
-            {"role": "user", "content": user_query},
-            {"role": "assistant", "content": assistant_message}
-        ]
+
+        # One turn at a time per session, so the history stays consistent
+        with session.lock:
+            # Call Gemini API for chat response
+            model = GenerativeModel("gemini-2.5-flash") # Or other appropriate Gemini model
+
+            # Start a chat session with the system prompt and the kept history
+            chat_session = model.start_chat(history=session.gemini_history())
+            gemini_chat_response = llm_gateway.call(
+                "chat", chat_session.send_message, user_query, priority=INTERACTIVE,
+                tokens=llm_gateway.estimate_tokens(user_query) + session.history_tokens())
+            assistant_message = gemini_chat_response.text
+            if not assistant_message:
+                raise Exception("No response generated from Gemini API")
+
+            chat_sessions.record_turn(session, user_query, assistant_message)
 
         # 3. Send response to webapp
-        return jsonify({
-            "response": assistant_message,
-            "chat_history": updated_chat_history
-        })
+        return jsonify(chat_reply(data, session, user_query, assistant_message))
 
+    except GatewayBusy as e:
+        return busy_response(e)
     except Exception as e:
         print(f"An error occurred during chat: {e}")
         return jsonify({"error": "An internal error occurred during chat."}), 500
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.route('/assess/stream', methods=['POST'])
+def assess_stream():
+    """
+    Server-Sent Events variant of /assess. Forwards the ML backend's `cluster`
+    event and `guidance` chunks as they arrive, streams the structured
+    recommendation as `career_details_chunk` events, then sends the parsed
+    `career_details` and `done`. Failures are reported as `error` events.
+    When the LLM gateway does not admit the call, the cluster's fallback
+    career_details are sent instead, as /assess does. Unlike /assess it has
+    no deadline: the client sees progress as it is made.
+    """
+    user_assessment_data = request.get_json(silent=True)
+    if not user_assessment_data:
+        return jsonify({"error": "Invalid JSON input"}), 400
+
+    try:
+        ml_response = ml_client.post("/predict_from_questionnaire/stream?fallback=true",
+                                     json=user_assessment_data, stream=True,
+                                     headers=correlation_headers())
+    except requests.exceptions.RequestException as e:
+        print(f"Error communicating with ML backend: {e}")
+        return jsonify({"error": f"Failed to connect to ML backend: {e}"}), 500
+
+    return Response(stream_with_context(_assess_events(user_assessment_data, ml_response,
+                                                       assessment_user_id(request.headers, user_assessment_data))),
+                    mimetype='text/event-stream', headers=SSE_HEADERS)
+
+def _assess_events(user_assessment_data, ml_response, user_id):
+    ml_results = None
+    fallback = None
+    guidance = []
+    try:
+        for event, data in iter_sse_events(ml_response.iter_lines(decode_unicode=True)):
+            if event == "cluster":
+                ml_results = data
+                fallback = ml_results.pop('fallback', None)
+            elif event == "guidance":
+                guidance.append(data)
+            if event != "done":
+                yield sse_event(event, data)
+    except requests.exceptions.RequestException as e:
+        print(f"ML backend stream failed: {e}")
+    finally:
+        ml_response.close()
+
+    if ml_results is None:
+        yield sse_event("error", {"error": "ML backend did not return a cluster"})
+        return
+
+    recommendation_prompt = build_recommendation_prompt(user_assessment_data,
+                                                        ml_results.get('cluster_name', 'N/A'))
+    parts = []
+    try:
+        model = GenerativeModel("gemini-2.5-flash")
+        with llm_gateway.slot("career_details_stream", recommendation_prompt, priority=INTERACTIVE) as call:
+            for chunk in model.generate_content(recommendation_prompt, stream=True):
+                call.usage(chunk)
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield sse_event("career_details_chunk", chunk.text)
+        career_details = parse_career_details("".join(parts))
+    except GatewayBusy as e:
+        print(f"Gemini call not admitted: {e}")
+        if fallback is None:
+            yield sse_event("error", {"error": BUSY_MESSAGE, "retry_after": e.retry_after})
+            return
+        FALLBACKS.inc(operation="assess", reason="busy")
+        career_details = apply_career_details(ml_results, None, fallback, False)
+    except json.JSONDecodeError as err:
+        print(f"Failed to parse careerDetails JSON: {err}")
+        yield sse_event("error", {"error": "Failed to parse career details JSON from model output"})
+        return
+    except Exception as e:
+        print(f"An error occurred while streaming career details: {e}")
+        yield sse_event("error", {"error": "An internal error occurred during assessment."})
+        return
+
+    yield sse_event("career_details", career_details)
+    ml_results['guidance'] = "".join(guidance) or MISSING_REPORT_MESSAGE
+    yield sse_event("done", store_assessment(user_id, ml_results, career_details, "stream"))
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Server-Sent Events variant of /chat. Sends the reply as `chunk` events and
+    finishes with `done` carrying the full response and session_id (plus the
+    updated chat_history for clients that posted one).
+    """
+    data = request.get_json(silent=True)
+    session, error = resolve_chat_session(data)
+    if error:
+        return error
+
+    user_query = data['user_query']
+
+    def events():
+        parts = []
+        try:
+            with session.lock:
+                model = GenerativeModel("gemini-2.5-flash")
+                chat_session = model.start_chat(history=session.gemini_history())
+                tokens = llm_gateway.estimate_tokens(user_query) + session.history_tokens()
+                with llm_gateway.slot("chat_stream", user_query, priority=INTERACTIVE, tokens=tokens) as call:
+                    for chunk in chat_session.send_message(user_query, stream=True):
+                        call.usage(chunk)
+                        if chunk.text:
+                            parts.append(chunk.text)
+                            yield sse_event("chunk", chunk.text)
+                assistant_message = "".join(parts)
+                if not assistant_message:
+                    raise Exception("No response generated from Gemini API")
+                chat_sessions.record_turn(session, user_query, assistant_message)
+        except Exception as e:
+            print(f"An error occurred during chat: {e}")
+            yield sse_event("error", {"error": "An internal error occurred during chat."})
+            return
+
+        yield sse_event("done", chat_reply(data, session, user_query, assistant_message))
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
+def resolve_chat_session(data):
+    """
+    Finds the server-side session for a chat request, or starts one from its
+    assessment_data (seeded with any chat_history the client sent).
+    Returns (session, None) or (None, error_response).
+    """
+    session, error, status = find_chat_session(data)
+    if error:
+        return None, (jsonify({"error": error}), status)
+    return session, None
+
+def find_chat_session(data):
+    """resolve_chat_session without Flask: returns (session, None, None) or (None, error, status)."""
+    if not data or 'user_query' not in data:
+        return None, "Invalid JSON input or missing user_query", 400
+
+    session_id = data.get('session_id')
+    if session_id:
+        session = chat_sessions.get(session_id)
+        if session is not None:
+            return session, None, None
+        if 'assessment_data' not in data:
+            return None, "Unknown or expired session_id; send assessment_data to start a new session", 404
+    elif 'assessment_data' not in data:
+        return None, "Invalid JSON input or missing user_query/assessment_data", 400
+
+    assessment_data = data['assessment_data'] # Expected to contain career_details and responses
+    system_prompt = build_chat_system_prompt(assessment_data)
+    return chat_sessions.create(system_prompt, assessment_data, data.get('chat_history')), None, None
+
+def chat_reply(data, session, user_query, assistant_message):
+    """The /chat response body for one answered turn."""
+    body = {
+        "response": assistant_message,
+        "session_id": session.session_id
+    }
+    if 'session_id' not in data:
+        # Clients still posting their own history get it back, updated
+        body["chat_history"] = data.get('chat_history', []) + [
+            {"role": "user", "content": user_query},
+            {"role": "assistant", "content": assistant_message}
+        ]
+    return body
+
+@app.route('/assessment/<assessment_id>', methods=['GET'])
+def get_assessment(assessment_id):
+    """A stored /assess result by its assessment_id, if it belongs to the X-User-ID caller."""
+    if assessment_store is None:
+        return jsonify({"error": "Assessment store is disabled"}), 404
+    try:
+        document = assessment_store.get_document(assessment_id, request.headers.get(USER_ID_HEADER))
+    except Exception:
+        return jsonify({"error": "Assessment store is unavailable"}), 503
+    if document is None:
+        return jsonify({"error": f"Unknown assessment {assessment_id}"}), 404
+    body, upgrade_pending = document
+    return Response(body + "\n", mimetype='application/json', headers=stored_result_headers(upgrade_pending))
+
+@app.route('/assessments', methods=['GET'])
+def list_assessments():
+    """The X-User-ID caller's newest stored results, newest first (?limit=, default 20)."""
+    if assessment_store is None:
+        return jsonify({"error": "Assessment store is disabled"}), 404
+    user_id = request.headers.get(USER_ID_HEADER)
+    if not user_id:
+        return jsonify({"error": USER_ID_REQUIRED_MESSAGE}), 401
+    limit, error = assessment_list_limit(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify({"assessments": assessment_store.list_for_user(user_id, limit)})
+
+@app.route('/assessment_store/stats', methods=['GET'])
+def assessment_store_stats():
+    """Write, drop and lookup counters of this worker's assessment store."""
+    if assessment_store is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **assessment_store.stats()})
+
+STORED_RESULT_HEADERS = {"Cache-Control": "private, max-age=86400, immutable"}
+# A fallback result is replaced when its generated result arrives
+UPGRADING_RESULT_HEADERS = {"Cache-Control": "private, no-cache"}
+MAX_ASSESSMENT_LIST = 100
+USER_ID_REQUIRED_MESSAGE = f"The {USER_ID_HEADER} header is required"
+
+def stored_result_headers(upgrade_pending):
+    """Cache headers for a stored result: final results never change, fallbacks awaiting an upgrade do."""
+    return UPGRADING_RESULT_HEADERS if upgrade_pending else STORED_RESULT_HEADERS
+
+def assessment_user_id(headers, data):
+    """The user an assessment belongs to: the X-User-ID header, else "user_id" in the body."""
+    user_id = headers.get(USER_ID_HEADER) or (data.get('user_id') if isinstance(data, dict) else None)
+    return str(user_id) if user_id else None
+
+def store_assessment(user_id, ml_results, career_details, assess_mode):
+    """
+    Queues a finished assessment in the store. Returns {"assessment_id": id}
+    to merge into the response, or {} when it is not stored.
+    """
+    if assessment_store is None:
+        return {}
+    assessment_id = assessment_store.save(ml_results, career_details, assess_mode, user_id)
+    return {"assessment_id": assessment_id} if assessment_id else {}
+
+def assessment_list_limit(args):
+    """Reads ?limit= of GET /assessments; returns (limit, error)."""
+    try:
+        limit = int(args.get('limit', 20))
+    except ValueError:
+        return 0, "limit must be an integer"
+    if not 1 <= limit <= MAX_ASSESSMENT_LIST:
+        return 0, f"limit must be between 1 and {MAX_ASSESSMENT_LIST}"
+    return limit, None
+
+def request_deadline(args):
+    """The request's Deadline: ?deadline= seconds (0 = no limit), else ASSESS_DEADLINE. Returns (deadline, error)."""
+    value = args.get('deadline')
+    if value is None:
+        return Deadline(ASSESS_DEADLINE), None
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None, "deadline must be a number of seconds"
+    if not (math.isfinite(seconds) and seconds >= 0):
+        return None, "deadline must be a non-negative number of seconds"
+    return Deadline(seconds), None
+
+def ml_backend_path(combined, deadline, background_report=False):
+    """
+    The ML backend call of an assessment, asking for the cluster's fallback
+    report and career_details too. In combined mode the backend skips its own
+    report. In legacy mode it generates it as a background job
+    (`background_report`), or within half the time left, leaving the rest to
+    the career_details call that follows.
+    """
+    path = "/predict_from_questionnaire?fallback=true"
+    if combined:
+        return path + "&guidance=false"
+    if background_report:
+        return path + "&async=true"
+    if deadline:
+        return path + f"&deadline={max(deadline.remaining() / 2, 0.001):.3f}"
+    return path
+
+def take_guidance_job(ml_results):
+    """
+    Removes the ML backend's guidance job fields from a legacy-mode result.
+    Returns the job ID when the report is a fallback whose generation carries on.
+    """
+    job_id = ml_results.pop('guidance_job_id', None)
+    ml_results.pop('guidance_url', None)
+    return job_id if ml_results.get('guidance_status') == "fallback" else None
+
+def generate_career_details(model, recommendation_prompt):
+    """The parsed career_details JSON of one Gemini call; identical assessments in flight share it."""
+    gemini_recommendation_response = llm_gateway.call(
+        "career_details", model.generate_content, recommendation_prompt,
+        priority=INTERACTIVE, coalesce=True)
+    with span("parse_career_details"):
+        return parse_career_details(gemini_recommendation_response.text)
+
+def apply_career_details(ml_results, career_details, fallback, combined):
+    """
+    Returns the career_details of the response and, in combined mode, puts
+    the report that came with them into ml_results. When `career_details` is
+    None the ML backend's `fallback` stands in for both. ml_results["fallback"]
+    lists the parts that came from the cluster's metadata.
+    """
+    parts = []
+    if career_details is None:
+        career_details = fallback['career_details']
+        parts.append("career_details")
+        if combined:
+            ml_results['guidance'] = fallback['guidance']
+            ml_results['guidance_status'] = "fallback"
+    elif combined:
+        # The report came back inside the same JSON; put it where the ML backend's would be
+        ml_results.pop('guidance_status', None)
+        ml_results['guidance'] = career_details.pop('report', None) or MISSING_REPORT_MESSAGE
+    if ml_results.get('guidance_status') == "fallback":
+        parts.insert(0, "guidance")
+    if parts:
+        ml_results['fallback'] = parts
+    return career_details
+
+def upgrade_later(assessment_id, user_id, assess_mode, ml_results, career_details, career_future,
+                  guidance_job_id, headers):
+    """
+    Stores the generated result in place of the fallback assessment once it
+    arrives: the career_details call still running in `career_future`, and
+    in legacy mode the ML backend's guidance job. Runs on an upgrade_calls
+    thread once the call is done, never on the request's thread.
+    """
+    def finish():
+        generated = None
+        pending = []
+        if career_future is not None:
+            pending.append("career_details")
+            try:
+                generated = career_future.result()
+            except Exception as e:
+                print(f"Career details for assessment {assessment_id} not generated: {e}")
+        report = None
+        if guidance_job_id is not None:
+            pending.append("guidance")
+            report = wait_for_guidance(guidance_job_id, headers)
+        store_upgrade(assessment_id, user_id, assess_mode, ml_results, career_details, generated, report,
+                      pending)
+
+    if career_future is not None:
+        # The callback runs at once on this thread if the call is already done, so it only hands finish on
+        career_future.add_done_callback(lambda _: upgrade_calls.submit(finish))
+    else:
+        upgrade_calls.submit(finish)
+
+def wait_for_guidance(job_id, headers):
+    """
+    Long-polls the ML backend's guidance job; returns the report, or None if
+    it failed, expired or is unknown to the backend (404: the job store is not
+    shared by its workers, or the job outlived GUIDANCE_JOB_TTL).
+    """
+    give_up_at = time.monotonic() + ml_client.read_timeout
+    try:
+        while True:
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                print(f"Guidance job {job_id} still pending after {ml_client.read_timeout:g}s")
+                return None
+            response = ml_client.get(f"/guidance/{job_id}",
+                                     params={"wait": f"{min(GUIDANCE_POLL_WAIT, remaining):.1f}"},
+                                     headers=headers)
+            if response.status_code == 200:
+                return response.json().get('guidance')
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            print(f"Guidance job {job_id} not found by the ML backend")
+        else:
+            print(f"Guidance job {job_id} failed: {e}")
+    except requests.exceptions.RequestException as e:
+        print(f"Guidance job {job_id} failed: {e}")
+    return None
+
+def store_upgrade(assessment_id, user_id, assess_mode, ml_results, career_details, generated, report, pending):
+    """
+    Stores a fallback assessment again under its ID, with the parts that were
+    generated after all: `generated` career_details (holding the report in
+    combined mode) and the ML backend's `report`. `pending` names the parts
+    ("career_details", "guidance") that were still running; when one of them
+    did not arrive the upgrade counts as failed and that part stays a fallback.
+    Either way the result is stored without `upgrade_pending`.
+    """
+    missing = [part for part, value in (("career_details", generated), ("guidance", report))
+               if part in pending and value is None]
+    if missing:
+        print(f"Assessment {assessment_id} keeps its fallback {' and '.join(missing)}")
+        FALLBACK_UPGRADES.inc(operation="assess", outcome="failed")
+    # Parts that stay fallbacks are listed again below
+    parts = [part for part in ml_results.get('fallback', ()) if part == "career_details" and generated is None]
+    ml_results = {key: value for key, value in ml_results.items() if key not in ("fallback", "upgrade_pending")}
+    if report is not None:
+        ml_results['guidance'] = report
+        ml_results.pop('guidance_status', None)
+    if generated is not None:
+        career_details = apply_career_details(ml_results, generated, None, assess_mode == "combined")
+    if ml_results.get('guidance_status') == "fallback":
+        parts.insert(0, "guidance")
+    ml_results.pop('fallback', None)
+    if parts:
+        ml_results['fallback'] = parts
+    assessment_store.save(ml_results, career_details, assess_mode, user_id, assessment_id=assessment_id)
+    if not missing:
+        FALLBACK_UPGRADES.inc(operation="assess", outcome="stored")
+
+@app.route('/ml_backend/stats', methods=['GET'])
+def ml_backend_stats():
+    """Latency, retry, circuit breaker and connection reuse stats of the ML backend client."""
+    return jsonify(ml_client.stats())
+
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    """Limits, budget use and queue counters of this worker's LLM gateway."""
+    return jsonify(llm_gateway.stats())
+
+BUSY_MESSAGE = "The service is busy; please retry shortly."
+
+def busy_response(error):
+    """503 with Retry-After for a Gemini call the LLM gateway did not admit."""
+    print(f"Gemini call not admitted: {error}")
+    response = jsonify({"error": BUSY_MESSAGE})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def iter_sse_events(lines):
+    """Parses text/event-stream lines into (event, data) pairs with JSON data."""
+    event, data_lines = "message", []
+    for line in lines:
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
+
+def build_recommendation_prompt(user_assessment_data, cluster_name, ml_results=None):
+    """
+    Builds the prompt asking Gemini for the structured career_details JSON.
+    Passing `ml_results` (combined mode) also asks for the markdown guidance
+    report under a "report" key, replacing the ML backend's own generation.
+    """
+    cluster_context = ""
+    report_field = ""
+    if ml_results is not None:
+        careers = ', '.join(career.get('career_name', '') for career in ml_results.get('suggested_careers', []))
+        cluster_context = f"""
+    - Cluster Description: {ml_results.get('cluster_description', 'N/A')}
+    - Suggested Careers From The Cluster: {careers or 'N/A'}"""
+        report_field = (
+            ',\n      "report": "A markdown career guidance report (use \\n for line breaks) with these sections: '
+            "Introduction acknowledging the student's inputs; Analysis of Strengths; Career Path Recommendations "
+            "with 2-3 specific roles, each with a typical day, required skills and future outlook; "
+            'Educational Guidance; Actionable Next Steps; Encouraging Closing"'
+        )
+
+    recommendation_prompt = f"""
+    You are a career counselor AI. Based on the assessment data and the determined career cluster "{cluster_name}", provide a detailed career recommendation.
+
+    Assessment Summary:
+    - Career Cluster: {cluster_name}{cluster_context}
+    - Primary Strengths: {user_assessment_data.get('verbalAptitude', 0) > 7 and "Verbal, " or ""}{user_assessment_data.get('quantitativeAptitude', 0) > 7 and "Quantitative, " or ""}{user_assessment_data.get('creativity', 0) > 7 and "Creative" or ""}
+    - Academic Stream: {user_assessment_data.get('academicStream', 'N/A')}
+    - Field of Interest: {user_assessment_data.get('fieldOfInterest', 'N/A')}
+    - Work Preferences: {user_assessment_data.get('workArrangement', 'N/A')}, {user_assessment_data.get('internationalWork', 'No') == "Yes" and "Open to international opportunities" or "Prefers domestic opportunities"}
+
+    Provide a detailed career recommendation in the following JSON format:
+    {{
+      "primaryCareer": "Specific job title",
+      "description": "2-3 sentence description of the career",
+      "salaryRange": "$XX,000 - $XX,000 (or INR equivalent)",
+      "growthOutlook": "Growth outlook with percentage",
+      "educationRequired": "Required education level and field",
+      "alternativePaths": [
+        {{"title": "Alternative Career 1", "description": "Brief description"}},
+        {{"title": "Alternative Career 2", "description": "Brief description"}}
+      ],
+      "keySkills": ["Skill 1", "Skill 2", "Skill 3", "Skill 4", "Skill 5"],
+      "nextSteps": ["Step 1", "Step 2", "Step 3", "Step 4"],
+      "whyRecommended": "Detailed explanation of why this career suits the student based on their assessment"{report_field}
+    }}
+
+    Respond ONLY with valid JSON. Make it personalized, realistic, and aligned with Indian career paths and salary expectations.
+    """
+    return recommendation_prompt
+
+def parse_career_details(career_details_raw):
+    """Parses the career_details JSON out of model output, with or without code fences."""
+    # Extract JSON from code blocks if needed
+    try:
+        if "```json" in career_details_raw:
+            career_details_raw = career_details_raw.split("```json")[1].split("```")[0].strip()
+        elif "```" in career_details_raw:
+            career_details_raw = career_details_raw.split("```")[1].split("```")[0].strip()
+    except Exception:
+        pass # ignore, use raw text
+    return json.loads(career_details_raw)
+
+def build_chat_system_prompt(assessment_data):
+    """Builds the chat system prompt from the student's assessment results."""
+    # Extract relevant assessment details for the system prompt
+    career_details = assessment_data.get('career_details', {})
+    assessment_responses = assessment_data.get('responses', {})
+
+    # Construct system prompt similar to career-chat/index.ts
+    system_prompt = f"""
+    You are a helpful career guidance AI assistant. You're chatting with a student about their career assessment results.
+
+    Career Recommendation:
+    - Primary Career: {career_details.get('primaryCareer', 'N/A')}
+    - Career Cluster: {assessment_data.get('career_cluster', 'N/A')}
+    - Description: {career_details.get('description', 'N/A')}
+    - Salary Range: {career_details.get('salaryRange', 'N/A')}
+    - Growth Outlook: {career_details.get('growthOutlook', 'N/A')}
+    - Education Required: {career_details.get('educationRequired', 'N/A')}
+
+    Key Skills Needed:
+    {', '.join(career_details.get('keySkills', [])) or "N/A"}
+
+    Student Assessment Summary:
+    - Academic Stream: {assessment_responses.get('academicStream', 'N/A')}
+    - Field of Interest: {assessment_responses.get('fieldOfInterest', 'N/A')}
+    - Verbal Aptitude: {assessment_responses.get('verbalAptitude', 'N/A')}/10
+    - Quantitative Aptitude: {assessment_responses.get('quantitativeAptitude', 'N/A')}/10
+    - Creativity: {assessment_responses.get('creativity', 'N/A')}/10
+
+    Guidelines:
+    - Provide personalized career guidance based on their assessment
+    - Answer questions about the recommended career path
+    - Suggest specific skills to develop, courses to take, and actionable steps
+    - Be realistic and concise (2-4 paragraphs max)
+    - Reference alternative careers if asked
+    - Help with education planning, skill development, and career roadmap
+    """
+    return system_prompt
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,394 @@
+"""
+Pooled HTTP client for the orchestrator-to-ML-backend hop.
+
+One keep-alive session is shared by every request. Each call gets a deadline,
+failed calls are retried with jittered exponential backoff, and a circuit
+breaker stops sending traffic to a backend that keeps failing. A POST may
+already have reached the backend when its response times out, so POSTs are
+only retried when the connection failed or the backend answered 502/503/504.
+AsyncMLBackendClient does the same on an aiohttp session for the asyncio
+entry point (asgi.py); cancelling the awaiting task aborts the request.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {502, 503, 504}
+# Methods safe to send again after a response that never arrived
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. After `reset_timeout`
+    seconds a single trial call is let through; success closes the circuit
+    again, failure re-opens it, and a trial that ends without either (the
+    caller was interrupted) must be handed back with release_trial().
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        # The permit of the half-open trial call in flight, if any
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        A permit for one call: True while the circuit is closed, a trial
+        permit while it is half-open, or False if the call may not be made.
+        Pass the permit to release_trial() once the call is over.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+            if self.state == "half-open" and self._trial is None:
+                self._trial = object()
+                return self._trial
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial = None
+
+    def release_trial(self, permit):
+        """
+        End the half-open trial of `permit` if it was abandoned without an
+        outcome. Permits of other calls, or of a trial already decided, are
+        ignored.
+        """
+        with self._lock:
+            if permit is not None and permit is self._trial:
+                self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = None
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class MLBackendClient:
+    """Shared, connection-pooled client for the ML backend."""
+
+    def __init__(self, base_url, pool_size=10, connect_timeout=3.0, read_timeout=120.0,
+                 retries=2, backoff=0.25, max_backoff=2.0, breaker=None, latency_window=1000):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._counters = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0,
+                          "circuit_rejections": 0}
+
+    def post(self, path, json=None, deadline=None, stream=False, headers=None):
+        """
+        POST to the backend and return the response, raising on HTTP errors.
+
+        `deadline` caps the total seconds spent across all attempts (defaults
+        to read_timeout). Failed connections and 502/503/504 responses are
+        retried; anything else is returned or raised at once. GETs are retried
+        after read timeouts and dropped connections too.
+        """
+        return self.request("POST", path, json=json, deadline=deadline, stream=stream, headers=headers)
+
+    def get(self, path, params=None, deadline=None, headers=None):
+        return self.request("GET", path, params=params, deadline=deadline, headers=headers)
+
+    def request(self, method, path, json=None, params=None, deadline=None, stream=False, headers=None):
+        url = f"{self.base_url}{path}"
+        budget = self.read_timeout if deadline is None else deadline
+        give_up_at = time.monotonic() + budget
+        self._count("requests")
+
+        attempt = 0
+        while True:
+            # Before allow(), so a call out of time never takes the half-open trial
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                self._count("failures")
+                raise requests.exceptions.Timeout(f"Deadline of {budget}s exceeded calling {url}")
+            permit = self.breaker.allow()
+            if not permit:
+                self._count("circuit_rejections")
+                raise CircuitOpenError(f"Circuit open for {self.base_url}; not calling {path}")
+
+            self._count("attempts")
+            start = time.monotonic()
+            delay = None
+            try:
+                response = self.session.request(
+                    method, url, json=json, params=params, stream=stream, headers=headers,
+                    timeout=(min(self.connect_timeout, remaining), min(self.read_timeout, remaining)))
+                _record_status(self.breaker, response.status_code)
+                if response.status_code in RETRY_STATUSES:
+                    response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                if not isinstance(e, requests.exceptions.HTTPError):
+                    self.breaker.record_failure()
+                if _retryable(method, e):
+                    delay = _retry_delay(self, attempt, give_up_at)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                logger.warning(f"Retrying {url} in {delay:.2f}s after error: {e}")
+            finally:
+                # Whatever ended the attempt, it no longer holds a half-open trial slot
+                self.breaker.release_trial(permit)
+
+            if delay is not None:
+                attempt += 1
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+            response.raise_for_status()
+            return response
+
+    def stats(self):
+        """Request counters, latency percentiles and connection reuse."""
+        stats = _request_stats(self)
+        connections, pooled_requests = 0, 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                pooled_requests += pool.num_requests
+
+        stats.update({
+            "connections_opened": connections,
+            "http_requests_sent": pooled_requests,
+            "connection_reuse_ratio": (1 - connections / pooled_requests) if pooled_requests else 0.0,
+        })
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+def _retryable(method, error):
+    """Whether a requests error may be retried: POSTs only when the backend cannot have acted on them."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUSES
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError) or method in IDEMPOTENT_METHODS
+    return isinstance(error, requests.exceptions.Timeout) and method in IDEMPOTENT_METHODS
+
+
+def _async_retryable(method, error):
+    """_retryable for aiohttp errors."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRY_STATUSES
+    if isinstance(error, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError)):
+        return True
+    return method in IDEMPOTENT_METHODS
+
+
+def _retry_delay(client, attempt, give_up_at):
+    """The jittered backoff before the next attempt, or None when retries or time ran out."""
+    if attempt >= client.retries:
+        return None
+    delay = random.uniform(0, min(client.max_backoff, client.backoff * 2 ** attempt))
+    return delay if time.monotonic() + delay < give_up_at else None
+
+
+def _record_status(breaker, status):
+    """A 5xx response counts as a failure of the backend; anything else as a success."""
+    if status >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _request_stats(client):
+    """Counters, circuit state and latency percentiles shared by both clients."""
+    with client._lock:
+        stats = dict(client._counters)
+        latencies = sorted(client._latencies)
+
+    def pct(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))]
+
+    stats.update({
+        "circuit_state": client.breaker.state,
+        "latency_p50_s": pct(50),
+        "latency_p95_s": pct(95),
+        "latency_p99_s": pct(99),
+    })
+    return stats
+
+
+class AsyncMLBackendClient:
+    """
+    MLBackendClient for coroutines, on a shared aiohttp session created on
+    first use. Raises aiohttp.ClientError or asyncio.TimeoutError where the
+    threaded client raises requests errors, and CircuitOpenError while the
+    breaker is open. Use it from one event loop.
+    """
+
+    def __init__(self, base_url, pool_size=100, connect_timeout=3.0, read_timeout=120.0,
+                 retries=2, backoff=0.25, max_backoff=2.0, breaker=None, latency_window=1000):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = None
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._counters = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0,
+                          "circuit_rejections": 0}
+
+    async def post(self, path, json=None, deadline=None, headers=None):
+        """
+        POST like MLBackendClient.post: deadline, retries and breaker included.
+        Returns the aiohttp response with its body already read.
+        """
+        return await self.request("POST", path, json=json, deadline=deadline, headers=headers)
+
+    async def get(self, path, params=None, deadline=None, headers=None):
+        return await self.request("GET", path, params=params, deadline=deadline, headers=headers)
+
+    async def request(self, method, path, json=None, params=None, deadline=None, headers=None):
+        if self.session is None:
+            # aiohttp sessions belong to the loop they are created on
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        url = f"{self.base_url}{path}"
+        budget = self.read_timeout if deadline is None else deadline
+        give_up_at = time.monotonic() + budget
+        self._count("requests")
+
+        attempt = 0
+        while True:
+            # Before allow(), so a call out of time never takes the half-open trial
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                self._count("failures")
+                raise asyncio.TimeoutError(f"Deadline of {budget}s exceeded calling {url}")
+            permit = self.breaker.allow()
+            if not permit:
+                self._count("circuit_rejections")
+                raise CircuitOpenError(f"Circuit open for {self.base_url}; not calling {path}")
+
+            self._count("attempts")
+            start = time.monotonic()
+            timeout = aiohttp.ClientTimeout(total=min(self.read_timeout, remaining),
+                                            connect=min(self.connect_timeout, remaining))
+            delay = None
+            try:
+                async with self.session.request(method, url, json=json, params=params, headers=headers,
+                                                timeout=timeout) as response:
+                    await response.read()
+                _record_status(self.breaker, response.status)
+                if response.status in RETRY_STATUSES:
+                    response.raise_for_status()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not isinstance(e, aiohttp.ClientResponseError):
+                    self.breaker.record_failure()
+                if _async_retryable(method, e):
+                    delay = _retry_delay(self, attempt, give_up_at)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                logger.warning(f"Retrying {url} in {delay:.2f}s after error: {e!r}")
+            finally:
+                # Whatever ended the attempt (a cancelled task, say), it no longer holds a half-open trial slot
+                self.breaker.release_trial(permit)
+
+            if delay is not None:
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(delay)
+                continue
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+            response.raise_for_status()
+            return response
+
+    def stats(self):
+        """Request counters, latency percentiles and circuit state."""
+        return _request_stats(self)
+
+    async def close(self):
+        if self.session is not None:
+            session, self.session = self.session, None
+            await session.close()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+def _client_settings():
+    return dict(
+        connect_timeout=float(os.getenv("ML_BACKEND_CONNECT_TIMEOUT", "3")),
+        read_timeout=float(os.getenv("ML_BACKEND_TIMEOUT", "120")),
+        retries=int(os.getenv("ML_BACKEND_RETRIES", "2")),
+        backoff=float(os.getenv("ML_BACKEND_BACKOFF", "0.25")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("ML_BACKEND_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("ML_BACKEND_BREAKER_RESET", "30")),
+        ),
+    )
+
+
+def async_client_from_env(base_url):
+    """Build the asyncio client from the ML_BACKEND_* environment variables."""
+    return AsyncMLBackendClient(base_url, pool_size=int(os.getenv("ML_BACKEND_ASYNC_POOL_SIZE", "100")),
+                                **_client_settings())
+
+
+def client_from_env(base_url):
+    """Build the client from the ML_BACKEND_* environment variables."""
+    return MLBackendClient(
+        base_url,
+        pool_size=int(os.getenv("ML_BACKEND_POOL_SIZE", "10")),
+        **_client_settings(),
+    )
@@ -0,0 +1,123 @@
+"""
+Shared fixtures for the orchestrator tests.
+
+The tests import the service modules from the Cloud & backend directory, as
+the benchmarks do, and run against local stand-ins for the ML backend: the
+benchmarks' stub, or a scripted backend answering each request as told.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVICE_DIR, 'benchmarks'))
+
+import _common  # noqa: E402  (puts the service on the path)
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET()
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path))
+            status, delay = self.server.script.pop(0) if self.server.script else (200, 0.0)
+        time.sleep(delay)
+        body = json.dumps({"status": status}).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # the client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ScriptedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+@pytest.fixture
+def scripted_backend():
+    """
+    A local backend answering each request with the next (status, delay) of
+    its `script` list, then 200 at once. `requests` lists (method, path) as
+    they arrive.
+    """
+    server = _ScriptedServer(("127.0.0.1", 0), _ScriptedHandler)
+    server.script = []
+    server.requests = []
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='session')
+def stub_ml_backend():
+    """The benchmarks' stub ML backend; tests may change its `guidance_delay`."""
+    server = _common.start_stub_ml_backend()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='session')
+def orchestrator(stub_ml_backend):
+    """
+    The main module, configured as the benchmarks run it: against the stub ML
+    backend and the local Gemini stub, with an in-memory assessment store.
+    """
+    os.environ.update(ML_BACKEND_URL=stub_ml_backend.url, LLM_STUB='1', LLM_STUB_LATENCY_MS='0',
+                      LLM_STUB_FAILURE_RATE='0', ASSESSMENT_STORE='memory')
+    import main
+    return main
+
+
+@pytest.fixture(scope='session')
+def asgi(orchestrator):
+    """The asgi module, serving the same main module."""
+    import asgi
+    return asgi
+
+
+@pytest.fixture
+def asgi_client(asgi):
+    from starlette.testclient import TestClient
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def server(request, orchestrator):
+    """(test client, module) of each server: main's Flask app, then the asgi app."""
+    if request.param == 'flask':
+        return orchestrator.app.test_client(), orchestrator
+    return request.getfixturevalue('asgi_client'), request.getfixturevalue('asgi')
+
+
+@pytest.fixture
+def closed_port():
+    """A localhost URL nothing listens on."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.server_close()
+    return url
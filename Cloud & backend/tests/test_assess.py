@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from random import Random
+
+import pytest
+
+from _common import STUB_FALLBACK, random_questionnaire
+from career_common.llm_gateway import GatewayBusy
+from career_common.metrics import FALLBACK_UPGRADES, FALLBACKS
+
+
+def body(response):
+    return response.get_json() if hasattr(response, 'get_json') else response.json()
+
+
+class ExpiringJobs(dict):
+    """Guidance jobs the stub ML backend forgets `ttl` seconds after queueing them."""
+
+    def __init__(self, ttl):
+        super().__init__()
+        self.ttl = ttl
+        self.queued_at = {}
+
+    def __setitem__(self, job_id, ready_at):
+        super().__setitem__(job_id, ready_at)
+        self.queued_at[job_id] = time.monotonic()
+
+    def get(self, job_id, default=None):
+        if time.monotonic() - self.queued_at.get(job_id, 0) > self.ttl:
+            return default
+        return super().get(job_id, default)
+
+
+def wait_for(predicate, timeout=10):
+    give_up_at = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < give_up_at:
+        time.sleep(0.02)
+    return predicate()
+
+
+@pytest.fixture
+def questionnaire():
+    return random_questionnaire(Random(0))
+
+
+def test_failed_guidance_job_serves_the_fallback_report(asgi, asgi_client, questionnaire, monkeypatch):
+    async def fail(ml_results):
+        raise RuntimeError("report lost")
+    monkeypatch.setattr(asgi, 'fetch_guidance', fail)
+
+    response = asgi_client.post('/assess?mode=legacy&deadline=5', json=questionnaire)
+    assert response.status_code == 200
+    ml_results = response.json()["ml_results"]
+    assert (ml_results["guidance"], ml_results["guidance_status"]) == (STUB_FALLBACK["guidance"], "fallback")
+    assert ml_results["fallback"] == ["guidance"]
+
+
+def test_upgrade_stores_career_details_when_the_report_fails(asgi, monkeypatch):
+    stored = []
+    monkeypatch.setattr(asgi.main, 'store_upgrade', lambda *args: stored.append(args))
+
+    async def career_details():
+        await asyncio.sleep(0.01)
+        return {"primaryCareer": "Judge"}
+
+    async def guidance():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("report lost")
+
+    async def run():
+        await asgi.upgrade_later("a1", "u1", "legacy", {}, {}, asyncio.ensure_future(career_details()),
+                                 asyncio.ensure_future(guidance()))
+
+    asyncio.run(run())
+    generated, report, pending = stored[0][-3:]
+    assert (generated, report, pending) == ({"primaryCareer": "Judge"}, None, ["career_details", "guidance"])
+
+
+@pytest.mark.parametrize('career_done', [True, False, None])
+def test_flask_upgrades_run_on_the_upgrade_pool(orchestrator, monkeypatch, career_done):
+    threads = []
+    monkeypatch.setattr(orchestrator, 'wait_for_guidance',
+                        lambda job_id, headers: threads.append(threading.current_thread().name) or "report")
+    monkeypatch.setattr(orchestrator, 'store_upgrade',
+                        lambda *args: threads.append(threading.current_thread().name))
+    career_future = None if career_done is None else Future()
+    if career_done:
+        career_future.set_result({"primaryCareer": "Judge"})
+
+    orchestrator.upgrade_later("a1", "u1", "legacy", {}, {}, career_future, "job-1", {})
+    if career_done is False:
+        career_future.set_result({"primaryCareer": "Judge"})
+    assert wait_for(lambda: len(threads) == 2)
+    assert all(name.startswith("assess-upgrade") for name in threads), threads
+
+
+def test_busy_gateway_serves_the_fallback(server, orchestrator, questionnaire, monkeypatch):
+    client, module = server
+
+    def busy(*args):
+        raise GatewayBusy("queue full", retry_after=3)
+
+    async def abusy(*args):
+        busy()
+
+    if module is orchestrator:
+        monkeypatch.setattr(orchestrator, 'generate_career_details', busy)
+    else:
+        monkeypatch.setattr(module, 'fetch_career_details', abusy)
+    before = FALLBACKS.value(operation="assess", reason="busy")
+
+    response = client.post('/assess?mode=combined&deadline=5', json=questionnaire)
+    assert response.status_code == 200
+    result = body(response)
+    assert result["career_details"] == STUB_FALLBACK["career_details"]
+    assert result["ml_results"]["fallback"] == ["guidance", "career_details"]
+    assert "upgrade_pending" not in result["ml_results"]
+    assert FALLBACKS.value(operation="assess", reason="busy") == before + 1
+
+
+def without_fallback(combined, deadline, background_report=False):
+    """ml_backend_path for an ML backend that sends no fallback."""
+    if combined:
+        return "/predict_from_questionnaire?guidance=false"
+    return "/predict_from_questionnaire?async=true" if background_report else "/predict_from_questionnaire"
+
+
+def test_busy_gateway_without_a_fallback_is_503(server, orchestrator, questionnaire, monkeypatch):
+    client, module = server
+
+    def busy(*args):
+        raise GatewayBusy("queue full", retry_after=3)
+
+    async def abusy(*args):
+        busy()
+
+    if module is orchestrator:
+        monkeypatch.setattr(orchestrator, 'generate_career_details', busy)
+    else:
+        monkeypatch.setattr(module, 'fetch_career_details', abusy)
+    monkeypatch.setattr(orchestrator, 'ml_backend_path', without_fallback)
+    response = client.post('/assess?mode=combined&deadline=5', json=questionnaire)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+@pytest.mark.parametrize('mode', ['combined', 'legacy'])
+def test_assessment_without_a_fallback_serves_the_generated_result(server, orchestrator, questionnaire,
+                                                                    monkeypatch, mode):
+    client, _ = server
+    monkeypatch.setattr(orchestrator, 'ml_backend_path', without_fallback)
+
+    response = client.post(f'/assess?mode={mode}&deadline=5', json=questionnaire)
+    assert response.status_code == 200
+    ml_results = body(response)["ml_results"]
+    assert "fallback" not in ml_results and "upgrade_pending" not in ml_results
+    assert ml_results["guidance"] not in (STUB_FALLBACK["guidance"], orchestrator.MISSING_REPORT_MESSAGE)
+
+
+def test_lost_guidance_job_fails_the_upgrade(server, orchestrator, stub_ml_backend, questionnaire, monkeypatch):
+    client, _ = server
+    # The job is never done, and a backend worker without the shared job store would not know it
+    monkeypatch.setattr(stub_ml_backend, 'guidance_delay', 5.0)
+    monkeypatch.setattr(stub_ml_backend, 'jobs', ExpiringJobs(0.3))
+    monkeypatch.setattr(orchestrator, 'GUIDANCE_POLL_WAIT', 0.05)
+    before = FALLBACK_UPGRADES.value(operation="assess", outcome="failed")
+
+    result = body(client.post('/assess?mode=legacy&deadline=0.2', json=questionnaire))
+    assert result["ml_results"]["guidance_status"] == "fallback"
+    assert result["ml_results"]["upgrade_pending"]
+
+    assert wait_for(lambda: FALLBACK_UPGRADES.value(operation="assess", outcome="failed") == before + 1)
+    response = client.get(f'/assessment/{result["assessment_id"]}')
+    assert "immutable" in response.headers["Cache-Control"]
+    stored = body(response)
+    assert stored["ml_results"]["guidance"] == STUB_FALLBACK["guidance"]
+    assert stored["ml_results"]["fallback"] == ["guidance"]
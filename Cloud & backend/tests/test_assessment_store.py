@@ -0,0 +1,162 @@
+import json
+import sqlite3
+import time
+import uuid
+
+import pytest
+
+import assessment_store
+from assessment_store import AssessmentStore, MemoryAssessmentBackend, SQLiteAssessmentBackend
+
+
+class Clock:
+    """Stands in for the time module in assessment_store, so created_at is set by the test."""
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(assessment_store, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    backend = (MemoryAssessmentBackend() if request.param == 'memory'
+               else SQLiteAssessmentBackend(str(tmp_path / 'assessments.sqlite3')))
+    return AssessmentStore(backend)
+
+
+def written(store):
+    """Wait until the writer has stored every queued result."""
+    give_up_at = time.monotonic() + 5
+    while store.stats()["pending"] and time.monotonic() < give_up_at:
+        time.sleep(0.01)
+    assert store.stats()["pending"] == 0
+
+
+def document(store, assessment_id, user_id=None):
+    found = store.get_document(assessment_id, user_id)
+    return None if found is None else (json.loads(found[0]), found[1])
+
+
+def result(cluster_name, **ml_results):
+    return dict(ml_results, cluster_name=cluster_name), {"primaryCareer": cluster_name}
+
+
+@pytest.mark.parametrize('wait', [False, True])
+def test_saved_result_is_read_back(store, wait):
+    ml_results, career_details = result("Builders")
+    assessment_id = store.save(ml_results, career_details, "combined", "u1")
+    if wait:
+        written(store)
+    stored, upgrade_pending = document(store, assessment_id, "u1")
+    assert stored["assessment_id"] == assessment_id
+    assert (stored["user_id"], stored["assess_mode"]) == ("u1", "combined")
+    assert (stored["ml_results"], stored["career_details"]) == (ml_results, career_details)
+    assert upgrade_pending is False
+    assert store.get_document("unknown", "u1") is None
+
+
+@pytest.mark.parametrize('wait', [False, True])
+def test_results_are_only_read_by_their_user(store, wait):
+    owned = store.save(*result("Builders"), "combined", "u1")
+    anonymous = store.save(*result("Healers"), "combined")
+    if wait:
+        written(store)
+    assert store.get_document(owned, "u2") is None
+    assert store.get_document(owned, None) is None
+    assert document(store, anonymous, "u2")[0]["user_id"] is None
+    assert document(store, anonymous)[0]["user_id"] is None
+
+
+@pytest.mark.parametrize('wait', [False, True])
+def test_upgrade_keeps_created_at_and_clears_upgrade_pending(store, clock, wait):
+    ml_results, career_details = result("Builders", upgrade_pending=True, fallback=["career_details"])
+    assessment_id = store.save(ml_results, career_details, "combined", "u1")
+    if wait:
+        written(store)
+    first, upgrade_pending = document(store, assessment_id, "u1")
+    assert upgrade_pending is True
+
+    clock.now += 3600
+    store.save(*result("Builders"), "combined", "u1", assessment_id=assessment_id)
+    upgraded, upgrade_pending = document(store, assessment_id, "u1")
+    assert upgrade_pending is False
+    assert upgraded["created_at"] == first["created_at"]
+    assert upgraded["career_details"] == {"primaryCareer": "Builders"}
+    listed = store.list_for_user("u1")
+    assert [entry["created_at"] for entry in listed] == [first["created_at"]]
+
+    written(store)
+    assert document(store, assessment_id, "u1") == (upgraded, False)
+    assert store.list_for_user("u1") == listed
+
+
+def test_list_is_newest_first_and_per_user(store, clock):
+    ids = []
+    for name in ("Builders", "Healers", "Thinkers"):
+        clock.now += 60
+        ids.append(store.save(*result(name), "legacy", "u1"))
+    store.save(*result("Others"), "legacy", "u2")
+    written(store)
+    clock.now += 60
+    # One more still queued, listed alongside the written ones
+    ids.append(store.save(*result("Makers"), "legacy", "u1"))
+
+    listed = store.list_for_user("u1", limit=3)
+    assert [entry["assessment_id"] for entry in listed] == ids[:0:-1]
+    assert [entry["cluster_name"] for entry in listed] == ["Makers", "Thinkers", "Healers"]
+    assert {entry["assess_mode"] for entry in listed} == {"legacy"}
+    assert store.list_for_user("nobody") == []
+
+
+def test_sqlite_file_without_upgrade_pending_is_migrated(tmp_path):
+    path = str(tmp_path / 'assessments.sqlite3')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE assessments (assessment_id TEXT PRIMARY KEY, user_id TEXT,"
+                     " created_at REAL NOT NULL, assess_mode TEXT NOT NULL, cluster_name TEXT,"
+                     " ml_results TEXT NOT NULL, career_details TEXT NOT NULL)")
+        conn.execute("INSERT INTO assessments VALUES ('old', 'u1', 1700000000, 'combined', 'Builders', '{}', '{}')")
+    conn.close()
+
+    store = AssessmentStore(SQLiteAssessmentBackend(path))
+    stored, upgrade_pending = document(store, 'old', 'u1')
+    assert (stored["created_at"], upgrade_pending) == ("2023-11-14T22:13:20+00:00", False)
+    assessment_id = store.save(*result("Healers", upgrade_pending=True), "combined", "u1")
+    written(store)
+    assert document(store, assessment_id, 'u1')[1] is True
+
+
+def body(response):
+    return response.get_json() if hasattr(response, 'get_json') else response.json()
+
+
+def test_routes_are_scoped_to_the_user_header(server, orchestrator):
+    client, _ = server
+    store = orchestrator.assessment_store
+    # Both servers share the store, so each run has a user of its own
+    user, other = uuid.uuid4().hex, uuid.uuid4().hex
+    owned = store.save(*result("Builders"), "combined", user)
+    upgrading = store.save(*result("Healers", upgrade_pending=True), "combined", user)
+
+    assert client.get('/assessments').status_code == 401
+    assert client.get(f'/assessments?user_id={user}').status_code == 401
+    listed = body(client.get('/assessments', headers={'X-User-ID': user}))["assessments"]
+    assert {entry["assessment_id"] for entry in listed} == {owned, upgrading}
+    assert body(client.get('/assessments', headers={'X-User-ID': other}))["assessments"] == []
+
+    assert client.get(f'/assessment/{owned}').status_code == 404
+    assert client.get(f'/assessment/{owned}', headers={'X-User-ID': other}).status_code == 404
+    response = client.get(f'/assessment/{owned}', headers={'X-User-ID': user})
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    response = client.get(f'/assessment/{upgrading}', headers={'X-User-ID': user})
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
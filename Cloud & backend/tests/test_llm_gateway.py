@@ -0,0 +1,276 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from career_common.llm_gateway import (BACKGROUND, INTERACTIVE, GatewayBusy, LLMGateway, MemoryBudgetWindow,
+                                       SQLiteBudgetWindow, gateway_from_env)
+from career_common.llm_stub import StubGenerativeModel, StubUsage
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """The Gemini stub, taking 50ms per generation and never failing."""
+    monkeypatch.setenv("LLM_STUB_LATENCY_MS", "50")
+    monkeypatch.setenv("LLM_STUB_FAILURE_RATE", "0")
+    return StubGenerativeModel()
+
+
+class Counting:
+    """Wraps a generate function, recording how many calls ran at once."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            return self.fn(prompt)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def test_concurrency_is_capped(model):
+    gateway = LLMGateway(max_concurrency=2)
+    generate = Counting(model.generate_content)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        responses = list(pool.map(lambda i: gateway.call("test", generate, f"prompt {i}"), range(6)))
+    assert len(responses) == 6
+    assert generate.max_running == 2
+    stats = gateway.stats()
+    assert (stats["admitted"], stats["running"], stats["queued_now"]) == (6, 0, 0)
+    assert stats["queued"] >= 4
+
+
+def test_identical_prompts_are_coalesced(model):
+    gateway = LLMGateway()
+    generate = Counting(model.generate_content)
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        texts = {response.text for response in
+                 pool.map(lambda _: gateway.call("test", generate, "same prompt", coalesce=True), range(5))}
+    assert len(texts) == 1
+    assert generate.calls + gateway.stats()["coalesced"] == 5
+    assert generate.calls < 5
+
+
+def test_request_budget_rejects_with_retry_after(model):
+    gateway = LLMGateway(requests_per_minute=2, queue_timeout=0.1)
+    for i in range(2):
+        gateway.call("test", model.generate_content, f"prompt {i}")
+    with pytest.raises(GatewayBusy) as busy:
+        gateway.call("test", model.generate_content, "prompt 3")
+    assert busy.value.retry_after > 1
+    assert gateway.stats()["rejected"] == 1
+
+
+def test_token_budget_is_settled_from_usage(model):
+    gateway = LLMGateway(tokens_per_minute=2000, expected_output_tokens=1000)
+    response = gateway.call("test", model.generate_content, "prompt")
+    usage = StubUsage("prompt", response.text)
+    assert gateway.stats()["window_tokens"] == usage.prompt_token_count + usage.candidates_token_count
+    # With the estimate settled, the next call fits the budget at once
+    gateway.call("test", model.generate_content, "prompt 2")
+    assert gateway.stats()["queued"] == 0
+
+
+def test_queue_serves_interactive_calls_first(model):
+    gateway = LLMGateway(max_concurrency=1)
+    order = []
+    release = threading.Event()
+
+    def hold(prompt):
+        release.wait(5)
+
+    def record(prompt):
+        order.append(prompt)
+
+    holder = threading.Thread(target=gateway.call, args=("test", hold, "hold"))
+    holder.start()
+    waiting = [threading.Thread(target=gateway.call, args=("test", record, name), kwargs={"priority": priority})
+               for name, priority in (("background", BACKGROUND), ("interactive", INTERACTIVE))]
+    for thread in waiting:
+        thread.start()
+        time.sleep(0.05)
+    assert gateway.stats()["queued_now"] == 2
+    release.set()
+    for thread in [holder] + waiting:
+        thread.join()
+    assert order == ["interactive", "background"]
+
+
+def test_full_queue_rejects_at_once(model):
+    gateway = LLMGateway(max_concurrency=1, max_queue=0)
+    with gateway.slot("test", "first"):
+        with pytest.raises(GatewayBusy):
+            with gateway.slot("test", "second"):
+                pass
+
+
+def test_async_calls_share_slots_and_coalesce(model):
+    gateway = LLMGateway(max_concurrency=1)
+    generate = Counting(lambda prompt: None)
+
+    async def agenerate(prompt):
+        generate(prompt)
+        return await model.generate_content_async(prompt)
+
+    async def run():
+        same = [gateway.acall("test", agenerate, "same", coalesce=True) for _ in range(3)]
+        return await asyncio.gather(*same, gateway.acall("test", agenerate, "other"))
+
+    responses = asyncio.run(run())
+    assert len({response.text for response in responses[:3]}) == 1
+    assert generate.calls == 2
+    assert gateway.stats()["coalesced"] == 2
+
+
+def test_cancelled_async_caller_leaves_the_queue(model):
+    gateway = LLMGateway(max_concurrency=1)
+
+    async def run():
+        async with gateway.aslot("test", "first"):
+            waiter = asyncio.ensure_future(gateway.acall("test", model.generate_content_async, "second"))
+            await asyncio.sleep(0.05)
+            assert gateway.stats()["queued_now"] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        return gateway.stats()
+
+    assert asyncio.run(run())["queued_now"] == 0
+
+
+class SlowBudget(MemoryBudgetWindow):
+    """A budget window whose admissions wait for `opened`, recording the threads they ran on."""
+
+    def __init__(self):
+        super().__init__()
+        self.opened = threading.Event()
+        self.threads = []
+
+    def admit(self, tokens, requests_per_minute, tokens_per_minute):
+        self.threads.append(threading.get_ident())
+        self.opened.wait(5)
+        return super().admit(tokens, requests_per_minute, tokens_per_minute)
+
+
+def test_budget_is_reserved_outside_the_gateway_lock(model):
+    budget = SlowBudget()
+    gateway = LLMGateway(max_concurrency=2, budget=budget)
+    calls = [threading.Thread(target=gateway.call, args=("test", model.generate_content, f"prompt {i}"))
+             for i in range(2)]
+    for thread in calls:
+        thread.start()
+    time.sleep(0.05)
+    # Both reservations are under way at once, and the gateway still answers
+    started = time.monotonic()
+    assert gateway.stats()["running"] == 2
+    assert time.monotonic() - started < 1
+    assert len(budget.threads) == 2
+    budget.opened.set()
+    for thread in calls:
+        thread.join()
+    assert gateway.stats()["admitted"] == 2
+
+
+def test_async_budget_is_reserved_off_the_event_loop(model):
+    budget = SlowBudget()
+    gateway = LLMGateway(max_concurrency=1, budget=budget)
+
+    async def run():
+        ticks = 0
+        call = asyncio.ensure_future(gateway.acall("test", model.generate_content_async, "prompt"))
+        while not budget.threads:
+            await asyncio.sleep(0.01)
+        # The loop keeps running while the reservation waits
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        budget.opened.set()
+        await call
+        return ticks
+
+    assert asyncio.run(run()) == 5
+    assert threading.get_ident() not in budget.threads
+    assert gateway.stats()["running"] == 0
+
+
+@pytest.mark.parametrize('store', ['memory', 'sqlite'])
+def test_budget_window_expires_admissions(tmp_path, store):
+    window = (MemoryBudgetWindow(window_seconds=0.2) if store == 'memory'
+              else SQLiteBudgetWindow(str(tmp_path / 'budget.sqlite3'), window_seconds=0.2))
+    assert window.admit(100, 2, 0) is not None
+    entry = window.admit(100, 2, 0)
+    assert window.admit(100, 2, 0) is None
+    window.settle(entry, 40)
+    assert tuple(window.usage()) == (2, 140)
+    assert 0 < window.wait() <= 0.2
+    time.sleep(0.25)
+    assert tuple(window.usage()) == (0, 0)
+    assert window.admit(100, 2, 0) is not None
+
+
+def test_token_budget_admits_one_oversized_call(tmp_path):
+    window = SQLiteBudgetWindow(str(tmp_path / 'budget.sqlite3'))
+    assert window.admit(5000, 0, 1000) is not None
+    assert window.admit(1, 0, 1000) is None
+
+
+def test_sqlite_budget_is_shared_by_gateways(model, tmp_path):
+    path = str(tmp_path / 'budget.sqlite3')
+    first, second = (LLMGateway(requests_per_minute=3, queue_timeout=0.05, budget=SQLiteBudgetWindow(path))
+                     for _ in range(2))
+    for i in range(2):
+        first.call("test", model.generate_content, f"prompt {i}")
+    second.call("test", model.generate_content, "prompt 2")
+    with pytest.raises(GatewayBusy):
+        second.call("test", model.generate_content, "prompt 3")
+    with pytest.raises(GatewayBusy):
+        first.call("test", model.generate_content, "prompt 4")
+    assert second.stats()["window_requests"] == 3
+
+
+def _admit_all(path, calls, admitted):
+    # In a worker process: a gateway of its own on the shared file
+    gateway = LLMGateway(requests_per_minute=5, queue_timeout=0, budget=SQLiteBudgetWindow(path))
+    for i in range(calls):
+        try:
+            gateway.call("test", str, i)
+        except GatewayBusy:
+            continue
+        with admitted.get_lock():
+            admitted.value += 1
+
+
+def test_sqlite_budget_holds_across_processes(tmp_path):
+    path = str(tmp_path / 'budget.sqlite3')
+    SQLiteBudgetWindow(path)
+    context = multiprocessing.get_context('fork')
+    admitted = context.Value('i', 0)
+    workers = [context.Process(target=_admit_all, args=(path, 4, admitted)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+    assert [worker.exitcode for worker in workers] == [0, 0, 0]
+    assert admitted.value == 5
+
+
+def test_gateway_from_env_selects_the_budget_store(monkeypatch, tmp_path):
+    assert isinstance(gateway_from_env().budget, MemoryBudgetWindow)
+    monkeypatch.setenv("LLM_BUDGET_STORE", "sqlite")
+    monkeypatch.setenv("LLM_BUDGET_PATH", str(tmp_path / 'budget.sqlite3'))
+    gateway = gateway_from_env()
+    assert isinstance(gateway.budget, SQLiteBudgetWindow)
+    assert gateway.stats()["budget"] == "SQLiteBudgetWindow"
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+
+import aiohttp
+import pytest
+import requests
+
+from ml_client import AsyncMLBackendClient, CircuitBreaker, CircuitOpenError, MLBackendClient
+
+
+def make_client(url, threshold=5, **settings):
+    settings = dict(dict(read_timeout=0.3, retries=2, backoff=0.01), **settings)
+    return MLBackendClient(url, breaker=CircuitBreaker(failure_threshold=threshold, reset_timeout=0), **settings)
+
+
+def make_async_client(url, threshold=5, **settings):
+    settings = dict(dict(read_timeout=0.3, retries=2, backoff=0.01), **settings)
+    return AsyncMLBackendClient(url, breaker=CircuitBreaker(failure_threshold=threshold, reset_timeout=0),
+                                **settings)
+
+
+async def async_call(client, method, path, **kwargs):
+    try:
+        return await getattr(client, method)(path, **kwargs)
+    finally:
+        await client.close()
+
+
+# CircuitBreaker
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == "half-open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_released_trial_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    permit = breaker.allow()
+    assert permit
+    breaker.release_trial(permit)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+
+def test_only_the_trial_permit_releases_the_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    closed_permit = breaker.allow()
+    breaker.record_failure()
+    stale_trial = breaker.allow()
+    breaker.record_failure()
+    trial = breaker.allow()
+    assert trial and trial is not stale_trial
+    # A call made while the circuit was closed, or an earlier trial, cannot free this one
+    breaker.release_trial(closed_permit)
+    breaker.release_trial(stale_trial)
+    assert not breaker.allow()
+    breaker.release_trial(trial)
+    assert breaker.allow()
+
+
+# MLBackendClient
+
+def test_post_read_timeout_is_not_retried(scripted_backend):
+    scripted_backend.script = [(200, 1.0)]
+    client = make_client(scripted_backend.url)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.post("/predict", json={}, deadline=5)
+    assert len(scripted_backend.requests) == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_get_read_timeout_is_retried(scripted_backend):
+    scripted_backend.script = [(200, 1.0)]
+    client = make_client(scripted_backend.url)
+    assert client.get("/guidance/1", deadline=5).status_code == 200
+    assert len(scripted_backend.requests) == 2
+
+
+def test_post_is_retried_on_gateway_errors(scripted_backend, caplog):
+    scripted_backend.script = [(503, 0.0), (502, 0.0)]
+    client = make_client(scripted_backend.url)
+    with caplog.at_level(logging.WARNING, logger="ml_client"):
+        assert client.post("/predict", json={}).status_code == 200
+    assert client.stats()["retries"] == 2
+    assert [record.message.startswith("Retrying") for record in caplog.records] == [True, True]
+
+
+def test_post_is_retried_when_the_connection_fails(closed_port):
+    client = make_client(closed_port)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.post("/predict", json={}, deadline=5)
+    assert client.stats()["attempts"] == 3
+
+
+def test_server_error_counts_as_a_breaker_failure(scripted_backend):
+    scripted_backend.script = [(500, 0.0)]
+    client = make_client(scripted_backend.url, threshold=1)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.post("/predict", json={})
+    assert client.breaker.state == "open"
+    assert len(scripted_backend.requests) == 1
+
+
+def test_client_error_keeps_the_breaker_closed(scripted_backend):
+    scripted_backend.script = [(400, 0.0)]
+    client = make_client(scripted_backend.url, threshold=1)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.post("/predict", json={})
+    assert client.breaker.state == "closed"
+
+
+def test_open_breaker_rejects_without_calling(scripted_backend):
+    client = make_client(scripted_backend.url, threshold=1)
+    client.breaker.reset_timeout = 60
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        client.post("/predict", json={})
+    assert scripted_backend.requests == []
+
+
+def test_interrupted_trial_is_released(scripted_backend, monkeypatch):
+    client = make_client(scripted_backend.url, threshold=1)
+    client.breaker.record_failure()
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(client.session, "request", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        client.post("/predict", json={})
+    assert client.breaker.state == "half-open"
+    monkeypatch.undo()
+    # The next caller gets the trial and closes the circuit
+    assert client.post("/predict", json={}).status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_expired_deadline_does_not_take_the_trial(scripted_backend):
+    client = make_client(scripted_backend.url, threshold=1)
+    client.breaker.record_failure()
+    with pytest.raises(requests.exceptions.Timeout):
+        client.post("/predict", json={}, deadline=0)
+    assert scripted_backend.requests == []
+    assert client.post("/predict", json={}).status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_closed_call_ending_does_not_release_another_trial(scripted_backend, monkeypatch):
+    client = make_client(scripted_backend.url, threshold=1)
+    trials = []
+
+    def interrupted(*args, **kwargs):
+        # While this call is in flight the circuit opens and another caller takes the trial
+        client.breaker.record_failure()
+        trials.append(client.breaker.allow())
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(client.session, "request", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        client.post("/predict", json={})
+    assert trials[0] and client.breaker.state == "half-open"
+    assert not client.breaker.allow()
+
+
+# AsyncMLBackendClient
+
+def test_async_post_read_timeout_is_not_retried(scripted_backend):
+    scripted_backend.script = [(200, 1.0)]
+    client = make_async_client(scripted_backend.url)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(async_call(client, "post", "/predict", json={}, deadline=5))
+    assert len(scripted_backend.requests) == 1
+
+
+def test_async_get_read_timeout_is_retried(scripted_backend):
+    scripted_backend.script = [(200, 1.0)]
+    client = make_async_client(scripted_backend.url)
+    assert asyncio.run(async_call(client, "get", "/guidance/1", deadline=5)).status == 200
+    assert len(scripted_backend.requests) == 2
+
+
+def test_async_post_is_retried_on_gateway_errors(scripted_backend):
+    scripted_backend.script = [(504, 0.0)]
+    client = make_async_client(scripted_backend.url)
+    assert asyncio.run(async_call(client, "post", "/predict", json={})).status == 200
+    assert client.stats()["retries"] == 1
+
+
+def test_async_post_is_retried_when_the_connection_fails(closed_port):
+    client = make_async_client(closed_port)
+    with pytest.raises(aiohttp.ClientConnectorError):
+        asyncio.run(async_call(client, "post", "/predict", json={}, deadline=5))
+    assert client.stats()["attempts"] == 3
+
+
+def test_async_server_error_counts_as_a_breaker_failure(scripted_backend):
+    scripted_backend.script = [(500, 0.0)]
+    client = make_async_client(scripted_backend.url, threshold=1)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(async_call(client, "post", "/predict", json={}))
+    assert client.breaker.state == "open"
+
+
+def test_async_cancelled_trial_is_released(scripted_backend):
+    scripted_backend.script = [(200, 1.0)]
+    client = make_async_client(scripted_backend.url, threshold=1, read_timeout=5)
+    client.breaker.record_failure()
+
+    async def cancel_then_call():
+        task = asyncio.ensure_future(client.post("/predict", json={}))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert client.breaker.state == "half-open"
+        return await async_call(client, "post", "/predict", json={})
+
+    assert asyncio.run(cancel_then_call()).status == 200
+    assert client.breaker.state == "closed"
+
+
+def test_async_expired_deadline_does_not_take_the_trial(scripted_backend):
+    client = make_async_client(scripted_backend.url, threshold=1)
+    client.breaker.record_failure()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(async_call(client, "post", "/predict", json={}, deadline=0))
+    assert asyncio.run(async_call(client, "post", "/predict", json={})).status == 200
+    assert client.breaker.state == "closed"
+
+
+def test_async_cancelled_closed_call_does_not_release_another_trial(scripted_backend):
+    scripted_backend.script = [(200, 1.0)]
+    client = make_async_client(scripted_backend.url, threshold=1, read_timeout=5)
+
+    async def cancel_during_trial():
+        task = asyncio.ensure_future(client.post("/predict", json={}))
+        await asyncio.sleep(0.1)
+        client.breaker.record_failure()
+        trial = client.breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.close()
+        return trial
+
+    assert asyncio.run(cancel_during_trial())
+    assert client.breaker.state == "half-open"
+    assert not client.breaker.allow()
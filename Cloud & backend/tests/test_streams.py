@@ -0,0 +1,200 @@
+import json
+from random import Random
+
+import pytest
+
+from _common import STUB_FALLBACK, STUB_ML_RESULT, random_questionnaire
+from career_common.llm_gateway import GatewayBusy
+from career_common.metrics import FALLBACKS
+
+CAREER_DETAILS = {"primaryCareer": "Data Scientist", "alternativePaths": ["Analyst"], "keySkills": ["SQL"]}
+
+
+def parse_events(body):
+    """(event, data) pairs of a text/event-stream body with JSON data."""
+    events = []
+    for block in body.split("\n\n"):
+        if block:
+            fields = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def sse_lines(events):
+    for event, data in events:
+        yield f"event: {event}"
+        yield f"data: {json.dumps(data)}"
+        yield ""
+
+
+class FakeStreamResponse:
+    """The ML backend's streamed response: iter_lines over canned events."""
+
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        return sse_lines(self.events)
+
+    def close(self):
+        self.closed = True
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModel:
+    """Gemini with streamed replies cut from `text`, or a failure raised before any chunk."""
+    text = json.dumps(CAREER_DETAILS)
+    error = None
+    histories = []
+
+    def __init__(self, model_name):
+        pass
+
+    def generate_content(self, prompt, stream=False):
+        return self._stream()
+
+    def start_chat(self, history=None):
+        FakeModel.histories.append(list(history or []))
+        return self
+
+    def send_message(self, content, stream=False):
+        return self._stream()
+
+    def _stream(self):
+        if self.error is not None:
+            raise self.error
+        for start in range(0, len(self.text), 16):
+            yield Chunk(self.text[start:start + 16])
+
+
+@pytest.fixture
+def model(orchestrator, monkeypatch):
+    monkeypatch.setattr(orchestrator, 'GenerativeModel', FakeModel)
+    monkeypatch.setattr(FakeModel, 'histories', [])
+    return FakeModel
+
+
+@pytest.fixture
+def ml_stream(orchestrator, monkeypatch):
+    """Replaces the ML backend's stream with canned events; `paths` records what was called."""
+    cluster = dict(STUB_ML_RESULT, guidance=None, fallback=STUB_FALLBACK)
+    backend = {"events": [("cluster", cluster), ("guidance", "## Report\n"), ("guidance", "Part 1."),
+                          ("done", {"cached": False})],
+               "paths": [], "responses": []}
+
+    def post(path, json=None, stream=False, headers=None, deadline=None):
+        response = FakeStreamResponse(backend["events"])
+        backend["paths"].append(path)
+        backend["responses"].append(response)
+        return response
+
+    monkeypatch.setattr(orchestrator.ml_client, 'post', post)
+    return backend
+
+
+@pytest.fixture
+def client(orchestrator):
+    return orchestrator.app.test_client()
+
+
+@pytest.fixture
+def questionnaire():
+    return random_questionnaire(Random(0))
+
+
+def assess_stream(client, questionnaire):
+    response = client.post('/assess/stream', json=questionnaire)
+    assert response.mimetype == 'text/event-stream'
+    return parse_events(response.get_data(as_text=True))
+
+
+def test_assess_stream_event_order(client, ml_stream, model, questionnaire):
+    events = assess_stream(client, questionnaire)
+    names = [event for event, _ in events]
+    chunks = names.count("career_details_chunk")
+    assert names == ["cluster", "guidance", "guidance"] + ["career_details_chunk"] * chunks + [
+        "career_details", "done"]
+    assert chunks > 1
+    assert "fallback" not in events[0][1]
+    assert "".join(data for event, data in events if event == "career_details_chunk") == model.text
+    assert events[-2][1] == CAREER_DETAILS
+    assert ml_stream["paths"] == ["/predict_from_questionnaire/stream?fallback=true"]
+    assert ml_stream["responses"][0].closed
+
+    stored = client.get(f'/assessment/{events[-1][1]["assessment_id"]}').get_json()
+    assert stored["ml_results"]["guidance"] == "## Report\nPart 1."
+    assert stored["career_details"] == CAREER_DETAILS
+
+
+def test_assess_stream_serves_the_fallback_when_busy(client, ml_stream, model, questionnaire, monkeypatch):
+    monkeypatch.setattr(model, 'error', GatewayBusy("queue full", retry_after=2))
+    before = FALLBACKS.value(operation="assess", reason="busy")
+
+    events = assess_stream(client, questionnaire)
+    assert [event for event, _ in events] == ["cluster", "guidance", "guidance", "career_details", "done"]
+    assert events[-2][1] == STUB_FALLBACK["career_details"]
+    assert FALLBACKS.value(operation="assess", reason="busy") == before + 1
+    stored = client.get(f'/assessment/{events[-1][1]["assessment_id"]}').get_json()
+    assert stored["ml_results"]["fallback"] == ["career_details"]
+
+
+def test_assess_stream_without_a_fallback_reports_busy(client, ml_stream, model, questionnaire, monkeypatch,
+                                                      orchestrator):
+    ml_stream["events"][0][1].pop("fallback")
+    monkeypatch.setattr(model, 'error', GatewayBusy("queue full", retry_after=2))
+    events = assess_stream(client, questionnaire)
+    assert events[-1] == ("error", {"error": orchestrator.BUSY_MESSAGE, "retry_after": 2})
+
+
+@pytest.mark.parametrize('text, message', [
+    ('{"primaryCareer": ', "Failed to parse career details JSON from model output"),
+    (None, "An internal error occurred during assessment."),
+])
+def test_assess_stream_failures_are_error_events(client, ml_stream, model, questionnaire, monkeypatch,
+                                                 text, message):
+    if text is None:
+        monkeypatch.setattr(model, 'error', RuntimeError("stream dropped"))
+    else:
+        monkeypatch.setattr(model, 'text', text)
+    events = assess_stream(client, questionnaire)
+    assert events[-1] == ("error", {"error": message})
+    assert "career_details" not in [event for event, _ in events]
+
+
+def test_assess_stream_needs_a_cluster(client, ml_stream, model, questionnaire):
+    ml_stream["events"] = [("error", {"error": "Model not loaded"})]
+    events = assess_stream(client, questionnaire)
+    assert events == [("error", {"error": "Model not loaded"}),
+                      ("error", {"error": "ML backend did not return a cluster"})]
+
+
+def test_chat_stream_sends_chunks_then_the_reply(client, model, monkeypatch):
+    monkeypatch.setattr(model, 'text', "Consider data science. It suits your maths scores.")
+    body = {"user_query": "What should I study?",
+            "assessment_data": {"career_details": CAREER_DETAILS, "responses": {}}}
+    events = parse_events(client.post('/chat/stream', json=body).get_data(as_text=True))
+    assert [event for event, _ in events[:-1]] == ["chunk"] * len(events[:-1])
+    done = events[-1]
+    assert done[0] == "done"
+    assert "".join(data for _, data in events[:-1]) == done[1]["response"] == model.text
+    assert done[1]["chat_history"][-1] == {"role": "assistant", "content": model.text}
+
+    # The next turn continues the server-side session with the first one in its history
+    events = parse_events(client.post('/chat/stream', json={
+        "user_query": "And after that?", "session_id": done[1]["session_id"]}).get_data(as_text=True))
+    assert events[-1][1]["session_id"] == done[1]["session_id"]
+    assert "chat_history" not in events[-1][1]
+    assert len(model.histories[1]) == len(model.histories[0]) + 2
+
+
+def test_chat_stream_failure_is_an_error_event(client, model, monkeypatch):
+    monkeypatch.setattr(model, 'error', RuntimeError("stream dropped"))
+    body = {"user_query": "Hi", "assessment_data": {"career_details": CAREER_DETAILS, "responses": {}}}
+    events = parse_events(client.post('/chat/stream', json=body).get_data(as_text=True))
+    assert events == [("error", {"error": "An internal error occurred during chat."})]
@@ -0,0 +1,251 @@
+"""
+Single-file artifact bundle for fast service startup.
+
+`python artifact_bundle.py` packs career_model.pkl, clusters_meta.json,
+mapping.csv and the model column order into model_bundle.pkl after
+validating that they fit together. The bundle holds only plain Python
+objects and NumPy arrays: the fitted scikit-learn estimators are exported
+with numpy_model, so loading it needs neither scikit-learn, pandas nor a CSV
+or JSON parse. It records the SHA-256 of each source file, and the loader
+ignores a bundle whose sources have changed since it was built.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import pickle
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+from numpy_model import ExportError, compare_models, export_model, is_exported, load_model
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE_FORMAT = 2
+DEFAULT_BUNDLE = 'model_bundle.pkl'
+SOURCES = {
+    'model': 'career_model.pkl',
+    'clusters_meta': 'clusters_meta.json',
+    'mapping': 'mapping.csv',
+}
+MAPPING_FIELDS = ('column', 'original_value', 'encoded_value')
+# Model entries the service reads; the rest of the training dict is dropped
+SERVING_MODEL_KEYS = ('scaler', 'career_feature_columns')
+# Generated feature rows the exported model must reproduce exactly
+EXPORT_CHECK_ROWS = 5000
+
+# Used when the model does not record its own input columns
+DEFAULT_MODEL_COLUMNS = [
+    'age', 'grade', 'parental_interest_level', 'psychometric_aptitude_verbal',
+    'psychometric_aptitude_quantitative', 'exploration_work_score', 'creativity_score',
+    'expected_salary', 'teamwork_score', 'psychometric_test_score', 'academic_average',
+    'academic_max', 'academic_min', 'academic_std', 'academic_subjects_count',
+    'hobby_count', 'has_creative_hobby', 'has_technical_hobby', 'has_sports_hobby',
+    'stream_Arts', 'stream_Commerce', 'stream_Science', 'family_income_band_High',
+    'family_income_band_Low', 'family_income_band_Lower-Middle', 'family_income_band_Middle',
+    'family_income_band_Upper-Middle', 'parental_expectation_field_Arts',
+    'parental_expectation_field_Commerce', 'parental_expectation_field_Engineering',
+    'parental_expectation_field_Law', 'parental_expectation_field_Medicine',
+    'parental_expectation_field_Science', 'parental_expectation_field_Technology',
+    'psychometric_test_given_No', 'psychometric_test_given_Yes', 'interest_Arts',
+    'interest_Commerce', 'interest_Engineering', 'interest_Law', 'interest_Medicine',
+    'interest_Science', 'interest_Technology', 'comfortable_outside_india_No',
+    'comfortable_outside_india_Yes', 'job_seeking_preference_Hybrid',
+    'job_seeking_preference_On-site', 'job_seeking_preference_Remote',
+    'disability_status_Hearing', 'disability_status_Learning', 'disability_status_Physical',
+    'disability_status_Unknown', 'disability_status_Visual'
+]
+
+
+class BundleError(Exception):
+    """The bundle or its source artifacts are missing, stale or inconsistent."""
+
+
+def source_path(name, base_dir=BASE_DIR):
+    return os.path.join(base_dir, SOURCES[name])
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_mapping(path):
+    """mapping.csv as a dict of column lists, with integer encoded values."""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    if not rows or any(field not in rows[0] for field in MAPPING_FIELDS):
+        raise BundleError(f"{path} must have the columns {', '.join(MAPPING_FIELDS)}")
+    return {
+        'column': [row['column'] for row in rows],
+        'original_value': [row['original_value'] for row in rows],
+        'encoded_value': [int(row['encoded_value']) for row in rows],
+    }
+
+
+def model_columns_of(model):
+    if hasattr(model, 'feature_names_in_'):
+        return [str(column) for column in model.feature_names_in_]
+    return list(DEFAULT_MODEL_COLUMNS)
+
+
+def serving_model(model):
+    """The parts of the trained model the service uses."""
+    if isinstance(model, dict):
+        return {key: model[key] for key in SERVING_MODEL_KEYS if key in model}
+    return model
+
+
+def load_sources(base_dir=BASE_DIR):
+    """Read the individual artifact files into bundle contents."""
+    import joblib
+
+    model = joblib.load(source_path('model', base_dir))
+    with open(source_path('clusters_meta', base_dir), 'r') as f:
+        clusters_meta = json.load(f)
+    return {
+        'model': serving_model(model),
+        'clusters_meta': clusters_meta,
+        'mapping': read_mapping(source_path('mapping', base_dir)),
+        'model_columns': model_columns_of(model),
+    }
+
+
+def validate(contents):
+    """Raise BundleError unless the model, clusters, mapping and columns agree."""
+    from cluster_table import ClusterTable
+    from preprocessing import FeatureEncoder, build_score_maps, calculate_scores
+
+    columns = contents['model_columns']
+    if not columns or len(set(columns)) != len(columns):
+        raise BundleError("model_columns must be a non-empty list of unique names")
+
+    mapping = contents['mapping']
+    if len({len(mapping[field]) for field in MAPPING_FIELDS}) != 1:
+        raise BundleError("mapping columns have different lengths")
+
+    clusters_meta = contents['clusters_meta']
+    if not clusters_meta:
+        raise BundleError("clusters_meta is empty")
+    centroid_keys = {tuple(info.get('centroid', {})) for info in clusters_meta.values()}
+    if len(centroid_keys) != 1:
+        raise BundleError("clusters do not share the same centroid dimensions")
+
+    model = contents['model']
+    if isinstance(model, dict):
+        scaler = model.get('scaler')
+        career_columns = model.get('career_feature_columns')
+        if scaler is not None and career_columns is not None:
+            if len(scaler.mean_) != len(career_columns):
+                raise BundleError("scaler and career_feature_columns have different lengths")
+    elif not hasattr(model, 'predict'):
+        raise BundleError(f"Unsupported model object {type(model).__name__}")
+
+    # Smoke test: a blank questionnaire encodes to one finite row
+    ClusterTable(clusters_meta)
+    encoder = FeatureEncoder(columns, mapping)
+    row = encoder.encode(calculate_scores({}, mapping, build_score_maps(mapping)))
+    if row.shape != (1, len(columns)) or not np.isfinite(row).all():
+        raise BundleError("FeatureEncoder produced an invalid row for an empty questionnaire")
+
+
+def export_checked(model, n_columns, rows=EXPORT_CHECK_ROWS):
+    """
+    Return (model, format): the NumPy export of `model` if it matches the
+    original on generated rows, otherwise the original, which then needs
+    scikit-learn to load.
+    """
+    try:
+        exported = export_model(model)
+    except ExportError as e:
+        print(f"Keeping the pickled model: {e}")
+        return model, 'pickle'
+    rng = np.random.default_rng(0)
+    features = np.vstack([rng.normal(size=(rows, n_columns)) * 3,
+                          rng.integers(0, 2, size=(rows, n_columns)).astype(np.float64)])
+    mismatches = compare_models(model, load_model(exported), features)
+    if mismatches:
+        print(f"Keeping the pickled model: the NumPy export differs in {', '.join(mismatches)}")
+        return model, 'pickle'
+    return exported, 'numpy'
+
+
+def source_version(base_dir=BASE_DIR):
+    """
+    (digests, version) of the source files in `base_dir`. The version is a
+    hash of all the digests, so the same files give the same version whether
+    they are served from a bundle or read directly.
+    """
+    digests = {name: file_digest(source_path(name, base_dir)) for name in SOURCES}
+    version = hashlib.sha256(''.join(digests[name] for name in sorted(digests)).encode()).hexdigest()[:16]
+    return digests, version
+
+
+def build_bundle(output=None, base_dir=BASE_DIR):
+    """Validate the source artifacts and write them as one bundle. Returns its header."""
+    output = output or os.path.join(base_dir, DEFAULT_BUNDLE)
+    contents = load_sources(base_dir)
+    validate(contents)
+    contents['model'], model_format = export_checked(contents['model'], len(contents['model_columns']))
+
+    digests, version = source_version(base_dir)
+    header = {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'built_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'sources': digests,
+        'model_format': model_format,
+    }
+    payload = pickle.dumps({**contents, 'header': header}, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Per-process name, so workers rebuilding the same bundle do not share a temp file
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, output)
+    return header
+
+
+def load_bundle(path, base_dir=BASE_DIR, check_sources=True):
+    """
+    Load a bundle written by build_bundle. Raises BundleError if it is from
+    another format or, with check_sources, if a source file it was built from
+    has changed since.
+    """
+    if not os.path.exists(path):
+        raise BundleError(f"{path} not found; run `python artifact_bundle.py` to build it")
+    with open(path, 'rb') as f:
+        contents = pickle.load(f)
+
+    header = contents.get('header', {}) if isinstance(contents, dict) else {}
+    if header.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f"{path} has bundle format {header.get('format')}, expected {BUNDLE_FORMAT}")
+    if check_sources:
+        for name, digest in header['sources'].items():
+            source = source_path(name, base_dir)
+            if os.path.exists(source) and file_digest(source) != digest:
+                raise BundleError(f"{SOURCES[name]} changed since {path} was built")
+    if is_exported(contents['model']):
+        contents['model'] = load_model(contents['model'])
+    return contents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--artifact-dir', default=BASE_DIR, help="directory with the source artifacts")
+    parser.add_argument('--output', help="bundle path (default: model_bundle.pkl in the artifact directory)")
+    args = parser.parse_args()
+    args.output = args.output or os.path.join(args.artifact_dir, DEFAULT_BUNDLE)
+    try:
+        header = build_bundle(args.output, args.artifact_dir)
+    except BundleError as e:
+        print(f"Invalid artifacts: {e}")
+        return 1
+    print(f"Wrote {args.output} (version {header['version']}, {header['model_format']} model)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,438 @@
+"""
+Offline bulk scoring of questionnaire exports, and the chunk scorer behind
+/predict_batch.
+
+    python batch_score.py INPUT OUTPUT [--workers N] [--chunk-size 1000] [--top-k 3]
+                          [--skip-llm] [--resume] [--checkpoint OUTPUT.checkpoint]
+
+INPUT is JSONL with one questionnaire per line, as posted to
+/predict_from_questionnaire, or CSV with one column per question ID (`1` to
+`22`). In CSV, the list answers (`4` and `5`) separate their options with `;`
+or hold a JSON array, and blank cells count as unanswered. Either format may
+be gzipped. OUTPUT gets one NDJSON line per input row, in input order, in the
+/predict_batch format: `index`, the cluster fields, `top_clusters` and, when
+the row has one, its `id`. Unless --skip-llm is given, each line also carries
+the row's `guidance` report and a `guidance_status`.
+
+The input is read in chunks of --chunk-size rows. Each chunk goes to a pool
+of --workers processes, and each worker scores it with one model call, as
+/predict_batch does. At most two chunks per worker are in flight, so memory
+use does not depend on the size of the input. The checkpoint file records the
+rows written and the output's length. It is rewritten every
+--checkpoint-interval seconds, after the output has been flushed to disk.
+--resume truncates the output to that length and continues after those rows.
+"""
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from gemini_utils import GUIDANCE_ERROR_MESSAGE, PROMPT_VERSION, generate_guidance
+from guidance_cache import cache_from_env
+from inference import predict_labels
+from career_common.llm_gateway import BACKGROUND, GatewayBusy
+from career_common.metrics import span
+from model_loader import load_artifact_contents
+from model_registry import build_version
+from preprocessing import calculate_scores, calculate_scores_batch
+
+FORMATS = ('jsonl', 'csv')
+# Questions answered with a list of options
+LIST_QUESTIONS = ('4', '5')
+# Ranked clusters per row when --top-k is not given and the centroids are usable
+DEFAULT_TOP_K = 3
+# Checkpoint fields that must match for --resume to continue a run
+RESUME_FIELDS = ('input', 'format', 'model_version', 'top_k', 'guidance', 'id_field')
+# Times a report is retried after the LLM gateway did not admit it
+GUIDANCE_RETRIES = 3
+
+
+class CheckpointError(Exception):
+    """The checkpoint does not match this run or its output file."""
+
+
+def batch_result_json(index, record, error, top_clusters=None):
+    """Serializes one /predict_batch result: the cluster summary or the row's error."""
+    if record is None:
+        return json.dumps({"index": index, "error": error})
+    if top_clusters is not None:
+        return f'{{"index": {index}, ' + record.response_json(top_clusters=top_clusters)[1:]
+    return f'{{"index": {index}, ' + record.summary_json[1:]
+
+
+def score_questionnaires(active, answers_list, offset=0, top_k=0):
+    """
+    Scores a chunk of questionnaires with a single model.predict call (and,
+    with top_k, a single centroid distance computation), after computing
+    their scores and features a column at a time. Returns one
+    (index, cluster record, error, top_clusters) tuple per input, where index
+    is its position in the batch and record is None for rows that failed.
+    """
+    results = [None] * len(answers_list)
+    for i, answers in enumerate(answers_list):
+        if isinstance(answers, Exception):
+            results[i] = (offset + i, None, str(answers), None)
+        elif not isinstance(answers, dict):
+            results[i] = (offset + i, None, "Questionnaire must be a JSON object", None)
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    with span("batch_calculate_scores"):
+        scores, errors = calculate_scores_batch([answers_list[i] for i in pending], active.mapping,
+                                                active.score_maps)
+    with span("batch_encode"):
+        features = active.encoder.encode_columns(scores, len(pending))
+    encoded = []
+    for i, error in zip(pending, errors):
+        if error is not None:
+            results[i] = (offset + i, None, str(error), None)
+        else:
+            encoded.append(i)
+
+    if encoded:
+        ok_rows = [error is None for error in errors]
+        with span("batch_predict"):
+            labels = predict_labels(active.model, features[ok_rows], active.encoder)
+        rankings = [None] * len(encoded)
+        if top_k:
+            with span("batch_top_k"):
+                rankings = active.centroid_scorer.rank(features[ok_rows], top_k, labels)
+        for i, label, ranking in zip(encoded, labels, rankings):
+            try:
+                results[i] = (offset + i, active.clusters_meta[label], None, ranking)
+            except Exception as e:
+                results[i] = (offset + i, None, f"Cluster lookup failed: {e}", None)
+
+    return results
+
+
+def csv_questionnaire(header, row):
+    """The questionnaire of one CSV row; blank cells are left out."""
+    answers = {}
+    for column, cell in zip(header, row):
+        cell = cell.strip()
+        if not cell:
+            continue
+        if column in LIST_QUESTIONS:
+            if cell.startswith('['):
+                answers[column] = json.loads(cell)
+            else:
+                answers[column] = [option.strip() for option in cell.split(';') if option.strip()]
+        else:
+            answers[column] = cell
+    return answers
+
+
+def input_format(path):
+    """'csv' for a .csv or .csv.gz file, otherwise 'jsonl'."""
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.lower().endswith('.csv') else 'jsonl'
+
+
+def open_input(path, fmt):
+    opener = gzip.open if path.endswith('.gz') else open
+    return opener(path, 'rt', encoding='utf-8', newline='' if fmt == 'csv' else None)
+
+
+def read_rows(f, fmt):
+    """
+    (CSV header or None, iterator of raw rows) of an open input file: JSONL
+    lines that are not blank, or CSV rows as lists of cells.
+    """
+    if fmt == 'csv':
+        reader = csv.reader(f)
+        header = [column.strip() for column in next(reader, [])]
+        return header, (row for row in reader if row)
+    return None, (line for line in f if line.strip())
+
+
+def chunked(rows, chunk_size, offset=0):
+    """(offset, rows) chunks of at most `chunk_size` rows."""
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield offset, chunk
+        offset += len(chunk)
+
+
+class ChunkScorer:
+    """
+    Turns chunks of raw input rows into NDJSON output. One is built per
+    process; reports are generated on a small thread pool, since each one
+    mostly waits on Gemini.
+    """
+
+    def __init__(self, active, fmt, header=None, top_k=0, guidance=False, id_field='id',
+                 llm_concurrency=16):
+        self.active = active
+        self.format = fmt
+        self.header = header
+        self.top_k = top_k
+        self.guidance = guidance
+        self.id_field = id_field
+        self.llm_concurrency = llm_concurrency
+        self.cache = cache_from_env(PROMPT_VERSION) if guidance else None
+        self._llm_pool = None
+
+    def parse(self, raw):
+        """The questionnaire of one raw row, or the ValueError it raised."""
+        try:
+            if self.format == 'csv':
+                return csv_questionnaire(self.header, raw)
+            return json.loads(raw)
+        except ValueError as e:
+            return ValueError(f"Invalid JSON: {e}")
+
+    def score(self, offset, raw_rows):
+        """Returns (NDJSON text, row count, error count) for one chunk."""
+        answers_list = [self.parse(raw) for raw in raw_rows]
+        results = score_questionnaires(self.active, answers_list, offset, self.top_k)
+        extras = [{} for _ in results]
+        for answers, extra in zip(answers_list, extras):
+            if isinstance(answers, dict) and self.id_field in answers:
+                extra['id'] = answers[self.id_field]
+        if self.guidance:
+            scored = [i for i, result in enumerate(results) if result[1] is not None]
+            if self._llm_pool is None:
+                self._llm_pool = ThreadPoolExecutor(max_workers=self.llm_concurrency)
+            reports = self._llm_pool.map(self.report, [results[i][1] for i in scored],
+                                         [answers_list[i] for i in scored])
+            for i, (report, status) in zip(scored, reports):
+                extras[i].update(guidance=report, guidance_status=status)
+
+        lines, errors = [], 0
+        for result, extra in zip(results, extras):
+            line = batch_result_json(*result)
+            if extra:
+                line = line[:-1] + ", " + json.dumps(extra)[1:]
+            lines.append(line + "\n")
+            errors += result[1] is None
+        return "".join(lines), len(results), errors
+
+    def report(self, record, answers):
+        """(guidance, guidance_status) of one scored row, from the cache or Gemini."""
+        scores = calculate_scores(answers, self.active.mapping, self.active.score_maps)
+        student_profile = self.active.profile_encoder.encode(scores)
+        for attempt in range(GUIDANCE_RETRIES + 1):
+            try:
+                if self.cache is None:
+                    return generate_guidance(record.info, student_profile, BACKGROUND), "done"
+                return self.cache.get_or_generate(record.cache_key, scores, generate_guidance,
+                                                  record.info, student_profile, BACKGROUND), "done"
+            except GatewayBusy as e:
+                if attempt == GUIDANCE_RETRIES:
+                    print(f"Guidance not generated: {e}")
+                    return GUIDANCE_ERROR_MESSAGE, "rejected"
+                time.sleep(e.retry_after)
+            except Exception as e:
+                print(f"Error generating guidance: {e}")
+                return GUIDANCE_ERROR_MESSAGE, "failed"
+
+
+# The scorer of this process. Forked workers inherit the parent's, spawned ones build their own.
+_scorer = None
+
+
+def _init_worker(scorer_options):
+    global _scorer
+    if _scorer is None:
+        _scorer = ChunkScorer(load_version(), **scorer_options)
+
+
+def _score_chunk(chunk):
+    return _scorer.score(*chunk)
+
+
+def _in_order(pool, chunks, depth):
+    """Score `chunks` on `pool` with at most `depth` in flight, yielding results in input order."""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(_score_chunk, chunk))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def load_version():
+    """The ModelVersion the service would load, from MODEL_ARTIFACT_DIR and ARTIFACT_BUNDLE."""
+    return build_version(load_artifact_contents(),
+                         temperature=float(os.getenv("CENTROID_TEMPERATURE", "1.0")))
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise CheckpointError(f"{path} is not a checkpoint: {e}")
+
+
+def write_checkpoint(path, state):
+    """Replace the checkpoint in one rename, so a crash leaves the old one or the new one."""
+    state = dict(state, updated=datetime.now(timezone.utc).isoformat(timespec='seconds'))
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(path + '.tmp', path)
+
+
+def _open_output(output_path, checkpoint):
+    """The output file, truncated to the checkpoint's length when resuming."""
+    if checkpoint is None:
+        return open(output_path, 'wb')
+    try:
+        out = open(output_path, 'r+b')
+    except FileNotFoundError:
+        raise CheckpointError(f"{output_path} is missing; rerun without --resume")
+    size = out.seek(0, os.SEEK_END)
+    if size < checkpoint['output_bytes']:
+        out.close()
+        raise CheckpointError(f"{output_path} is shorter ({size} bytes) than its checkpoint "
+                              f"({checkpoint['output_bytes']} bytes); rerun without --resume")
+    out.truncate(checkpoint['output_bytes'])
+    out.seek(checkpoint['output_bytes'])
+    return out
+
+
+def score_file(active, input_path, output_path, fmt=None, workers=1, chunk_size=1000, top_k=0,
+               guidance=False, id_field='id', checkpoint_path=None, resume=False,
+               checkpoint_interval=10.0, llm_concurrency=16):
+    """
+    Score `input_path` into `output_path` and return the run's stats. With
+    workers=0 the chunks are scored in this process. Raises CheckpointError
+    when --resume cannot continue.
+    """
+    global _scorer
+    fmt = fmt or input_format(input_path)
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint'
+    state = {
+        "input": os.path.abspath(input_path),
+        "format": fmt,
+        "model_version": active.version,
+        "top_k": top_k,
+        "guidance": guidance,
+        "id_field": id_field,
+        "rows": 0,
+        "errors": 0,
+        "output_bytes": 0,
+        "complete": False,
+    }
+    checkpoint = read_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        changed = [field for field in RESUME_FIELDS if checkpoint.get(field) != state[field]]
+        if changed:
+            raise CheckpointError(f"{checkpoint_path} was written with a different {', '.join(changed)}; "
+                                  f"rerun without --resume")
+        state.update(rows=checkpoint['rows'], errors=checkpoint['errors'],
+                     output_bytes=checkpoint['output_bytes'], complete=checkpoint['complete'])
+    resumed_from = state['rows']
+    stats = {"rows": 0, "errors": 0, "resumed_from": resumed_from, "elapsed_s": 0.0, "rows_per_s": 0.0}
+    if state['complete']:
+        print(f"{checkpoint_path}: already complete ({state['rows']} rows)")
+        return stats
+
+    start = last_checkpoint = time.perf_counter()
+    with open_input(input_path, fmt) as f, _open_output(output_path, checkpoint) as out:
+        header, rows = read_rows(f, fmt)
+        scorer_options = {"fmt": fmt, "header": header, "top_k": top_k, "guidance": guidance,
+                          "id_field": id_field, "llm_concurrency": llm_concurrency}
+        _scorer = ChunkScorer(active, **scorer_options)
+        chunks = chunked(itertools.islice(rows, resumed_from, None), chunk_size, resumed_from)
+        pool = None
+        try:
+            if workers:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(scorer_options,))
+                results = _in_order(pool, chunks, 2 * workers)
+            else:
+                results = (_score_chunk(chunk) for chunk in chunks)
+            for text, count, errors in results:
+                out.write(text.encode('utf-8'))
+                state['rows'] += count
+                state['errors'] += errors
+                now = time.perf_counter()
+                if now - last_checkpoint >= checkpoint_interval:
+                    _save(out, checkpoint_path, state)
+                    last_checkpoint = now
+                    scored = state['rows'] - resumed_from
+                    print(f"{state['rows']} rows, {scored / (now - start):.0f} rows/s")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        state['complete'] = True
+        _save(out, checkpoint_path, state)
+
+    elapsed = time.perf_counter() - start
+    stats.update(rows=state['rows'] - resumed_from, errors=state['errors'], elapsed_s=elapsed,
+                 rows_per_s=(state['rows'] - resumed_from) / elapsed if elapsed else 0.0)
+    return stats
+
+
+def _save(out, checkpoint_path, state):
+    """Flush the output to disk, then record how much of it is complete."""
+    out.flush()
+    os.fsync(out.fileno())
+    state['output_bytes'] = out.tell()
+    write_checkpoint(checkpoint_path, state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help="JSONL or CSV questionnaires, optionally gzipped")
+    parser.add_argument('output', help="NDJSON results, one line per input row")
+    parser.add_argument('--format', choices=FORMATS, help="input format (default: from the file name)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="scoring processes; 0 scores in this process (default: one per core)")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="rows per model call")
+    parser.add_argument('--top-k', type=int,
+                        help=f"ranked clusters per row, 0 for none (default: {DEFAULT_TOP_K})")
+    parser.add_argument('--skip-llm', action='store_true', help="score only, without guidance reports")
+    parser.add_argument('--llm-concurrency', type=int, default=16,
+                        help="reports generated at once per worker; set LLM_BUDGET_STORE=sqlite to share budgets")
+    parser.add_argument('--id-field', default='id', help="input field copied to the output as `id`")
+    parser.add_argument('--checkpoint', help="checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument('--checkpoint-interval', type=float, default=10.0, help="seconds between checkpoints")
+    parser.add_argument('--resume', action='store_true', help="continue from the checkpoint")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.workers < 0:
+        parser.error("--workers must not be negative")
+
+    active = load_version()
+    if args.top_k is None:
+        top_k = DEFAULT_TOP_K if active.centroid_scorer is not None else 0
+    elif args.top_k and active.centroid_scorer is None:
+        print("--top-k is unavailable: cluster centroids could not be loaded")
+        return 1
+    else:
+        top_k = max(args.top_k, 0)
+    top_k = min(top_k, len(active.clusters_meta))
+
+    try:
+        stats = score_file(active, args.input, args.output, fmt=args.format, workers=args.workers,
+                           chunk_size=args.chunk_size, top_k=top_k, guidance=not args.skip_llm,
+                           id_field=args.id_field, checkpoint_path=args.checkpoint, resume=args.resume,
+                           checkpoint_interval=args.checkpoint_interval,
+                           llm_concurrency=args.llm_concurrency)
+    except (CheckpointError, OSError) as e:
+        print(f"Batch scoring failed: {e}")
+        return 1
+    resumed = f", resumed after row {stats['resumed_from']}" if stats['resumed_from'] else ""
+    print(f"Scored {stats['rows']} rows ({stats['errors']} errors in total{resumed}) in "
+          f"{stats['elapsed_s']:.1f}s: {stats['rows_per_s']:.0f} rows/s with {args.workers} worker(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Shared helpers for the ml_backend benchmark scripts."""
+import os
+import random
+import sys
+import time
+
+# The service modules load their artifacts from relative paths, so benchmarks
+# run from the ml_backend directory with it on the import path.
+ML_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ML_BACKEND_DIR)
+os.chdir(ML_BACKEND_DIR)
+
+GRADES = ['10th', '12th', 'Below 10']
+STREAMS = ['Arts', 'Commerce', 'Science', 'Unknown']
+INCOME_BANDS = ['High', 'Low', 'Lower-Middle', 'Middle', 'Upper-Middle']
+FIELDS = ['Arts', 'Commerce', 'Engineering', 'Law', 'Medicine', 'Science', 'Technology']
+WORK_ARRANGEMENTS = ['Hybrid', 'On-site', 'Remote']
+DISABILITIES = ['Hearing', 'Learning', 'Physical', 'Unknown', 'Visual']
+HOBBIES = ['Creative Hobbies', 'Technical Hobbies', 'Sports']
+
+
+def _maybe(rng, value, missing_rate):
+    """Return `value`, or a blank answer `missing_rate` of the time."""
+    if rng.random() < missing_rate:
+        return rng.choice([None, '', 'n/a'])
+    return value
+
+
+def random_answers(rng, missing_rate=0.05):
+    """A questionnaire payload as posted to /predict_from_questionnaire."""
+    return {
+        '1': _maybe(rng, rng.randint(13, 19), missing_rate),
+        '2': _maybe(rng, rng.choice(GRADES), missing_rate),
+        '3': _maybe(rng, rng.choice(STREAMS), missing_rate),
+        '4': rng.sample(DISABILITIES, rng.randint(0, 1)),
+        '5': rng.sample(HOBBIES, rng.randint(0, 3)),
+        '6': _maybe(rng, rng.choice(INCOME_BANDS), missing_rate),
+        '7': _maybe(rng, rng.choice(FIELDS), missing_rate),
+        '8': _maybe(rng, rng.randint(0, 10), missing_rate),
+        '9': _maybe(rng, rng.randint(0, 10), missing_rate),
+        '10': _maybe(rng, rng.randint(0, 10), missing_rate),
+        '11': _maybe(rng, rng.randint(0, 10), missing_rate),
+        '12': _maybe(rng, rng.randint(0, 10), missing_rate),
+        '13': _maybe(rng, rng.randint(0, 10), missing_rate),
+        '14': _maybe(rng, rng.choice(FIELDS), missing_rate),
+        '15': _maybe(rng, rng.randrange(10000, 200000, 5000), missing_rate),
+        '16': _maybe(rng, rng.choice(WORK_ARRANGEMENTS), missing_rate),
+        '17': _maybe(rng, rng.choice(['Yes', 'No']), missing_rate),
+        '18': _maybe(rng, rng.randint(30, 100), missing_rate),
+        '19': _maybe(rng, str(rng.randint(30, 100)), missing_rate),
+        '20': _maybe(rng, rng.uniform(30, 100), missing_rate),
+        '21': _maybe(rng, rng.choice(['Yes', 'No']), missing_rate),
+        '22': _maybe(rng, rng.randint(0, 100), missing_rate),
+    }
+
+
+def random_record(rng, missing_rate=0.05):
+    """A raw student record as posted to /predict, with categorical strings."""
+    return {
+        'age': _maybe(rng, rng.randint(13, 19), missing_rate),
+        'grade': _maybe(rng, rng.choice(GRADES), missing_rate),
+        'stream': _maybe(rng, rng.choice(STREAMS), missing_rate),
+        'family_income_band': _maybe(rng, rng.choice(INCOME_BANDS), missing_rate),
+        'parental_expectation_field': _maybe(rng, rng.choice(FIELDS), missing_rate),
+        'parental_interest_level': _maybe(rng, rng.randint(0, 10), missing_rate),
+        'psychometric_aptitude_verbal': _maybe(rng, rng.randint(0, 10), missing_rate),
+        'psychometric_aptitude_quantitative': _maybe(rng, str(rng.randint(0, 10)), missing_rate),
+        'creativity_score': _maybe(rng, rng.randint(0, 10), missing_rate),
+        'teamwork_score': _maybe(rng, rng.uniform(0, 10), missing_rate),
+        'exploration_work_score': _maybe(rng, rng.randint(0, 10), missing_rate),
+        'interest': _maybe(rng, rng.choice(FIELDS), missing_rate),
+        'expected_salary': _maybe(rng, rng.randrange(10000, 200000, 5000), missing_rate),
+        'job_seeking_preference': _maybe(rng, rng.choice(WORK_ARRANGEMENTS), missing_rate),
+        'comfortable_outside_india': _maybe(rng, rng.choice(['Yes', 'No']), missing_rate),
+        'math_score': _maybe(rng, rng.randint(30, 100), missing_rate),
+        'english_score': _maybe(rng, rng.randint(30, 100), missing_rate),
+        'science_score': _maybe(rng, rng.randint(30, 100), missing_rate),
+        'psychometric_test_given': _maybe(rng, rng.choice(['Yes', 'No']), missing_rate),
+        'psychometric_test_score': _maybe(rng, rng.randint(0, 100), missing_rate),
+        'has_creative_hobby': rng.randint(0, 1),
+        'has_technical_hobby': rng.randint(0, 1),
+        'has_sports_hobby': rng.randint(0, 1),
+        'disability_status': _maybe(rng, rng.choice(DISABILITIES), missing_rate),
+    }
+
+
+def make_rng(seed=1234):
+    return random.Random(seed)
+
+
+def time_calls(fn, inputs, repeat=1):
+    """Call `fn` on every input and return the per-call latencies in seconds."""
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Mean and tail latencies in microseconds."""
+    count = len(samples)
+    return {
+        "count": count,
+        "mean_us": sum(samples) / count * 1e6 if count else 0.0,
+        "p50_us": percentile(samples, 50) * 1e6,
+        "p95_us": percentile(samples, 95) * 1e6,
+        "p99_us": percentile(samples, 99) * 1e6,
+    }
+
+
+def print_row(label, stats):
+    print(f"{label:<40} mean={stats['mean_us']:>10.1f}us  p50={stats['p50_us']:>10.1f}us  "
+          f"p95={stats['p95_us']:>10.1f}us  p99={stats['p99_us']:>10.1f}us")
@@ -0,0 +1,177 @@
+"""
+Throughput of the offline batch scorer by worker count, with checks of its
+output order, CSV input and resume.
+
+    python benchmarks/bench_batch_score.py [--rows 100000] [--workers 0,1,2,4]
+                                           [--chunk-size 1000] [--top-k 3]
+                                           [--output bench_batch_score.json] [--baseline previous.json]
+
+Seeded questionnaires are written to a JSONL file and scored by
+batch_score.score_file without guidance. Each worker count is one run (0
+scores in this process), reported in rows/s along with its speedup over
+one worker. --workers defaults to 0, 1 and powers of two up to the core
+count. The checks:
+  * every run writes the same bytes as scoring the rows one chunk at a time
+    with score_questionnaires, as /predict_batch does
+  * the same rows as CSV give the same output
+  * a `python batch_score.py` run killed after its first checkpoint and
+    then run again with --resume gives the same output
+Exits non-zero if a check fails or a run regresses against --baseline.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import ML_BACKEND_DIR, make_rng, random_answers
+from batch_score import LIST_QUESTIONS, batch_result_json, score_file, score_questionnaires
+from model_loader import load_artifact_contents
+from model_registry import build_version
+from career_common import bench_results as results
+
+QUESTIONS = [str(question) for question in range(1, 23)]
+
+
+def write_inputs(directory, rows, seed):
+    """The same questionnaires as JSONL and CSV; returns both paths and the questionnaires."""
+    rng = make_rng(seed)
+    questionnaires = [dict(random_answers(rng), id=f"student-{i}") for i in range(rows)]
+    jsonl_path = os.path.join(directory, 'questionnaires.jsonl')
+    with open(jsonl_path, 'w') as f:
+        for answers in questionnaires:
+            f.write(json.dumps(answers) + "\n")
+    csv_path = os.path.join(directory, 'questionnaires.csv')
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(QUESTIONS + ['id'])
+        for answers in questionnaires:
+            writer.writerow([';'.join(answers[column]) if column in LIST_QUESTIONS
+                             else '' if answers.get(column) is None else answers[column]
+                             for column in QUESTIONS + ['id']])
+    return jsonl_path, csv_path, questionnaires
+
+
+def expected_output(active, questionnaires, chunk_size, top_k):
+    """What /predict_batch would stream for the questionnaires, plus each row's id."""
+    lines = []
+    for start in range(0, len(questionnaires), chunk_size):
+        chunk = questionnaires[start:start + chunk_size]
+        for result, answers in zip(score_questionnaires(active, chunk, start, top_k), chunk):
+            lines.append(batch_result_json(*result)[:-1] + ", " + json.dumps({"id": answers['id']})[1:] + "\n")
+    return "".join(lines).encode('utf-8')
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def check_resume(input_path, output_path, expected, args):
+    """Kill a CLI run after its first checkpoint, resume it, and compare the output."""
+    command = [sys.executable, os.path.join(ML_BACKEND_DIR, 'batch_score.py'), input_path, output_path,
+               '--skip-llm', '--workers', '1', '--chunk-size', str(args.chunk_size),
+               '--top-k', str(args.top_k), '--checkpoint-interval', '0.1']
+    checkpoint_path = output_path + '.checkpoint'
+    # In its own process group, so the kill takes its workers down too, as a crash would
+    process = subprocess.Popen(command, cwd=ML_BACKEND_DIR, stdout=subprocess.DEVNULL, start_new_session=True)
+    killed_at = None
+    try:
+        while process.poll() is None:
+            try:
+                with open(checkpoint_path) as f:
+                    checkpoint = json.load(f)
+            except (OSError, ValueError):
+                checkpoint = None
+            if checkpoint and checkpoint['rows'] and not checkpoint['complete']:
+                os.killpg(process.pid, signal.SIGKILL)
+                killed_at = checkpoint['rows']
+                break
+            time.sleep(0.005)
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    if killed_at is None:
+        return ["resume: the run finished before it could be killed; use more --rows"]
+
+    resumed = subprocess.run(command + ['--resume'], cwd=ML_BACKEND_DIR, capture_output=True, text=True)
+    print(f"resume: killed after {killed_at} of {args.rows} rows; {resumed.stdout.strip().splitlines()[-1]}")
+    if resumed.returncode != 0:
+        return [f"resume: exit status {resumed.returncode}"]
+    if read_bytes(output_path) != expected:
+        return ["resume: output differs from an uninterrupted run"]
+    return []
+
+
+def worker_counts(value):
+    if value:
+        return [int(count) for count in value.split(',') if count.strip()]
+    counts, count = [0, 1], 2
+    while count <= (os.cpu_count() or 1):
+        counts.append(count)
+        count *= 2
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--workers', help="comma-separated worker counts (default: 0, 1, 2, 4, ... cores)")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    results.add_arguments(parser, "bench_batch_score.json")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        active = build_version(load_artifact_contents())
+    top_k = min(args.top_k, len(active.clusters_meta)) if active.centroid_scorer is not None else 0
+    args.top_k = top_k
+
+    failures, suite_results = [], {}
+    with tempfile.TemporaryDirectory() as directory:
+        jsonl_path, csv_path, questionnaires = write_inputs(directory, args.rows, args.seed)
+        expected = expected_output(active, questionnaires, args.chunk_size, top_k)
+        del questionnaires
+        output_path = os.path.join(directory, 'scored.jsonl')
+
+        print(f"{args.rows} rows, chunks of {args.chunk_size}, top_k={top_k}, {os.cpu_count()} core(s)")
+        print(f"{'workers':>8} {'rows/s':>10} {'speedup':>8} {'seconds':>8}")
+        one_worker = None
+        for workers in worker_counts(args.workers):
+            stats = score_file(active, jsonl_path, output_path, workers=workers, chunk_size=args.chunk_size,
+                               top_k=top_k, checkpoint_interval=3600)
+            if workers == 1:
+                one_worker = stats['rows_per_s']
+            speedup = f"{stats['rows_per_s'] / one_worker:>7.2f}x" if one_worker else f"{'':>8}"
+            print(f"{workers:>8} {stats['rows_per_s']:>10.0f} {speedup} {stats['elapsed_s']:>8.2f}")
+            suite_results[f"workers={workers}"] = {"rows": stats['rows'], "elapsed_s": stats['elapsed_s'],
+                                                  "throughput_rps": stats['rows_per_s']}
+            if read_bytes(output_path) != expected:
+                failures.append(f"workers={workers}: output differs from score_questionnaires")
+
+        score_file(active, csv_path, output_path, workers=1, chunk_size=args.chunk_size, top_k=top_k,
+                   checkpoint_interval=3600)
+        csv_identical = read_bytes(output_path) == expected
+        print(f"csv input: {'same output' if csv_identical else 'DIFFERENT output'} as JSONL")
+        if not csv_identical:
+            failures.append("csv: output differs from the JSONL input's")
+
+        failures += check_resume(jsonl_path, os.path.join(directory, 'resumed.jsonl'), expected, args)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}
+    regressed = results.finish(args, 'ml_backend.batch_score', params, suite_results, ML_BACKEND_DIR)
+    return 1 if failures or regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
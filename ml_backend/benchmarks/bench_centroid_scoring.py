@@ -0,0 +1,97 @@
+"""
+Equivalence check and benchmark for CentroidScorer top-k ranking vs a
+per-student, per-cluster distance loop, over cohorts of 1 to 100k students.
+
+    python benchmarks/bench_centroid_scoring.py [--sizes 1,10,100,1000,10000,100000] [--k 3]
+
+Exits non-zero if the vectorized ranking disagrees with the loop.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from _common import make_rng, random_answers
+from centroid_scoring import scorer_from_model
+from model_loader import load_model_artifacts
+from preprocessing import FeatureEncoder, build_score_maps, calculate_scores_batch
+
+# The loop reference is only timed up to this cohort size
+MAX_LOOP_ROWS = 10000
+
+
+def loop_top_k(scorer, features, k):
+    """Distances one student and one centroid at a time, sorted per student."""
+    points = scorer.project(features)
+    labels = []
+    for point in points:
+        distances = [float(np.sqrt(((point - centroid) ** 2).sum())) for centroid in scorer.centroids]
+        labels.append(sorted(range(len(distances)), key=distances.__getitem__)[:k])
+    return np.array(labels)
+
+
+def cohort_features(encoder, mapping, score_maps, size, seed):
+    """Encoded features for `size` students, built from a pool of random questionnaires."""
+    rng = make_rng(seed)
+    pool = [random_answers(rng) for _ in range(min(size, 2000))]
+    scores, _ = calculate_scores_batch(pool, mapping, score_maps)
+    features = encoder.encode_columns(scores, len(pool))
+    repeats = -(-size // len(features))
+    return np.tile(features, (repeats, 1))[:size]
+
+
+def best_of(fn, repeat):
+    """Fastest of `repeat` calls, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1,10,100,1000,10000,100000')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    model, clusters_meta, mapping, model_columns = load_model_artifacts()
+    encoder = FeatureEncoder(model_columns, mapping)
+    scorer = scorer_from_model(model, clusters_meta, encoder)
+    if scorer is None:
+        print("Centroid scoring is unavailable for these artifacts")
+        return 1
+    score_maps = build_score_maps(mapping)
+    print(f"clusters: {len(clusters_meta)}, centroid dimensions: {', '.join(scorer.career_columns)}")
+
+    features = cohort_features(encoder, mapping, score_maps, 2000, args.seed)
+    labels, _, _ = scorer.top_k(features, args.k)
+    expected = loop_top_k(scorer, features, args.k)
+    mismatches = int((labels != expected).any(axis=1).sum())
+    print(f"top-{args.k} ranking: {len(features) - mismatches}/{len(features)} identical")
+    full = scorer.affinities(scorer.distances(features)).sum(axis=1)
+    print(f"affinities sum to 1: {bool(np.allclose(full, 1.0))}")
+    failed = mismatches > 0 or not np.allclose(full, 1.0)
+
+    print()
+    print(f"{'cohort':>8}  {'vectorized':>12}  {'per row':>12}  {'loop':>12}  {'speedup':>8}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        cohort = cohort_features(encoder, mapping, score_maps, size, args.seed)
+        vectorized = best_of(lambda: scorer.top_k(cohort, args.k), args.repeat)
+        if size <= MAX_LOOP_ROWS:
+            loop = best_of(lambda: loop_top_k(scorer, cohort, args.k), 1)
+            loop_text, speedup = f"{loop * 1e3:>10.2f}ms", f"{loop / vectorized:>7.1f}x"
+        else:
+            loop_text, speedup = f"{'-':>12}", f"{'-':>8}"
+        print(f"{size:>8}  {vectorized * 1e3:>10.2f}ms  {vectorized / size * 1e6:>10.2f}us  "
+              f"{loop_text}  {speedup}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Microbenchmark for building a cluster response from the DataFrame metadata vs
+the precomputed ClusterTable records.
+
+    python benchmarks/bench_cluster_lookup.py [--samples 20000]
+
+Exits non-zero if the two paths produce different response bodies.
+"""
+import argparse
+import json
+import sys
+
+import pandas as pd
+
+from _common import make_rng, print_row, summarize, time_calls
+from cluster_table import ClusterTable, cluster_description, cluster_name
+
+
+def pandas_response(clusters_meta, cluster_label):
+    """The per-request lookup /predict_from_questionnaire used to do."""
+    cluster_key = clusters_meta.index[cluster_label]
+    cluster_info = clusters_meta.loc[cluster_key]
+
+    if 'top_jobs' in cluster_info:
+        careers = pd.DataFrame(cluster_info['top_jobs'], columns=['career_name'])
+    else:
+        careers = pd.DataFrame([{"career_name": "Career recommendations not available"}])
+
+    return json.dumps({
+        "cluster_label": int(cluster_label),
+        "cluster_name": cluster_name(cluster_key, cluster_info),
+        "cluster_description": cluster_description(cluster_info),
+        "suggested_careers": careers.to_dict(orient='records'),
+        "guidance": None,
+        "guidance_status": "skipped",
+    })
+
+
+def record_response(table, cluster_label):
+    return table[cluster_label].response_json(guidance=None, guidance_status="skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    with open('clusters_meta.json', 'r') as f:
+        clusters_frame = pd.read_json(f, orient='index')
+    table = ClusterTable.from_json('clusters_meta.json')
+
+    mismatches = [label for label in range(len(table))
+                  if json.loads(pandas_response(clusters_frame, label)) !=
+                  json.loads(record_response(table, label))]
+    print(f"clusters: {len(table) - len(mismatches)}/{len(table)} identical")
+
+    rng = make_rng(args.seed)
+    labels = [rng.randrange(len(table)) for _ in range(args.samples)]
+    legacy = summarize(time_calls(lambda label: pandas_response(clusters_frame, label), labels))
+    precomputed = summarize(time_calls(lambda label: record_response(table, label), labels))
+    print()
+    print_row('DataFrame lookup + json.dumps', legacy)
+    print_row('ClusterTable record', precomputed)
+    print(f"speedup (mean): {legacy['mean_us'] / precomputed['mean_us']:.1f}x")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
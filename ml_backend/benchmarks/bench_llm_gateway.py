@@ -0,0 +1,345 @@
+"""
+Behaviour and overhead of the LLM gateway against the local Gemini stub.
+
+    python benchmarks/bench_llm_gateway.py [--llm-latency-ms 100]
+
+Runs the stub behind an LLMGateway in scenarios that each check one
+guarantee: identical concurrent prompts are coalesced into one generation,
+at most max_concurrency calls run at once, request and token budgets hold
+over their window (shortened to one second here), queued calls are admitted
+by priority, a full queue and an expired wait raise GatewayBusy, and token
+reservations are settled from usage_metadata. The asyncio checks cover
+acall: coalescing and the concurrency cap on one event loop, cancelled tasks
+leaving the queue, and a coalesced generation being cancelled once all of
+its callers are. Also times the admission overhead of an uncontended call.
+Exits non-zero if any check failed.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import _common  # noqa: F401  (puts ml_backend on the import path)
+from career_common.llm_gateway import BACKGROUND, INTERACTIVE, GatewayBusy, LLMGateway
+from career_common.llm_stub import StubGenerativeModel
+
+
+class CountingModel:
+    """The stub model, counting calls and the most that ran at once."""
+
+    def __init__(self):
+        self.model = StubGenerativeModel()
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+        self.cancelled = 0
+
+    def generate_content(self, prompt):
+        self._start()
+        try:
+            return self.model.generate_content(prompt)
+        finally:
+            self._finish()
+
+    async def generate_content_async(self, prompt):
+        self._start()
+        try:
+            return await self.model.generate_content_async(prompt)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self._finish()
+
+    def _start(self):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def _finish(self):
+        with self._lock:
+            self.running -= 1
+
+
+def run_concurrently(fn, items, threads=32):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(fn, items))
+
+
+def check_coalescing(latency):
+    model, gateway = CountingModel(), LLMGateway()
+    responses = run_concurrently(
+        lambda _: gateway.call('guidance', model.generate_content, "same prompt", coalesce=True), range(20))
+    texts = {response.text for response in responses}
+    return (model.calls == 1 and len(texts) == 1 and gateway.coalesced == 19,
+            f"20 identical calls -> {model.calls} generation(s), {gateway.coalesced} coalesced")
+
+
+def check_no_coalescing_for_distinct_prompts(latency):
+    model, gateway = CountingModel(), LLMGateway()
+    run_concurrently(lambda i: gateway.call('guidance', model.generate_content, f"prompt {i % 5}",
+                                            coalesce=True), range(5))
+    return model.calls == 5, f"5 distinct prompts -> {model.calls} generation(s)"
+
+
+def check_concurrency_cap(latency):
+    model, gateway = CountingModel(), LLMGateway(max_concurrency=4)
+    start = time.perf_counter()
+    run_concurrently(lambda i: gateway.call('guidance', model.generate_content, f"prompt {i}"), range(16))
+    elapsed = time.perf_counter() - start
+    return (model.max_running <= 4 and elapsed >= 4 * latency * 0.9,
+            f"16 calls, cap 4 -> at most {model.max_running} at once, {elapsed:.2f}s")
+
+
+def admissions_per_window(admitted_at, window):
+    return max(sum(1 for t in admitted_at if start <= t < start + window) for start in admitted_at)
+
+
+def check_request_budget(latency):
+    model, gateway = CountingModel(), LLMGateway(requests_per_minute=5, window_seconds=1.0)
+    admitted_at = []
+
+    def call(i):
+        return gateway.call('guidance', lambda prompt: (admitted_at.append(time.monotonic()),
+                                                        model.generate_content(prompt))[1], f"p{i}")
+
+    start = time.perf_counter()
+    run_concurrently(call, range(12))
+    elapsed = time.perf_counter() - start
+    busiest = admissions_per_window(admitted_at, 1.0)
+    return (busiest <= 5 and elapsed >= 2.0,
+            f"12 calls at 5/window -> at most {busiest} per window, {elapsed:.2f}s")
+
+
+def check_token_budget(latency):
+    model = CountingModel()
+    # About 1100 tokens per call, before and after settlement, 2500 per window: two calls fit
+    gateway = LLMGateway(tokens_per_minute=2500, expected_output_tokens=100, window_seconds=1.0)
+    admitted_at = []
+
+    def call(i):
+        return gateway.call('guidance', lambda prompt: (admitted_at.append(time.monotonic()),
+                                                        model.generate_content(prompt))[1],
+                            f"p{i} " + "x" * 4000)
+
+    start = time.perf_counter()
+    run_concurrently(call, range(6))
+    elapsed = time.perf_counter() - start
+    busiest = admissions_per_window(admitted_at, 1.0)
+    return (busiest <= 2 and elapsed >= 2.0,
+            f"6 calls of ~1100 tokens at 2500/window -> at most {busiest} per window, {elapsed:.2f}s")
+
+
+def check_priority(latency):
+    gateway = LLMGateway(max_concurrency=1)
+    release, order = threading.Event(), []
+    blocker = threading.Thread(target=gateway.call, args=('guidance', lambda _: release.wait(), "blocker"))
+    blocker.start()
+    time.sleep(0.05)
+
+    threads = []
+    for name, priority in [("background 1", BACKGROUND), ("background 2", BACKGROUND),
+                           ("interactive 1", INTERACTIVE), ("interactive 2", INTERACTIVE)]:
+        thread = threading.Thread(target=gateway.call, args=('guidance', order.append, name, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)  # fixes arrival order
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join()
+    expected = ["interactive 1", "interactive 2", "background 1", "background 2"]
+    return order == expected, f"admitted {', '.join(order)}"
+
+
+def check_coalesced_promotion(latency):
+    gateway = LLMGateway(max_concurrency=1)
+    release, order = threading.Event(), []
+    blocker = threading.Thread(target=gateway.call, args=('guidance', lambda _: release.wait(), "blocker"))
+    blocker.start()
+    time.sleep(0.05)
+    calls = [("shared", BACKGROUND), ("interactive", INTERACTIVE), ("shared", INTERACTIVE)]
+    threads = []
+    for prompt, priority in calls:
+        thread = threading.Thread(target=gateway.call, kwargs=dict(
+            operation='guidance', fn=order.append, prompt=prompt, priority=priority, coalesce=True))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join()
+    # The background call was promoted when an interactive caller joined it
+    return order == ["shared", "interactive"], f"admitted {', '.join(order)}"
+
+
+def check_rejections(latency):
+    gateway = LLMGateway(max_concurrency=1, max_queue=2, queue_timeout=0.2)
+    release = threading.Event()
+    blocker = threading.Thread(target=gateway.call, args=('guidance', lambda _: release.wait(), "blocker"))
+    blocker.start()
+    time.sleep(0.05)
+    outcomes = []
+
+    def call(i):
+        try:
+            gateway.call('guidance', lambda prompt: prompt, f"p{i}")
+            outcomes.append("ok")
+        except GatewayBusy:
+            outcomes.append("busy")
+
+    start = time.perf_counter()
+    run_concurrently(call, range(3), threads=3)
+    elapsed = time.perf_counter() - start
+    release.set()
+    blocker.join()
+    stats = gateway.stats()
+    return (outcomes.count("busy") == 3 and stats["queued_now"] == 0 and stats["running"] == 0,
+            f"3 calls behind a held slot, queue of 2, 0.2s timeout -> {outcomes.count('busy')} busy "
+            f"in {elapsed:.2f}s")
+
+
+def check_usage_settlement(latency):
+    model, gateway = CountingModel(), LLMGateway(expected_output_tokens=1000)
+    reserved = gateway.estimate_tokens("prompt")
+    response = gateway.call('guidance', model.generate_content, "prompt")
+    usage = response.usage_metadata
+    actual = usage.prompt_token_count + usage.candidates_token_count
+    window_tokens = gateway.stats()["window_tokens"]
+    return window_tokens == actual, f"reserved {reserved} tokens, settled to {window_tokens} (usage {actual})"
+
+
+def check_async_coalescing(latency):
+    model, gateway = CountingModel(), LLMGateway()
+
+    async def run():
+        return await asyncio.gather(*[gateway.acall('guidance', model.generate_content_async, "same prompt",
+                                                    coalesce=True) for _ in range(20)])
+
+    texts = {response.text for response in asyncio.run(run())}
+    return (model.calls == 1 and len(texts) == 1 and gateway.coalesced == 19,
+            f"20 identical tasks -> {model.calls} generation(s), {gateway.coalesced} coalesced")
+
+
+def check_async_concurrency_cap(latency):
+    model, gateway = CountingModel(), LLMGateway(max_concurrency=4)
+
+    async def run():
+        await asyncio.gather(*[gateway.acall('guidance', model.generate_content_async, f"prompt {i}")
+                               for i in range(16)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    return (model.max_running <= 4 and elapsed >= 4 * latency * 0.9,
+            f"16 tasks, cap 4 -> at most {model.max_running} at once, {elapsed:.2f}s")
+
+
+def check_async_cancellation(latency):
+    gateway = LLMGateway(max_concurrency=1)
+    model = CountingModel()
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold(_):
+            await release.wait()
+
+        blocker = asyncio.ensure_future(gateway.acall('guidance', hold, "blocker"))
+        await asyncio.sleep(0.01)
+        waiting = [asyncio.ensure_future(gateway.acall('guidance', model.generate_content_async, f"p{i}"))
+                   for i in range(3)]
+        await asyncio.sleep(0.01)
+        queued = gateway.stats()["queued_now"]
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        left = gateway.stats()["queued_now"]
+        release.set()
+        await blocker
+        # The freed slot goes to a new call, not to a cancelled one
+        await gateway.acall('guidance', model.generate_content_async, "after")
+        return queued, left
+
+    queued, left = asyncio.run(run())
+    stats = gateway.stats()
+    return (queued == 3 and left == 0 and model.calls == 1 and stats["running"] == 0,
+            f"3 queued tasks cancelled -> {left} left in the queue, {model.calls} generation(s) ran")
+
+
+def check_async_abandoned_flight(latency):
+    model, gateway = CountingModel(), LLMGateway()
+
+    async def run():
+        callers = [asyncio.ensure_future(gateway.acall('guidance', model.generate_content_async, "same prompt",
+                                                       coalesce=True)) for _ in range(3)]
+        await asyncio.sleep(latency / 4)
+        callers[0].cancel()
+        await asyncio.sleep(0)
+        survived = model.cancelled == 0
+        for caller in callers[1:]:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return survived
+
+    survived = asyncio.run(run())
+    return (survived and model.calls == 1 and model.cancelled == 1,
+            f"generation kept while callers remain: {survived}, cancelled with the last: {model.cancelled == 1}")
+
+
+def admission_overhead(calls=20000):
+    """Microseconds per uncontended call through the gateway, minus a direct call."""
+    gateway = LLMGateway(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+    fn = str.upper
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn("prompt")
+    direct = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        gateway.call('overhead', fn, "prompt")
+    gated = time.perf_counter() - start
+    return (gated - direct) / calls * 1e6
+
+
+CHECKS = [
+    ("coalescing", check_coalescing),
+    ("distinct prompts", check_no_coalescing_for_distinct_prompts),
+    ("concurrency cap", check_concurrency_cap),
+    ("request budget", check_request_budget),
+    ("token budget", check_token_budget),
+    ("priority order", check_priority),
+    ("coalesced promotion", check_coalesced_promotion),
+    ("rejections", check_rejections),
+    ("usage settlement", check_usage_settlement),
+    ("async coalescing", check_async_coalescing),
+    ("async concurrency cap", check_async_concurrency_cap),
+    ("async cancellation", check_async_cancellation),
+    ("async abandoned flight", check_async_abandoned_flight),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--llm-latency-ms', type=float, default=100)
+    args = parser.parse_args()
+    os.environ['LLM_STUB_LATENCY_MS'] = str(args.llm_latency_ms)
+    os.environ['LLM_STUB_FAILURE_RATE'] = '0'
+
+    failed = 0
+    for name, check in CHECKS:
+        ok, detail = check(args.llm_latency_ms / 1000.0)
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<22} {detail}")
+    print(f"admission overhead: {admission_overhead():.1f}us per uncontended call")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Overhead of the request instrumentation in metrics.py.
+
+    python benchmarks/bench_metrics.py [--samples 200000]
+
+Times a bare histogram observation and an empty span(), then a full
+/predict_from_questionnaire?guidance=false request through the Flask test
+client with and without the instrument_app request hooks.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('LLM_STUB', '1')
+
+from _common import make_rng, random_answers
+from career_common import metrics
+
+
+def per_call_ns(fn, samples):
+    start = time.perf_counter()
+    for _ in range(samples):
+        fn()
+    return (time.perf_counter() - start) / samples * 1e9
+
+
+def request_us(client, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        client.post('/predict_from_questionnaire?guidance=false', json=payload)
+    return (time.perf_counter() - start) / len(payloads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=7)
+    args = parser.parse_args()
+
+    histogram = metrics.Histogram('bench_seconds', 'Benchmark histogram.', ('stage',))
+
+    def empty_span():
+        with metrics.span('bench'):
+            pass
+
+    print(f"Histogram.observe: {per_call_ns(lambda: histogram.observe(0.003, stage='x'), args.samples):8.0f}ns")
+    print(f"empty span():      {per_call_ns(empty_span, args.samples):8.0f}ns")
+
+    import main as service
+    rng = make_rng()
+    payloads = [random_answers(rng) for _ in range(args.requests)]
+
+    app = service.app
+    client = app.test_client()
+    request_us(client, payloads[:50])  # warm-up
+
+    hooks = [app.before_request_funcs, app.after_request_funcs, app.teardown_request_funcs]
+    with_hooks = [list(funcs.get(None, [])) for funcs in hooks]
+    without_hooks = [[fn for fn in funcs if fn.__module__ != 'career_common.metrics'] for funcs in with_hooks]
+    timings = {True: [], False: []}
+    # Alternate rounds so machine noise hits both variants alike
+    for _ in range(args.rounds):
+        for instrumented in (True, False):
+            for funcs, selected in zip(hooks, with_hooks if instrumented else without_hooks):
+                funcs[None] = selected
+            timings[instrumented].append(request_us(client, payloads))
+    for funcs, original in zip(hooks, with_hooks):
+        funcs[None] = original
+    instrumented, plain = statistics.median(timings[True]), statistics.median(timings[False])
+
+    print(f"request, instrumented: {instrumented:8.1f}us")
+    print(f"request, without hooks:{plain:8.1f}us  (overhead {instrumented - plain:.1f}us)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Equivalence check and microbenchmark for the NumPy export of career_model.pkl
+vs the unpickled scikit-learn objects.
+
+    python benchmarks/bench_numpy_model.py [--samples 5000]
+
+Exits non-zero if the exported evaluators disagree with scikit-learn on any
+generated questionnaire or random feature row.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from _common import ML_BACKEND_DIR, make_rng, print_row, random_answers, summarize, time_calls
+from artifact_bundle import load_sources
+from inference import predict_labels
+from numpy_model import compare_models, export_model, load_model
+from preprocessing import FeatureEncoder, build_score_maps, calculate_scores_batch
+
+
+def import_seconds(statement):
+    """Wall time of `statement` in a fresh interpreter."""
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ML_BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    contents = load_sources()
+    original = contents['model']
+    evaluator = load_model(export_model(original))
+    encoder = FeatureEncoder(contents['model_columns'], contents['mapping'])
+    score_maps = build_score_maps(contents['mapping'])
+
+    rng = make_rng(args.seed)
+    answers = [random_answers(rng) for _ in range(args.samples)]
+    scores, _ = calculate_scores_batch(answers, contents['mapping'], score_maps)
+    features = encoder.encode_columns(scores, len(answers))
+    random_rows = np.random.default_rng(args.seed).normal(size=features.shape) * 3
+
+    failed = False
+    for label, rows in [('questionnaire', features), ('random row', random_rows)]:
+        mismatches = compare_models(original, evaluator, rows)
+        same_labels = np.array_equal(predict_labels(original, rows, encoder),
+                                     predict_labels(evaluator, rows, encoder))
+        if not same_labels:
+            mismatches.append('predict_labels')
+        print(f"{label}: {len(rows)} rows, {'identical' if not mismatches else 'MISMATCH in ' + ', '.join(mismatches)}")
+        failed = failed or bool(mismatches)
+
+    scalers = [(original.get('scaler'), evaluator.get('scaler'))] if isinstance(original, dict) else []
+    for sklearn_scaler, numpy_scaler in scalers:
+        if sklearn_scaler is None:
+            continue
+        width = sklearn_scaler.n_features_in_
+        rows = [np.random.default_rng(i).normal(size=(1, width)) for i in range(min(args.samples, 2000))]
+        print()
+        legacy = summarize(time_calls(sklearn_scaler.transform, rows))
+        exported = summarize(time_calls(numpy_scaler.transform, rows))
+        print_row('StandardScaler.transform', legacy)
+        print_row('StandardScalerArrays.transform', exported)
+        print(f"speedup (mean): {legacy['mean_us'] / exported['mean_us']:.1f}x")
+
+    print()
+    start = time.perf_counter()
+    sklearn_import = import_seconds("import sklearn.preprocessing")
+    numpy_import = import_seconds("import numpy_model")
+    print(f"import sklearn.preprocessing: {sklearn_import * 1e3:.1f}ms, "
+          f"import numpy_model: {numpy_import * 1e3:.1f}ms ({time.perf_counter() - start:.1f}s total)")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Equivalence check and microbenchmark for FeatureEncoder vs preprocess_data.
+
+    python benchmarks/bench_preprocessing.py [--samples 2000]
+
+Exits non-zero if the compiled encoder disagrees with the DataFrame path on
+any generated questionnaire or raw record.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from _common import make_rng, print_row, random_answers, random_record, summarize, time_calls
+from model_loader import load_model_artifacts
+from preprocessing import FeatureEncoder, calculate_scores, preprocess_data
+
+
+def check_equivalence(encoder, inputs, model_columns, mapping):
+    """Return the inputs on which the two paths disagree."""
+    mismatches = []
+    for data in inputs:
+        # preprocess_data passes unparseable raw values (e.g. age='n/a') through
+        # as strings; the encoder coerces them to 0 like every other NaN.
+        expected = preprocess_data(data, model_columns, mapping)
+        expected = expected.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(np.float64)
+        actual = encoder.encode(data)
+        if not np.allclose(actual, expected, rtol=1e-12, atol=1e-12, equal_nan=True):
+            mismatches.append(data)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    _, _, mapping, model_columns = load_model_artifacts()
+    encoder = FeatureEncoder(model_columns, mapping)
+
+    rng = make_rng(args.seed)
+    questionnaires = [calculate_scores(random_answers(rng), mapping) for _ in range(args.samples)]
+    records = [random_record(rng) for _ in range(args.samples)]
+    # Edge cases: no numeric subject scores, a single score, blank ratings
+    edge_cases = [
+        dict(records[0], math_score=None, english_score='', science_score='n/a'),
+        dict(records[1], math_score=None, english_score='', science_score=72),
+        dict(records[2], creativity_score=None, teamwork_score='abc'),
+        {key: value for key, value in records[3].items() if key != 'age'},
+    ]
+
+    failed = False
+    for label, inputs in [('questionnaire', questionnaires), ('raw record', records),
+                          ('edge case', edge_cases)]:
+        mismatches = check_equivalence(encoder, inputs, model_columns, mapping)
+        print(f"{label}: {len(inputs) - len(mismatches)}/{len(inputs)} identical")
+        if mismatches:
+            failed = True
+            print(f"  first mismatch: {mismatches[0]}")
+
+    print()
+    inputs = questionnaires[:min(args.samples, 500)]
+    legacy = summarize(time_calls(lambda data: preprocess_data(data, model_columns, mapping), inputs))
+    compiled = summarize(time_calls(encoder.encode, inputs))
+    print_row('preprocess_data (DataFrame)', legacy)
+    print_row('FeatureEncoder.encode', compiled)
+    print(f"speedup (mean): {legacy['mean_us'] / compiled['mean_us']:.1f}x")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Guidance prompt size and generation latency, before and after the compact
+profile encoder and compiled template.
+
+    python benchmarks/bench_prompt.py [--samples 500] [--llm-latency-ms 200]
+                                      [--ms-per-prompt-token 0.1] [--live 0]
+
+"Before" is the previous prompt: the indented instruction block with the
+student's calculate_scores dict rendered by DataFrame.to_string(), mapping
+codes and -1 sentinels included. "After" is build_guidance_prompt with
+student_profile.ProfileEncoder. Both are built for the same seeded
+questionnaires and their predicted clusters.
+
+Token counts come from career_common.tokens.estimate_tokens and the
+4-characters-per-token rule, so no tokenizer is needed. Generation latency is
+measured through the local stub, which adds LLM_STUB_MS_PER_PROMPT_TOKEN per
+prompt token.
+`--live N` also sends N prompts of each kind to Gemini (needs GEMINI_API_KEY)
+and reports the prompt_token_count it bills. Exits non-zero if a compact
+profile is not deterministic, still contains a sentinel, or the compact
+prompt is not smaller.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+from _common import make_rng, percentile, print_row, random_answers, summarize, time_calls
+from gemini_utils import build_guidance_prompt, get_generative_model_class
+from inference import predict_labels
+from career_common.llm_stub import StubGenerativeModel
+from career_common.tokens import estimate_tokens
+from model_loader import load_artifact_contents
+from model_registry import build_version
+from preprocessing import calculate_scores
+
+# The guidance prompt before the compact encoder, kept verbatim for comparison
+LEGACY_TEMPLATE = """
+    As an expert career counselor, provide a detailed and personalized career path recommendation for a student.
+
+    **Student's Profile:**
+    {student_profile}
+
+    **Initial Career Cluster Analysis:**
+    Our model has identified the following career cluster as a potential fit for the student:
+    - **Cluster Name:** {name}
+    - **Description:** {description}
+    - **Key Traits:** {key_traits}
+    - **Potential Career Paths:** {career_paths}
+
+    **Your Task:**
+    Based on the student's complete profile and the initial cluster analysis, provide a comprehensive and encouraging report. The report should include:
+    1.  **Introduction:** A warm and personalized opening acknowledging the student's inputs.
+    2.  **Analysis of Strengths:** Interpret the student's self-reported skills, interests, and academic performance. Highlight their strengths and connect them to potential career fields.
+    3.  **Career Path Recommendations:** Elaborate on the suggested career paths from the cluster. Suggest 2-3 specific, actionable career roles. For each role, describe a typical day, required skills, and future outlook.
+    4.  **Educational Guidance:** Recommend specific educational pathways (e.g., degrees, certifications) needed for these roles. Suggest relevant subjects the student should focus on.
+    5.  **Actionable Next Steps:** Provide a clear, step-by-step plan for the student to explore these recommendations further. This could include online courses, internships, informational interviews, or projects.
+    6.  **Encouraging Closing:** End with a positive and motivational message.
+
+    Structure the response in a clear, readable format using markdown.
+    """
+
+
+def legacy_prompt(cluster_info, scores):
+    import pandas as pd
+    return LEGACY_TEMPLATE.format(
+        student_profile=pd.DataFrame([scores], index=[0]).to_string(),
+        name=cluster_info.get('name', 'N/A'),
+        description=cluster_info.get('description', 'N/A'),
+        key_traits=', '.join(cluster_info.get('key_traits', [])),
+        career_paths=', '.join(cluster_info.get('career_paths', [])),
+    )
+
+
+def token_stats(prompts):
+    estimated = [estimate_tokens(prompt) for prompt in prompts]
+    by_chars = [len(prompt) // 4 + 1 for prompt in prompts]
+    return {
+        "chars": sum(len(prompt) for prompt in prompts) / len(prompts),
+        "tokens_mean": sum(estimated) / len(estimated),
+        "tokens_p95": percentile(estimated, 95),
+        "chars_div_4_mean": sum(by_chars) / len(by_chars),
+    }
+
+
+def generation_latencies(model_class, prompts):
+    """Seconds per generate_content call, and the prompt_token_count of each response."""
+    latencies, billed = [], []
+    for prompt in prompts:
+        model = model_class(model_name="gemini-2.5-flash")
+        start = time.perf_counter()
+        response = model.generate_content(prompt)
+        latencies.append(time.perf_counter() - start)
+        usage = getattr(response, 'usage_metadata', None)
+        billed.append(getattr(usage, 'prompt_token_count', 0) or 0)
+    return latencies, billed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--generations', type=int, default=50, help="stub generations per prompt kind")
+    parser.add_argument('--llm-latency-ms', type=float, default=200)
+    parser.add_argument('--ms-per-prompt-token', type=float, default=0.1)
+    parser.add_argument('--live', type=int, default=0, help="prompts of each kind to send to Gemini")
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        active = build_version(load_artifact_contents())
+    rng = make_rng(args.seed)
+    students = []
+    for _ in range(args.samples):
+        scores = calculate_scores(random_answers(rng), active.mapping, active.score_maps)
+        label = predict_labels(active.model, active.encoder.encode(scores), active.encoder)[0]
+        students.append((active.clusters_meta[label].info, scores))
+
+    encode = active.profile_encoder.encode
+    before = [legacy_prompt(info, scores) for info, scores in students]
+    after = [build_guidance_prompt(info, encode(scores)) for info, scores in students]
+
+    failures = []
+    for _, scores in students:
+        profile = encode(scores)
+        if profile != encode(dict(reversed(list(scores.items())))):
+            failures.append("profile depends on key order")
+        if "-1" in profile.split():
+            failures.append(f"sentinel in profile: {profile!r}")
+
+    print(f"{args.samples} questionnaires")
+    print(f"{'prompt':<10} {'chars':>8} {'tokens':>8} {'p95':>6} {'chars/4':>8}")
+    stats = {}
+    for label, prompts in (("before", before), ("after", after)):
+        stats[label] = token_stats(prompts)
+        print(f"{label:<10} {stats[label]['chars']:>8.0f} {stats[label]['tokens_mean']:>8.0f} "
+              f"{stats[label]['tokens_p95']:>6.0f} {stats[label]['chars_div_4_mean']:>8.0f}")
+    saved = 1 - stats["after"]["tokens_mean"] / stats["before"]["tokens_mean"]
+    print(f"input tokens saved: {saved:.0%} (estimate_tokens), "
+          f"{1 - stats['after']['chars_div_4_mean'] / stats['before']['chars_div_4_mean']:.0%} (chars/4)")
+    if saved <= 0:
+        failures.append("compact prompt is not smaller")
+
+    print_row('build prompt, before', summarize(time_calls(lambda s: legacy_prompt(*s), students)))
+    print_row('build prompt, after',
+              summarize(time_calls(lambda s: build_guidance_prompt(s[0], encode(s[1])), students)))
+
+    os.environ.update(LLM_STUB_LATENCY_MS=str(args.llm_latency_ms),
+                      LLM_STUB_MS_PER_PROMPT_TOKEN=str(args.ms_per_prompt_token), LLM_STUB_FAILURE_RATE='0')
+    print(f"stub generation, {args.llm_latency_ms:.0f}ms + {args.ms_per_prompt_token}ms per prompt token:")
+    for label, prompts in (("before", before), ("after", after)):
+        latencies, billed = generation_latencies(StubGenerativeModel, prompts[:args.generations])
+        print_row(f'generate, {label} ({sum(billed) / len(billed):.0f} stub tokens)', summarize(latencies))
+
+    if args.live:
+        os.environ.pop('LLM_STUB', None)
+        model_class = get_generative_model_class()
+        print(f"Gemini, {args.live} prompts each:")
+        for label, prompts in (("before", before), ("after", after)):
+            latencies, billed = generation_latencies(model_class, prompts[:args.live])
+            print_row(f'generate, {label} ({sum(billed) / len(billed):.0f} billed tokens)', summarize(latencies))
+
+    for failure in failures[:5]:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
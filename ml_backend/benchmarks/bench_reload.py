@@ -0,0 +1,107 @@
+"""
+Latency and correctness of predictions while the model registry swaps in a
+new artifact version.
+
+    python benchmarks/bench_reload.py [--threads 4] [--window 2]
+
+Copies the artifacts to a temporary directory, serves them through main.py
+with Flask test clients on several threads, and measures request latency in
+three windows: steady state, a reload of an unchanged bundle (?force) and a
+reload after clusters_meta.json is edited, which rebuilds the bundle in a
+child process. Exits non-zero if any request failed or reported a version
+in its body different from its X-Model-Version header.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from _common import ML_BACKEND_DIR, make_rng, percentile, random_answers
+
+ARTIFACTS = ('career_model.pkl', 'clusters_meta.json', 'mapping.csv')
+
+
+def measure(service, payloads, threads, action, settle):
+    """Run `action` while `threads` clients post payloads; returns (latencies, failures, seconds)."""
+    stop = threading.Event()
+    latencies, failures = [], []
+
+    def client_loop(offset):
+        client = service.app.test_client()
+        i = offset
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.post('/predict_from_questionnaire?guidance=false',
+                                   json=payloads[i % len(payloads)])
+            latencies.append(time.perf_counter() - start)
+            if (response.status_code != 200
+                    or response.headers.get('X-Model-Version') != response.get_json().get('model_version')):
+                failures.append(response.status_code)
+            i += threads
+
+    workers = [threading.Thread(target=client_loop, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(settle)
+    start = time.perf_counter()
+    action()
+    duration = time.perf_counter() - start
+    time.sleep(settle)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return latencies, failures, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--window', type=float, default=2.0, help="seconds measured around each action")
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    artifact_dir = tempfile.mkdtemp(prefix='bench_reload_')
+    try:
+        for name in ARTIFACTS:
+            shutil.copy(os.path.join(ML_BACKEND_DIR, name), artifact_dir)
+        os.environ.update(MODEL_ARTIFACT_DIR=artifact_dir, LLM_STUB='1', GUIDANCE_CACHE='off')
+        import main as service
+
+        def edit_clusters():
+            path = os.path.join(artifact_dir, 'clusters_meta.json')
+            with open(path) as f:
+                clusters = json.load(f)
+            first = next(iter(clusters))
+            clusters[first]['description'] = f"{clusters[first].get('description', '')} (revised)"
+            with open(path, 'w') as f:
+                json.dump(clusters, f)
+            service.registry.reload()
+
+        rng = make_rng(args.seed)
+        payloads = [random_answers(rng) for _ in range(500)]
+        scenarios = [
+            ('steady state', lambda: time.sleep(args.window)),
+            ('forced reload, same bundle', lambda: service.registry.reload(force=True)),
+            ('edited clusters_meta.json', edit_clusters),
+        ]
+
+        failed = False
+        print(f"{'window':<28} {'action':>9} {'requests':>9} {'p50':>9} {'p99':>9} {'max':>9} {'failed':>7}")
+        for label, action in scenarios:
+            before = service.registry.version()
+            latencies, failures, duration = measure(service, payloads, args.threads, action, args.window / 2)
+            print(f"{label:<28} {duration:>8.2f}s {len(latencies):>9} {percentile(latencies, 50) * 1e3:>7.2f}ms "
+                  f"{percentile(latencies, 99) * 1e3:>7.2f}ms {max(latencies) * 1e3:>7.1f}ms {len(failures):>7}"
+                  f"   {before} -> {service.registry.version()}")
+            failed = failed or bool(failures)
+        return 1 if failed else 0
+    finally:
+        shutil.rmtree(artifact_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Cold-start benchmark: import time of main.py and time to the first prediction,
+loading artifacts from the bundle vs the individual source files.
+
+    python benchmarks/bench_startup.py [--runs 5]
+
+Each run is a fresh interpreter with LLM_STUB=1, so no API key is needed.
+Build the bundle first with `python artifact_bundle.py`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from _common import ML_BACKEND_DIR
+
+# Runs inside the child interpreter and prints its timings as JSON
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+client = main.app.test_client()
+response = client.post('/predict_from_questionnaire?guidance=false', json={
+    '1': 16, '2': '10th', '3': 'Science', '4': [], '5': ['Sports'], '6': 'Middle',
+    '7': 'Engineering', '8': 7, '9': 6, '10': 8, '11': 5, '12': 7, '13': 6,
+    '14': 'Technology', '15': 50000, '16': 'Hybrid', '17': 'Yes', '18': 80,
+    '19': 75, '20': 85, '21': 'No', '22': 0})
+predicted = time.perf_counter()
+heavy = [name for name in ('pandas', 'sklearn', 'google.generativeai') if name in sys.modules]
+print(json.dumps({"import_s": imported - start, "first_prediction_s": predicted - imported,
+                  "status": response.status_code, "modules": heavy}))
+"""
+
+
+def run_once(bundle):
+    env = dict(os.environ, LLM_STUB='1', GUIDANCE_CACHE='off')
+    if not bundle:
+        env['ARTIFACT_BUNDLE'] = 'off'
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=ML_BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process_s'] = wall
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'artifacts':<14} {'import main':>12} {'1st predict':>12} {'process':>10}  loaded")
+    variants = [('bundle', True), ('source files', False)]
+    # Alternate the variants so disk cache warm-up does not favour either one
+    results = {label: [] for label, _ in variants}
+    for _ in range(args.runs):
+        for label, bundle in variants:
+            results[label].append(run_once(bundle))
+    for label, runs in results.items():
+        if any(run['status'] != 200 for run in runs):
+            failed = True
+        median = {key: statistics.median(run[key] for run in runs)
+                  for key in ('import_s', 'first_prediction_s', 'process_s')}
+        print(f"{label:<14} {median['import_s'] * 1e3:>10.1f}ms {median['first_prediction_s'] * 1e3:>10.1f}ms "
+              f"{median['process_s'] * 1e3:>8.1f}ms  {', '.join(runs[-1]['modules']) or '-'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Microbenchmark suite for the scoring hot path, with JSON results and a
+baseline comparison.
+
+    python benchmarks/bench_suite.py [--samples 2000] [--cold-runs 5]
+                                     [--output bench_suite.json]
+                                     [--baseline previous.json] [--tolerance 0.10]
+
+Times calculate_scores, preprocess_data, FeatureEncoder.encode, the model's
+predict step (one row and a batch) and load_model_artifacts, both warm and in
+a fresh interpreter. Inputs come from a fixed seed, so two runs on the same
+machine measure the same work. With --baseline it exits non-zero if any
+latency grew by more than the tolerance.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from _common import ML_BACKEND_DIR, make_rng, print_row, random_answers, random_record, summarize, time_calls
+from inference import predict_labels
+from model_loader import load_model_artifacts
+from preprocessing import FeatureEncoder, build_score_maps, calculate_scores, preprocess_data
+from career_common import bench_results as results
+
+# preprocess_data builds a DataFrame per call (~25ms), so it gets fewer inputs
+LEGACY_SAMPLES = 200
+
+# Runs inside the child interpreter and prints the load time in seconds
+COLD_LOAD = r"""
+import contextlib, io, time
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    from model_loader import load_model_artifacts
+    model = load_model_artifacts()[0]
+print(time.perf_counter() - start if model is not None else -1)
+"""
+
+
+def cold_load_samples(runs):
+    """load_model_artifacts wall time, import included, in `runs` fresh interpreters."""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', COLD_LOAD], cwd=ML_BACKEND_DIR,
+                                env=dict(os.environ, LLM_STUB='1'),
+                                capture_output=True, text=True, check=True)
+        seconds = float(result.stdout.strip().splitlines()[-1])
+        if seconds < 0:
+            raise RuntimeError("load_model_artifacts failed in the child interpreter")
+        samples.append(seconds)
+    return samples
+
+
+def quiet(fn):
+    """`fn` with its progress prints swallowed, for functions that log each call."""
+    def call(item):
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                return fn(item)
+            finally:
+                sys.stdout = stdout
+    return call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3, help="passes over the inputs per benchmark")
+    parser.add_argument('--cold-runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1234)
+    results.add_arguments(parser, 'bench_suite.json')
+    args = parser.parse_args()
+
+    model, _, mapping, model_columns = quiet(lambda _: load_model_artifacts())(None)
+    if model is None:
+        print("model artifacts failed to load", file=sys.stderr)
+        return 1
+    encoder = FeatureEncoder(model_columns, mapping)
+    score_maps = build_score_maps(mapping)
+
+    rng = make_rng(args.seed)
+    answers = [random_answers(rng) for _ in range(args.samples)]
+    records = [random_record(rng) for _ in range(args.samples)]
+    scored = [calculate_scores(item, mapping, score_maps) for item in answers]
+    rows = [encoder.encode(item) for item in scored]
+    batches = [np.vstack(rows[start:start + args.batch_size])
+               for start in range(0, len(rows), args.batch_size)]
+
+    benchmarks = [
+        ('calculate_scores', lambda item: calculate_scores(item, mapping, score_maps), answers),
+        ('preprocess_data', lambda item: preprocess_data(item, model_columns, mapping),
+         records[:LEGACY_SAMPLES]),
+        ('FeatureEncoder.encode', encoder.encode, scored),
+        ('predict x1', lambda row: predict_labels(model, row, encoder), rows),
+        (f'predict x{args.batch_size}', lambda batch: predict_labels(model, batch, encoder), batches),
+        ('load_model_artifacts (warm)', quiet(lambda _: load_model_artifacts()), range(args.cold_runs)),
+    ]
+
+    suite_results = {}
+    for name, fn, inputs in benchmarks:
+        inputs = list(inputs)
+        fn(inputs[0])  # warm-up
+        stats = summarize(time_calls(fn, inputs, repeat=args.repeat))
+        print_row(name, stats)
+        suite_results[name] = stats
+
+    stats = summarize(cold_load_samples(args.cold_runs))
+    print_row('load_model_artifacts (cold)', stats)
+    suite_results['load_model_artifacts (cold)'] = stats
+
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    params['artifact_bundle'] = os.getenv('ARTIFACT_BUNDLE', 'default')
+    return 1 if results.finish(args, 'ml_backend.microbench', params, suite_results, ML_BACKEND_DIR) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
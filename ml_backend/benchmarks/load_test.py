@@ -0,0 +1,132 @@
+"""
+Load test of gunicorn worker/thread configurations against the Gemini stub.
+
+    python benchmarks/load_test.py [--configs 1x1,2x1,1x8,2x8] [--requests 64]
+                                   [--concurrency 32] [--latency-ms 500]
+
+Each configuration (<workers>x<threads>) starts gunicorn with the production
+profile, LLM_STUB=1 and LLM_STUB_LATENCY_MS, disables the guidance cache so
+every request waits on a generation, and reports throughput, latency and the
+workers' proportional memory (PSS, Linux only).
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import ML_BACKEND_DIR, make_rng, percentile, random_answers
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, threads, latency_ms, port):
+    env = dict(os.environ, SERVING_PROFILE='production', GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads), GUNICORN_BIND=f'127.0.0.1:{port}',
+               LLM_STUB='1', LLM_STUB_LATENCY_MS=str(latency_ms), GUIDANCE_CACHE='off')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+                              cwd=ML_BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/cache/stats', timeout=1).read()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("gunicorn did not become ready within 60s")
+
+
+def worker_pss_mb(master_pid):
+    """Summed PSS of the master and its workers in MB, or None off Linux."""
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            pids = [master_pid] + [int(pid) for pid in f.read().split()]
+        total_kb = 0
+        for pid in pids:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        return total_kb / 1024
+    except (OSError, StopIteration, ValueError):
+        return None
+
+
+def post(port, payload):
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/predict_from_questionnaire', data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return time.perf_counter() - start, status
+
+
+def run_config(workers, threads, payloads, concurrency, latency_ms):
+    port = free_port()
+    server = start_server(workers, threads, latency_ms, port)
+    try:
+        post(port, payloads[0])  # warm-up
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda payload: post(port, payload), payloads))
+        elapsed = time.perf_counter() - start
+        pss = worker_pss_mb(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "throughput": len(results) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3,
+        "errors": sum(1 for _, status in results if status != 200),
+        "pss_mb": pss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--configs', default='1x1,2x1,1x8,2x8')
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency-ms', type=float, default=500)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    rng = make_rng(args.seed)
+    payloads = [random_answers(rng) for _ in range(args.requests)]
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, stub latency {args.latency_ms:.0f}ms")
+    print(f"{'config':>8} {'req/s':>8} {'p50':>10} {'p95':>10} {'errors':>7} {'PSS':>9}")
+    failed = False
+    for config in args.configs.split(','):
+        workers, threads = (int(part) for part in config.split('x'))
+        stats = run_config(workers, threads, payloads, args.concurrency, args.latency_ms)
+        pss = f"{stats['pss_mb']:>7.1f}MB" if stats['pss_mb'] is not None else f"{'-':>9}"
+        print(f"{config:>8} {stats['throughput']:>8.1f} {stats['p50_ms']:>8.0f}ms {stats['p95_ms']:>8.0f}ms "
+              f"{stats['errors']:>7} {pss}")
+        failed = failed or stats['errors'] > 0
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Nearest-centroid ranking of every cluster for a batch of students.
+
+clusters_meta.json stores each cluster's centroid in the standardized career
+feature space. Six of those dimensions have a student-side counterpart; the
+student features are projected onto them, standardized with the model's
+scaler, and compared to all centroids with one matrix product. Affinities are
+a softmax over negative distances, so they sum to 1 across all clusters.
+They measure closeness to a centroid, not the model's confidence: the model
+may predict a cluster whose centroid is not the nearest, so rankings put the
+predicted cluster first and the nearest of the others after it.
+"""
+import numpy as np
+
+# Career feature (centroid dimension) -> encoded student feature
+CENTROID_FEATURES = {
+    'verbal_aptitude_weight': 'psychometric_aptitude_verbal',
+    'quantitative_aptitude_weight': 'psychometric_aptitude_quantitative',
+    'creativity_requirement': 'creativity_score',
+    'teamwork_requirement': 'teamwork_score',
+    'exploration_requirement': 'exploration_work_score',
+    'salary_inr_avg': 'expected_salary',
+}
+# Standardized student values are clipped to this many standard deviations
+MAX_Z = 3.0
+
+
+class CentroidScorer:
+    """Ranks clusters by Euclidean distance between student features and centroids."""
+
+    def __init__(self, clusters, encoder, mean=None, scale=None, temperature=1.0,
+                 feature_map=CENTROID_FEATURES):
+        self.clusters = clusters
+        self.temperature = temperature
+        career_columns = [career for career, student in feature_map.items()
+                          if student in encoder.index
+                          and all(career in record.info.get('centroid', {}) for record in clusters)]
+        if not career_columns:
+            raise ValueError("No centroid dimension has a matching student feature")
+        self.career_columns = career_columns
+        self.feature_index = np.array([encoder.index[feature_map[career]] for career in career_columns])
+
+        self.centroids = np.array([[record.info['centroid'][career] for career in career_columns]
+                                   for record in clusters], dtype=np.float64)
+        self._centroid_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.mean = np.zeros(len(career_columns)) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = np.ones(len(career_columns)) if scale is None else np.asarray(scale, dtype=np.float64)
+
+    def project(self, features):
+        """Standardized (n_rows, n_dims) student coordinates in centroid space."""
+        projected = (np.asarray(features, dtype=np.float64)[:, self.feature_index] - self.mean) / self.scale
+        np.nan_to_num(projected, copy=False)
+        return np.clip(projected, -MAX_Z, MAX_Z, out=projected)
+
+    def distances(self, features):
+        """(n_rows, n_clusters) Euclidean distances, from one matrix product."""
+        points = self.project(features)
+        squared = (np.einsum('ij,ij->i', points, points)[:, None]
+                   - 2.0 * points @ self.centroids.T
+                   + self._centroid_sq[None, :])
+        return np.sqrt(np.maximum(squared, 0.0, out=squared), out=squared)
+
+    def affinities(self, distances):
+        """Softmax over negative distances; each row sums to 1."""
+        logits = -distances / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        weights = np.exp(logits)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights
+
+    def top_k(self, features, k, first=None):
+        """
+        Return (labels, distances, affinities), each (n_rows, k), nearest
+        cluster first in every row. With `first`, each row's label in it
+        (the model's prediction) leads instead, followed by the k - 1 nearest
+        other clusters; labels outside the table are ignored.
+        """
+        distances = self.distances(features)
+        affinities = self.affinities(distances)
+        order_by = distances
+        if first is not None:
+            first = np.asarray(first)
+            rows = np.flatnonzero((first >= 0) & (first < distances.shape[1]))
+            order_by = distances.copy()
+            order_by[rows, first[rows]] = -1.0  # distances are never negative
+        k = min(k, distances.shape[1])
+        if k < distances.shape[1]:
+            candidates = np.argpartition(order_by, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(k), distances.shape).copy()
+        order = np.take_along_axis(order_by, candidates, axis=1).argsort(axis=1, kind='stable')
+        labels = np.take_along_axis(candidates, order, axis=1)
+        return (labels, np.take_along_axis(distances, labels, axis=1),
+                np.take_along_axis(affinities, labels, axis=1))
+
+    def rank(self, features, k, first=None):
+        """Top-k clusters per row as lists of JSON-ready dicts, led by `first` as in top_k."""
+        labels, distances, affinities = self.top_k(features, k, first)
+        return [
+            [{
+                "cluster_label": int(label),
+                "cluster_name": self.clusters[label].name,
+                "distance": round(float(distance), 6),
+                "affinity": round(float(affinity), 6),
+            } for label, distance, affinity in zip(row_labels, row_distances, row_affinities)]
+            for row_labels, row_distances, row_affinities in zip(labels, distances, affinities)
+        ]
+
+
+def scorer_from_model(model, clusters, encoder, temperature=1.0):
+    """
+    Build a CentroidScorer, standardizing with the scaler stored alongside the
+    model when there is one. Returns None if the centroids cannot be used.
+    """
+    scaler = model.get('scaler') if isinstance(model, dict) else None
+    columns = list(model.get('career_feature_columns', [])) if isinstance(model, dict) else []
+    try:
+        scorer = CentroidScorer(clusters, encoder, temperature=temperature)
+        if scaler is not None and all(career in columns for career in scorer.career_columns):
+            positions = [columns.index(career) for career in scorer.career_columns]
+            scorer.mean = np.asarray(scaler.mean_, dtype=np.float64)[positions]
+            scorer.scale = np.asarray(scaler.scale_, dtype=np.float64)[positions]
+        return scorer
+    except Exception as e:
+        print(f"Centroid scoring disabled: {e}")
+        return None
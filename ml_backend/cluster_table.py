@@ -0,0 +1,143 @@
+"""
+Immutable per-cluster lookup table built once from clusters_meta.json.
+
+Each cluster becomes a ClusterRecord holding its metadata and the JSON
+fragments responses are assembled from, so the request path never indexes a
+DataFrame or re-serializes cluster metadata. clusters_meta.json may leave out
+a cluster's name and description; they are then made from its top jobs and
+main fields, so responses never carry "N/A".
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from fallback_report import fallback_career_details, fallback_guidance, main_fields
+
+NO_CAREERS = [{"career_name": "Career recommendations not available"}]
+
+
+@dataclass(frozen=True)
+class ClusterRecord:
+    label: int
+    key: str
+    cache_key: str  # key plus a digest of the metadata, so edited clusters miss the report cache
+    info: MappingProxyType  # read-only view of the cluster's metadata
+    name: str
+    description: str
+    suggested_careers: tuple
+    info_json: str
+    summary_json: str  # {"cluster_label", "cluster_name", "cluster_description", "suggested_careers"}
+    fallback_guidance: str  # report rendered from the metadata, served when Gemini's misses its deadline
+    fallback_json: str  # {"guidance", "career_details"} rendered from the metadata
+
+    def summary(self):
+        """The cluster summary as a fresh dict."""
+        return {
+            "cluster_label": self.label,
+            "cluster_name": self.name,
+            "cluster_description": self.description,
+            "suggested_careers": [dict(career) for career in self.suggested_careers],
+        }
+
+    def response_json(self, fallback=False, **fields):
+        """
+        The summary object with `fields` appended, serialized as JSON. With
+        `fallback`, the metadata-rendered report and career_details are
+        appended too, under "fallback".
+        """
+        body = self.summary_json
+        if fields:
+            body = body[:-1] + ", " + json.dumps(fields)[1:]
+        if fallback:
+            body = body[:-1] + ', "fallback": ' + self.fallback_json + "}"
+        return body
+
+
+def cluster_name(key, info):
+    """The cluster's name, or its main field and two top jobs when it has none."""
+    if info.get('name'):
+        return info['name']
+    careers = " & ".join(list(info.get('top_jobs') or [])[:2])
+    fields = main_fields(info)
+    if fields and careers:
+        return f"{fields[0]}: {careers}"
+    return careers or (fields[0] if fields else key)
+
+
+def cluster_description(info):
+    """The cluster's description, or one listing its top jobs and main fields when it has none."""
+    if info.get('description'):
+        return info['description']
+    careers = list(info.get('top_jobs') or [])[:3]
+    fields = main_fields(info)[:2]
+    if not careers and not fields:
+        return "No description is recorded for this cluster."
+    description = f"Careers such as {', '.join(careers)}" if careers else "Careers"
+    if fields:
+        description += f", mostly in {' and '.join(fields)}"
+    return description + "."
+
+
+def build_record(label, key, info):
+    name = cluster_name(key, info)
+    description = cluster_description(info)
+    top_jobs = info.get('top_jobs')
+    if top_jobs is not None:
+        careers = [{"career_name": job} for job in top_jobs]
+    else:
+        careers = NO_CAREERS
+    dumps = json.dumps
+    info_json = dumps(info)
+    guidance = fallback_guidance(info)
+    return ClusterRecord(
+        label=label,
+        key=key,
+        cache_key=f"{key}:{hashlib.sha256(info_json.encode('utf-8')).hexdigest()[:12]}",
+        info=MappingProxyType(dict(info)),
+        name=name,
+        description=description,
+        suggested_careers=tuple(MappingProxyType(dict(career)) for career in careers),
+        info_json=info_json,
+        summary_json=(f'{{"cluster_label": {label}, "cluster_name": {dumps(name)}, '
+                      f'"cluster_description": {dumps(description)}, '
+                      f'"suggested_careers": {dumps(careers)}}}'),
+        fallback_guidance=guidance,
+        fallback_json=dumps({"guidance": guidance, "career_details": fallback_career_details(info)}),
+    )
+
+
+class ClusterTable:
+    """Clusters in file order; index by predicted label or look up by cluster key."""
+
+    def __init__(self, clusters_meta):
+        self.records = tuple(build_record(label, key, info)
+                             for label, (key, info) in enumerate(clusters_meta.items()))
+        self._by_key = MappingProxyType({record.key: record for record in self.records})
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def __getitem__(self, label):
+        """The record of a predicted label; IndexError for labels outside the table, negative ones too."""
+        label = int(label)
+        if not 0 <= label < len(self.records):
+            raise IndexError(f"Predicted cluster ID {label} not found in metadata.")
+        return self.records[label]
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def keys(self):
+        return list(self._by_key)
+
+    def __contains__(self, key):
+        return key in self._by_key
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
@@ -1,11 +1,8 @@
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 
 def configure_apis():
-    """Load environment variables and configure APIs."""
+    """
+    Load environment variables from .env. The Gemini client is configured by
+    gemini_utils on the first generation, so startup never imports its SDK.
+    """
     load_dotenv()
-    # Configure Gemini API
-    # Make sure to set your GOOGLE_API_KEY environment variable
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
@@ -0,0 +1,80 @@
+"""
+Guidance report and career_details for a cluster rendered from its
+clusters_meta.json fields, without calling Gemini.
+
+They are served when a generated report misses its deadline or fails, in
+place of an apology. The text depends only on the cluster's metadata, so it
+is rendered once per cluster when the cluster table is built. Fields a
+cluster does not have (name, description, key traits) are left out.
+"""
+
+NEXT_STEPS = [
+    "Read about a typical day in two or three careers from this summary that interest you",
+    "Find out which degrees or certifications they need, and which school subjects matter most for them",
+    "Talk to someone who works in one of these roles, or try a short online course or project in the field",
+    "Look for an internship, volunteering or job-shadowing opportunity",
+]
+NOT_ESTIMATED = "Not estimated in this summary"
+
+
+def _careers(cluster_info):
+    return list(cluster_info.get('career_paths') or cluster_info.get('top_jobs') or [])
+
+
+def main_fields(cluster_info):
+    """Fields of interest most common among the cluster's students, most common first."""
+    categories = cluster_info.get('primary_categories') or {}
+    return sorted(categories, key=lambda field: (-categories[field], field))
+
+
+def fallback_guidance(cluster_info):
+    """A short markdown guidance report for the cluster."""
+    careers = _careers(cluster_info)
+    fields = main_fields(cluster_info)
+    traits = list(cluster_info.get('key_traits') or [])
+    name = cluster_info.get('name')
+
+    lines = ["## Your Career Guidance Summary", ""]
+    lines.append(f"Your answers are closest to the **{name}** career cluster." if name else
+                 "Your answers are closest to a group of students with similar strengths and interests.")
+    if cluster_info.get('description'):
+        lines += ["", cluster_info['description']]
+    if traits:
+        lines += ["", "### Strengths to build on", ""] + [f"- {trait}" for trait in traits]
+    if careers:
+        lines += ["", "### Careers to explore", ""] + [f"- {career}" for career in careers]
+    if fields:
+        lines += ["", "### Fields students like you chose", "", ", ".join(fields)]
+    lines += ["", "### Next steps", ""] + [f"{i}. {step}." for i, step in enumerate(NEXT_STEPS, 1)]
+    lines += ["", "This summary comes from your career cluster. A personalised report can take a "
+                  "little longer; check back for it later."]
+    return "\n".join(lines)
+
+
+def fallback_career_details(cluster_info):
+    """career_details in the shape the orchestrator asks Gemini for, from the cluster's metadata."""
+    careers = _careers(cluster_info)
+    fields = main_fields(cluster_info)
+    primary = careers[0] if careers else "Career recommendation not available"
+    in_field = f" in {fields[0]}" if fields else ""
+
+    why = "Students whose answers are closest to yours most often choose careers such as "
+    why += ", ".join(careers[:3]) if careers else "the ones in this cluster"
+    if fields:
+        why += f", mostly in {' and '.join(fields[:2])}"
+    return {
+        "primaryCareer": primary,
+        "description": cluster_info.get('description') or (
+            f"{primary} is the most common career among students with answers like yours." if careers
+            else "No careers are recorded for this cluster yet."),
+        "salaryRange": NOT_ESTIMATED,
+        "growthOutlook": NOT_ESTIMATED,
+        "educationRequired": f"Usually a degree{in_field}; requirements vary by role" if fields
+                             else "Varies by role",
+        "alternativePaths": [{"title": career, "description": f"Another common career{in_field} for "
+                                                              f"students with answers like yours."}
+                             for career in careers[1:4]],
+        "keySkills": list(cluster_info.get('key_traits') or []),
+        "nextSteps": list(NEXT_STEPS),
+        "whyRecommended": why + ".",
+    }
@@ -1,85 +1,133 @@
 
 import os
 import logging
-import google.generativeai as genai
+import threading
+
+from career_common.llm_gateway import INTERACTIVE, gateway_from_env
+from prompts import GUIDANCE
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize the client with error handling
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    logger.error("GEMINI_API_KEY environment variable is not set.")
-    raise RuntimeError("GEMINI_API_KEY environment variable is required.")
+# Resolved on first use so importing this module neither loads the Gemini SDK
+# nor needs an API key
+_generative_model_class = None
+_client_lock = threading.Lock()
+
+# Concurrency, per-minute budgets, coalescing and the priority queue for every
+# Gemini call of this process; configured by the LLM_* environment variables
+llm_gateway = gateway_from_env()
 
-# Clean the API key by removing any quotes or extra content
-if '=' in GEMINI_API_KEY:  # If Docker passed the entire env var string
-    GEMINI_API_KEY = GEMINI_API_KEY.split('=', 1)[1]  # Get everything after the =
 
-# Remove any remaining quotes and whitespace
-GEMINI_API_KEY = GEMINI_API_KEY.replace('"', '').replace("'", '').strip()
+def _gemini_api_key():
+    """GEMINI_API_KEY (or GOOGLE_API_KEY), cleaned of quoting added by Docker."""
+    api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        logger.error("GEMINI_API_KEY environment variable is not set.")
+        raise RuntimeError("GEMINI_API_KEY environment variable is required.")
 
+    # Clean the API key by removing any quotes or extra content
+    if '=' in api_key:  # If Docker passed the entire env var string
+        api_key = api_key.split('=', 1)[1]  # Get everything after the =
 
-genai.configure(api_key=GEMINI_API_KEY)
+    # Remove any remaining quotes and whitespace
+    return api_key.replace('"', '').replace("'", '').strip()
 
 
-def get_gemini_response(cluster_info, student_data):
+def get_generative_model_class():
     """
-    Generates a personalized career guidance response using the Gemini API.
+    The GenerativeModel class to call: the local stub with LLM_STUB set,
+    otherwise the Gemini SDK's, configured with the API key on first call.
     """
-    generation_config = {
-        "temperature": 0.9,
-        "top_p": 0.85,
-        "top_k": 30,
-        "max_output_tokens": 4096,
-    }
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    ]
-
-    try:
-        student_profile = student_data.to_string()
-    except Exception as e:
-        logger.error(f"Failed to convert student_data to string: {e}")
-        student_profile = str(student_data)
-
-    prompt = f"""
-    As an expert career counselor, provide a detailed and personalized career path recommendation for a student.
-
-    **Student's Profile:**
-    {student_profile}
-
-    **Initial Career Cluster Analysis:**
-    Our model has identified the following career cluster as a potential fit for the student:
-    - **Cluster Name:** {cluster_info.get('name', 'N/A')}
-    - **Description:** {cluster_info.get('description', 'N/A')}
-    - **Key Traits:** {', '.join(cluster_info.get('key_traits', []))}
-    - **Potential Career Paths:** {', '.join(cluster_info.get('career_paths', []))}
-
-    **Your Task:**
-    Based on the student's complete profile and the initial cluster analysis, provide a comprehensive and encouraging report. The report should include:
-    1.  **Introduction:** A warm and personalized opening acknowledging the student's inputs.
-    2.  **Analysis of Strengths:** Interpret the student's self-reported skills, interests, and academic performance. Highlight their strengths and connect them to potential career fields.
-    3.  **Career Path Recommendations:** Elaborate on the suggested career paths from the cluster. Suggest 2-3 specific, actionable career roles. For each role, describe a typical day, required skills, and future outlook.
-    4.  **Educational Guidance:** Recommend specific educational pathways (e.g., degrees, certifications) needed for these roles. Suggest relevant subjects the student should focus on.
-    5.  **Actionable Next Steps:** Provide a clear, step-by-step plan for the student to explore these recommendations further. This could include online courses, internships, informational interviews, or projects.
-    6.  **Encouraging Closing:** End with a positive and motivational message.
-
-    Structure the response in a clear, readable format using markdown.
+    global _generative_model_class
+    if _generative_model_class is not None:
+        return _generative_model_class
+    with _client_lock:
+        if _generative_model_class is None:
+            # Set LLM_STUB=1 to generate reports with the local stub instead of the Gemini API
+            if os.environ.get("LLM_STUB", "").lower() in ("1", "true", "yes"):
+                from career_common.llm_stub import StubGenerativeModel
+                logger.info("LLM_STUB is set; using the local Gemini stub.")
+                _generative_model_class = StubGenerativeModel
+            else:
+                import google.generativeai as genai
+                genai.configure(api_key=_gemini_api_key())
+                _generative_model_class = genai.GenerativeModel
+    return _generative_model_class
+
+
+# Bump the template's version whenever the prompt or generation settings change so
+# cached reports are not reused
+PROMPT_VERSION = GUIDANCE.version
+
+GUIDANCE_ERROR_MESSAGE = "Sorry, there was an error generating your career guidance report. Please try again later."
+
+
+GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "top_p": 0.85,
+    "top_k": 30,
+    "max_output_tokens": 4096,
+}
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+
+def generate_guidance(cluster_info, student_profile, priority=INTERACTIVE):
+    """
+    Generates a personalized career guidance report using the Gemini API.
+    `student_profile` is the text from student_profile.ProfileEncoder. Raises
+    on API errors (and GatewayBusy), so callers can serve the cluster's
+    fallback report or record the failure. Identical prompts in flight share
+    one generation.
     """
+    prompt = build_guidance_prompt(cluster_info, student_profile)
+    response = llm_gateway.call('guidance', _guidance_model().generate_content, prompt,
+                                priority=priority, coalesce=True)
+    return response.text
 
-    try:
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        logger.error(f"Error generating Gemini response: {e}")
-        return "Sorry, there was an error generating your career guidance report. Please try again later."
+
+def stream_guidance(cluster_info, student_profile):
+    """
+    Streams the guidance report, yielding text chunks as Gemini produces them.
+    Raises on API errors.
+    """
+    prompt = build_guidance_prompt(cluster_info, student_profile)
+    with llm_gateway.slot('guidance_stream', prompt, priority=INTERACTIVE) as call:
+        for chunk in _guidance_model().generate_content(prompt, stream=True):
+            call.usage(chunk)
+            if chunk.text:
+                yield chunk.text
+
+
+def _guidance_model():
+    return get_generative_model_class()(
+        model_name="gemini-2.5-flash",
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS
+    )
+
+
+def build_guidance_prompt(cluster_info, student_profile):
+    """Builds the career guidance prompt for a cluster and a compact student profile."""
+    return GUIDANCE.render(profile=student_profile, cluster=cluster_summary(cluster_info))
+
+
+def cluster_summary(cluster_info):
+    """The cluster's metadata as `- Label: value` lines, leaving out fields it does not have."""
+    categories = cluster_info.get('primary_categories') or {}
+    fields = [
+        ("Name", cluster_info.get('name')),
+        ("Description", cluster_info.get('description')),
+        ("Key traits", ', '.join(cluster_info.get('key_traits') or [])),
+        ("Career paths", ', '.join(cluster_info.get('career_paths') or cluster_info.get('top_jobs') or [])),
+        # Most common fields of interest among the students in the cluster
+        ("Main fields", ', '.join(sorted(categories, key=lambda field: (-categories[field], field)))),
+    ]
+    lines = [f"- {label}: {value}" for label, value in fields if value]
+    return "\n".join(lines) if lines else "- No details available."
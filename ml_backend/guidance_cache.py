@@ -0,0 +1,244 @@
+"""
+Content-addressed cache for generated guidance reports.
+
+Reports are keyed by a hash of the cluster ID, the canonicalized student
+features and the prompt template version, so two students who land in the same
+cluster with the same normalized answers share one generation.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical_value(value):
+    """Normalize numbers so 7, 7.0 and numpy 7 hash the same, and NaN/None agree."""
+    if value is None:
+        return None
+    if hasattr(value, 'item'):  # numpy scalar
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+        return round(value, 9)
+    if isinstance(value, (list, tuple)):
+        return [_canonical_value(item) for item in value]
+    return value
+
+
+def make_cache_key(cluster_id, features, prompt_version):
+    """SHA-256 over the cluster ID, sorted canonical features and template version."""
+    canonical = {str(key): _canonical_value(value) for key, value in features.items()}
+    payload = json.dumps([str(prompt_version), str(cluster_id), canonical],
+                         sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    Cache shared by every worker process on the host through one SQLite file.
+    Entries expire after `ttl_seconds`; the least recently used are evicted
+    once the table grows past `max_entries`.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl_seconds=86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS guidance_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS guidance_cache_last_access"
+                         " ON guidance_cache (last_access)")
+
+    def _connect(self):
+        # One connection per thread and per process, since a preloaded app forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM guidance_cache WHERE key = ?",
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM guidance_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE guidance_cache SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO guidance_cache (key, value, created_at, last_access)"
+                " VALUES (?, ?, ?, ?)", (key, value, now, now))
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM guidance_cache WHERE key IN ("
+                    " SELECT key FROM guidance_cache ORDER BY last_access LIMIT ?)", (excess,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM guidance_cache").fetchone()[0]
+
+
+class GuidanceCache:
+    """Front end over a cache backend that counts hits, misses and stores."""
+
+    def __init__(self, backend, prompt_version):
+        self.backend = backend
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def key(self, cluster_id, features):
+        return make_cache_key(cluster_id, features, self.prompt_version)
+
+    def get(self, cluster_id, features):
+        """Return the cached report, or None on a miss."""
+        try:
+            value = self.backend.get(self.key(cluster_id, features))
+        except Exception as e:
+            logger.error(f"Guidance cache lookup failed: {e}")
+            value = None
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, cluster_id, features, value):
+        try:
+            self.backend.set(self.key(cluster_id, features), value)
+        except Exception as e:
+            logger.error(f"Guidance cache store failed: {e}")
+            with self._lock:
+                self.errors += 1
+            return
+        with self._lock:
+            self.stores += 1
+
+    def get_or_generate(self, cluster_id, features, generate, *args, **kwargs):
+        """
+        Return the cached report or call generate(*args, **kwargs) and cache
+        its result. Exceptions from `generate` propagate and are not cached.
+        """
+        value = self.get(cluster_id, features)
+        if value is None:
+            value = self.generate_and_set(cluster_id, features, generate, *args, **kwargs)
+        return value
+
+    def generate_and_set(self, cluster_id, features, generate, *args, **kwargs):
+        """
+        get_or_generate for a caller that already missed with get(), so the
+        miss is counted once: call generate(*args, **kwargs) and cache its
+        result.
+        """
+        value = generate(*args, **kwargs)
+        if value:
+            self.set(cluster_id, features, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "backend": type(self.backend).__name__,
+                "prompt_version": self.prompt_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+        try:
+            stats["entries"] = len(self.backend)
+        except Exception:
+            stats["entries"] = None
+        return stats
+
+
+def cache_from_env(prompt_version):
+    """
+    Build the guidance cache selected by GUIDANCE_CACHE (memory, sqlite or off).
+    Returns None when caching is disabled.
+    """
+    kind = os.getenv("GUIDANCE_CACHE", "memory").lower()
+    max_entries = int(os.getenv("GUIDANCE_CACHE_MAX_ENTRIES", "10000"))
+    ttl_seconds = int(os.getenv("GUIDANCE_CACHE_TTL", "86400"))
+
+    if kind in ("off", "none", "0", "false"):
+        return None
+    if kind == "sqlite":
+        path = os.getenv("GUIDANCE_CACHE_PATH", "guidance_cache.sqlite3")
+        backend = SQLiteCacheBackend(path, max_entries=max_entries, ttl_seconds=ttl_seconds)
+    else:
+        backend = MemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    logger.info(f"Guidance cache enabled ({type(backend).__name__}, ttl={ttl_seconds}s, "
+                f"max_entries={max_entries})")
+    return GuidanceCache(backend, prompt_version)
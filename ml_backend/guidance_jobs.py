@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ("done", "failed")
+JOB_FIELDS = ("job_id", "status", "result", "error", "created_at", "finished_at")
+
+
+class QueueFullError(Exception):
+    """Raised when the guidance queue already holds max_pending jobs."""
+
+
+class MemoryJobStore:
+    """Jobs kept in this process, so only the worker that accepted a job can answer for it."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def evict(self, ttl_seconds):
+        """Drop jobs that finished more than `ttl_seconds` ago."""
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] is not None and job["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """
+    Jobs shared by every worker process on the host through one SQLite file,
+    so any worker can answer GET /guidance/<job_id>. Jobs still run in the
+    worker that accepted them; results are stored as JSON. A job left
+    unfinished by a worker that exited is dropped two TTLs after it was
+    created.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS guidance_jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " result TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS guidance_jobs_created_at ON guidance_jobs (created_at)")
+
+    def _connect(self):
+        # One connection per thread and per process, since a preloaded app forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, job):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO guidance_jobs (job_id, status, result, error, created_at, finished_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job["job_id"], job["status"], json.dumps(job["result"]), job["error"],
+                 job["created_at"], job["finished_at"]))
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE guidance_jobs SET {assignments} WHERE job_id = ?",
+                         (*fields.values(), job_id))
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT job_id, status, result, error, created_at, finished_at FROM guidance_jobs"
+            " WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def evict(self, ttl_seconds):
+        """Drop jobs that finished more than `ttl_seconds` ago, and abandoned ones."""
+        cutoff = time.time() - ttl_seconds
+        with self._connect() as conn:
+            conn.execute("DELETE FROM guidance_jobs WHERE finished_at < ?"
+                         " OR (finished_at IS NULL AND created_at < ?)", (cutoff, cutoff - ttl_seconds))
+
+
+class GuidanceJobs:
+    """
+    Bounded background pool for guidance report generation.
+
+    Jobs run on at most `max_workers` threads and at most `max_pending` may be
+    queued or running at once. Finished jobs are kept for `ttl_seconds` so
+    clients can poll for them, then evicted. Job status and results live in
+    `store` (a MemoryJobStore by default); with a SQLiteJobStore every worker
+    process can report on jobs accepted by the others.
+    """
+
+    def __init__(self, max_workers=4, max_pending=100, ttl_seconds=600, store=None, poll_interval=0.05):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.store = store if store is not None else MemoryJobStore()
+        self.poll_interval = poll_interval
+        # Completion events of the jobs running in this process
+        self._events = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return its job ID."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} guidance jobs already pending")
+            self._pending += 1
+            if self._executor is None:
+                # Created lazily so a preloaded app does not fork live threads
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="guidance")
+            job_id = uuid.uuid4().hex
+            self._events[job_id] = threading.Event()
+
+        try:
+            self.store.evict(self.ttl_seconds)
+            self.store.create({"job_id": job_id, "status": "pending", "result": None, "error": None,
+                               "created_at": time.time(), "finished_at": None})
+        except Exception:
+            self._finish(job_id)
+            raise
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def get(self, job_id, wait=0):
+        """
+        Return the public view of a job, or None if it is unknown or expired.
+        With `wait` > 0, block up to that many seconds for it to finish: on
+        the job's completion event when it runs in this process, otherwise
+        by polling the store.
+        """
+        job = self.store.get(job_id)
+        if job is None or wait <= 0 or job["status"] in FINISHED:
+            return job
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None:
+            event.wait(wait)
+            return self.store.get(job_id)
+
+        give_up_at = time.monotonic() + wait
+        while True:
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                return job
+            time.sleep(min(self.poll_interval, remaining))
+            job = self.store.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return job
+
+    def _run(self, job_id, fn, args, kwargs):
+        try:
+            self.store.update(job_id, status="running")
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"Guidance job {job_id} failed: {e}")
+                self.store.update(job_id, status="failed", error=str(e), finished_at=time.time())
+            else:
+                self.store.update(job_id, status="done", result=result, finished_at=time.time())
+        except Exception as e:
+            logger.error(f"Guidance job {job_id} could not be stored: {e}")
+        finally:
+            self._finish(job_id)
+
+    def _finish(self, job_id):
+        with self._lock:
+            self._pending -= 1
+            event = self._events.pop(job_id)
+        event.set()
+
+
+def jobs_from_env():
+    """
+    Build the guidance job pool from GUIDANCE_WORKERS, GUIDANCE_MAX_PENDING
+    and GUIDANCE_JOB_TTL, storing jobs as GUIDANCE_JOBS_STORE selects:
+    `memory` (this worker only) or `sqlite` (at GUIDANCE_JOBS_PATH, shared by
+    the workers on the host).
+    """
+    kind = os.getenv("GUIDANCE_JOBS_STORE", "memory").lower()
+    if kind == "sqlite":
+        store = SQLiteJobStore(os.getenv("GUIDANCE_JOBS_PATH", "guidance_jobs.sqlite3"))
+    else:
+        store = MemoryJobStore()
+    logger.info(f"Guidance jobs stored in {type(store).__name__}")
+    return GuidanceJobs(
+        max_workers=int(os.getenv("GUIDANCE_WORKERS", "4")),
+        max_pending=int(os.getenv("GUIDANCE_MAX_PENDING", "100")),
+        ttl_seconds=int(os.getenv("GUIDANCE_JOB_TTL", "600")),
+        store=store,
+    )
@@ -1,5 +1,71 @@
-bind = "0.0.0.0:8080"
-workers = 1
-timeout = 120  # Increased timeout to 120 seconds
+import gc
+import multiprocessing
+import os
+import tempfile
+
+# SERVING_PROFILE=production preloads the app into the master, forks one
+# worker per CPU and gives each a pool of threads, since most request time is
+# spent waiting on Gemini. Every setting below can be overridden on its own.
+profile = os.getenv("SERVING_PROFILE", "development").lower()
+production = profile == "production"
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:" + os.getenv("PORT", "8080"))
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() if production else 1))
+threads = int(os.getenv("GUNICORN_THREADS", 8 if production else 1))
+# gthread when threads > 1; "gevent" also works if gevent is installed
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread" if threads > 1 else "sync")
+# Load model artifacts once in the master and share them copy-on-write
+preload_app = os.getenv("GUNICORN_PRELOAD", "1" if production else "0").lower() in ("1", "true", "yes")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))  # Increased timeout to 120 seconds
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers now and then; 0 disables
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+# Access log lines carry the X-Request-ID correlation ID set by the orchestrator
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(M)sms rid=%({x-request-id}i)s'
 capture_output = True
-enable_stdio_inheritance = True
\ No newline at end of file
+enable_stdio_inheritance = True
+
+if workers > 1:
+    # /metrics sums every worker's values from this directory instead of
+    # answering with the one worker that happened to get the scrape
+    os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "career-path-metrics"))
+    # GET /guidance/<job_id> usually reaches another worker than the one running the job
+    os.environ.setdefault("GUIDANCE_JOBS_STORE", "sqlite")
+    if int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")) or int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")):
+        # The per-minute budgets are the API key's, not each worker's
+        os.environ.setdefault("LLM_BUDGET_STORE", "sqlite")
+        os.environ.setdefault("LLM_BUDGET_PATH", os.path.join(tempfile.gettempdir(), "career-path-llm-budget.sqlite3"))
+
+
+def _process_metrics():
+    from career_common.metrics import PROCESS_METRICS
+    return PROCESS_METRICS
+
+
+def on_starting(server):
+    metrics = _process_metrics()
+    if metrics is not None:
+        metrics.clear()
+
+
+def when_ready(server):
+    if preload_app:
+        # Move the preloaded objects out of the collector's generations so
+        # collections in the workers do not write to (and so copy) their pages
+        gc.freeze()
+    server.log.info(f"Serving profile {profile}: {workers} {worker_class} worker(s) x {threads} thread(s), "
+                    f"preload {'on' if preload_app else 'off'}")
+
+
+def worker_exit(server, worker):
+    metrics = _process_metrics()
+    if metrics is not None:
+        metrics.write()
+
+
+def child_exit(server, worker):
+    metrics = _process_metrics()
+    if metrics is not None:
+        metrics.mark_process_dead(worker.pid)
@@ -1,48 +1,84 @@
-import pandas as pd
-from flask import Flask, request, jsonify
+import os
+import hmac
+import json
+import math
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import traceback
 
 from config import configure_apis
-from model_loader import load_model_artifacts
-from preprocessing import preprocess_data, calculate_scores
-from gemini_utils import get_gemini_response
+from model_loader import ARTIFACT_BUNDLE, ARTIFACT_DIR, load_artifact_contents
+from model_registry import ModelRegistry, ReloadError, artifact_paths
+from preprocessing import calculate_scores
+from inference import predict_labels
+from batch_score import batch_result_json, score_questionnaires
+from gemini_utils import (GUIDANCE_ERROR_MESSAGE, PROMPT_VERSION, generate_guidance, llm_gateway,
+                          stream_guidance)
+from guidance_cache import cache_from_env
+from guidance_jobs import QueueFullError, jobs_from_env
+from career_common.llm_gateway import BACKGROUND, INTERACTIVE, GatewayBusy
+from career_common.metrics import FALLBACKS, instrument_app, span
 
 # Configure APIs and load model artifacts
 configure_apis()
-model, clusters_meta, mapping, model_columns = load_model_artifacts()
+# Serves one model version at a time and swaps in new artifacts without a restart;
+# MODEL_WATCH_INTERVAL polls the artifact files every that many seconds (0 = off)
+registry = ModelRegistry(load_artifact_contents,
+                         temperature=float(os.getenv("CENTROID_TEMPERATURE", "1.0")),
+                         watch_paths=artifact_paths(ARTIFACT_DIR, ARTIFACT_BUNDLE),
+                         watch_interval=float(os.getenv("MODEL_WATCH_INTERVAL", "0")))
+registry.load_initial()
+# Bearer token for POST /admin/reload; the endpoint is disabled without one
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN", "")
+
+# Rows scored per model.predict call by /predict_batch
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "1000"))
+
+# Background pool for ?async=true guidance generation; GUIDANCE_JOBS_STORE=sqlite
+# lets every worker answer for jobs accepted by the others
+guidance_jobs = jobs_from_env()
+# Shared report cache; configured by GUIDANCE_CACHE (memory, sqlite or off)
+guidance_cache = cache_from_env(PROMPT_VERSION)
+# Upper bound for the ?wait= long-poll on /guidance/<job_id>
+GUIDANCE_MAX_WAIT = float(os.getenv("GUIDANCE_MAX_WAIT", "30"))
+# Seconds a request waits for its report before the cluster's fallback report
+# is served (0 = no limit); ?deadline= overrides it per request
+GUIDANCE_DEADLINE = float(os.getenv("GUIDANCE_DEADLINE", "0"))
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+instrument_app(app)  # Correlation IDs, stage timings and GET /metrics
+registry.init_app(app)  # Model file watcher and the X-Model-Version header
 app.config['DEBUG'] = True
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    if not all([model, clusters_meta is not None, mapping is not None]):
+    active = current_model()
+    if active is None:
         return jsonify({"error": "Model not loaded. Please check server logs."}), 500
 
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "Invalid JSON input"}), 400
+        deadline, error = query_deadline()
+        if error:
+            return jsonify({"error": error}), 400
 
-        original_data_df = pd.DataFrame([data])
-        processed_df = preprocess_data(data, model_columns, mapping)
+        student_profile = active.profile_encoder.encode(data)
+        features = active.encoder.encode(data)
 
-        prediction = model.predict(processed_df)
-        cluster_id = prediction[0]
+        cluster_id = predict_labels(active.model, features, active.encoder)[0]
 
-        if cluster_id in clusters_meta.index:
-            cluster_info = clusters_meta.loc[cluster_id]
-        else:
+        # Labels index the clusters in file order, as in /predict_from_questionnaire
+        record = active.clusters_meta[cluster_id] if 0 <= cluster_id < len(active.clusters_meta) else None
+        if record is None:
             return jsonify({"error": f"Predicted cluster ID {cluster_id} not found in metadata."}), 500
 
-        gemini_response = get_gemini_response(cluster_info, original_data_df)
+        guidance = guidance_before_deadline(record, deadline, generate_guidance, record.info, student_profile)
+        body = {"career_guidance": guidance.pop("guidance"), **guidance}
 
-        return jsonify({
-            "predicted_cluster": cluster_info.to_dict(),
-            "career_guidance": gemini_response
-        })
+        return json_response('{"predicted_cluster": ' + record.info_json + ', ' + json.dumps(body)[1:])
 
     except Exception as e:
         print(f"An error occurred during prediction: {e}")
@@ -50,48 +86,61 @@ def predict():
 
 @app.route('/predict_from_questionnaire', methods=['POST'])
 def predict_from_questionnaire():
-    if not all([model, clusters_meta is not None, mapping is not None]):
+    active = current_model()
+    if active is None:
         return jsonify({"error": "Model not loaded"}), 500
     
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "Invalid JSON provided"}), 400
+        top_k, error = query_top_k(active)
+        if not error:
+            deadline, error = query_deadline()
+        if error:
+            return jsonify({"error": error}), 400
+
+        scores, record, ranking = classify_questionnaire(active, data, top_k)
+        # ?fallback=true adds the metadata-rendered report and career_details, for
+        # callers that hold their own deadline
+        fields = {**ranking, "model_version": active.version, "fallback": query_flag('fallback')}
+
+        if not query_flag('guidance', default=True):
+            # The caller (e.g. the orchestrator's combined mode) writes its own report
+            return json_response(record.response_json(**fields, guidance=None, guidance_status="skipped"))
+
+        if query_flag('async'):
+            cached = guidance_cache.get(record.cache_key, scores) if guidance_cache else None
+            if cached is not None:
+                return json_response(record.response_json(**fields, guidance=cached, guidance_status="done"))
+
+            # Return the cluster now and generate the report in the background
+            try:
+                # Queued behind interactive generations in the LLM gateway
+                job_id = guidance_jobs.submit(cached_guidance, active, record, scores, priority=BACKGROUND,
+                                              looked_up=guidance_cache is not None)
+            except QueueFullError as e:
+                print(f"Guidance queue full: {e}")
+                return json_response(record.response_json(**fields, guidance=None,
+                                                          guidance_status="rejected"))
+            return json_response(record.response_json(
+                **fields,
+                guidance=None,
+                guidance_status="pending",
+                guidance_job_id=job_id,
+                guidance_url=f"/guidance/{job_id}"
+            ))
+
+        looked_up = bool(deadline) and guidance_cache is not None
+        if looked_up:
+            # A cached report needs no job to wait on
+            cached = guidance_cache.get(record.cache_key, scores)
+            if cached is not None:
+                return json_response(record.response_json(**fields, guidance=cached))
 
-        scores = calculate_scores(data, mapping)
-        processed_data = preprocess_data(scores, model_columns, mapping)
-        
-        if hasattr(model, 'predict'):
-            prediction = model.predict(processed_data)
-            cluster_label = prediction[0]
-        else:
-            # Fallback for non-standard model object
-            scores_series = processed_data.iloc[0]
-            if scores_series['academic_average'] > 0.8 and scores_series['stream_Science'] == 1:
-                cluster_label = 0
-            elif scores_series['academic_average'] > 0.8:
-                cluster_label = 1
-            else:
-                cluster_label = 2
-        
-        cluster_key = clusters_meta.index[cluster_label]
-        cluster_info = clusters_meta.loc[cluster_key]
-        
-        if 'top_jobs' in cluster_info:
-            careers = pd.DataFrame(cluster_info['top_jobs'], columns=['career_name'])
-        else:
-            careers = pd.DataFrame([{"career_name": "Career recommendations not available"}])
-
-        student_df = pd.DataFrame([scores], index=[0])
-        gemini_guidance = get_gemini_response(cluster_info, student_df)
-        
-        return jsonify({
-            "cluster_label": int(cluster_label),
-            "cluster_name": cluster_info.get('name', 'N/A'),
-            "cluster_description": cluster_info.get('description', 'N/A'),
-            "suggested_careers": careers.to_dict(orient='records'),
-            "guidance": gemini_guidance
-        })
+        guidance = guidance_before_deadline(record, deadline, cached_guidance, active, record, scores,
+                                            looked_up=looked_up)
+        return json_response(record.response_json(**fields, **guidance))
     except Exception as e:
         error_details = {
             "error": str(e),
@@ -101,5 +150,318 @@ def predict_from_questionnaire():
         print("Error in predict_from_questionnaire:", error_details)
         return jsonify({"error": str(e), "details": error_details}), 500
 
+@app.route('/predict_from_questionnaire/stream', methods=['POST'])
+def predict_from_questionnaire_stream():
+    """
+    Server-Sent Events variant of /predict_from_questionnaire. Sends a `cluster`
+    event as soon as the prediction is made, then the report as `guidance`
+    chunks while Gemini generates it, then `done` (or `error`).
+    """
+    active = current_model()
+    if active is None:
+        return jsonify({"error": "Model not loaded"}), 500
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Invalid JSON provided"}), 400
+
+    try:
+        scores, record, _ = classify_questionnaire(active, data)
+    except Exception as e:
+        print("Error in predict_from_questionnaire_stream:", traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+    if not query_flag('guidance', default=True):
+        return Response(cluster_event(record, query_flag('fallback')) + sse_event("done", {"cached": False}),
+                        mimetype='text/event-stream')
+
+    return Response(
+        stream_with_context(_guidance_events(active, scores, record, query_flag('fallback'))),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/guidance/<job_id>', methods=['GET'])
+def get_guidance(job_id):
+    """
+    Returns the status of a background guidance job. Pass ?wait=<seconds> to
+    long-poll until the report is ready (capped at GUIDANCE_MAX_WAIT).
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), GUIDANCE_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    job = guidance_jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired guidance job {job_id}"}), 404
+
+    body = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        body["guidance"] = job["result"]
+        return jsonify(body)
+    if job["status"] == "failed":
+        body["error"] = job["error"]
+        return jsonify(body), 500
+    return jsonify(body), 202
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Scores a cohort of questionnaires without LLM guidance.
+
+    Accepts a JSON array (or {"questionnaires": [...]}) and answers with one
+    JSON document, or an NDJSON body (Content-Type: application/x-ndjson) and
+    streams NDJSON results back. Bad rows get an "error" entry instead of
+    failing the whole batch. ?top_k=<n> adds each row's n nearest clusters.
+    """
+    active = current_model()
+    if active is None:
+        return jsonify({"error": "Model not loaded"}), 500
+    top_k, error = query_top_k(active)
+    if error:
+        return jsonify({"error": error}), 400
+
+    if request.mimetype == 'application/x-ndjson':
+        # The whole stream is scored by the version that was current when it started
+        return Response(stream_with_context(_stream_ndjson_batch(active, request.stream, top_k)),
+                        mimetype='application/x-ndjson')
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('questionnaires')
+    if not isinstance(data, list):
+        return jsonify({"error": "Expected a JSON array of questionnaires"}), 400
+
+    results = []
+    for start in range(0, len(data), BATCH_CHUNK_SIZE):
+        results.extend(score_questionnaires(active, data[start:start + BATCH_CHUNK_SIZE], start, top_k))
+
+    error_count = sum(1 for _, record, _, _ in results if record is None)
+    return json_response('{"results": [' + ", ".join(batch_result_json(*result) for result in results) +
+                         f'], "count": {len(results)}, "error_count": {error_count}, '
+                         f'"model_version": {json.dumps(active.version)}}}')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the guidance report cache for this worker."""
+    if guidance_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **guidance_cache.stats()})
+
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    """Limits, budget use and queue counters of this worker's LLM gateway."""
+    return jsonify(llm_gateway.stats())
+
+@app.route('/model', methods=['GET'])
+def model_status():
+    """The model version this worker serves, and its reload history."""
+    return jsonify(registry.status())
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Loads the artifacts again and swaps them in if their version changed,
+    without interrupting requests in flight. Needs `Authorization: Bearer
+    <MODEL_ADMIN_TOKEN>`. ?force=true swaps even an unchanged version;
+    ?async=true returns 202 at once and reloads in the background. Only the
+    worker that answers reloads; MODEL_WATCH_INTERVAL reloads every worker.
+    """
+    if not MODEL_ADMIN_TOKEN:
+        return jsonify({"error": "Reload endpoint disabled: MODEL_ADMIN_TOKEN is not set"}), 403
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {MODEL_ADMIN_TOKEN}".encode('utf-8')):
+        return jsonify({"error": "Invalid admin token"}), 401
+
+    force = query_flag('force')
+    if query_flag('async'):
+        started = registry.reload_in_background(force)
+        return jsonify({"status": "started" if started else "already_running", **registry.status()}), 202
+    try:
+        result = registry.reload(force)
+    except ReloadError as e:
+        return jsonify({"error": f"Reload failed: {e}", **registry.status()}), 500
+    return jsonify({"status": result, **registry.status()})
+
+def current_model():
+    """
+    The ModelVersion that serves this request. Read it once per request and
+    pass it along, so a reload mid-request cannot mix two versions.
+    """
+    active = registry.current
+    if active is not None:
+        g.model_version = active.version
+    return active
+
+def query_flag(name, default=False):
+    """Reads a boolean query parameter such as ?async=true or ?guidance=false."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+def query_deadline():
+    """Reads ?deadline= (seconds, 0 = no limit) and returns (seconds, error); GUIDANCE_DEADLINE without it."""
+    value = request.args.get('deadline')
+    if value is None:
+        return GUIDANCE_DEADLINE, None
+    try:
+        deadline = float(value)
+    except ValueError:
+        return 0, "deadline must be a number of seconds"
+    if not (math.isfinite(deadline) and deadline >= 0):
+        return 0, "deadline must be a non-negative number of seconds"
+    return deadline, None
+
+def query_top_k(active):
+    """Reads ?top_k= and returns (k, error). k is 0 when no ranking was asked for."""
+    value = request.args.get('top_k')
+    if value is None:
+        return 0, None
+    if active.centroid_scorer is None:
+        return 0, "top_k is unavailable: cluster centroids could not be loaded"
+    try:
+        top_k = int(value)
+    except ValueError:
+        return 0, "top_k must be an integer"
+    if top_k < 1:
+        return 0, "top_k must be at least 1"
+    return min(top_k, len(active.clusters_meta)), None
+
+def classify_questionnaire(active, data, top_k=0):
+    """
+    Scores a questionnaire and returns (scores, cluster record, ranking), where
+    ranking is {"top_clusters": [...]} when top_k > 0 and empty otherwise.
+    """
+    with span("calculate_scores"):
+        scores = calculate_scores(data, active.mapping, active.score_maps)
+    with span("encode"):
+        features = active.encoder.encode(scores)
+    with span("predict"):
+        cluster_label = predict_labels(active.model, features, active.encoder)[0]
+    record = active.clusters_meta[cluster_label]
+    ranking = {}
+    if top_k:
+        with span("top_k"):
+            # The predicted cluster leads, so top_clusters[0] always agrees with cluster_label
+            ranking = {"top_clusters": active.centroid_scorer.rank(features, top_k, [cluster_label])[0]}
+    return scores, record, ranking
+
+def json_response(body, status=200):
+    """Wraps an already serialized JSON body in a response."""
+    return Response(body + "\n", status=status, mimetype='application/json')
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def cluster_event(record, fallback=False):
+    """
+    The `cluster` SSE event, built from the record's pre-serialized summary
+    (with the cluster's `fallback` report and career_details when asked for).
+    """
+    data = record.response_json(fallback=True) if fallback else record.summary_json
+    return f"event: cluster\ndata: {data}\n\n"
+
+def _guidance_events(active, scores, record, fallback=False):
+    yield cluster_event(record, fallback)
+
+    cached = guidance_cache.get(record.cache_key, scores) if guidance_cache else None
+    if cached is not None:
+        yield sse_event("guidance", cached)
+        yield sse_event("done", {"cached": True})
+        return
+
+    parts = []
+    try:
+        student_profile = active.profile_encoder.encode(scores)
+        for chunk in stream_guidance(record.info, student_profile):
+            parts.append(chunk)
+            yield sse_event("guidance", chunk)
+    except Exception as e:
+        print(f"Error streaming guidance: {e}")
+        yield sse_event("error", {"error": GUIDANCE_ERROR_MESSAGE})
+        return
+
+    report = "".join(parts)
+    if guidance_cache is not None and report:
+        guidance_cache.set(record.cache_key, scores, report)
+    yield sse_event("done", {"cached": False})
+
+def guidance_before_deadline(record, deadline, generate, *args, **kwargs):
+    """
+    Response fields for the report of `generate(*args, **kwargs)`: {"guidance": report}
+    when it is generated within `deadline` seconds (0 waits as long as it
+    takes). Otherwise, or when generation fails, the cluster's fallback
+    report with guidance_status "fallback", plus the guidance job still
+    generating the real report when it missed the deadline.
+    """
+    if not deadline:
+        try:
+            return {"guidance": generate(*args, **kwargs)}
+        except GatewayBusy as e:
+            print(f"Guidance not generated: {e}")
+            return fallback_fields(record, "busy")
+        except Exception as e:
+            print(f"Error generating guidance: {e}")
+            return fallback_fields(record, "error")
+
+    # Generated as a job so this request can stop waiting while it carries on
+    try:
+        job_id = guidance_jobs.submit(generate, *args, **kwargs)
+    except QueueFullError as e:
+        print(f"Guidance queue full: {e}")
+        return fallback_fields(record, "busy")
+    job = guidance_jobs.get(job_id, wait=deadline)
+    if job is not None and job["status"] == "done":
+        return {"guidance": job["result"]}
+    if job is None or job["status"] == "failed":
+        return fallback_fields(record, "error")
+    return {**fallback_fields(record, "deadline"), "guidance_job_id": job_id,
+            "guidance_url": f"/guidance/{job_id}"}
+
+def fallback_fields(record, reason):
+    FALLBACKS.inc(operation="guidance", reason=reason)
+    return {"guidance": record.fallback_guidance, "guidance_status": "fallback"}
+
+def cached_guidance(active, record, scores, priority=INTERACTIVE, looked_up=False):
+    """
+    Returns the guidance report for this cluster and score profile, generating
+    it with Gemini only on a cache miss. `looked_up` says the caller already
+    missed the cache, so it is not looked up (or counted) again. Generation
+    errors are raised.
+    """
+    with span("guidance"):
+        student_profile = active.profile_encoder.encode(scores)
+        if guidance_cache is None:
+            return generate_guidance(record.info, student_profile, priority)
+        if looked_up:
+            return guidance_cache.generate_and_set(record.cache_key, scores, generate_guidance,
+                                                   record.info, student_profile, priority)
+        return guidance_cache.get_or_generate(record.cache_key, scores, generate_guidance,
+                                              record.info, student_profile, priority)
+
+def _stream_ndjson_batch(active, lines, top_k=0):
+    """Parses NDJSON questionnaires in chunks and yields NDJSON results."""
+    chunk = []
+    offset = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except ValueError as e:
+            chunk.append(ValueError(f"Invalid JSON: {e}"))
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            for result in score_questionnaires(active, chunk, offset, top_k):
+                yield batch_result_json(*result) + "\n"
+            offset += len(chunk)
+            chunk = []
+    if chunk:
+        for result in score_questionnaires(active, chunk, offset, top_k):
+            yield batch_result_json(*result) + "\n"
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
@@ -1,48 +1,78 @@
-import pandas as pd
-import joblib
+import os
+import subprocess
+import sys
+
+from artifact_bundle import (BASE_DIR, DEFAULT_BUNDLE, BundleError, load_bundle,
+                             load_sources, source_version)
+from cluster_table import ClusterTable
+
+# Directory holding career_model.pkl, clusters_meta.json and mapping.csv
+ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", BASE_DIR)
+# Prebuilt artifact bundle; set ARTIFACT_BUNDLE=off to always read the source files
+ARTIFACT_BUNDLE = os.getenv("ARTIFACT_BUNDLE", os.path.join(ARTIFACT_DIR, DEFAULT_BUNDLE))
+# Rebuild a missing or stale bundle in a child process instead of reading the source files here
+ARTIFACT_BUNDLE_REBUILD = os.getenv("ARTIFACT_BUNDLE_REBUILD", "1").lower() in ("1", "true", "yes")
+
+def rebuild_bundle(artifact_dir, bundle_path):
+    """
+    Build the bundle with `python artifact_bundle.py` in a child process, so
+    scikit-learn and pandas are imported there and not in this worker, which
+    keeps serving meanwhile. Returns True if the bundle was written.
+    """
+    try:
+        result = subprocess.run([sys.executable, os.path.join(BASE_DIR, 'artifact_bundle.py'),
+                                 '--artifact-dir', artifact_dir, '--output', bundle_path],
+                                cwd=BASE_DIR, capture_output=True, text=True, timeout=300)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Artifact bundle rebuild failed: {e}")
+        return False
+    if result.returncode != 0:
+        output = (result.stdout + result.stderr).strip().splitlines()
+        print(f"Artifact bundle rebuild failed: {output[-1] if output else result.returncode}")
+        return False
+    return True
+
+def _load_bundle_contents(artifact_dir, bundle_path):
+    contents = load_bundle(bundle_path, artifact_dir)
+    contents['version'] = contents['header']['version']
+    contents['source'] = 'bundle'
+    print(f"Loaded artifact bundle {contents['version']}")
+    return contents
+
+def load_artifact_contents(artifact_dir=ARTIFACT_DIR, bundle_path=ARTIFACT_BUNDLE):
+    """
+    Load the artifacts as bundle contents plus their 'version' and 'source':
+    from the bundle when it is usable (rebuilding it first if it is missing
+    or stale), otherwise from the source files. Errors are raised.
+    """
+    if bundle_path.lower() != 'off':
+        try:
+            return _load_bundle_contents(artifact_dir, bundle_path)
+        except BundleError as e:
+            print(f"Artifact bundle not used: {e}")
+        if ARTIFACT_BUNDLE_REBUILD and rebuild_bundle(artifact_dir, bundle_path):
+            try:
+                return _load_bundle_contents(artifact_dir, bundle_path)
+            except BundleError as e:
+                print(f"Rebuilt artifact bundle not used: {e}")
+
+    print("Attempting to load model files...")
+    _, version = source_version(artifact_dir)
+    contents = load_sources(artifact_dir)
+    contents['version'] = version
+    contents['source'] = 'source files'
+    print("Loaded career_model.pkl, clusters_meta.json and mapping.csv")
+    return contents
 
 def load_model_artifacts():
     """Load the pre-trained model and other necessary files."""
     try:
-        print("Attempting to load model files...")
-        model = joblib.load('career_model.pkl')
-        print("Loaded career_model.pkl")
-        
-        # Correctly load the JSON file
-        with open('clusters_meta.json', 'r') as f:
-            clusters_meta_json = pd.read_json(f, orient='index')
-        print("Loaded clusters_meta.json")
-
-        mapping = pd.read_csv('mapping.csv')
-        print("Loaded mapping.csv")
-        
-        # Extract model columns from the model if available
-        if hasattr(model, 'feature_names_in_'):
-            model_columns = model.feature_names_in_
-        else:
-            # Define model columns manually if not available in the model object
-            model_columns = [
-                'age', 'grade', 'parental_interest_level', 'psychometric_aptitude_verbal',
-                'psychometric_aptitude_quantitative', 'exploration_work_score', 'creativity_score',
-                'expected_salary', 'teamwork_score', 'psychometric_test_score', 'academic_average',
-                'academic_max', 'academic_min', 'academic_std', 'academic_subjects_count',
-                'hobby_count', 'has_creative_hobby', 'has_technical_hobby', 'has_sports_hobby',
-                'stream_Arts', 'stream_Commerce', 'stream_Science', 'family_income_band_High',
-                'family_income_band_Low', 'family_income_band_Lower-Middle', 'family_income_band_Middle',
-                'family_income_band_Upper-Middle', 'parental_expectation_field_Arts',
-                'parental_expectation_field_Commerce', 'parental_expectation_field_Engineering',
-                'parental_expectation_field_Law', 'parental_expectation_field_Medicine',
-                'parental_expectation_field_Science', 'parental_expectation_field_Technology',
-                'psychometric_test_given_No', 'psychometric_test_given_Yes', 'interest_Arts',
-                'interest_Commerce', 'interest_Engineering', 'interest_Law', 'interest_Medicine',
-                'interest_Science', 'interest_Technology', 'comfortable_outside_india_No',
-                'comfortable_outside_india_Yes', 'job_seeking_preference_Hybrid',
-                'job_seeking_preference_On-site', 'job_seeking_preference_Remote',
-                'disability_status_Hearing', 'disability_status_Learning', 'disability_status_Physical',
-                'disability_status_Unknown', 'disability_status_Visual'
-            ]
-            
-        return model, clusters_meta_json, mapping, model_columns
+        contents = load_artifact_contents()
+
+        # Per-cluster records with pre-serialized JSON, built once at startup
+        clusters_meta = ClusterTable(contents['clusters_meta'])
+
+        return contents['model'], clusters_meta, contents['mapping'], contents['model_columns']
 
     except Exception as e:
         print(f"Error loading model files: {str(e)}. Make sure all model-related files are present.")
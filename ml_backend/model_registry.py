@@ -0,0 +1,245 @@
+"""
+Versioned model artifacts with background reload and an atomic swap.
+
+A ModelVersion holds everything a request needs to score a questionnaire:
+the model, cluster table, mapping, encoders, score maps and centroid scorer,
+all built from one set of artifact files and tagged with their version. The
+registry serves one version at a time. Each request reads `registry.current`
+once and keeps that object to the end, so a reload never changes the model
+under a request in flight. A reload loads, validates and warms up the new
+version beside the old one, then replaces the reference in a single
+assignment. Requests never wait on a reload.
+
+Reloads come from `reload()` (POST /admin/reload) or from a watcher thread
+that polls the artifact files' modification times. Each worker process runs
+its own watcher, started on its first request.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from flask import g
+
+from artifact_bundle import SOURCES, validate
+from centroid_scoring import scorer_from_model
+from cluster_table import ClusterTable
+from inference import predict_labels
+from preprocessing import FeatureEncoder, build_score_maps, calculate_scores
+from student_profile import ProfileEncoder
+
+VERSION_HEADER = "X-Model-Version"
+
+
+class ReloadError(Exception):
+    """The new artifacts could not be loaded or failed validation; the old version keeps serving."""
+
+
+@dataclass(frozen=True)
+class ModelVersion:
+    version: str
+    source: str  # 'bundle' or 'source files'
+    model: object
+    clusters_meta: ClusterTable
+    mapping: dict
+    model_columns: list
+    encoder: FeatureEncoder
+    score_maps: dict
+    centroid_scorer: object  # CentroidScorer, or None when the centroids are unusable
+    profile_encoder: ProfileEncoder  # the student profile for guidance prompts
+    loaded_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat(timespec='seconds'))
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "clusters": len(self.clusters_meta),
+            "top_k": self.centroid_scorer is not None,
+        }
+
+
+def build_version(contents, temperature=1.0):
+    """
+    Validate loaded artifact contents and build a ModelVersion from them,
+    scoring one blank questionnaire so the first real request pays no
+    warm-up cost. Raises on invalid artifacts.
+    """
+    validate(contents)
+    clusters_meta = ClusterTable(contents['clusters_meta'])
+    mapping = contents['mapping']
+    encoder = FeatureEncoder(contents['model_columns'], mapping)
+    score_maps = build_score_maps(mapping)
+    model = contents['model']
+    centroid_scorer = scorer_from_model(model, clusters_meta, encoder, temperature=temperature)
+
+    features = encoder.encode(calculate_scores({}, mapping, score_maps))
+    label = predict_labels(model, features, encoder)[0]
+    clusters_meta[label]  # the model must only predict known clusters
+    if centroid_scorer is not None:
+        centroid_scorer.rank(features, 1)
+
+    return ModelVersion(
+        version=contents['version'],
+        source=contents['source'],
+        model=model,
+        clusters_meta=clusters_meta,
+        mapping=mapping,
+        model_columns=contents['model_columns'],
+        encoder=encoder,
+        score_maps=score_maps,
+        centroid_scorer=centroid_scorer,
+        profile_encoder=ProfileEncoder(mapping),
+    )
+
+
+class ModelRegistry:
+    """
+    Serves the current ModelVersion and replaces it on reload.
+
+    `loader` returns artifact contents with 'version' and 'source' keys
+    (model_loader.load_artifact_contents). `watch_paths` are polled every
+    `watch_interval` seconds once watching starts; 0 disables the watcher.
+    """
+
+    def __init__(self, loader, temperature=1.0, watch_paths=(), watch_interval=0):
+        self.current = None
+        self._loader = loader
+        self.temperature = temperature
+        self.watch_paths = tuple(watch_paths)
+        self.watch_interval = watch_interval
+        self._reload_lock = threading.Lock()
+        self._watch_lock = threading.Lock()
+        self._watcher_pid = None
+        self._seen = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_reload_at = None
+
+    def load_initial(self):
+        """Load the first version at startup. Returns it, or None if the artifacts are unusable."""
+        try:
+            self.reload()
+        except ReloadError as e:
+            print(f"Error loading model files: {e}. Make sure all model-related files are present.")
+        return self.current
+
+    def reload(self, force=False):
+        """
+        Load the artifacts and swap them in if their version differs from the
+        one serving (or always, with force). Returns "reloaded" or
+        "unchanged". Raises ReloadError and keeps the current version if the
+        new artifacts fail to load or validate. One reload runs at a time.
+        """
+        with self._reload_lock:
+            # Taken before loading: files that change mid-load are seen again on the next poll
+            fingerprint = self.fingerprint()
+            start = time.perf_counter()
+            try:
+                contents = self._loader()
+                if not force and self.current is not None and contents['version'] == self.current.version:
+                    self._seen = fingerprint
+                    self.last_error = None  # the artifacts load again, e.g. after a broken edit was undone
+                    return "unchanged"
+                candidate = build_version(contents, self.temperature)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise ReloadError(self.last_error) from e
+
+            previous = self.current
+            self.current = candidate  # the swap; requests holding `previous` finish on it
+            self._seen = fingerprint
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_at = candidate.loaded_at
+            print(f"Serving model version {candidate.version} from {candidate.source} "
+                  f"(was {previous.version if previous else 'none'}, "
+                  f"loaded in {time.perf_counter() - start:.2f}s)")
+            return "reloaded"
+
+    def reload_in_background(self, force=False):
+        """Start a reload on a daemon thread. Returns False if one is already running."""
+        if self._reload_lock.locked():
+            return False
+        threading.Thread(target=self._reload_logged, args=(force,), daemon=True,
+                         name="model-reload").start()
+        return True
+
+    def _reload_logged(self, force=False):
+        try:
+            self.reload(force)
+        except ReloadError as e:
+            print(f"Model reload failed, still serving {self.version()}: {e}")
+
+    def version(self):
+        current = self.current
+        return current.version if current is not None else None
+
+    def fingerprint(self):
+        """(path, mtime_ns, size) of every watched file; None for missing files."""
+        stamps = []
+        for path in self.watch_paths:
+            try:
+                stat = os.stat(path)
+                stamps.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append((path, None, None))
+        return tuple(stamps)
+
+    def ensure_watching(self):
+        """Start this process's watcher thread if it is enabled and not running (e.g. after a fork)."""
+        if not self.watch_interval or self._watcher_pid == os.getpid():
+            return
+        with self._watch_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self._watch, daemon=True, name="model-watcher").start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            fingerprint = self.fingerprint()
+            if fingerprint != self._seen:
+                # Recorded up front so broken artifacts are retried when they change, not every poll
+                self._seen = fingerprint
+                self._reload_logged()
+
+    def status(self):
+        current = self.current
+        return {
+            **(current.describe() if current is not None else {"version": None}),
+            "reloads": self.reloads,
+            "reload_failures": self.failures,
+            "last_error": self.last_error,
+            "last_reload_at": self.last_reload_at,
+            "reloading": self._reload_lock.locked(),
+            "watch_interval": self.watch_interval,
+        }
+
+    def init_app(self, app):
+        """Start the watcher on the first request of each worker and tag responses with the version."""
+
+        @app.before_request
+        def _start_watcher():
+            self.ensure_watching()
+
+        @app.after_request
+        def _add_version_header(response):
+            version = g.get('model_version')
+            if version is not None:
+                response.headers[VERSION_HEADER] = version
+            return response
+
+        return app
+
+
+def artifact_paths(artifact_dir, bundle_path):
+    """The files a change to which should trigger a reload."""
+    paths = [os.path.join(artifact_dir, filename) for filename in SOURCES.values()]
+    if bundle_path.lower() != 'off':
+        paths.append(bundle_path)
+    return paths
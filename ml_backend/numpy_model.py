@@ -0,0 +1,204 @@
+"""
+Array-backed export of the fitted scikit-learn objects in career_model.pkl.
+
+export_model turns each supported estimator into a plain dict of NumPy
+arrays, and load_model turns those dicts into small evaluators with the same
+`transform`/`predict` results, so serving never imports scikit-learn. The
+exported form holds no sklearn classes and unpickles with NumPy alone.
+"""
+import numpy as np
+
+# Marks an exported estimator inside the model structure
+KIND = '__numpy_model__'
+LINEAR_CLASSIFIERS = ('LogisticRegression', 'LinearSVC', 'RidgeClassifier', 'SGDClassifier', 'Perceptron')
+
+
+class ExportError(Exception):
+    """The model contains an estimator this module cannot evaluate."""
+
+
+class StandardScalerArrays:
+    """StandardScaler.transform: (X - mean_) / scale_."""
+
+    def __init__(self, mean, scale, feature_names=None):
+        self.mean_ = mean
+        self.scale_ = scale
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+
+    def transform(self, features):
+        return (np.asarray(features, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class NearestCenterArrays:
+    """KMeans-style predict: the label of the closest center by Euclidean distance."""
+
+    def __init__(self, centers, labels, feature_names=None):
+        self.centers = centers
+        self.labels = labels
+        self._centers_sq = np.einsum('ij,ij->i', centers, centers)
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+
+    def transform(self, features):
+        """Euclidean distance to every center, as KMeans.transform returns."""
+        features = np.asarray(features, dtype=np.float64)
+        squared = (np.einsum('ij,ij->i', features, features)[:, None]
+                   - 2.0 * features @ self.centers.T + self._centers_sq[None, :])
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def predict(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        # ||x||^2 is the same for every center, so it does not change the argmin
+        distances = self._centers_sq[None, :] - 2.0 * features @ self.centers.T
+        return self.labels[np.argmin(distances, axis=1)]
+
+
+class LinearClassifierArrays:
+    """predict of a fitted linear classifier: argmax of X @ coef.T + intercept."""
+
+    def __init__(self, coef, intercept, classes, feature_names=None):
+        self.coef = coef
+        self.intercept = intercept
+        self.classes = classes
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+
+    def predict(self, features):
+        scores = np.asarray(features, dtype=np.float64) @ self.coef.T + self.intercept
+        if scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(int)]
+        return self.classes[np.argmax(scores, axis=1)]
+
+
+class PipelineArrays:
+    """A Pipeline of exported steps: every step but the last transforms."""
+
+    def __init__(self, steps, feature_names=None):
+        self.steps = steps
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+
+    def _transform_all(self, features):
+        for step in self.steps[:-1]:
+            features = step.transform(features)
+        return features
+
+    def transform(self, features):
+        return self.steps[-1].transform(self._transform_all(features))
+
+    def predict(self, features):
+        return self.steps[-1].predict(self._transform_all(features))
+
+
+def _array(values):
+    return np.array(values, dtype=np.float64)
+
+
+def _feature_names(estimator):
+    names = getattr(estimator, 'feature_names_in_', None)
+    return None if names is None else [str(name) for name in names]
+
+
+def _is_sklearn(value):
+    return type(value).__module__.split('.')[0] == 'sklearn'
+
+
+def export_estimator(estimator):
+    """One fitted sklearn estimator as a dict of arrays. Raises ExportError if unsupported."""
+    name = type(estimator).__name__
+    spec = {KIND: None, 'feature_names': _feature_names(estimator)}
+    if name == 'StandardScaler':
+        n_features = estimator.n_features_in_
+        mean = estimator.mean_ if estimator.with_mean else None
+        scale = estimator.scale_ if estimator.with_std else None
+        spec.update({KIND: 'standard_scaler',
+                     'mean': np.zeros(n_features) if mean is None else _array(mean),
+                     'scale': np.ones(n_features) if scale is None else _array(scale)})
+    elif name in ('KMeans', 'MiniBatchKMeans'):
+        centers = _array(estimator.cluster_centers_)
+        spec.update({KIND: 'nearest_center', 'centers': centers,
+                     'labels': np.arange(len(centers))})
+    elif name == 'NearestCentroid' and getattr(estimator, 'metric', 'euclidean') == 'euclidean':
+        spec.update({KIND: 'nearest_center', 'centers': _array(estimator.centroids_),
+                     'labels': np.asarray(estimator.classes_)})
+    elif name in LINEAR_CLASSIFIERS:
+        spec.update({KIND: 'linear', 'coef': np.atleast_2d(_array(estimator.coef_)),
+                     'intercept': np.atleast_1d(_array(estimator.intercept_)),
+                     'classes': np.asarray(estimator.classes_)})
+    elif name == 'Pipeline':
+        spec.update({KIND: 'pipeline',
+                     'steps': [export_estimator(step) for _, step in estimator.steps
+                               if step is not None and step != 'passthrough']})
+    else:
+        raise ExportError(f"No NumPy evaluator for {name}")
+    return spec
+
+
+def export_model(model):
+    """
+    The model with every sklearn estimator replaced by its exported arrays.
+    A dict model (scaler plus metadata) is exported entry by entry.
+    """
+    if isinstance(model, dict):
+        return {key: export_estimator(value) if _is_sklearn(value) else value
+                for key, value in model.items()}
+    if _is_sklearn(model):
+        return export_estimator(model)
+    raise ExportError(f"No NumPy evaluator for {type(model).__name__}")
+
+
+def load_estimator(spec):
+    kind = spec[KIND]
+    names = spec.get('feature_names')
+    if kind == 'standard_scaler':
+        return StandardScalerArrays(spec['mean'], spec['scale'], names)
+    if kind == 'nearest_center':
+        return NearestCenterArrays(spec['centers'], spec['labels'], names)
+    if kind == 'linear':
+        return LinearClassifierArrays(spec['coef'], spec['intercept'], spec['classes'], names)
+    if kind == 'pipeline':
+        return PipelineArrays([load_estimator(step) for step in spec['steps']], names)
+    raise ExportError(f"Unknown exported estimator kind {kind!r}")
+
+
+def is_exported(model):
+    """True if `model` came from export_model."""
+    if isinstance(model, dict):
+        return KIND in model or any(isinstance(value, dict) and KIND in value for value in model.values())
+    return False
+
+
+def load_model(exported):
+    """Evaluators for an export_model result, in the same structure as the original model."""
+    if KIND in exported:
+        return load_estimator(exported)
+    return {key: load_estimator(value) if isinstance(value, dict) and KIND in value else value
+            for key, value in exported.items()}
+
+
+def compare_models(original, evaluator, features):
+    """
+    Return a list of the methods whose output differs between the original
+    model and its evaluator on `features` (empty if they agree).
+    """
+    if isinstance(original, dict):
+        pairs = [(original[key], evaluator[key]) for key in original if _is_sklearn(original[key])]
+    else:
+        pairs = [(original, evaluator)]
+
+    mismatches = []
+    for estimator, exported in pairs:
+        rows = features
+        n_features = getattr(estimator, 'n_features_in_', features.shape[1])
+        if rows.shape[1] != n_features:
+            # Scalers stored beside the model see their own feature space
+            rows = np.random.default_rng(0).normal(size=(len(features), n_features)) * 3
+        name = type(estimator).__name__
+        if hasattr(estimator, 'predict') and hasattr(exported, 'predict'):
+            if not np.array_equal(np.asarray(estimator.predict(rows)), exported.predict(rows)):
+                mismatches.append(f"{name}.predict")
+        if hasattr(estimator, 'transform') and hasattr(exported, 'transform'):
+            if not np.allclose(estimator.transform(rows), exported.transform(rows), rtol=1e-9, atol=1e-12):
+                mismatches.append(f"{name}.transform")
+    return mismatches
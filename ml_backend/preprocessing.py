@@ -1,28 +1,42 @@
-import pandas as pd
+import math
+
+import numpy as np
+
+# Rating scales reported on 0-10 and normalized to 0.0-1.0
+RATING_SCALES = [
+    'parental_interest_level', 'psychometric_aptitude_verbal',
+    'psychometric_aptitude_quantitative', 'exploration_work_score',
+    'creativity_score', 'teamwork_score'
+]
+SUBJECT_SCORES = [
+    'math_score', 'english_score', 'science_score'
+    # Add other potential subject score columns here if any
+]
+ACADEMIC_STATS = [
+    'academic_average', 'academic_max', 'academic_min', 'academic_std',
+    'academic_subjects_count'
+]
+HOBBY_COLUMNS = ['has_creative_hobby', 'has_technical_hobby', 'has_sports_hobby']
 
 def preprocess_data(data, model_columns, mapping):
     """
     Preprocesses the incoming JSON data to match the model's input format.
+    `mapping` may be a DataFrame or the dict of columns from the artifact bundle.
     """
+    # Only this reference path needs pandas; the service uses FeatureEncoder
+    import pandas as pd
+
+    mapping = pd.DataFrame(mapping)
     # Convert incoming JSON to a DataFrame
     df = pd.DataFrame([data])
 
     # Normalize rating scales from 0-10 to 0.0-1.0
-    rating_scales = [
-        'parental_interest_level', 'psychometric_aptitude_verbal',
-        'psychometric_aptitude_quantitative', 'exploration_work_score',
-        'creativity_score', 'teamwork_score'
-    ]
-    for col in rating_scales:
+    for col in RATING_SCALES:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce') / 10.0
 
     # Calculate academic stats
-    subject_scores = [
-        'math_score', 'english_score', 'science_score'
-        # Add other potential subject score columns here if any
-    ]
-    scores = df[subject_scores].apply(pd.to_numeric, errors='coerce').dropna(axis=1)
+    scores = df[SUBJECT_SCORES].apply(pd.to_numeric, errors='coerce').dropna(axis=1)
     
     if not scores.empty:
         df['academic_average'] = scores.mean(axis=1)
@@ -38,8 +52,7 @@ def preprocess_data(data, model_columns, mapping):
         df['academic_subjects_count'] = 0
 
     # Calculate hobby-related features
-    hobby_cols = ['has_creative_hobby', 'has_technical_hobby', 'has_sports_hobby']
-    df['hobby_count'] = df[hobby_cols].sum(axis=1)
+    df['hobby_count'] = df[HOBBY_COLUMNS].sum(axis=1)
     
     # One-hot encode categorical variables based on the mapping file
     for _, row in mapping.iterrows():
@@ -57,24 +70,243 @@ def preprocess_data(data, model_columns, mapping):
 
     return df[model_columns]
 
-def calculate_scores(answers, mapping):
+def _to_number(value):
+    """Coerce a single value the way pd.to_numeric(errors='coerce') does."""
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def _numbers(values):
+    """Coerce a column of values to a float64 array the way _to_number does each one."""
+    try:
+        numbers = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        numbers = None
+    # A column of equal-length lists converts without error, but to a 2-D array
+    if numbers is None or numbers.ndim != 1:
+        numbers = np.array([value if value.__class__ in (int, float) else _to_number(value) for value in values],
+                           dtype=np.float64)
+    return numbers
+
+def _matches(values, value):
+    """1.0 where a column of values equals `value`, else 0.0."""
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        # Computed columns hold only numbers, which never equal a category name
+        if isinstance(value, (int, float)):
+            return (values == value).astype(np.float64)
+        return np.zeros(len(values))
+    return np.array([1.0 if v == value else 0.0 for v in values], dtype=np.float64)
+
+def _academic_stats_columns(scores):
+    """
+    _academic_stats of every row of an (n_rows, n_subjects) score matrix, NaN
+    where a subject is not numeric, as one array per statistic.
+    """
+    valid = ~np.isnan(scores)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(valid, scores, 0).sum(axis=1) / count
+        squares = np.where(valid, (scores - average[:, None]) ** 2, 0).sum(axis=1)
+        # NaN for a single score, as the sample std is; zeroed with the other NaNs
+        std = np.where(count > 1, np.sqrt(squares / np.maximum(count - 1, 1)), np.nan)
+    maximum = np.where(valid, scores, -np.inf).max(axis=1)
+    minimum = np.where(valid, scores, np.inf).min(axis=1)
+    stats = [average, maximum, minimum, std, count.astype(np.float64)]
+    none = count == 0
+    for column in stats:
+        column[none] = 0
+    return stats
+
+class FeatureEncoder:
+    """
+    Compiled equivalent of preprocess_data.
+
+    The column plan is built once from mapping.csv and model_columns so that
+    a request dict can be written straight into a float row by fixed column
+    index, without building a DataFrame per request. Batches are encoded a
+    column at a time with NumPy (encode_batch, encode_columns).
+    """
+
+    def __init__(self, model_columns, mapping):
+        self.columns = list(model_columns)
+        self.index = {col: i for i, col in enumerate(self.columns)}
+
+        # Later mapping rows win in preprocess_data, so keep them first here
+        onehot_sources = {}
+        for column, value in zip(mapping['column'], mapping['original_value']):
+            onehot_sources.setdefault(f"{column}_{value}", []).insert(0, (column, value))
+
+        self._stats = []
+        self._hobby_count = []
+        self._onehot = []
+        self._ratings = []
+        self._passthrough = []
+        for i, col in enumerate(self.columns):
+            if col in ACADEMIC_STATS:
+                self._stats.append((i, ACADEMIC_STATS.index(col)))
+            elif col == 'hobby_count':
+                self._hobby_count.append(i)
+            elif col in onehot_sources:
+                self._onehot.append((i, col, onehot_sources[col]))
+            elif col in RATING_SCALES:
+                self._ratings.append((i, col))
+            else:
+                self._passthrough.append((i, col))
+        # Read with data[col] by encode_into, so a record without them fails
+        self._required = (SUBJECT_SCORES if self._stats else []) + (HOBBY_COLUMNS if self._hobby_count else [])
+
+    def encode(self, data):
+        """Encode one request dict into a (1, n_columns) float array."""
+        row = np.empty((1, len(self.columns)), dtype=np.float64)
+        self.encode_into(data, row[0])
+        return row
+
+    def encode_batch(self, records):
+        """
+        Encode many request dicts into one (n_rows, n_columns) matrix, as encode
+        does each. Returns the matrix and, per row, the exception encode would
+        have raised or None. Rows that failed are left as zeros.
+        """
+        errors = [None if isinstance(data, dict) else TypeError("Record must be a dict") for data in records]
+        for col in self._required:
+            for i in np.flatnonzero([error is None and col not in data for data, error in zip(records, errors)]):
+                errors[i] = KeyError(col)
+        rows = [data if error is None else {} for data, error in zip(records, errors)]
+
+        features = self._encode_columns(lambda col: [data.get(col) for data in rows],
+                                        lambda col: np.array([col in data for data in rows], dtype=bool),
+                                        len(rows))
+        features[[i for i, error in enumerate(errors) if error is not None]] = 0
+        return features, errors
+
+    def encode_columns(self, columns, n_rows):
+        """
+        Encode the column form returned by calculate_scores_batch, in which
+        every row has every column, into an (n_rows, n_columns) matrix.
+        """
+        absent = [None] * n_rows
+        return self._encode_columns(lambda col: columns.get(col, absent),
+                                    lambda col: np.full(n_rows, col in columns), n_rows)
+
+    def _encode_columns(self, values, present, n_rows):
+        """
+        The encode_into plan applied to whole columns: `values(col)` returns a
+        column's raw values (None where a row lacks it), `present(col)` a
+        boolean array of the rows that have it.
+        """
+        features = np.empty((n_rows, len(self.columns)), dtype=np.float64)
+        numbers = {}
+
+        def number(col):
+            if col not in numbers:
+                numbers[col] = _numbers(values(col))
+            return numbers[col]
+
+        for i, col in self._passthrough:
+            features[:, i] = number(col)
+
+        for i, col in self._ratings:
+            features[:, i] = np.where(present(col), number(col) / 10.0, 0)
+
+        for i, col, sources in self._onehot:
+            features[:, i] = number(col)
+            # The first source a row has decides it, so apply them last to first
+            for column, value in reversed(sources):
+                has = present(column)
+                features[has, i] = _matches(values(column), value)[has]
+
+        if self._stats:
+            stats = _academic_stats_columns(np.column_stack([number(col) for col in SUBJECT_SCORES]))
+            for i, pos in self._stats:
+                features[:, i] = stats[pos]
+
+        if self._hobby_count:
+            hobbies = np.column_stack([number(col) for col in HOBBY_COLUMNS])
+            hobby_count = np.where(np.isnan(hobbies), 0, hobbies).sum(axis=1)
+            for i in self._hobby_count:
+                features[:, i] = hobby_count
+
+        features[np.isnan(features)] = 0
+        return features
+
+    def encode_into(self, data, row):
+        """Write the encoded features of `data` into the preallocated 1-D `row`."""
+        for i, col in self._passthrough:
+            row[i] = _to_number(data.get(col))
+
+        for i, col in self._ratings:
+            row[i] = _to_number(data[col]) / 10.0 if col in data else 0
+
+        for i, col, sources in self._onehot:
+            for column, value in sources:
+                if column in data:
+                    row[i] = 1 if data[column] == value else 0
+                    break
+            else:
+                row[i] = _to_number(data.get(col))
+
+        if self._stats:
+            stats = self._academic_stats(data)
+            for i, pos in self._stats:
+                row[i] = stats[pos]
+
+        if self._hobby_count:
+            hobby_count = 0.0
+            for col in HOBBY_COLUMNS:
+                value = _to_number(data[col])
+                if not math.isnan(value):
+                    hobby_count += value
+            for i in self._hobby_count:
+                row[i] = hobby_count
+
+        row[np.isnan(row)] = 0
+        return row
+
+    @staticmethod
+    def _academic_stats(data):
+        """Average, max, min, sample std and count of the numeric subject scores."""
+        scores = [_to_number(data[col]) for col in SUBJECT_SCORES]
+        scores = [score for score in scores if not math.isnan(score)]
+        if not scores:
+            return (0, 0, 0, 0, 0)
+
+        count = len(scores)
+        average = sum(scores) / count
+        if count > 1:
+            std = math.sqrt(sum((score - average) ** 2 for score in scores) / (count - 1))
+        else:
+            std = math.nan
+        return (average, max(scores), min(scores), std, count)
+
+def build_score_maps(mapping):
+    """
+    Builds the categorical lookups used by calculate_scores from the mapping.csv
+    rows, keyed by column name. Build once and reuse across requests.
+    """
+    score_maps = {}
+    for column, original, encoded in zip(mapping['column'], mapping['original_value'],
+                                         mapping['encoded_value']):
+        score_maps.setdefault(column, {})[original] = encoded
+    return score_maps
+
+def calculate_scores(answers, mapping, score_maps=None):
     """
     Calculates scores from questionnaire answers to be used as input for the ML model.
+    Pass `score_maps` from build_score_maps to skip rebuilding the lookups.
     """
     # Mapping for categorical variables
     # Create mappings from the mapping.csv file
-    grade_map = dict(zip(mapping[mapping['column'] == 'grade']['original_value'], 
-                        mapping[mapping['column'] == 'grade']['encoded_value']))
-    stream_map = dict(zip(mapping[mapping['column'] == 'stream']['original_value'], 
-                         mapping[mapping['column'] == 'stream']['encoded_value']))
-    income_map = dict(zip(mapping[mapping['column'] == 'family_income_band']['original_value'], 
-                         mapping[mapping['column'] == 'family_income_band']['encoded_value']))
-    parent_expectation_map = dict(zip(mapping[mapping['column'] == 'parental_expectation_field']['original_value'], 
-                                    mapping[mapping['column'] == 'parental_expectation_field']['encoded_value']))
-    career_interest_map = dict(zip(mapping[mapping['column'] == 'interest']['original_value'], 
-                                 mapping[mapping['column'] == 'interest']['encoded_value']))
-    work_arrangement_map = dict(zip(mapping[mapping['column'] == 'job_seeking_preference']['original_value'], 
-                                  mapping[mapping['column'] == 'job_seeking_preference']['encoded_value']))
+    if score_maps is None:
+        score_maps = build_score_maps(mapping)
+    grade_map = score_maps.get('grade', {})
+    stream_map = score_maps.get('stream', {})
+    income_map = score_maps.get('family_income_band', {})
+    parent_expectation_map = score_maps.get('parental_expectation_field', {})
+    career_interest_map = score_maps.get('interest', {})
+    work_arrangement_map = score_maps.get('job_seeking_preference', {})
     yes_no_map = {'Yes': 1, 'No': 0}
 
     # Hobbies - one-hot encoding
@@ -116,3 +348,91 @@ def calculate_scores(answers, mapping):
     }
     
     return feature_dict
+
+def calculate_scores_batch(answers_list, mapping, score_maps=None):
+    """
+    Calculates the scores of many questionnaires a column at a time, building
+    the lookups only once. Returns (columns, errors): `columns` maps each
+    calculate_scores feature to one value per questionnaire (the raw answers
+    as lists, the computed features as float arrays), ready for
+    FeatureEncoder.encode_columns; `errors` holds, per questionnaire, the
+    exception calculate_scores would have raised, or None. The values of
+    failed questionnaires are placeholders.
+    """
+    if score_maps is None:
+        score_maps = build_score_maps(mapping)
+    errors = [None if isinstance(answers, dict) else TypeError("Questionnaire must be a JSON object")
+              for answers in answers_list]
+    rows = [answers if error is None else {} for answers, error in zip(answers_list, errors)]
+
+    def answers(question, default=None):
+        return [row.get(question, default) for row in rows]
+
+    def computed(fn, values):
+        # Retried one value at a time only when a value raises, so the row
+        # keeps the first exception calculate_scores would have raised
+        try:
+            return _numbers([fn(value) for value in values])
+        except Exception:
+            pass
+        results = []
+        for i, value in enumerate(values):
+            try:
+                results.append(fn(value))
+            except Exception as e:
+                if errors[i] is None:
+                    errors[i] = e
+                results.append(0)
+        return _numbers(results)
+
+    def category(column, question):
+        lookup = score_maps.get(column, {})
+        return computed(lambda value: lookup.get(value, -1), answers(question))
+
+    def yes_no(question):
+        return computed(lambda value: {'Yes': 1, 'No': 0}.get(value, -1), answers(question))
+
+    # Evaluated in calculate_scores' order, so the same exception wins
+    hobbies = answers('5', [])
+    hobbies_creative = computed(lambda value: 1 if 'Creative Hobbies' in value else 0, hobbies)
+    hobbies_technical = computed(lambda value: 1 if 'Technical Hobbies' in value else 0, hobbies)
+    hobbies_sports = computed(lambda value: 1 if 'Sports' in value else 0, hobbies)
+    has_disability = computed(lambda value: 0 if 'Unknown' in value or not value else 1, answers('4', []))
+
+    grade = category('grade', '2')
+    stream = category('stream', '3')
+    income = category('family_income_band', '6')
+    parent_expectation = category('parental_expectation_field', '7')
+    career_interest = category('interest', '14')
+    work_arrangement = category('job_seeking_preference', '16')
+    comfortable_outside_india = yes_no('17')
+    psychometric_test_given = yes_no('21')
+    psychometric_test_score = computed(lambda value: value or 0, answers('22', 0))
+
+    columns = {
+        'age': answers('1'),
+        'grade': grade,
+        'stream': stream,
+        'family_income_band': income,
+        'parental_expectation_field': parent_expectation,
+        'parental_interest_level': answers('8'),
+        'psychometric_aptitude_verbal': answers('9'),
+        'psychometric_aptitude_quantitative': answers('10'),
+        'creativity_score': answers('11'),
+        'teamwork_score': answers('12'),
+        'exploration_work_score': answers('13'),
+        'interest': career_interest,
+        'expected_salary': answers('15'),
+        'job_seeking_preference': work_arrangement,
+        'comfortable_outside_india': comfortable_outside_india,
+        'math_score': answers('18'),
+        'english_score': answers('19'),
+        'science_score': answers('20'),
+        'psychometric_test_given': psychometric_test_given,
+        'psychometric_test_score': psychometric_test_score,
+        'has_creative_hobby': hobbies_creative,
+        'has_technical_hobby': hobbies_technical,
+        'has_sports_hobby': hobbies_sports,
+        'disability_status': has_disability,
+    }
+    return columns, errors
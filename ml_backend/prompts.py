@@ -0,0 +1,77 @@
+"""
+Gemini prompt templates, compiled once at import.
+
+A template's text is dedented, stripped of trailing whitespace and blank-line
+runs, and split into literal and `{field}` pieces when it is registered, so
+rendering is a single join. Each template carries a version. Bump it whenever
+the text changes, because cached reports are keyed by it.
+"""
+import re
+import string
+import textwrap
+
+from career_common.tokens import estimate_tokens
+
+
+def compact(text):
+    """Dedent `text`, strip trailing whitespace and collapse runs of blank lines."""
+    lines = [line.rstrip() for line in textwrap.dedent(text).strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+class PromptTemplate:
+    """A named, versioned prompt compiled into literal and field pieces."""
+    __slots__ = ('name', 'version', 'text', 'fields', 'static_tokens', '_pieces')
+
+    def __init__(self, name, version, text):
+        self.name = name
+        self.version = version
+        self.text = compact(text)
+        pieces, fields = [], []
+        for literal, field, spec, conversion in string.Formatter().parse(self.text):
+            if literal:
+                pieces.append((True, literal))
+            if field is not None:
+                if not field or spec or conversion:
+                    raise ValueError(f"Template {name}: only plain {{name}} fields are supported")
+                pieces.append((False, field))
+                fields.append(field)
+        self._pieces = tuple(pieces)
+        self.fields = frozenset(fields)
+        self.static_tokens = estimate_tokens("".join(text for literal, text in pieces if literal))
+
+    def render(self, **values):
+        """The prompt with every field filled in; raises KeyError for a missing one."""
+        return "".join(text if literal else str(values[text]) for literal, text in self._pieces)
+
+
+TEMPLATES = {}
+
+
+def register(name, version, text):
+    """Compile and register a template, returning it."""
+    template = TEMPLATES[name] = PromptTemplate(name, version, text)
+    return template
+
+
+def get_template(name):
+    return TEMPLATES[name]
+
+
+GUIDANCE = register('guidance', 'guidance-v2', """
+    As an expert career counselor, write a personalized career path recommendation for this student.
+
+    Student profile:
+    {profile}
+
+    Career cluster our model predicted for the student:
+    {cluster}
+
+    Using the profile and the cluster, write an encouraging report in markdown with these sections:
+    1. Introduction: a warm, personal opening that acknowledges the student's answers.
+    2. Strengths: interpret their skills, interests and academic results, and connect them to career fields.
+    3. Career paths: 2-3 specific roles from the cluster, each with a typical day, required skills and outlook.
+    4. Education: degrees or certifications these roles need, and subjects to focus on now.
+    5. Next steps: a step-by-step plan, e.g. online courses, internships, informational interviews or projects.
+    6. Closing: a positive, motivating message.
+""")
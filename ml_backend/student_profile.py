@@ -0,0 +1,127 @@
+"""
+Compact, human-readable student profiles for the guidance prompt.
+
+The encoder accepts either calculate_scores output (categoricals as
+mapping.csv codes) or a raw /predict record (categoricals as strings). It
+decodes codes back to their labels and skips unanswered fields: blanks,
+"n/a", -1 sentinels and the "Unknown" category. Related fields share a line.
+The output is deterministic, so equal inputs give equal prompts.
+"""
+import math
+
+# (key, label) of single-valued fields, in prompt order
+CATEGORIES = [
+    ('grade', 'Grade'),
+    ('stream', 'Stream'),
+    ('interest', 'Career interest'),
+    ('parental_expectation_field', "Parents' preferred field"),
+    ('family_income_band', 'Family income'),
+    ('job_seeking_preference', 'Preferred work arrangement'),
+    ('comfortable_outside_india', 'Open to working abroad'),
+]
+# 0-10 self-ratings, reported on one line
+RATINGS = [
+    ('psychometric_aptitude_verbal', 'verbal'),
+    ('psychometric_aptitude_quantitative', 'quantitative'),
+    ('creativity_score', 'creativity'),
+    ('teamwork_score', 'teamwork'),
+    ('exploration_work_score', 'exploration'),
+    ('parental_interest_level', 'parental involvement'),
+]
+SUBJECTS = [('math_score', 'math'), ('english_score', 'English'), ('science_score', 'science')]
+HOBBIES = [('has_creative_hobby', 'creative'), ('has_technical_hobby', 'technical'),
+           ('has_sports_hobby', 'sports')]
+YES_NO = {0: 'No', 1: 'Yes'}
+MISSING = {'', 'n/a', 'na', 'none', 'null', 'nan', 'unknown'}
+
+
+def _number(value):
+    """`value` as a float, or None when it is blank, non-numeric, NaN or infinite."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _format_number(number):
+    return str(int(number)) if number == int(number) else f"{number:.1f}"
+
+
+class ProfileEncoder:
+    """Formats a student's data as short `Label: value` lines, using the mapping to decode codes."""
+
+    def __init__(self, mapping):
+        self._labels = {}
+        for column, original, encoded in zip(mapping['column'], mapping['original_value'],
+                                             mapping['encoded_value']):
+            self._labels.setdefault(column, {})[int(encoded)] = str(original)
+        for column in ('comfortable_outside_india', 'psychometric_test_given'):
+            self._labels.setdefault(column, YES_NO)
+
+    def _category(self, column, value):
+        """The label of a categorical answer given as a code or a string, or None if unanswered."""
+        if isinstance(value, str):
+            label = value.strip()
+        else:
+            number = _number(value)
+            if number is None or number < 0:
+                return None
+            label = self._labels.get(column, {}).get(int(number))
+            if label is None:
+                return None
+        return None if label.lower() in MISSING else label
+
+    @staticmethod
+    def _numbers(data, fields):
+        """`label value` pairs of the answered numeric fields, comma-separated."""
+        parts = []
+        for column, label in fields:
+            number = _number(data.get(column))
+            # Ratings and scores are never negative; a negative one is a -1 sentinel
+            if number is not None and number >= 0:
+                parts.append(f"{label} {_format_number(number)}")
+        return ", ".join(parts)
+
+    def encode(self, data):
+        """The profile of one student as newline-separated lines."""
+        lines = []
+        age = _number(data.get('age'))
+        if age is not None and age > 0:
+            lines.append(f"Age: {_format_number(age)}")
+        for column, label in CATEGORIES:
+            value = self._category(column, data.get(column))
+            if value is not None:
+                lines.append(f"{label}: {value}")
+
+        ratings = self._numbers(data, RATINGS)
+        if ratings:
+            lines.append(f"Self-ratings (0-10): {ratings}")
+        subjects = self._numbers(data, SUBJECTS)
+        if subjects:
+            lines.append(f"Subject scores (%): {subjects}")
+
+        test_given = self._category('psychometric_test_given', data.get('psychometric_test_given'))
+        test_score = _number(data.get('psychometric_test_score'))
+        # calculate_scores reports an untaken test as score 0
+        if test_score is not None and (test_given == 'Yes' or (test_given is None and test_score > 0)):
+            lines.append(f"Psychometric test score: {_format_number(test_score)}/100")
+        elif test_given == 'No':
+            lines.append("Psychometric test: not taken")
+
+        salary = _number(data.get('expected_salary'))
+        if salary is not None and salary > 0:
+            lines.append(f"Expected salary: INR {salary:,.0f}")
+        hobbies = [label for column, label in HOBBIES if _number(data.get(column))]
+        if hobbies:
+            lines.append(f"Hobbies: {', '.join(hobbies)}")
+
+        disability = data.get('disability_status')
+        if isinstance(disability, str):
+            if disability.strip().lower() not in MISSING:
+                lines.append(f"Disability: {disability.strip()}")
+        elif _number(disability):
+            lines.append("Disability: reported")
+        return "\n".join(lines) if lines else "No answers given."
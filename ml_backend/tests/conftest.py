@@ -0,0 +1,53 @@
+"""
+Shared fixtures for the ml_backend tests.
+
+The service loads its artifacts from relative paths, so the tests run from the
+ml_backend directory with it on the import path, as the benchmarks do; the
+questionnaire generators are the benchmarks' own.
+"""
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVICE_DIR, 'benchmarks'))
+
+import _common  # noqa: E402  (puts the service on the path and changes to its directory)
+
+
+@pytest.fixture(scope='session')
+def artifacts():
+    """(model, clusters_meta, mapping, model_columns) as the service loads them."""
+    from model_loader import load_model_artifacts
+    return load_model_artifacts()
+
+
+@pytest.fixture(scope='session')
+def mapping(artifacts):
+    return artifacts[2]
+
+
+@pytest.fixture(scope='session')
+def model_columns(artifacts):
+    return artifacts[3]
+
+
+@pytest.fixture
+def rng():
+    return _common.make_rng(1234)
+
+
+@pytest.fixture(scope='session')
+def service(tmp_path_factory):
+    """main, imported once with the Gemini stub and a SQLite job store under a temporary directory."""
+    directory = tmp_path_factory.mktemp('service')
+    os.environ.update(LLM_STUB='1', LLM_STUB_LATENCY_MS='20', LLM_STUB_FAILURE_RATE='0', GUIDANCE_CACHE='off',
+                      GUIDANCE_JOBS_STORE='sqlite', GUIDANCE_JOBS_PATH=str(directory / 'jobs.sqlite3'))
+    import main
+    return main
+
+
+@pytest.fixture
+def client(service):
+    return service.app.test_client()
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+import batch_score
+from _common import random_answers
+from batch_score import RESUME_FIELDS, CheckpointError, read_checkpoint, score_file
+
+ROWS = 40
+CHUNK_SIZE = 7
+
+
+@pytest.fixture(scope='module')
+def active(service):
+    return service.registry.current
+
+
+@pytest.fixture
+def input_path(tmp_path, rng):
+    path = tmp_path / 'questionnaires.jsonl'
+    with open(path, 'w') as f:
+        for i in range(ROWS):
+            f.write(json.dumps(dict(random_answers(rng), id=f"row-{i}")) + "\n")
+        f.write("{not json\n")
+    return str(path)
+
+
+@pytest.fixture
+def full_output(active, input_path, tmp_path):
+    """The output of one uninterrupted run."""
+    path = str(tmp_path / 'full.ndjson')
+    score_file(active, input_path, path, workers=0, chunk_size=CHUNK_SIZE, top_k=3)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def interrupt_after(monkeypatch, chunks):
+    """Makes the run stop with a KeyboardInterrupt once `chunks` chunks are scored."""
+    score_chunk = batch_score._score_chunk
+    scored = []
+
+    def score(chunk):
+        if len(scored) == chunks:
+            raise KeyboardInterrupt
+        scored.append(chunk[0])
+        return score_chunk(chunk)
+
+    monkeypatch.setattr(batch_score, '_score_chunk', score)
+
+
+def mark_incomplete(checkpoint_path):
+    """Turns a finished run's checkpoint into one of a run that stopped at its last row."""
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    checkpoint["complete"] = False
+    with open(checkpoint_path, 'w') as f:
+        json.dump(checkpoint, f)
+
+
+def test_every_row_is_written_in_order(full_output, tmp_path):
+    results = [json.loads(line) for line in full_output.decode('utf-8').splitlines()]
+    assert [result["index"] for result in results] == list(range(ROWS + 1))
+    assert [result.get("id") for result in results[:ROWS]] == [f"row-{i}" for i in range(ROWS)]
+    assert all(len(result["top_clusters"]) == 3 for result in results[:ROWS])
+    assert results[ROWS]["error"].startswith("Invalid JSON")
+
+    checkpoint = read_checkpoint(str(tmp_path / 'full.ndjson.checkpoint'))
+    assert checkpoint["complete"]
+    assert (checkpoint["rows"], checkpoint["errors"]) == (ROWS + 1, 1)
+    assert checkpoint["output_bytes"] == len(full_output)
+
+
+def test_resumed_run_matches_an_uninterrupted_one(active, input_path, full_output, tmp_path, monkeypatch):
+    output_path = str(tmp_path / 'out.ndjson')
+    interrupt_after(monkeypatch, 3)
+    with pytest.raises(KeyboardInterrupt):
+        score_file(active, input_path, output_path, workers=0, chunk_size=CHUNK_SIZE, top_k=3,
+                   checkpoint_interval=0)
+    monkeypatch.undo()
+    checkpoint = read_checkpoint(output_path + '.checkpoint')
+    assert (checkpoint["rows"], checkpoint["complete"]) == (3 * CHUNK_SIZE, False)
+    # A line cut short after the checkpoint is dropped on resume
+    with open(output_path, 'ab') as f:
+        f.write(b'{"index": 21, "clus')
+
+    stats = score_file(active, input_path, output_path, workers=0, chunk_size=CHUNK_SIZE, top_k=3, resume=True)
+    assert (stats["resumed_from"], stats["rows"]) == (3 * CHUNK_SIZE, ROWS + 1 - 3 * CHUNK_SIZE)
+    with open(output_path, 'rb') as f:
+        assert f.read() == full_output
+
+
+def test_worker_processes_write_the_same_output(active, input_path, full_output, tmp_path):
+    output_path = str(tmp_path / 'out.ndjson')
+    score_file(active, input_path, output_path, workers=2, chunk_size=CHUNK_SIZE, top_k=3)
+    with open(output_path, 'rb') as f:
+        assert f.read() == full_output
+
+
+def test_complete_run_is_not_scored_again(active, input_path, full_output, tmp_path, monkeypatch):
+    interrupt_after(monkeypatch, 0)
+    stats = score_file(active, input_path, str(tmp_path / 'full.ndjson'), workers=0, top_k=3, resume=True)
+    assert stats["rows"] == 0 and stats["resumed_from"] == ROWS + 1
+
+
+def test_resume_without_a_checkpoint_starts_over(active, input_path, full_output, tmp_path):
+    output_path = str(tmp_path / 'out.ndjson')
+    stats = score_file(active, input_path, output_path, workers=0, chunk_size=CHUNK_SIZE, top_k=3, resume=True)
+    assert (stats["resumed_from"], stats["rows"]) == (0, ROWS + 1)
+
+
+@pytest.mark.parametrize('field, options', [('top_k', {"top_k": 1}), ('id_field', {"top_k": 3, "id_field": "key"})])
+def test_resume_with_other_options_is_refused(active, input_path, full_output, tmp_path, field, options):
+    assert field in RESUME_FIELDS
+    mark_incomplete(str(tmp_path / 'full.ndjson.checkpoint'))
+    with pytest.raises(CheckpointError, match=f"different {field}"):
+        score_file(active, input_path, str(tmp_path / 'full.ndjson'), workers=0, resume=True, **options)
+
+
+def test_resume_needs_the_output_it_checkpointed(active, input_path, full_output, tmp_path):
+    mark_incomplete(str(tmp_path / 'full.ndjson.checkpoint'))
+    output_path = tmp_path / 'full.ndjson'
+    output_path.write_bytes(full_output[:100])
+    with pytest.raises(CheckpointError, match="is shorter"):
+        score_file(active, input_path, str(output_path), workers=0, top_k=3, resume=True)
+    output_path.unlink()
+    with pytest.raises(CheckpointError, match="is missing"):
+        score_file(active, input_path, str(output_path), workers=0, top_k=3, resume=True)
+
+
+def test_unreadable_checkpoint_is_an_error(active, input_path, tmp_path):
+    output_path = tmp_path / 'out.ndjson'
+    (tmp_path / 'out.ndjson.checkpoint').write_text("{")
+    with pytest.raises(CheckpointError, match="is not a checkpoint"):
+        score_file(active, input_path, str(output_path), workers=0, resume=True)
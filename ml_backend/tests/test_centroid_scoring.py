@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from _common import random_answers
+from preprocessing import calculate_scores
+
+
+@pytest.fixture(scope='module')
+def active(service):
+    return service.registry.current
+
+
+@pytest.fixture
+def features(active, rng):
+    scores = [calculate_scores(random_answers(rng), active.mapping, active.score_maps) for _ in range(50)]
+    return np.vstack([active.encoder.encode(row) for row in scores])
+
+
+def test_ranking_is_nearest_first(active, features):
+    labels, distances, affinities = active.centroid_scorer.top_k(features, 4)
+    assert (np.diff(distances, axis=1) >= 0).all()
+    assert (labels[:, 0] == active.centroid_scorer.distances(features).argmin(axis=1)).all()
+    assert (affinities <= 1).all()
+
+
+@pytest.mark.parametrize('k', [1, 3, 15])
+def test_predicted_cluster_leads_the_ranking(active, features, k):
+    scorer = active.centroid_scorer
+    # The farthest cluster, so it is never first on its own
+    first = scorer.distances(features).argmax(axis=1)
+    labels, distances, _ = scorer.top_k(features, k, first)
+    nearest, nearest_distances, _ = scorer.top_k(features, k + 1)
+
+    assert (labels[:, 0] == first).all()
+    for row in range(len(features)):
+        others = [label for label in nearest[row] if label != first[row]][:k - 1]
+        assert list(labels[row, 1:]) == others
+        assert len(set(labels[row])) == k
+    assert np.allclose(distances[:, 1:], nearest_distances[:, :k - 1])
+
+
+def test_predicted_labels_outside_the_table_are_ignored(active, features):
+    scorer = active.centroid_scorer
+    labels, _, _ = scorer.top_k(features[:2], 3, [-1, len(active.clusters_meta)])
+    assert (labels == scorer.top_k(features[:2], 3)[0]).all()
+
+
+def test_top_clusters_start_with_the_prediction(client, rng):
+    for _ in range(20):
+        body = client.post('/predict_from_questionnaire?guidance=false&top_k=3', json=random_answers(rng)).get_json()
+        assert body["top_clusters"][0]["cluster_label"] == body["cluster_label"]
+        assert body["top_clusters"][0]["cluster_name"] == body["cluster_name"]
+
+    questionnaires = [random_answers(rng) for _ in range(50)]
+    results = client.post('/predict_batch?top_k=3', json=questionnaires).get_json()["results"]
+    assert all(result["top_clusters"][0]["cluster_label"] == result["cluster_label"] for result in results)
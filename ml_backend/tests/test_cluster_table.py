@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pytest
+
+import batch_score
+from _common import random_answers
+from cluster_table import ClusterTable, cluster_description, cluster_name
+
+
+@pytest.fixture(scope='module')
+def table():
+    return ClusterTable.from_json('clusters_meta.json')
+
+
+def test_clusters_without_names_get_derived_ones(table):
+    for record in table:
+        assert record.name and record.name != "N/A"
+        assert record.description and record.description != "N/A"
+        summary = json.loads(record.summary_json)
+        assert summary["cluster_name"] == record.name
+        assert summary["cluster_description"] == record.description
+    assert len({record.name for record in table}) == len(table)
+
+
+def test_derived_name_and_description():
+    info = {"top_jobs": ["Judge", "Paralegal", "Notary", "Clerk"], "primary_categories": {"Commerce": 2, "Law": 9}}
+    assert cluster_name("C1", info) == "Law: Judge & Paralegal"
+    assert cluster_description(info) == "Careers such as Judge, Paralegal, Notary, mostly in Law and Commerce."
+    assert cluster_name("C1", {}) == "C1"
+    assert cluster_description({}) == "No description is recorded for this cluster."
+
+
+def test_metadata_name_and_description_are_kept():
+    info = {"name": "Healers", "description": "People who heal.", "top_jobs": ["Nurse"]}
+    record = ClusterTable({"C1": info})[0]
+    assert (record.name, record.description) == ("Healers", "People who heal.")
+
+
+@pytest.mark.parametrize('label', [-1, 15, np.int64(-2)])
+def test_labels_outside_the_table_are_rejected(table, label):
+    with pytest.raises(IndexError, match="not found in metadata"):
+        table[label]
+
+
+def test_unknown_predicted_cluster_is_an_error(service, client, monkeypatch, rng):
+    monkeypatch.setattr(service, 'predict_labels', lambda model, features, encoder: np.array([-1]))
+    response = client.post('/predict_from_questionnaire?guidance=false', json=random_answers(rng))
+    assert response.status_code == 500
+    assert "Predicted cluster ID -1 not found" in response.get_json()["error"]
+
+
+def test_unknown_predicted_cluster_fails_only_its_batch_row(service, monkeypatch, rng):
+    active = service.registry.current
+    monkeypatch.setattr(batch_score, 'predict_labels',
+                        lambda model, features, encoder: np.array([3, -1, len(active.clusters_meta)]))
+    results = batch_score.score_questionnaires(active, [random_answers(rng) for _ in range(3)])
+    assert results[0][1].label == 3
+    assert [error for _, _, error, _ in results[1:]] == [
+        "Cluster lookup failed: Predicted cluster ID -1 not found in metadata.",
+        "Cluster lookup failed: Predicted cluster ID 15 not found in metadata.",
+    ]
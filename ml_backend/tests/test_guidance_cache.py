@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+import guidance_cache
+from _common import random_answers
+from guidance_cache import (GuidanceCache, MemoryCacheBackend, SQLiteCacheBackend, cache_from_env,
+                            make_cache_key)
+
+
+class Clock:
+    """Stands in for the time module, so entries age without sleeping."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(guidance_cache, 'time', clock)
+    return clock
+
+
+def make_backend(kind, tmp_path, **options):
+    if kind == 'memory':
+        return MemoryCacheBackend(**options)
+    return SQLiteCacheBackend(str(tmp_path / 'cache.sqlite3'), **options)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def kind(request):
+    return request.param
+
+
+def test_equal_features_share_a_key():
+    key = make_cache_key(3, {"a": 7, "b": 0.5, "c": None}, "v1")
+    assert make_cache_key(3, {"c": float('nan'), "b": 0.5, "a": np.int64(7)}, "v1") == key
+    assert make_cache_key(3, {"a": 7.0, "b": np.float64(0.5), "c": None}, "v1") == key
+    assert make_cache_key(4, {"a": 7, "b": 0.5, "c": None}, "v1") != key
+    assert make_cache_key(3, {"a": 7, "b": 0.5, "c": None}, "v2") != key
+
+
+def test_entries_expire_after_their_ttl(kind, tmp_path, clock):
+    backend = make_backend(kind, tmp_path, ttl_seconds=60)
+    backend.set("k", "report")
+    clock.now += 59
+    assert backend.get("k") == "report"
+    clock.now += 2
+    assert backend.get("k") is None
+    assert len(backend) == 0
+
+
+def test_least_recently_used_entries_are_evicted(kind, tmp_path, clock):
+    backend = make_backend(kind, tmp_path, max_entries=2)
+    backend.set("a", "A")
+    clock.now += 1
+    backend.set("b", "B")
+    clock.now += 1
+    assert backend.get("a") == "A"
+    clock.now += 1
+    backend.set("c", "C")
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == ("A", None, "C")
+    assert len(backend) == 2
+
+
+def test_sqlite_entries_are_shared_by_backends(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    SQLiteCacheBackend(path).set("k", "report")
+    assert SQLiteCacheBackend(path).get("k") == "report"
+
+
+def test_counters_and_hit_rate(kind, tmp_path):
+    cache = GuidanceCache(make_backend(kind, tmp_path), "v1")
+    calls = []
+
+    def generate(name):
+        calls.append(name)
+        return f"report for {name}"
+
+    assert cache.get_or_generate(1, {"a": 1}, generate, "ada") == "report for ada"
+    assert cache.get_or_generate(1, {"a": 1.0}, generate, "bob") == "report for ada"
+    assert cache.get(2, {"a": 1}) is None
+    assert cache.generate_and_set(2, {"a": 1}, generate, "cy") == "report for cy"
+    assert calls == ["ada", "cy"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 2, 2, 2)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_failed_or_empty_reports_are_not_cached():
+    cache = GuidanceCache(MemoryCacheBackend(), "v1")
+
+    def fail():
+        raise RuntimeError("Gemini down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_generate(1, {}, fail)
+    assert cache.get_or_generate(1, {}, lambda: "") == ""
+    assert cache.stats()["stores"] == 0
+
+
+def test_backend_errors_are_counted_as_misses():
+    class Broken:
+        def get(self, key):
+            raise OSError("disk gone")
+
+        def set(self, key, value):
+            raise OSError("disk gone")
+
+        def __len__(self):
+            raise OSError("disk gone")
+
+    cache = GuidanceCache(Broken(), "v1")
+    assert cache.get_or_generate(1, {}, lambda: "report") == "report"
+    stats = cache.stats()
+    assert (stats["misses"], stats["stores"], stats["errors"], stats["entries"]) == (1, 0, 2, None)
+
+
+def test_cache_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("GUIDANCE_CACHE", "off")
+    assert cache_from_env("v1") is None
+    monkeypatch.setenv("GUIDANCE_CACHE", "sqlite")
+    monkeypatch.setenv("GUIDANCE_CACHE_PATH", str(tmp_path / 'cache.sqlite3'))
+    assert isinstance(cache_from_env("v1").backend, SQLiteCacheBackend)
+    monkeypatch.delenv("GUIDANCE_CACHE")
+    assert isinstance(cache_from_env("v1").backend, MemoryCacheBackend)
+
+
+@pytest.fixture
+def cache(service, monkeypatch):
+    cache = GuidanceCache(MemoryCacheBackend(), service.PROMPT_VERSION)
+    monkeypatch.setattr(service, 'guidance_cache', cache)
+    return cache
+
+
+@pytest.mark.parametrize('query', ['async=true', 'deadline=5'])
+def test_each_request_counts_one_lookup(service, client, cache, rng, query):
+    answers = random_answers(rng)
+    body = client.post(f'/predict_from_questionnaire?{query}', json=answers).get_json()
+    if body.get("guidance_status") == "pending":
+        assert service.guidance_jobs.get(body["guidance_job_id"], wait=10)["status"] == "done"
+    assert (cache.hits, cache.misses, cache.stores) == (0, 1, 1)
+
+    body = client.post(f'/predict_from_questionnaire?{query}', json=answers).get_json()
+    assert body["guidance"] and body.get("guidance_status", "done") == "done"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert client.get('/cache/stats').get_json()["hit_rate"] == 0.5
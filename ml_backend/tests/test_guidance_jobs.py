@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from _common import random_answers
+from guidance_jobs import GuidanceJobs, MemoryJobStore, QueueFullError, SQLiteJobStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def jobs(request, tmp_path):
+    store = MemoryJobStore() if request.param == 'memory' else SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+    return GuidanceJobs(max_workers=2, max_pending=2, ttl_seconds=600, store=store)
+
+
+def fail():
+    raise ValueError("no report")
+
+
+def test_finished_job_has_its_result(jobs):
+    job_id = jobs.submit(lambda name: f"report for {name}", "ada")
+    job = jobs.get(job_id, wait=5)
+    assert job["status"] == "done"
+    assert job["result"] == "report for ada"
+    assert job["finished_at"] >= job["created_at"]
+
+
+def test_failed_job_has_its_error(jobs):
+    job = jobs.get(jobs.submit(fail), wait=5)
+    assert job["status"] == "failed"
+    assert job["error"] == "no report"
+
+
+def test_unknown_job_is_none(jobs):
+    assert jobs.get("no-such-job", wait=0.1) is None
+
+
+def test_full_queue_rejects_jobs(jobs):
+    release = threading.Event()
+    job_ids = [jobs.submit(release.wait, 5) for _ in range(2)]
+    with pytest.raises(QueueFullError):
+        jobs.submit(release.wait, 5)
+    release.set()
+    assert all(jobs.get(job_id, wait=5)["status"] == "done" for job_id in job_ids)
+    jobs.get(jobs.submit(str, 1), wait=5)  # room again once they finished
+
+
+def test_expired_jobs_are_evicted(tmp_path):
+    jobs = GuidanceJobs(ttl_seconds=0, store=SQLiteJobStore(str(tmp_path / 'jobs.sqlite3')))
+    job_id = jobs.submit(str, 1)
+    assert jobs.get(job_id, wait=5)["status"] == "done"
+    jobs.get(jobs.submit(str, 2), wait=5)
+    assert jobs.get(job_id) is None
+
+
+def test_sqlite_jobs_are_visible_to_other_workers(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    accepting, other = (GuidanceJobs(store=SQLiteJobStore(path), poll_interval=0.01) for _ in range(2))
+    release = threading.Event()
+    job_id = accepting.submit(lambda: release.wait(5) and {"report": "ready"})
+
+    assert other.get(job_id)["status"] in ("pending", "running")
+    assert other.get(job_id, wait=0.05)["status"] in ("pending", "running")
+    release.set()
+    # Polls the shared file, since the job runs in the other pool
+    assert other.get(job_id, wait=5)["result"] == {"report": "ready"}
+
+
+def test_async_guidance_is_served_by_any_worker(service, client, rng):
+    response = client.post('/predict_from_questionnaire?async=true', json=random_answers(rng))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["guidance_status"] == "pending"
+
+    # A second worker's pool on the same job store answers the poll
+    other_worker = GuidanceJobs(store=SQLiteJobStore(service.guidance_jobs.store.path))
+    job = other_worker.get(body["guidance_job_id"], wait=10)
+    assert job["status"] == "done"
+    assert job["result"]
+
+    polled = client.get(f"{body['guidance_url']}?wait=5")
+    assert polled.status_code == 200
+    assert polled.get_json()["guidance"] == job["result"]
+    assert client.get('/guidance/unknown').status_code == 404
@@ -0,0 +1,120 @@
+import functools
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from _common import ML_BACKEND_DIR, random_answers
+from model_loader import load_artifact_contents
+from model_registry import VERSION_HEADER, ModelRegistry, ReloadError, artifact_paths
+
+ARTIFACTS = ('career_model.pkl', 'clusters_meta.json', 'mapping.csv')
+
+
+@pytest.fixture
+def artifact_dir(tmp_path):
+    for name in ARTIFACTS:
+        shutil.copy(os.path.join(ML_BACKEND_DIR, name), tmp_path)
+    return tmp_path
+
+
+def make_registry(artifact_dir, watch_interval=0):
+    return ModelRegistry(functools.partial(load_artifact_contents, str(artifact_dir), 'off'),
+                         watch_paths=artifact_paths(str(artifact_dir), 'off'), watch_interval=watch_interval)
+
+
+def edit_clusters(artifact_dir, description):
+    path = artifact_dir / 'clusters_meta.json'
+    clusters = json.loads(path.read_text())
+    clusters[next(iter(clusters))]['description'] = description
+    path.write_text(json.dumps(clusters))
+
+
+def test_reload_swaps_in_edited_artifacts(artifact_dir):
+    registry = make_registry(artifact_dir)
+    first = registry.load_initial()
+    assert registry.reload() == "unchanged"
+    assert registry.current is first
+
+    edit_clusters(artifact_dir, "Revised.")
+    assert registry.reload() == "reloaded"
+    assert registry.current.version != first.version
+    assert registry.current.clusters_meta[0].description == "Revised."
+    # A request holding the old version finishes on it
+    assert first.clusters_meta[0].description != "Revised."
+    assert registry.status()["reloads"] == 2
+
+
+def test_forced_reload_replaces_an_unchanged_version(artifact_dir):
+    registry = make_registry(artifact_dir)
+    first = registry.load_initial()
+    assert registry.reload(force=True) == "reloaded"
+    assert registry.current is not first
+    assert registry.current.version == first.version
+
+
+def test_failed_reload_keeps_serving_the_old_version(artifact_dir):
+    registry = make_registry(artifact_dir)
+    first = registry.load_initial()
+    (artifact_dir / 'clusters_meta.json').write_text("{not json")
+
+    with pytest.raises(ReloadError):
+        registry.reload()
+    assert registry.current is first
+    status = registry.status()
+    assert status["reload_failures"] == 1
+    assert status["last_error"].startswith("JSONDecodeError")
+
+    # Fixed files load again
+    shutil.copy(os.path.join(ML_BACKEND_DIR, 'clusters_meta.json'), artifact_dir)
+    assert registry.reload() == "unchanged"
+    assert registry.status()["last_error"] is None
+
+
+def test_missing_artifacts_leave_no_version(tmp_path):
+    registry = make_registry(tmp_path)
+    assert registry.load_initial() is None
+    assert registry.status()["version"] is None
+
+
+def test_watcher_reloads_changed_files(artifact_dir):
+    registry = make_registry(artifact_dir, watch_interval=0.05)
+    first = registry.load_initial()
+    registry.ensure_watching()
+    edit_clusters(artifact_dir, "Watched.")
+
+    give_up_at = time.monotonic() + 30
+    while registry.current is first and time.monotonic() < give_up_at:
+        time.sleep(0.05)
+    assert registry.current.clusters_meta[0].description == "Watched."
+
+
+def test_requests_during_a_reload_see_one_version(service, rng):
+    payloads = [random_answers(rng) for _ in range(50)]
+    failures, served = [], []
+    stop = threading.Event()
+
+    def post():
+        client = service.app.test_client()
+        while not stop.is_set():
+            for payload in payloads:
+                response = client.post('/predict_from_questionnaire?guidance=false', json=payload)
+                served.append(response.status_code)
+                if (response.status_code != 200
+                        or response.headers[VERSION_HEADER] != response.get_json()['model_version']):
+                    failures.append(response.status_code)
+
+    clients = [threading.Thread(target=post) for _ in range(2)]
+    for thread in clients:
+        thread.start()
+    try:
+        for _ in range(3):
+            assert service.registry.reload(force=True) == "reloaded"
+    finally:
+        stop.set()
+        for thread in clients:
+            thread.join()
+    assert served and failures == []
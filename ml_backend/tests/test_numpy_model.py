@@ -0,0 +1,104 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.linear_model import LogisticRegression, Perceptron, RidgeClassifier, SGDClassifier
+from sklearn.neighbors import NearestCentroid
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import LinearSVC
+from sklearn.tree import DecisionTreeClassifier
+
+from _common import make_rng, random_answers
+from artifact_bundle import load_sources
+from inference import predict_labels
+from numpy_model import ExportError, compare_models, export_model, load_model
+from preprocessing import FeatureEncoder, build_score_maps, calculate_scores_batch
+
+ESTIMATORS = {
+    'kmeans': lambda: KMeans(n_clusters=4, n_init=3, random_state=0),
+    'minibatch_kmeans': lambda: MiniBatchKMeans(n_clusters=4, n_init=3, random_state=0),
+    'nearest_centroid': NearestCentroid,
+    'logistic_regression': lambda: LogisticRegression(max_iter=1000),
+    'linear_svc': LinearSVC,
+    'ridge': RidgeClassifier,
+    'sgd': lambda: SGDClassifier(random_state=0),
+    'perceptron': lambda: Perceptron(random_state=0),
+    'scaled_kmeans': lambda: make_pipeline(StandardScaler(), KMeans(n_clusters=4, n_init=3, random_state=0)),
+    'scaled_logistic_regression': lambda: make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000)),
+}
+
+
+@pytest.fixture(scope='module')
+def training_data():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(scale=4, size=(4, 6))
+    labels = rng.integers(0, 4, size=400)
+    return centers[labels] + rng.normal(size=(400, 6)), labels
+
+
+@pytest.fixture(scope='module')
+def rows():
+    return np.random.default_rng(1).normal(scale=5, size=(2000, 6))
+
+
+def round_trip(model):
+    """Evaluators loaded from the pickled export, as a bundle would hold it."""
+    exported = pickle.dumps(export_model(model))
+    assert b'sklearn' not in exported
+    return load_model(pickle.loads(exported))
+
+
+@pytest.mark.parametrize('name', ESTIMATORS)
+def test_exported_predict_matches_sklearn(training_data, rows, name):
+    features, labels = training_data
+    estimator = ESTIMATORS[name]().fit(features, labels)
+    evaluator = round_trip(estimator)
+
+    np.testing.assert_array_equal(evaluator.predict(rows), estimator.predict(rows))
+    np.testing.assert_array_equal(evaluator.predict(features), estimator.predict(features))
+    assert compare_models(estimator, evaluator, rows) == []
+
+
+def test_binary_linear_classifier(training_data, rows):
+    features, labels = training_data
+    estimator = LogisticRegression().fit(features, labels % 2)
+    np.testing.assert_array_equal(round_trip(estimator).predict(rows), estimator.predict(rows))
+
+
+@pytest.mark.parametrize('with_mean, with_std', [(True, True), (False, True), (True, False)])
+def test_exported_scaler_matches_sklearn(training_data, rows, with_mean, with_std):
+    scaler = StandardScaler(with_mean=with_mean, with_std=with_std).fit(training_data[0])
+    np.testing.assert_allclose(round_trip(scaler).transform(rows), scaler.transform(rows), rtol=1e-12)
+
+
+def test_dict_model_keeps_its_metadata(training_data):
+    model = {'scaler': StandardScaler().fit(training_data[0]), 'career_feature_columns': ['a', 'b']}
+    evaluator = round_trip(model)
+    assert evaluator['career_feature_columns'] == ['a', 'b']
+    assert compare_models(model, evaluator, training_data[0]) == []
+
+
+def test_unsupported_estimator_is_not_exported(training_data):
+    with pytest.raises(ExportError, match="DecisionTreeClassifier"):
+        export_model(DecisionTreeClassifier().fit(*training_data))
+
+
+@pytest.fixture(scope='module')
+def career_model():
+    """The sources a bundle is built from, and features of generated questionnaires."""
+    contents = load_sources()
+    rng = make_rng(2)
+    answers = [random_answers(rng) for _ in range(500)]
+    scores, _ = calculate_scores_batch(answers, contents['mapping'], build_score_maps(contents['mapping']))
+    encoder = FeatureEncoder(contents['model_columns'], contents['mapping'])
+    return contents['model'], encoder, encoder.encode_columns(scores, len(answers))
+
+
+def test_exported_career_model_matches_the_pickle(career_model):
+    original, encoder, features = career_model
+    evaluator = round_trip(original)
+    assert compare_models(original, evaluator, features) == []
+    np.testing.assert_array_equal(predict_labels(evaluator, features, encoder),
+                                  predict_labels(original, features, encoder))
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from _common import random_answers, random_record
+from preprocessing import FeatureEncoder, calculate_scores, calculate_scores_batch, preprocess_data
+
+
+@pytest.fixture(scope='module')
+def encoder(model_columns, mapping):
+    return FeatureEncoder(model_columns, mapping)
+
+
+def reference(data, model_columns, mapping):
+    # preprocess_data passes unparseable raw values (e.g. age='n/a') through
+    # as strings; the encoder coerces them to 0 like every other NaN
+    expected = preprocess_data(data, model_columns, mapping)
+    return expected.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(np.float64)
+
+
+def assert_encodes_like_preprocess_data(encoder, inputs, model_columns, mapping):
+    for data in inputs:
+        np.testing.assert_allclose(encoder.encode(data), reference(data, model_columns, mapping),
+                                   rtol=1e-12, atol=1e-12, err_msg=repr(data))
+
+
+def test_questionnaires_match_preprocess_data(encoder, model_columns, mapping, rng):
+    inputs = [calculate_scores(random_answers(rng), mapping) for _ in range(200)]
+    assert_encodes_like_preprocess_data(encoder, inputs, model_columns, mapping)
+
+
+def test_raw_records_match_preprocess_data(encoder, model_columns, mapping, rng):
+    inputs = [random_record(rng, missing_rate=0.2) for _ in range(200)]
+    assert_encodes_like_preprocess_data(encoder, inputs, model_columns, mapping)
+
+
+@pytest.mark.parametrize('overrides', [
+    {'math_score': None, 'english_score': '', 'science_score': 'n/a'},  # no subject scores
+    {'math_score': None, 'english_score': '', 'science_score': 72},     # a single score
+    {'creativity_score': None, 'teamwork_score': 'abc'},                # blank ratings
+    {'stream': 'Astronomy', 'interest': None},                          # unknown categories
+])
+def test_edge_cases_match_preprocess_data(encoder, model_columns, mapping, rng, overrides):
+    data = dict(random_record(rng, missing_rate=0), **overrides)
+    assert_encodes_like_preprocess_data(encoder, [data], model_columns, mapping)
+
+
+def test_missing_key_matches_preprocess_data(encoder, model_columns, mapping, rng):
+    data = {key: value for key, value in random_record(rng).items() if key != 'age'}
+    assert_encodes_like_preprocess_data(encoder, [data], model_columns, mapping)
+
+
+def test_encode_batch_matches_encode(encoder, mapping, rng):
+    inputs = [calculate_scores(random_answers(rng), mapping) for _ in range(50)]
+    features, errors = encoder.encode_batch(inputs)
+    assert not any(errors)
+    np.testing.assert_array_equal(features, np.vstack([encoder.encode(data) for data in inputs]))
+
+
+def test_encode_batch_fails_rows_like_encode(encoder, rng):
+    good = random_record(rng)
+    without_score = {key: value for key, value in random_record(rng).items() if key != 'math_score'}
+    features, errors = encoder.encode_batch([good, without_score, 'not a dict'])
+    np.testing.assert_allclose(features[0], encoder.encode(good)[0], rtol=1e-12, atol=1e-12)
+    assert errors[0] is None
+    assert isinstance(errors[1], KeyError)
+    assert isinstance(errors[2], TypeError)
+    assert not features[1:].any()
+
+
+def test_calculate_scores_batch_matches_calculate_scores(encoder, mapping, rng):
+    answers_list = [random_answers(rng, missing_rate=0.2) for _ in range(300)]
+    columns, errors = calculate_scores_batch(answers_list, mapping)
+    assert not any(errors)
+    expected = np.vstack([encoder.encode(calculate_scores(answers, mapping)) for answers in answers_list])
+    np.testing.assert_allclose(encoder.encode_columns(columns, len(answers_list)), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_calculate_scores_batch_keeps_per_row_errors(mapping, rng):
+    answers_list = [random_answers(rng), dict(random_answers(rng), **{'5': 3}), ['not', 'a', 'dict'],
+                    dict(random_answers(rng), **{'2': ['unhashable']})]
+    _, errors = calculate_scores_batch(answers_list, mapping)
+    assert errors[0] is None
+    for i in (1, 3):
+        with pytest.raises(type(errors[i])):
+            calculate_scores(answers_list[i], mapping)
+    assert isinstance(errors[2], TypeError)
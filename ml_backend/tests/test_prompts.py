@@ -0,0 +1,59 @@
+import pytest
+
+from career_common.tokens import estimate_tokens
+from gemini_utils import build_guidance_prompt, cluster_summary
+from prompts import GUIDANCE, PromptTemplate, compact
+
+
+def test_templates_are_compacted():
+    template = PromptTemplate('test', 'test-v1', """
+        First line.   
+
+
+        Second line with {field}.
+    """)
+    assert template.text == "First line.\n\nSecond line with {field}."
+    assert template.fields == {'field'}
+    assert compact("a\n\n\n\nb  ") == "a\n\nb"
+
+
+def test_render_fills_fields_and_requires_them():
+    template = PromptTemplate('test', 'test-v1', "Hello {name}, {name} again; {count} items.")
+    assert template.render(name="Ada", count=3) == "Hello Ada, Ada again; 3 items."
+    with pytest.raises(KeyError):
+        template.render(name="Ada")
+
+
+@pytest.mark.parametrize('text', ["{}", "{name:>10}", "{name!r}"])
+def test_only_plain_fields_are_supported(text):
+    with pytest.raises(ValueError):
+        PromptTemplate('test', 'test-v1', text)
+
+
+def test_guidance_prompt_is_stable():
+    cluster = {'name': "Builders", 'top_jobs': ["Engineer", "Architect"],
+               'primary_categories': {'Technology': 5, 'Arts': 2, 'Engineering': 5}}
+    prompt = build_guidance_prompt(cluster, "Age: 16\nGrade: 10th")
+    assert prompt == build_guidance_prompt(dict(cluster), "Age: 16\nGrade: 10th")
+    assert "Student profile:\nAge: 16\nGrade: 10th\n" in prompt
+    assert ("- Name: Builders\n- Career paths: Engineer, Architect\n"
+            "- Main fields: Engineering, Technology, Arts") in prompt
+    assert "{" not in prompt
+    assert GUIDANCE.static_tokens < estimate_tokens(prompt)
+
+
+def test_cluster_summary_leaves_out_missing_fields():
+    assert cluster_summary({'name': "Builders", 'description': "", 'key_traits': None}) == "- Name: Builders"
+    assert cluster_summary({}) == "- No details available."
+
+
+@pytest.mark.parametrize('text, tokens', [
+    ("", 0),
+    ("word", 1),
+    ("words", 2),
+    ("12345", 2),
+    ("a, b.", 4),
+    ("a  b", 3),
+])
+def test_estimate_tokens(text, tokens):
+    assert estimate_tokens(text) == tokens
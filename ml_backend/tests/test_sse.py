@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from _common import random_answers
+from guidance_cache import GuidanceCache, MemoryCacheBackend
+
+STREAM = '/predict_from_questionnaire/stream'
+
+
+def parse_events(body):
+    """(event, data) pairs of a text/event-stream body with JSON data."""
+    events = []
+    for block in body.split("\n\n"):
+        if not block:
+            continue
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def chunks(service, monkeypatch):
+    """Replaces Gemini's stream with a fake one; returns the profiles it was asked for."""
+    calls = []
+
+    def fake_stream_guidance(cluster_info, student_profile):
+        calls.append(student_profile)
+        yield "## Report\n"
+        yield "Part 1. "
+        yield "Part 2."
+
+    monkeypatch.setattr(service, 'stream_guidance', fake_stream_guidance)
+    return calls
+
+
+@pytest.fixture
+def cache(service, monkeypatch):
+    guidance_cache = GuidanceCache(MemoryCacheBackend(), service.PROMPT_VERSION)
+    monkeypatch.setattr(service, 'guidance_cache', guidance_cache)
+    return guidance_cache
+
+
+def test_stream_sends_cluster_then_guidance_chunks(client, chunks, rng):
+    response = client.post(STREAM, json=random_answers(rng))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    events = parse_events(response.get_data(as_text=True))
+    assert [event for event, _ in events] == ["cluster", "guidance", "guidance", "guidance", "done"]
+    assert {"cluster_label", "cluster_name"} <= set(events[0][1])
+    assert [data for event, data in events if event == "guidance"] == ["## Report\n", "Part 1. ", "Part 2."]
+    assert events[-1][1] == {"cached": False}
+    assert len(chunks) == 1
+
+
+def test_stream_is_cached_once_finished(client, chunks, cache, rng):
+    answers = random_answers(rng)
+    first = parse_events(client.post(STREAM, json=answers).get_data(as_text=True))
+    second = parse_events(client.post(STREAM, json=answers).get_data(as_text=True))
+
+    assert first[-1] == ("done", {"cached": False})
+    assert second == [first[0], ("guidance", "## Report\nPart 1. Part 2."), ("done", {"cached": True})]
+    assert len(chunks) == 1
+
+
+def test_failed_stream_sends_error_and_is_not_cached(service, client, cache, monkeypatch, rng):
+    def failing_stream_guidance(cluster_info, student_profile):
+        yield "Part 1. "
+        raise RuntimeError("stream dropped")
+
+    monkeypatch.setattr(service, 'stream_guidance', failing_stream_guidance)
+    answers = random_answers(rng)
+    events = parse_events(client.post(STREAM, json=answers).get_data(as_text=True))
+
+    assert [event for event, _ in events] == ["cluster", "guidance", "error"]
+    assert events[-1][1] == {"error": service.GUIDANCE_ERROR_MESSAGE}
+    assert cache.stats()["entries"] == 0
+
+
+def test_stream_without_guidance_sends_only_the_cluster(client, chunks, rng):
+    events = parse_events(client.post(f"{STREAM}?guidance=false", json=random_answers(rng)).get_data(as_text=True))
+    assert [event for event, _ in events] == ["cluster", "done"]
+    assert chunks == []
+
+
+@pytest.mark.parametrize('guidance', ['true', 'false'])
+def test_cluster_event_carries_the_fallback_when_asked(client, chunks, rng, guidance):
+    answers = random_answers(rng)
+    plain = parse_events(client.post(f"{STREAM}?guidance={guidance}", json=answers).get_data(as_text=True))
+    events = parse_events(client.post(f"{STREAM}?guidance={guidance}&fallback=true",
+                                      json=answers).get_data(as_text=True))
+    assert "fallback" not in plain[0][1]
+    fallback = events[0][1].pop("fallback")
+    assert events[0][1] == plain[0][1]
+    assert fallback["guidance"] and fallback["career_details"]
+
+
+def test_stream_rejects_invalid_json(client):
+    assert client.post(STREAM, data="not json", content_type='application/json').status_code == 400
@@ -0,0 +1,60 @@
+import pytest
+
+from _common import random_answers, random_record
+from preprocessing import calculate_scores
+from student_profile import ProfileEncoder
+
+
+@pytest.fixture(scope='module')
+def encoder(mapping):
+    return ProfileEncoder(mapping)
+
+
+def test_codes_are_decoded_to_labels(encoder):
+    profile = encoder.encode({'age': 16, 'grade': 1, 'stream': 2, 'comfortable_outside_india': 1,
+                              'math_score': 81, 'english_score': 72.5, 'has_technical_hobby': 1})
+    assert profile.splitlines() == [
+        "Age: 16",
+        "Grade: 12th",
+        "Stream: Science",
+        "Open to working abroad: Yes",
+        "Subject scores (%): math 81, English 72.5",
+        "Hobbies: technical",
+    ]
+
+
+@pytest.mark.parametrize('value', [-1, -1.0, None, '', 'n/a', 'NaN', 'Unknown', ' unknown ', 3])
+def test_unanswered_stream_is_skipped(encoder, value):
+    # Code 3 is the mapping's "Unknown" stream
+    assert "Stream" not in encoder.encode({'grade': 0, 'stream': value})
+
+
+@pytest.mark.parametrize('value', [-1, None, 'n/a', 'inf', float('nan')])
+def test_unanswered_numbers_are_skipped(encoder, value):
+    profile = encoder.encode({'age': value, 'creativity_score': value, 'teamwork_score': 7,
+                              'expected_salary': value})
+    assert profile == "Self-ratings (0-10): teamwork 7"
+
+
+def test_unknown_disability_is_skipped(encoder):
+    assert "Disability" not in encoder.encode({'disability_status': 'Unknown'})
+    assert encoder.encode({'disability_status': 'Visual'}) == "Disability: Visual"
+    assert encoder.encode({'disability_status': 1}) == "Disability: reported"
+
+
+def test_untaken_psychometric_test(encoder):
+    assert encoder.encode({'psychometric_test_given': 0, 'psychometric_test_score': 0}) == \
+        "Psychometric test: not taken"
+    assert encoder.encode({'psychometric_test_score': 0}) == "No answers given."
+    assert encoder.encode({'psychometric_test_given': 'Yes', 'psychometric_test_score': 64}) == \
+        "Psychometric test score: 64/100"
+
+
+def test_profiles_are_stable_and_free_of_sentinels(encoder, mapping, rng):
+    for _ in range(200):
+        scores = calculate_scores(random_answers(rng, missing_rate=0.3), mapping)
+        profile = encoder.encode(scores)
+        assert profile == encoder.encode(dict(reversed(list(scores.items()))))
+        assert " -1" not in profile and "Unknown" not in profile and "nan" not in profile.lower()
+        record = random_record(rng, missing_rate=0.3)
+        assert encoder.encode(record) == encoder.encode(dict(record))
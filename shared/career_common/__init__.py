@@ -0,0 +1 @@
+"""Modules shared by ml_backend and the Cloud & backend orchestrator."""
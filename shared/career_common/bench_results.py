@@ -0,0 +1,134 @@
+"""
+JSON result files for the benchmark suites, and comparison against a baseline.
+
+A result file records the suite, its parameters, the environment it ran in
+and one stats dict per benchmark. `compare` matches benchmarks by name and
+flags every compared metric that moved the wrong way by more than the
+tolerance: p50/p95 latencies and error rates may only go down, throughput may
+only go up. Means and p99s are recorded but too noisy to gate on.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+FORMAT = 1
+# Metric -> +1 if higher is better, -1 if lower is better
+COMPARED_METRICS = {
+    'p50_us': -1, 'p95_us': -1,
+    'p50_ms': -1, 'p95_ms': -1,
+    'throughput_rps': 1,
+    'error_rate': -1,
+}
+# Differences below one microsecond (or millisecond) are timer noise
+NOISE_FLOOR = 1.0
+
+
+def _git_commit(directory):
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def environment(directory):
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": _git_commit(directory),
+    }
+
+
+def write_results(path, suite, params, results, directory):
+    """Write one suite run to `path` and return the document."""
+    document = {
+        "format": FORMAT,
+        "suite": suite,
+        "created": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "environment": environment(directory),
+        "params": params,
+        "results": results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return document
+
+
+def load_results(path):
+    with open(path) as f:
+        document = json.load(f)
+    if document.get('format') != FORMAT:
+        raise ValueError(f"{path}: unsupported result format {document.get('format')!r}")
+    return document
+
+
+def compare(current, baseline, tolerance=0.10):
+    """
+    Compare two result documents. Returns a list of rows
+    (benchmark, metric, baseline, current, change, regressed), where change
+    is the relative difference and regressed is True past the tolerance.
+    """
+    if current['suite'] != baseline['suite']:
+        raise ValueError(f"cannot compare suite {current['suite']!r} with {baseline['suite']!r}")
+    rows = []
+    for name, stats in current['results'].items():
+        old_stats = baseline['results'].get(name)
+        if old_stats is None:
+            continue
+        for metric, value in stats.items():
+            direction = COMPARED_METRICS.get(metric)
+            old = old_stats.get(metric)
+            if not direction or not isinstance(old, (int, float)) or not isinstance(value, (int, float)):
+                continue
+            if old:
+                change = (value - old) / old
+            else:
+                change = 0.0 if value == old else float('inf') * (1 if value > old else -1)
+            if metric == 'error_rate':
+                # Error rates are fractions already; compare them absolutely
+                regressed = value - old > tolerance
+            else:
+                regressed = change * direction < -tolerance and abs(value - old) >= NOISE_FLOOR
+            rows.append((name, metric, old, value, change, regressed))
+    return rows
+
+
+def print_comparison(rows, baseline_path):
+    print(f"\nvs baseline {baseline_path}")
+    print(f"{'benchmark':<32} {'metric':<15} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, metric, old, value, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:<32} {metric:<15} {old:>12.2f} {value:>12.2f} {change:>+8.1%}{flag}")
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} regression(s) in {len(rows)} compared metric(s)")
+    return regressions
+
+
+def add_arguments(parser, default_output):
+    parser.add_argument('--output', default=default_output, help="JSON result file to write")
+    parser.add_argument('--baseline', help="earlier result file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="relative slowdown allowed before a metric counts as a regression")
+
+
+def finish(args, suite, params, results, directory):
+    """
+    Write the results and compare them with --baseline if given. Returns the
+    number of regressions, for the script's exit status.
+    """
+    document = write_results(args.output, suite, params, results, directory)
+    print(f"\nresults written to {args.output}")
+    if not args.baseline:
+        return 0
+    try:
+        baseline = load_results(args.baseline)
+        return print_comparison(compare(document, baseline, args.tolerance), args.baseline)
+    except (OSError, ValueError) as e:
+        print(f"cannot compare with {args.baseline}: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,602 @@
+"""
+Shared gateway for Gemini calls: a bounded concurrency pool, per-minute
+request and token budgets, single-flight coalescing of identical in-flight
+prompts, and a priority queue for calls that have to wait.
+
+Every call reserves its estimated tokens (career_common.tokens' estimate of
+the prompt plus the expected output) when it is admitted. The reservation is replaced by the
+response's usage_metadata once it arrives. A call is admitted at once when a
+slot and budget are free and nobody is queued. Otherwise it joins a queue
+ordered by priority, then arrival. Only the head of the queue is admitted,
+so a large call waiting for token budget is not overtaken forever by the
+smaller calls behind it. A full queue or a wait longer than the queue
+timeout raises GatewayBusy.
+
+With `coalesce=True`, identical (operation, prompt) calls that arrive while
+one is in flight wait for it and share its response instead of calling
+Gemini again. Only use it for stateless prompts: chat turns are never
+coalesced. Coalescing, the concurrency limit and the queue are per worker
+process. The per-minute budgets are too, unless the gateway records its
+admissions in a SQLiteBudgetWindow shared by every worker on the host.
+
+`acall` and `aslot` are the asyncio versions for coroutine callers. They share
+the same slots, budgets and queue as threaded callers, but wait on the event
+loop instead of blocking it. A cancelled task leaves the queue at once. A
+coalesced async generation is cancelled when every caller waiting on it has
+been cancelled.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from career_common.metrics import LLM_COALESCED, LLM_QUEUED, LLM_REJECTED, llm_call, span
+from career_common.tokens import estimate_tokens
+
+# Queue priorities; lower is served first
+INTERACTIVE = 0
+DEFAULT = 1
+BACKGROUND = 2
+
+
+class GatewayBusy(Exception):
+    """The call was not admitted: the queue was full or it waited longer than the queue timeout."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def response_tokens(response):
+    """Prompt plus completion tokens from a response's usage_metadata, or None without it."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return None
+    return ((getattr(usage, 'prompt_token_count', 0) or 0)
+            + (getattr(usage, 'candidates_token_count', 0) or 0))
+
+
+class MemoryBudgetWindow:
+    """Admissions of the last `window_seconds`, counted in this process only."""
+
+    def __init__(self, window_seconds=60.0):
+        self.window_seconds = window_seconds
+        self._entries = deque()  # [admitted_at, tokens] per admitted call
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def admit(self, tokens, requests_per_minute, tokens_per_minute):
+        """Record an admission if it fits both budgets (0 = no limit); returns its entry or None."""
+        with self._lock:
+            self._expire()
+            if requests_per_minute and len(self._entries) >= requests_per_minute:
+                return None
+            # A call larger than the whole budget still runs once the window is empty
+            if tokens_per_minute and self._tokens and self._tokens + tokens > tokens_per_minute:
+                return None
+            entry = [time.monotonic(), tokens]
+            self._entries.append(entry)
+            self._tokens += tokens
+            return entry
+
+    def settle(self, entry, tokens):
+        """Swap an admission's estimate for its real usage while it still counts."""
+        with self._lock:
+            if time.monotonic() - entry[0] < self.window_seconds:
+                self._tokens += tokens - entry[1]
+                entry[1] = tokens
+
+    def usage(self):
+        """(requests, tokens) admitted in the window."""
+        with self._lock:
+            self._expire()
+            return len(self._entries), self._tokens
+
+    def wait(self):
+        """Seconds until the oldest admission expires (the longest a budget can stay exhausted)."""
+        with self._lock:
+            if not self._entries:
+                return self.window_seconds
+            return max(0.01, self._entries[0][0] + self.window_seconds - time.monotonic())
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self._entries and self._entries[0][0] <= cutoff:
+            self._tokens -= self._entries.popleft()[1]
+
+
+class SQLiteBudgetWindow:
+    """
+    Admissions of the last `window_seconds` in one SQLite file, so every
+    worker process on the host spends the same per-minute budgets. Each
+    admission checks and records itself in one write transaction.
+    """
+
+    def __init__(self, path, window_seconds=60.0):
+        self.path = path
+        self.window_seconds = window_seconds
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS llm_budget ("
+                     " id INTEGER PRIMARY KEY,"
+                     " admitted_at REAL NOT NULL,"
+                     " tokens INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_budget_admitted_at ON llm_budget (admitted_at)")
+
+    def _connect(self):
+        # One connection per thread and per process, since a preloaded app forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def admit(self, tokens, requests_per_minute, tokens_per_minute):
+        conn = self._connect()
+        now = time.time()
+        # IMMEDIATE takes the write lock first, so no other worker admits between the check and the insert
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM llm_budget WHERE admitted_at <= ?", (now - self.window_seconds,))
+            requests, used = conn.execute("SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM llm_budget").fetchone()
+            if ((requests_per_minute and requests >= requests_per_minute)
+                    or (tokens_per_minute and used and used + tokens > tokens_per_minute)):
+                entry = None
+            else:
+                entry = conn.execute("INSERT INTO llm_budget (admitted_at, tokens) VALUES (?, ?)",
+                                     (now, tokens)).lastrowid
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return entry
+
+    def settle(self, entry, tokens):
+        # An expired admission is gone already
+        self._connect().execute("UPDATE llm_budget SET tokens = ? WHERE id = ?", (tokens, entry))
+
+    def usage(self):
+        return self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM llm_budget WHERE admitted_at > ?",
+            (time.time() - self.window_seconds,)).fetchone()
+
+    def wait(self):
+        oldest, = self._connect().execute(
+            "SELECT MIN(admitted_at) FROM llm_budget WHERE admitted_at > ?",
+            (time.time() - self.window_seconds,)).fetchone()
+        if oldest is None:
+            return self.window_seconds
+        return max(0.01, oldest + self.window_seconds - time.time())
+
+
+def _flight_key(operation, prompt):
+    return hashlib.sha256(f"{operation}\0{prompt}".encode('utf-8')).hexdigest()
+
+
+class GatewaySlot:
+    """
+    Context manager holding one admitted call; wraps metrics.llm_call. Pass
+    responses (or the last streamed chunk) to `usage` to count tokens and
+    settle the budget reservation.
+    """
+
+    def __init__(self, gateway, operation, ticket):
+        self._gateway = gateway
+        self.operation = operation
+        self._ticket = ticket
+        self._actual = None
+
+    def __enter__(self):
+        self._gateway._acquire(self.operation, self._ticket)
+        self._call = llm_call(self.operation).__enter__()
+        return self
+
+    def usage(self, response):
+        self._call.usage(response)
+        tokens = response_tokens(response)
+        if tokens is not None:
+            self._actual = tokens
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._call.__exit__(exc_type, exc, tb)
+        finally:
+            self._gateway._release(self._ticket, self._actual)
+
+
+class AsyncGatewaySlot(GatewaySlot):
+    """GatewaySlot for coroutines: `async with` waits for admission without blocking the loop."""
+
+    async def __aenter__(self):
+        await self._gateway._aacquire(self.operation, self._ticket)
+        self._call = llm_call(self.operation).__enter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            return self._call.__exit__(exc_type, exc, tb)
+        finally:
+            await self._gateway._arelease(self._ticket, self._actual)
+
+
+class LLMGateway:
+    """
+    Admission control for Gemini calls in one process.
+
+    At most `max_concurrency` calls run at once. `requests_per_minute` and
+    `tokens_per_minute` cap admissions over a sliding window of
+    `window_seconds` (0 = no cap), recorded in `budget` (a
+    MemoryBudgetWindow by default; pass a SQLiteBudgetWindow to share the
+    budgets between processes). At most `max_queue` calls wait, each for up
+    to `queue_timeout` seconds.
+
+    The budget window is only read and written outside the gateway's lock
+    (and off the event loop for async callers), so a slow SQLite file never
+    holds up releases or the rest of the queue.
+    """
+
+    def __init__(self, max_concurrency=16, requests_per_minute=0, tokens_per_minute=0,
+                 max_queue=200, queue_timeout=30.0, expected_output_tokens=1000, window_seconds=60.0,
+                 budget=None):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.expected_output_tokens = expected_output_tokens
+        self.window_seconds = window_seconds
+        self.budget = budget if budget is not None else MemoryBudgetWindow(window_seconds)
+        self._cond = threading.Condition()
+        self._queue = []  # heap of tickets: [priority, seq, tokens, budget entry]
+        self._seq = itertools.count()
+        self._running = 0
+        self._waiters = set()  # (loop, asyncio.Event) of async callers in the queue
+        self._generation = 0  # bumped by every notify, so a poll can tell it missed one
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._async_flights = {}  # touched only from the event loop
+        self.admitted = 0
+        self.queued = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def estimate_tokens(self, *texts):
+        """Tokens a call is expected to use: its prompt texts plus the expected output."""
+        return sum(estimate_tokens(text) for text in texts) + self.expected_output_tokens
+
+    def slot(self, operation, prompt, priority=DEFAULT, tokens=None):
+        """
+        Context manager that waits for admission, then times the call like
+        metrics.llm_call. Use it for streamed calls; `call` for the rest.
+        `tokens` overrides the estimate from `prompt` (e.g. to add chat history).
+        """
+        return GatewaySlot(self, operation, self._ticket(prompt, priority, tokens))
+
+    def call(self, operation, fn, prompt, priority=DEFAULT, coalesce=False, tokens=None):
+        """
+        Return fn(prompt) once admitted. With coalesce, an identical call
+        already in flight is awaited and its response (or error) shared.
+        Raises GatewayBusy when not admitted.
+        """
+        if not coalesce:
+            return self._call(operation, fn, prompt, self._ticket(prompt, priority, tokens))
+
+        key = _flight_key(operation, prompt)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = (Future(), self._ticket(prompt, priority, tokens))
+            else:
+                self.coalesced += 1
+        future, ticket = flight
+        if not leader:
+            self._promote(ticket, priority)
+            LLM_COALESCED.inc(operation=operation)
+            with span("llm_coalesced"):
+                return future.result()
+
+        try:
+            response = self._call(operation, fn, prompt, ticket)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+
+    def aslot(self, operation, prompt, priority=DEFAULT, tokens=None):
+        """`slot` for coroutines, used with `async with`."""
+        return AsyncGatewaySlot(self, operation, self._ticket(prompt, priority, tokens))
+
+    async def acall(self, operation, fn, prompt, priority=DEFAULT, coalesce=False, tokens=None):
+        """
+        Return await fn(prompt) once admitted, where fn is a coroutine
+        function. Like `call`, but queued waits and coalesced waits yield to
+        the event loop and end when the calling task is cancelled.
+        """
+        if not coalesce:
+            return await self._acall(operation, fn, prompt, self._ticket(prompt, priority, tokens))
+
+        key = _flight_key(operation, prompt)
+        flight = self._async_flights.get(key)
+        leader = flight is None
+        if leader:
+            ticket = self._ticket(prompt, priority, tokens)
+            task = asyncio.ensure_future(self._acall(operation, fn, prompt, ticket))
+            # [task, ticket, callers waiting on it]
+            flight = self._async_flights[key] = [task, ticket, 0]
+
+            def land(_):
+                if self._async_flights.get(key) is flight:
+                    del self._async_flights[key]
+            task.add_done_callback(land)
+        else:
+            self.coalesced += 1
+            self._promote(flight[1], priority)
+            LLM_COALESCED.inc(operation=operation)
+        task = flight[0]
+        flight[2] += 1
+        try:
+            if leader:
+                return await asyncio.shield(task)
+            with span("llm_coalesced"):
+                return await asyncio.shield(task)
+        finally:
+            flight[2] -= 1
+            # Nobody is left to read the response
+            if not flight[2] and not task.done():
+                task.cancel()
+
+    async def _acall(self, operation, fn, prompt, ticket):
+        async with AsyncGatewaySlot(self, operation, ticket) as slot:
+            response = await fn(prompt)
+            slot.usage(response)
+            return response
+
+    def _call(self, operation, fn, prompt, ticket):
+        with GatewaySlot(self, operation, ticket) as slot:
+            response = fn(prompt)
+            slot.usage(response)
+            return response
+
+    def _ticket(self, prompt, priority, tokens):
+        if tokens is None:
+            tokens = self.estimate_tokens(str(prompt))
+        return [priority, next(self._seq), tokens, None]
+
+    def _promote(self, ticket, priority):
+        """Move a queued ticket up to `priority` when a more urgent caller joins its flight."""
+        with self._cond:
+            if priority < ticket[0]:
+                ticket[0] = priority
+                if ticket in self._queue:
+                    heapq.heapify(self._queue)
+                    self._notify()
+
+    def _acquire(self, operation, ticket):
+        if self._admit(ticket, queued=False):
+            return
+        if not self._enqueue(operation, ticket):
+            raise GatewayBusy(f"{self.max_queue} Gemini calls already queued", retry_after=self._retry_after())
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            with span("llm_queue"):
+                while True:
+                    with self._cond:
+                        generation = self._generation
+                    if self._admit(ticket, queued=True):
+                        return
+                    timeout = self._queue_wait(operation, ticket, deadline)
+                    with self._cond:
+                        # Sleep unless a release or dequeue notified since the poll
+                        if self._generation == generation:
+                            self._cond.wait(timeout)
+        except BaseException:
+            self._leave(ticket)
+            raise
+        finally:
+            LLM_QUEUED.dec(operation=operation)
+
+    async def _aacquire(self, operation, ticket):
+        loop = asyncio.get_running_loop()
+        if await self._aadmit(ticket, queued=False):
+            return
+        waiter = (loop, asyncio.Event())
+        if not self._enqueue(operation, ticket, waiter):
+            retry_after = await loop.run_in_executor(None, self._retry_after)
+            raise GatewayBusy(f"{self.max_queue} Gemini calls already queued", retry_after=retry_after)
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            with span("llm_queue"):
+                while True:
+                    # A notify from here on sets the event again
+                    waiter[1].clear()
+                    if await self._aadmit(ticket, queued=True):
+                        return
+                    timeout = await loop.run_in_executor(None, self._queue_wait, operation, ticket, deadline)
+                    try:
+                        await asyncio.wait_for(waiter[1].wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            self._leave(ticket)
+            raise
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+            LLM_QUEUED.dec(operation=operation)
+
+    def _admit(self, ticket, queued):
+        """
+        Start the ticket if it may go now (nobody queued, or it heads the
+        queue), a slot is free and the budgets allow it; returns whether it
+        started. The slot is taken under the lock and the budget reserved
+        outside it; a ticket the budget turns away hands its slot back.
+        """
+        with self._cond:
+            if self._running >= self.max_concurrency:
+                return False
+            if (not self._queue or self._queue[0] is not ticket) if queued else self._queue:
+                return False
+            self._running += 1
+        try:
+            entry = self.budget.admit(ticket[2], self.requests_per_minute, self.tokens_per_minute)
+        except BaseException:
+            self._hand_back(ticket)
+            raise
+        if entry is None:
+            self._hand_back(ticket)
+            return False
+        ticket[3] = entry
+        with self._cond:
+            self.admitted += 1
+            if ticket in self._queue:
+                # Notifies, as the next ticket may fit as well
+                self._dequeue(ticket)
+        return True
+
+    async def _aadmit(self, ticket, queued):
+        """`_admit` on the default executor, keeping the budget's I/O off the event loop."""
+        admit = asyncio.get_running_loop().run_in_executor(None, self._admit, ticket, queued)
+        try:
+            return await asyncio.shield(admit)
+        except asyncio.CancelledError:
+            # The reservation runs on; free the slot if it ends up started
+            admit.add_done_callback(
+                lambda done: not done.cancelled() and not done.exception() and done.result()
+                and self._release(ticket, None))
+            raise
+
+    def _hand_back(self, ticket):
+        """Return a slot the budget turned the ticket away from."""
+        with self._cond:
+            self._running -= 1
+            # The head is the only ticket that could use it; wake the others if that is someone else
+            if self._queue and self._queue[0] is not ticket:
+                self._notify()
+
+    def _enqueue(self, operation, ticket, waiter=None):
+        """Queue the ticket (and the async caller's waiter); returns False when the queue is full."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._reject(operation, 'queue_full')
+                return False
+            heapq.heappush(self._queue, ticket)
+            self.queued += 1
+            if waiter is not None:
+                self._waiters.add(waiter)
+        LLM_QUEUED.inc(operation=operation)
+        return True
+
+    def _queue_wait(self, operation, ticket, deadline):
+        """Seconds a queued ticket sleeps before polling again. Raises GatewayBusy past the deadline."""
+        if time.monotonic() >= deadline:
+            with self._cond:
+                self._dequeue(ticket)
+                self._reject(operation, 'timeout')
+            raise GatewayBusy(f"Waited {self.queue_timeout:g}s for a Gemini slot",
+                              retry_after=self._retry_after())
+        # Releases notify; budget windows free up on their own, so wake for those too
+        return min(deadline - time.monotonic(), self._window_wait())
+
+    def _leave(self, ticket):
+        with self._cond:
+            if ticket in self._queue:
+                self._dequeue(ticket)
+
+    def _dequeue(self, ticket):
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._notify()
+
+    def _notify(self):
+        """Wake every queued caller, threads and event-loop tasks alike. Call with the lock held."""
+        self._generation += 1
+        self._cond.notify_all()
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _release(self, ticket, actual_tokens):
+        try:
+            if actual_tokens is not None:
+                self.budget.settle(ticket[3], actual_tokens)
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._notify()
+
+    async def _arelease(self, ticket, actual_tokens):
+        if actual_tokens is None:
+            self._release(ticket, None)
+            return
+        # Shielded, so a cancelled caller still frees its slot once the settle is written
+        await asyncio.shield(asyncio.get_running_loop().run_in_executor(None, self._release, ticket, actual_tokens))
+
+    def _window_wait(self):
+        # Budgets free up as admissions expire, in this process or (shared) any other
+        return self.budget.wait()
+
+    def _retry_after(self):
+        if self._running < self.max_concurrency and self.budget.usage()[0]:
+            return math.ceil(self._window_wait())
+        return 1
+
+    def _reject(self, operation, reason):
+        self.rejected += 1
+        LLM_REJECTED.inc(operation=operation, reason=reason)
+
+    def stats(self):
+        window_requests, window_tokens = self.budget.usage()
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "running": self._running,
+                "queued_now": len(self._queue),
+                "window_requests": window_requests,
+                "window_tokens": window_tokens,
+                "budget": type(self.budget).__name__,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+
+
+def budget_from_env():
+    """
+    The window the per-minute budgets are counted in, as LLM_BUDGET_STORE
+    selects: `memory` (this worker only) or `sqlite` (at LLM_BUDGET_PATH,
+    shared by the workers on the host).
+    """
+    if os.getenv("LLM_BUDGET_STORE", "memory").lower() == "sqlite":
+        return SQLiteBudgetWindow(os.getenv("LLM_BUDGET_PATH", "llm_budget.sqlite3"))
+    return MemoryBudgetWindow()
+
+
+def gateway_from_env():
+    """Build the gateway from the LLM_* environment variables."""
+    return LLMGateway(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+        requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+        tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+        max_queue=int(os.getenv("LLM_MAX_QUEUE", "200")),
+        queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+        expected_output_tokens=int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1000")),
+        budget=budget_from_env(),
+    )
@@ -0,0 +1,168 @@
+"""
+Local stand-in for the Gemini client, used for tests, benchmarks and offline runs.
+
+Enable it with LLM_STUB=1. LLM_STUB_LATENCY_MS adds a generation delay (spread
+across the chunks when streaming), LLM_STUB_MS_PER_PROMPT_TOKEN adds a delay
+per prompt token before the first chunk, as prompt processing does, and
+LLM_STUB_FAILURE_RATE (0.0-1.0) makes that fraction of calls raise; set
+LLM_STUB_SEED to make the sequence of injected failures repeatable.
+
+The `_async` methods mirror the SDK's asyncio API and sleep on the event loop,
+so a cancelled caller stops its generation.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+STREAM_CHUNKS = 8
+# Shared by every stub model, so the failure sequence is per process, not per call
+_failures = random.Random(os.environ.get("LLM_STUB_SEED") or None)
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class StubUsage:
+    """Mimics GenerateContentResponse.usage_metadata, at about 4 characters per token."""
+
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(str(prompt)) // 4 + 1
+        self.candidates_token_count = len(text) // 4 + 1
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class StubResponse:
+    """Mimics the `.text` and `.usage_metadata` attributes of a Gemini GenerateContentResponse."""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class StubGenerativeModel:
+    """Drop-in for genai.GenerativeModel that never touches the network."""
+
+    def __init__(self, model_name="stub", generation_config=None, safety_settings=None, **kwargs):
+        self.model_name = model_name
+        self.latency = _env_float("LLM_STUB_LATENCY_MS", 0) / 1000.0
+        self.prompt_token_latency = _env_float("LLM_STUB_MS_PER_PROMPT_TOKEN", 0) / 1000.0
+        self.failure_rate = _env_float("LLM_STUB_FAILURE_RATE", 0)
+
+    def generate_content(self, prompt, stream=False):
+        text = self._render(prompt)
+        if stream:
+            return self._stream(text, prompt)
+        usage = StubUsage(prompt, text)
+        self._wait(self.latency + self._prefill(usage))
+        return StubResponse(text, usage)
+
+    async def generate_content_async(self, prompt, stream=False):
+        text = self._render(prompt)
+        if stream:
+            return self._astream(text, prompt)
+        usage = StubUsage(prompt, text)
+        await self._await(self.latency + self._prefill(usage))
+        return StubResponse(text, usage)
+
+    def start_chat(self, history=None):
+        return StubChatSession(self, history or [])
+
+    def _stream(self, text, prompt):
+        usage = StubUsage(prompt, text)
+        step = max(1, len(text) // STREAM_CHUNKS + 1)
+        for start in range(0, len(text), step):
+            self._wait(self.latency / STREAM_CHUNKS + (self._prefill(usage) if start == 0 else 0))
+            # Like Gemini, the last chunk carries the usage totals
+            last = start + step >= len(text)
+            yield StubResponse(text[start:start + step], usage if last else None)
+
+    async def _astream(self, text, prompt):
+        usage = StubUsage(prompt, text)
+        step = max(1, len(text) // STREAM_CHUNKS + 1)
+        for start in range(0, len(text), step):
+            await self._await(self.latency / STREAM_CHUNKS + (self._prefill(usage) if start == 0 else 0))
+            last = start + step >= len(text)
+            yield StubResponse(text[start:start + step], usage if last else None)
+
+    def _prefill(self, usage):
+        return self.prompt_token_latency * usage.prompt_token_count
+
+    def _wait(self, seconds):
+        if seconds:
+            time.sleep(seconds)
+        if self.failure_rate and _failures.random() < self.failure_rate:
+            raise RuntimeError("LLM stub injected failure")
+
+    async def _await(self, seconds):
+        if seconds:
+            await asyncio.sleep(seconds)
+        self._wait(0)
+
+    @staticmethod
+    def _render(prompt):
+        prompt = str(prompt)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        report = (
+            "## Career Guidance Report\n\n"
+            f"Stub report `{digest}` generated locally from a {len(prompt)}-character prompt.\n\n"
+            "### Next Steps\n\n"
+            "1. Explore the suggested career paths.\n"
+            "2. Talk to people working in these roles.\n"
+        )
+        if "JSON" not in prompt:
+            return report
+
+        details = {
+            "primaryCareer": "Stub Career",
+            "description": f"Placeholder recommendation {digest} from the local LLM stub.",
+            "salaryRange": "INR 6,00,000 - INR 12,00,000",
+            "growthOutlook": "10% over the next decade",
+            "educationRequired": "Bachelor's degree in a related field",
+            "alternativePaths": [
+                {"title": "Stub Alternative 1", "description": "First alternative."},
+                {"title": "Stub Alternative 2", "description": "Second alternative."}
+            ],
+            "keySkills": ["Communication", "Problem solving", "Teamwork", "Curiosity", "Planning"],
+            "nextSteps": ["Research the field", "Take an online course", "Find a mentor", "Build a project"],
+            "whyRecommended": "Generated by the local LLM stub for testing."
+        }
+        if '"report"' in prompt:
+            details["report"] = report
+        return "```json\n" + json.dumps(details, indent=2) + "\n```"
+
+
+class StubChatSession:
+    """Mimics genai.ChatSession for start_chat()/send_message()."""
+
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, content, stream=False):
+        reply = self._record(content)
+        if stream:
+            return self.model._stream(reply, content)
+        usage = StubUsage(content, reply)
+        self.model._wait(self.model.latency + self.model._prefill(usage))
+        return StubResponse(reply, usage)
+
+    async def send_message_async(self, content, stream=False):
+        reply = self._record(content)
+        if stream:
+            return self.model._astream(reply, content)
+        usage = StubUsage(content, reply)
+        await self.model._await(self.model.latency + self.model._prefill(usage))
+        return StubResponse(reply, usage)
+
+    def _record(self, content):
+        reply = f"Stub answer to: {content}"
+        self.history.append({"role": "user", "parts": [{"text": str(content)}]})
+        self.history.append({"role": "model", "parts": [{"text": reply}]})
+        return reply
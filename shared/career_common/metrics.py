@@ -0,0 +1,580 @@
+"""
+Dependency-free Prometheus metrics and request-scoped timing spans.
+
+Counters, gauges and fixed-bucket histograms live in one registry per process
+and are rendered in the Prometheus text format on /metrics. With METRICS_DIR
+set, the worker processes of a server share their values through that
+directory and /metrics renders the sum over all of them (see ProcessMetrics). Every request gets
+a correlation ID (the caller's X-Request-ID, or a new one) that is echoed in
+the response and forwarded to downstream calls. `span(stage)` times one stage
+of the request into the stage histogram and the response's Server-Timing
+header. Recording costs two perf_counter calls, a bisect and a locked
+increment, so it stays on in production.
+
+`instrument_app` wires this into a Flask app. `ASGIMetrics` does the same for
+an ASGI app, keeping the request's timer in a context variable so spans
+recorded by tasks it spawns land on the right request.
+"""
+import asyncio
+import bisect
+import contextvars
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_ENVIRON = "HTTP_X_REQUEST_ID"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; spans from sub-millisecond feature encoding up to slow LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class Metric:
+    """A metric family with a fixed set of label names."""
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple([str(labels[name]) for name in self.labelnames])
+
+    def render(self, values=None):
+        """The metric's text-format lines, from `values` when given."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        if values is not None:
+            lines.extend(self._render_samples(sorted(values.items())))
+            return lines
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def snapshot(self):
+        """A JSON-serializable copy of the values: [[label values], value] pairs."""
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+    def merge(self, values, samples):
+        """Add the `samples` of one snapshot to the `values` dict."""
+        for key, value in samples:
+            key = tuple(key)
+            values[key] = values.get(key, 0) + value
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last is +Inf), then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def merge(self, values, samples):
+        for key, (counts, total, count) in samples:
+            key = tuple(key)
+            state = values.get(key)
+            if state is None:
+                values[key] = [list(counts), total, count]
+                continue
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += count
+
+    def _render_samples(self, items):
+        lines = []
+        bounds = [_format_value(float(bound)) for bound in self.buckets] + ['+Inf']
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} "
+                             f"{cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(float(total))}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, snapshots=None):
+        """
+        The text format of every metric: this process's values, or the sum of
+        `snapshots` (as returned by `snapshot`, e.g. one per process) when given.
+        """
+        lines = []
+        for metric in self._metrics:
+            if snapshots is None:
+                lines.extend(metric.render())
+                continue
+            values = {}
+            for snapshot in snapshots:
+                metric.merge(values, snapshot.get(metric.name, ()))
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def get(self, name):
+        for metric in self._metrics:
+            if metric.name == name:
+                return metric
+        return None
+
+
+REGISTRY = Registry()
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Time from request start to the last byte of the response.',
+    ('method', 'endpoint', 'status')))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    'http_requests_in_flight', 'Requests being handled, including open streams.', ('endpoint',)))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    'stage_duration_seconds', 'Time spent in each stage of a request.', ('stage',)))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    'llm_requests_total', 'Gemini calls by operation and outcome (ok, error, cancelled).',
+    ('operation', 'outcome')))
+LLM_TOKENS = REGISTRY.register(Counter(
+    'llm_tokens_total', 'Gemini tokens by operation and kind (prompt, completion).', ('operation', 'kind')))
+LLM_IN_FLIGHT = REGISTRY.register(Gauge(
+    'llm_requests_in_flight', 'Gemini calls waiting for a response.', ('operation',)))
+LLM_QUEUED = REGISTRY.register(Gauge(
+    'llm_requests_queued', 'Gemini calls waiting in the gateway queue for a slot or budget.', ('operation',)))
+LLM_COALESCED = REGISTRY.register(Counter(
+    'llm_coalesced_total', 'Gemini calls answered by an identical call already in flight.', ('operation',)))
+LLM_REJECTED = REGISTRY.register(Counter(
+    'llm_rejected_total', 'Gemini calls the gateway turned away (queue_full, timeout).', ('operation', 'reason')))
+FALLBACKS = REGISTRY.register(Counter(
+    'fallback_total', 'Results served from cluster metadata instead of Gemini (deadline, error, busy, unparsable).',
+    ('operation', 'reason')))
+FALLBACK_UPGRADES = REGISTRY.register(Counter(
+    'fallback_upgrades_total', 'Fallback results replaced once their generation finished (stored, failed).',
+    ('operation', 'outcome')))
+
+
+class ProcessMetrics:
+    """
+    Sums the registry over the worker processes of one server. Each process
+    writes its values to `<directory>/<pid>.json` every `interval` seconds
+    from a daemon thread started on its first request, and `render` adds the
+    files of every process to its own current values. A scrape therefore sees
+    the other workers' values as of their last write.
+
+    When a worker exits, the master calls `mark_process_dead`: its counters
+    and histograms are folded into `exited.json`, so totals never go
+    backwards, and its gauges are dropped. Use one directory per server and
+    `clear` it when the server starts.
+    """
+    EXITED = 'exited.json'
+
+    def __init__(self, directory, interval=5.0, registry=REGISTRY):
+        self.directory = directory
+        self.interval = interval
+        self.registry = registry
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def start(self):
+        """Start this process's writer thread, once per process (it is not inherited by forks)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._write_periodically, name='metrics-writer', daemon=True).start()
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError:
+                pass  # a full or removed directory only makes the next scrape stale
+
+    def write(self):
+        """Write this process's current values."""
+        self._dump(self._path(os.getpid()), self.registry.snapshot())
+
+    def _dump(self, path, snapshot):
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temporary, path)
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def render(self):
+        """The text format of the values summed over every process."""
+        own = self._path(os.getpid())
+        snapshots = [self.registry.snapshot()]
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.json') and path != own:
+                snapshot = self._load(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return self.registry.render(snapshots)
+
+    def mark_process_dead(self, pid):
+        """Fold an exited worker's counters and histograms into exited.json and drop its gauges."""
+        path = self._path(pid)
+        snapshot = self._load(path)
+        if snapshot is None:
+            return
+        exited_path = os.path.join(self.directory, self.EXITED)
+        exited = self._load(exited_path) or {}
+        for name, samples in snapshot.items():
+            metric = self.registry.get(name)
+            if metric is None or metric.type == 'gauge':
+                continue
+            values = {}
+            metric.merge(values, exited.get(name, ()))
+            metric.merge(values, samples)
+            exited[name] = [[list(key), value] for key, value in values.items()]
+        self._dump(exited_path, exited)
+        os.remove(path)
+
+    def clear(self):
+        """Remove the files of a previous run."""
+        for name in os.listdir(self.directory):
+            if name.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(self.directory, name))
+
+
+def process_metrics_from_env():
+    """ProcessMetrics on METRICS_DIR (METRICS_WRITE_INTERVAL seconds, default 5), or None when unset."""
+    directory = os.getenv('METRICS_DIR')
+    if not directory:
+        return None
+    return ProcessMetrics(directory, interval=float(os.getenv('METRICS_WRITE_INTERVAL', '5')))
+
+
+PROCESS_METRICS = process_metrics_from_env()
+
+
+def render_metrics():
+    """The /metrics body: summed over the server's processes with METRICS_DIR, else this process's."""
+    if PROCESS_METRICS is not None:
+        return PROCESS_METRICS.render()
+    return REGISTRY.render()
+
+
+class RequestTimer:
+    """Per-request correlation ID, start time and recorded spans."""
+    __slots__ = ('request_id', 'endpoint', 'start', 'spans', 'status')
+
+    def __init__(self, request_id, endpoint):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.spans = []
+        self.status = 500
+        self.start = time.perf_counter()
+
+
+# The timer of the ASGI request being handled; Flask requests keep theirs on g
+_asgi_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+def _current_timer():
+    return g.get('request_timer') if has_request_context() else _asgi_timer.get()
+
+
+def request_id():
+    """The correlation ID of the current request, or None outside one."""
+    timer = _current_timer()
+    return timer.request_id if timer is not None else None
+
+
+def correlation_headers():
+    """Headers that carry the current correlation ID to a downstream service."""
+    current = request_id()
+    return {REQUEST_ID_HEADER: current} if current else {}
+
+
+def _record_span(stage, seconds):
+    STAGE_DURATION.observe(seconds, stage=stage)
+    timer = _current_timer()
+    if timer is not None:
+        timer.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_span(stage, time.perf_counter() - start)
+
+
+def record_usage(operation, response):
+    """Add a Gemini response's usage_metadata token counts, if it has any."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    completion_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, operation=operation, kind='prompt')
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, operation=operation, kind='completion')
+
+
+class LLMCall:
+    """
+    Context manager around one Gemini call: tracks it in flight, times it as
+    the `llm_<operation>` stage and counts its outcome. Pass responses (or
+    the last streamed chunk) to `usage` to count tokens.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __enter__(self):
+        LLM_IN_FLIGHT.inc(operation=self.operation)
+        self._start = time.perf_counter()
+        return self
+
+    def usage(self, response):
+        record_usage(self.operation, response)
+
+    def __exit__(self, exc_type, exc, tb):
+        LLM_IN_FLIGHT.dec(operation=self.operation)
+        _record_span(f"llm_{self.operation}", time.perf_counter() - self._start)
+        if exc_type is None:
+            outcome = 'ok'
+        elif issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):
+            outcome = 'cancelled'  # the client went away
+        else:
+            outcome = 'error'
+        LLM_REQUESTS.inc(operation=self.operation, outcome=outcome)
+        return False
+
+
+def llm_call(operation):
+    return LLMCall(operation)
+
+
+def instrument_app(app):
+    """
+    Add correlation IDs, in-flight and latency metrics to every request of
+    `app`, and serve the registry on GET /metrics.
+    """
+
+    # Hooks touch the request and g proxies once each; they run on every request
+    @app.before_request
+    def _start_request():
+        current = request._get_current_object()
+        rule = current.url_rule
+        # Caller-supplied IDs are echoed back, so keep them short
+        timer = RequestTimer(current.environ.get(REQUEST_ID_ENVIRON, '')[:128] or uuid.uuid4().hex,
+                             rule.rule if rule is not None else 'unmatched')
+        g.request_timer = timer
+        HTTP_IN_FLIGHT.inc(endpoint=timer.endpoint)
+        if PROCESS_METRICS is not None:
+            PROCESS_METRICS.start()
+
+    @app.after_request
+    def _add_headers(response):
+        timer = g.get('request_timer')
+        if timer is not None:
+            headers = response.headers
+            headers[REQUEST_ID_HEADER] = timer.request_id
+            if timer.spans:
+                headers['Server-Timing'] = _server_timing(timer.spans)
+            timer.status = response.status_code
+        return response
+
+    # With stream_with_context this runs when the stream ends, so streamed
+    # responses are timed to their last byte and stay in flight until then
+    @app.teardown_request
+    def _finish_request(error):
+        timer = g.pop('request_timer', None)
+        if timer is None:
+            return
+        HTTP_IN_FLIGHT.dec(endpoint=timer.endpoint)
+        status = 500 if error is not None else timer.status
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - timer.start, method=request.method,
+                                      endpoint=timer.endpoint, status=status)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus text-format metrics of this server (METRICS_DIR) or worker process."""
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+    return app
+
+
+def _server_timing(spans):
+    return ', '.join([f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in spans])
+
+
+class ASGIMetrics:
+    """
+    ASGI middleware doing what instrument_app does for Flask: correlation
+    IDs, in-flight and latency metrics, Server-Timing, and GET /metrics.
+    `endpoints` are the app's route paths; a path with `{param}` segments is
+    counted under that template. Other paths are counted as `unmatched` so
+    arbitrary URLs cannot grow the label set.
+    """
+
+    def __init__(self, app, endpoints):
+        self.app = app
+        self.endpoints = frozenset(path for path in endpoints if '{' not in path)
+        self.templates = [(re.compile(re.sub(r'\\\{[^/]*?\\\}', '[^/]+', re.escape(path))), path)
+                          for path in endpoints if '{' in path]
+
+    def _endpoint(self, path):
+        if path in self.endpoints:
+            return path
+        for pattern, template in self.templates:
+            if pattern.fullmatch(path):
+                return template
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        path = scope['path']
+        if path == '/metrics' and scope['method'] == 'GET':
+            body = render_metrics().encode('utf-8')
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', CONTENT_TYPE.encode('latin-1')),
+                                    (b'content-length', str(len(body)).encode('latin-1'))]})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        caller_id = ''
+        for name, value in scope['headers']:
+            if name == b'x-request-id':
+                caller_id = value.decode('latin-1')[:128]
+                break
+        timer = RequestTimer(caller_id or uuid.uuid4().hex, self._endpoint(path))
+        token = _asgi_timer.set(timer)
+        HTTP_IN_FLIGHT.inc(endpoint=timer.endpoint)
+        if PROCESS_METRICS is not None:
+            PROCESS_METRICS.start()
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'x-request-id', timer.request_id.encode('latin-1')))
+                if timer.spans:
+                    headers.append((b'server-timing', _server_timing(timer.spans).encode('latin-1')))
+                timer.status = message['status']
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _asgi_timer.reset(token)
+            HTTP_IN_FLIGHT.dec(endpoint=timer.endpoint)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - timer.start, method=scope['method'],
+                                          endpoint=timer.endpoint, status=timer.status)
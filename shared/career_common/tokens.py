@@ -0,0 +1,29 @@
+"""
+Tokenizer-free token estimate, shared by the prompt templates, the LLM
+gateway's budget reservations and the chat history budgets so they all count
+the same way.
+"""
+import re
+
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|\s+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """
+    Approximate Gemini token count of `text` without a tokenizer: about four
+    letters or three digits per token, one per punctuation mark, and runs of
+    whitespace beyond a single space count too.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        first = piece[0]
+        if first.isalpha():
+            tokens += (len(piece) + 3) // 4
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first.isspace():
+            if piece != ' ':
+                tokens += (len(piece) + 7) // 8
+        else:
+            tokens += 1
+    return tokens